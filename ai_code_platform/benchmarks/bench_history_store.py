@@ -0,0 +1,87 @@
+"""
+Benchmarks HistoryStore writes and searches on a large synthetic history.
+
+Fills a fresh database with generated records through the background writer,
+then times full-text, metadata and combined searches.
+
+Run from the repository root:
+    python -m ai_code_platform.benchmarks.bench_history_store --records 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from ai_code_platform.llm_code_generator.history_store import HistoryRecord, HistoryStore
+
+WORDS = (
+    "parse sort merge cache fetch retry stream token queue graph tree index json csv http "
+    "server client async thread lock file path user order invoice report metric billing"
+).split()
+LANGUAGES = ["python", "javascript", "typescript", "go", "rust"]
+MODELS = ["claude-3-opus-20240229", "claude-3-haiku-20240307", "llama3", "mistral"]
+
+
+def synthetic_record(rng: random.Random, created_at: float) -> HistoryRecord:
+    words = rng.sample(WORDS, 6)
+    prompt = f"Write a function to {words[0]} the {words[1]} {words[2]} with {words[3]} support"
+    code = f"def {words[0]}_{words[1]}({words[2]}):\n    # {words[4]} {words[5]}\n    return {words[2]}\n"
+    return HistoryRecord(
+        prompt=prompt,
+        language=rng.choice(LANGUAGES),
+        code=code,
+        service="LocalLLMService",
+        model=rng.choice(MODELS),
+        duration=rng.uniform(0.5, 20),
+        input_tokens=rng.randint(20, 4000),
+        output_tokens=rng.randint(20, 2000),
+        created_at=created_at,
+    )
+
+
+def timed(label: str, query, repeat: int = 20) -> None:
+    samples, results = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = len(query())
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<44} {statistics.median(samples):8.2f} ms (p50)  {max(samples):8.2f} ms (max)  {results} rows")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--path", type=str, help="Database file (default: a temporary file).")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    store = HistoryStore(path, batch_size=5000)
+    rng = random.Random(0)
+    now = time.time()
+
+    start = time.perf_counter()
+    enqueue_time = 0.0
+    for i in range(args.records):
+        record = synthetic_record(rng, now - (args.records - i))
+        t = time.perf_counter()
+        store.record(record)
+        enqueue_time += time.perf_counter() - t
+    store.flush()
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.records} records in {elapsed:.1f}s; record() took {enqueue_time / args.records * 1e6:.1f} us per call on average")
+    print(f"Database size: {os.path.getsize(path) / 1e6:.0f} MB at {path}")
+
+    timed("newest 20", lambda: store.search(limit=20))
+    timed("text: 'merge invoice'", lambda: store.search("merge invoice"))
+    timed("text prefix: 'bill*'", lambda: store.search("bill*"))
+    timed("text: 'merge invoice', by relevance", lambda: store.search("merge invoice", by_relevance=True))
+    timed("language=go, last hour", lambda: store.search(language="go", since=now - 3600))
+    timed("text 'retry' + model=llama3", lambda: store.search("retry", model="llama3"))
+    timed("get by id prefix", lambda: [store.get(record.id[:10])])
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
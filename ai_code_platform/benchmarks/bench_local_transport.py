@@ -0,0 +1,88 @@
+"""
+Benchmarks LocalLLMService transports against the in-process fake server.
+
+Compares the default one-off requests.post calls, a pooled keep-alive
+requests.Session and LocalTransport (gzip request bodies, plus HTTP/2 when
+httpx[http2] is installed) for many concurrent requests with a large context
+prompt.
+
+Run from the repository root:
+    python -m ai_code_platform.benchmarks.bench_local_transport --requests 200 --concurrency 32
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ai_code_platform.llm_code_generator.fake_llm_server import FakeLLMServer
+from ai_code_platform.llm_code_generator.local_llm_service import LocalLLMService
+from ai_code_platform.llm_code_generator.local_transport import HTTP2_AVAILABLE, LocalTransport
+
+
+def build_prompt(context_kib: int) -> str:
+    line = "def helper_{i}(value):\n    return value * {i}  # existing project code used as context\n"
+    text, i = [], 0
+    while sum(len(t) for t in text) < context_kib * 1024:
+        text.append(line.format(i=i))
+        i += 1
+    return "".join(text) + "\nTask: write a function that sums all helpers."
+
+
+def run(llm: LocalLLMService, prompt: str, total: int, concurrency: int) -> dict:
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        llm.generate_code(prompt, "python")
+        latencies.append(time.perf_counter() - start)
+
+    llm.generate_code("warm up", "python")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per transport. Default: 200")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent requests. Default: 32")
+    parser.add_argument("--context-kib", type=int, default=64, help="Size of the context prompt in KiB. Default: 64")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake server seconds per token. Default: 0")
+    args = parser.parse_args()
+
+    prompt = build_prompt(args.context_kib)
+    with FakeLLMServer(token_latency=args.token_latency) as server:
+        session = requests.Session()
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+        transport = LocalTransport(pool_size=args.concurrency)
+        candidates = [
+            ("requests.post (default)", LocalLLMService(api_base_url=server.url)),
+            ("pooled Session", LocalLLMService(api_base_url=server.url, session=session)),
+            ("LocalTransport", LocalLLMService(api_base_url=server.url, transport=transport)),
+        ]
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, prompt {len(prompt) / 1024:.0f} KiB, "
+              f"HTTP/2 available: {HTTP2_AVAILABLE}")
+        print(f"{'transport':<26}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, llm in candidates:
+            result = run(llm, prompt, args.requests, args.concurrency)
+            print(f"{name:<26}{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+
+        ratio = transport.bytes_sent / max(1, transport.bytes_before_compression)
+        print(f"LocalTransport protocol: {transport.protocol_for(server.url)}, "
+              f"request bytes on the wire: {ratio:.0%} of uncompressed "
+              f"({server.gzip_requests} gzip requests received)")
+        transport.close()
+
+
+if __name__ == "__main__":
+    main()
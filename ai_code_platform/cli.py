@@ -1,6 +1,12 @@
 import argparse
+import asyncio
+import json
 import os
 import sys
+import time
+from dataclasses import asdict
+
+import requests
 
 # Add the parent directory (ai_code_platform) to sys.path
 # to allow importing from llm_code_generator
@@ -8,24 +14,49 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir) # This should be the project root if cli.py is in ai_code_platform
 # This script (cli.py) is intended to be in the `ai_code_platform` directory.
 # Imports are relative to this location.
+from ai_code_platform.llm_code_generator.capabilities import CapabilityCache
+from ai_code_platform.llm_code_generator.cassette import Cassette, record_service, replay_traffic
+from ai_code_platform.llm_code_generator.docs_generator import DocsGenerator
+from ai_code_platform.llm_code_generator.evaluation import Evaluator, load_corpus, solution_responder
+from ai_code_platform.llm_code_generator.fake_llm_server import FakeLLMServer
+from ai_code_platform.llm_code_generator.feedback import FeedbackStore, InvalidFeedbackError
+from ai_code_platform.llm_code_generator.history_store import HistoryStore
 from ai_code_platform.llm_code_generator.llm_service import (
     LLMService,
     LLMConfigurationError,
     LLMAPIError,
+    LLMValidationError,
 )
 from ai_code_platform.llm_code_generator.claude_service import ClaudeService
 from ai_code_platform.llm_code_generator.local_llm_service import LocalLLMService
+from ai_code_platform.llm_code_generator.local_transport import LocalTransport
+from ai_code_platform.llm_code_generator.context_packer import ContextPacker
+from ai_code_platform.llm_code_generator.response_cache import ResponseCache
+from ai_code_platform.llm_code_generator.project_generator import ProjectGenerator, load_manifest
+from ai_code_platform.llm_code_generator.output_stats import STATS_FILENAME, OutputLengthStats
+from ai_code_platform.llm_code_generator.prefetch import Prefetcher
+from ai_code_platform.llm_code_generator.profiling import DEFAULT_INTERVAL, Profiler, phase
+from ai_code_platform.llm_code_generator.prompt_watcher import PromptWatcher
+from ai_code_platform.llm_code_generator.storage import atomic_write_text, default_cache_dir
+from ai_code_platform.llm_code_generator.streaming_output import (
+    MULTI_FILE_INSTRUCTION,
+    StreamingFileSplitter,
+    StreamingFileWriter,
+    default_extension,
+    write_stream,
+)
+from ai_code_platform.server import GenerationServer, ServicePool, build_service_factory
 
 # Capture default values at import time so that tests patching the service
 # classes don't replace these with mocks.
 CLAUDE_DEFAULT_MODEL = ClaudeService.DEFAULT_MODEL
 LOCAL_DEFAULT_API_BASE = LocalLLMService.DEFAULT_API_BASE
 LOCAL_DEFAULT_MODEL = LocalLLMService.DEFAULT_MODEL
+DEFAULT_CONTEXT_BUDGET = 8000
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Generate code using an LLM.")
-    parser.add_argument("prompt", type=str, help="The natural language prompt for code generation.")
+def _add_service_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the options shared by every command that talks to an LLM service."""
     parser.add_argument(
         "--service",
         type=str,
@@ -33,12 +64,6 @@ def main():
         default="local", # Default to local for easier testing without API keys
         help="The LLM service to use (claude or local). Default: local",
     )
-    parser.add_argument(
-        "--language",
-        type=str,
-        default="python",
-        help="The programming language for the generated code. Default: python",
-    )
     parser.add_argument(
         "--claude-model",
         type=str,
@@ -60,40 +85,173 @@ def main():
         default=LOCAL_DEFAULT_MODEL,
         help=f"Model name for the local LLM. Default: {LOCAL_DEFAULT_MODEL}",
     )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help=(
+            "Use the optimized local transport: HTTP/2 multiplexing when httpx[http2] is installed "
+            "and gzip request bodies when the server advertises support. Falls back to HTTP/1.1 automatically."
+        ),
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=str,
+        metavar="DURATION",
+        help="Ask the local server to keep the model loaded between requests (Ollama-style duration, e.g. 30m).",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help=(
+            "Probe the local server's capabilities (models, streaming, n, stop sequences, prompt caching, "
+            "keep-alive) and use the fastest request path it supports. The profile is cached per endpoint "
+            "for a day; see `cli.py probe`."
+        ),
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help=(
+            "Preconnect to the backend and send a minimal priming request before the first real one "
+            "(loads the model and primes server prompt caches), then report cold versus warm latency."
+        ),
+    )
+    parser.add_argument(
+        "--adaptive-max-tokens",
+        action="store_true",
+        help=(
+            "Size max_tokens from output lengths learned in past runs (per model and language) "
+            "instead of a fixed 2048. Truncated replies are continued either way."
+        ),
+    )
+    parser.add_argument(
+        "--history",
+        dest="record_history",
+        action="store_true",
+        help="Record generations in the history store (see `cli.py history`). Off by default.",
+    )
+    # History used to be on by default; keep the old opt-out working in scripts.
+    parser.add_argument("--no-history", dest="record_history", action="store_false", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--record",
+        type=str,
+        metavar="CASSETTE",
+        help="Record every backend request and response, with timing, to a cassette file for `cli.py replay`.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="PATH",
+        help=(
+            "Sample CPU per phase (setup, request, extract, validate, ...) and write collapsed stacks "
+            "to PATH for flamegraph.pl or speedscope. A summary is printed to stderr."
+        ),
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="With --profile, also trace allocations per phase and report the top allocation sites (slower).",
+    )
+    parser.add_argument(
+        "--profile-sample-rate",
+        type=float,
+        default=1.0,
+        metavar="FRACTION",
+        help="With --profile, only profile this fraction of requests, e.g. 0.05 on a busy server. Default: 1.0",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=DEFAULT_INTERVAL * 1000,
+        metavar="MS",
+        help=f"With --profile, milliseconds between stack samples. Default: {DEFAULT_INTERVAL * 1000:g}",
+    )
     parser.add_argument(
         "--api-key",
         type=str,
         help="API key for the LLM service (e.g., Anthropic API Key for Claude, or a key for a secured local LLM). Can also be set via environment variables.",
     )
 
-    args = parser.parse_args()
 
-    llm: LLMService | None = None
+def _create_service(args: argparse.Namespace) -> LLMService:
+    """Builds the LLM service selected by the shared service arguments."""
+    kwargs = {}
+    if args.adaptive_max_tokens:
+        # Saved by _run_with_error_handling once the command finishes.
+        args.output_stats = OutputLengthStats(path=os.path.join(default_cache_dir(), STATS_FILENAME))
+        kwargs["output_stats"] = args.output_stats
+    if args.service == "claude":
+        print(f"Using Claude service with model: {args.claude_model}")
+        # API key can be passed directly or read from ANTHROPIC_API_KEY env var by the service
+        llm = ClaudeService(api_key=args.api_key, model=args.claude_model, **kwargs)
+    elif args.service == "local":
+        print(f"Using local LLM service. API URL: {args.local_url}, Model: {args.local_model}")
+        if args.http2:
+            kwargs["transport"] = LocalTransport()
+        if args.keep_alive:
+            kwargs["keep_alive"] = args.keep_alive
+        if args.probe:
+            kwargs["capabilities"] = CapabilityCache()
+        llm = LocalLLMService(
+            api_base_url=args.local_url,
+            model=args.local_model,
+            api_key=args.api_key or "not-needed", # Pass explicitly if provided
+            **kwargs,
+        )
+    else:
+        # Should not happen due to choices in argparse
+        print(f"Error: Unknown service '{args.service}'", file=sys.stderr)
+        sys.exit(1)
+    if args.record_history:
+        # Closed (flushing queued records) by _run_with_error_handling.
+        args.history = llm.history = HistoryStore()
+    if args.warmup:
+        _warm_up(llm, getattr(args, "language", "python"))
+    if args.record:
+        # Saved by _run_with_error_handling. Attached after warm-up so only real traffic is captured.
+        args.cassette = Cassette(args.record)
+        record_service(llm, args.cassette)
+    return llm
 
-    try:
-        if args.service == "claude":
-            print(f"Using Claude service with model: {args.claude_model}")
-            # API key can be passed directly or read from ANTHROPIC_API_KEY env var by the service
-            llm = ClaudeService(api_key=args.api_key, model=args.claude_model)
-        elif args.service == "local":
-            print(f"Using local LLM service. API URL: {args.local_url}, Model: {args.local_model}")
-            llm = LocalLLMService(
-                api_base_url=args.local_url,
-                model=args.local_model,
-                api_key=args.api_key or "not-needed" # Pass explicitly if provided
-            )
-        else:
-            # Should not happen due to choices in argparse
-            print(f"Error: Unknown service '{args.service}'", file=sys.stderr)
-            sys.exit(1)
 
-        print(f"Generating {args.language} code for prompt: '{args.prompt}'")
-        generated_code = llm.generate_code(args.prompt, args.language)
+def _warm_up(llm: LLMService, language: str | list[str]) -> None:
+    """Warms up the service and prints the measured cold and warm latencies."""
+    if not isinstance(language, str):
+        language = language[0]
+    report = llm.warm_up(language)
+    if report.cold_latency is None:
+        print(f"Warm-up: connected in {report.preconnect_time * 1000:.0f} ms (backend doesn't support priming requests)")
+        return
+    print(
+        f"Warm-up: connected in {report.preconnect_time * 1000:.0f} ms, "
+        f"cold first call {report.cold_latency * 1000:.0f} ms, warm call {report.warm_latency * 1000:.0f} ms"
+    )
+
+
+def _stream_to_disk(llm: LLMService, prompt: str, args: argparse.Namespace) -> None:
+    """Streams one generation to --output or, split into files, to --output-dir."""
+    if args.output:
+        output = StreamingFileWriter(args.output)
+    else:
+        output = StreamingFileSplitter(args.output_dir, args.language, on_file=lambda path: print(f"Wrote {path}"))
+        prompt = f"{prompt}\n\n{MULTI_FILE_INSTRUCTION}"
+    paths = write_stream(llm.stream_code(prompt, args.language), output)
+    if args.output:
+        print(f"Wrote {paths[0]}")
+    elif not paths:
+        print("The response contained no code; nothing was written.")
 
-        print("\\n--- Generated Code ---")
-        print(generated_code)
-        print("--- End of Code ---")
 
+def _run_with_error_handling(args: argparse.Namespace, command) -> None:
+    """Runs a command, translating service errors into messages and exit codes."""
+    profile = getattr(args, "profile", None)
+    profiler = None
+    if profile:
+        profiler = Profiler(
+            interval=args.profile_interval / 1000, memory=args.profile_memory, sample_rate=args.profile_sample_rate
+        ).start()
+    try:
+        command()
     except LLMConfigurationError as e:
         print(f"Configuration Error: {e}", file=sys.stderr)
         if args.service == "claude" and "ANTHROPIC_API_KEY" in str(e):
@@ -104,9 +262,745 @@ def main():
     except LLMAPIError as e:
         print(f"API Error: {e}", file=sys.stderr)
         sys.exit(1)
+    except LLMValidationError as e:
+        print(f"Validation Error: {e}", file=sys.stderr)
+        sys.exit(1)
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        output_stats = getattr(args, "output_stats", None)
+        if output_stats is not None:
+            output_stats.save()
+        history = getattr(args, "history", None)
+        if history is not None:
+            history.close()
+        cassette = getattr(args, "cassette", None)
+        if cassette is not None:
+            cassette.close()
+            print(f"Recorded {cassette.recorded_calls} call(s) and {cassette.recorded_exchanges} exchange(s) to {cassette.path}")
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_collapsed(profile)
+            print(profiler.summary(), file=sys.stderr)
+            print(f"Wrote collapsed stacks to {profile}", file=sys.stderr)
+
+
+def project_main(argv: list[str]) -> None:
+    """Entry point for `cli.py project`: generates a multi-file project from a manifest."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py project",
+        description="Generate a multi-file project from a manifest of prompts with dependency edges.",
+    )
+    parser.add_argument("manifest", type=str, help="Path to the JSON project manifest.")
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=".",
+        help="Directory to write generated files and the progress checkpoint to. Default: current directory",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Maximum number of files generated concurrently. Default: 4",
+    )
+    _add_service_arguments(parser)
+    args = parser.parse_args(argv)
+
+    def run() -> None:
+        nodes = load_manifest(args.manifest)
+        llm = _create_service(args)
+        print(f"Generating {len(nodes)} files into {args.output_dir} with up to {args.jobs} concurrent requests")
+        report = ProjectGenerator(llm, args.output_dir, max_workers=args.jobs).generate(nodes)
+
+        for path, result in report.results.items():
+            status = "reused" if result.reused else f"{result.duration:.2f}s"
+            print(f"  {path}: {status}")
+        print(f"Generated {len(report.generated)} files, reused {len(report.reused)} unchanged files.")
+        print(f"Wall time: {report.wall_time:.2f}s (serial would be {report.serial_time:.2f}s)")
+        print(f"Critical path: {report.critical_path_time:.2f}s ({' -> '.join(report.critical_path)})")
+
+    _run_with_error_handling(args, run)
+
+
+def refine_main(argv: list[str]) -> None:
+    """Entry point for `cli.py refine`: applies a change request to an existing file via a patch."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py refine",
+        description="Apply a change request to previously generated code using a compact patch instead of a full rewrite.",
+    )
+    parser.add_argument("file", type=str, help="The file containing the previously generated code.")
+    parser.add_argument("change_request", type=str, help="The natural language description of the change.")
+    parser.add_argument(
+        "--language",
+        type=str,
+        default="python",
+        help="The programming language of the code. Default: python",
+    )
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        help="Write the refined code back to FILE instead of printing it.",
+    )
+    _add_service_arguments(parser)
+    args = parser.parse_args(argv)
+
+    def run() -> None:
+        with open(args.file, "r", encoding="utf-8") as f:
+            previous_code = f.read()
+        llm = _create_service(args)
+        result = llm.refine_code(previous_code, args.change_request, args.language)
+
+        if args.in_place:
+            atomic_write_text(args.file, result.code)
+            print(f"Updated {args.file}")
+        else:
+            print("--- Refined Code ---")
+            print(result.code)
+            print("--- End of Code ---")
+        if result.used_patch:
+            print(
+                f"Applied patch: {result.output_tokens} output tokens vs ~{result.full_regeneration_tokens} "
+                f"for a full rewrite (saved ~{result.saved_tokens})."
+            )
+        else:
+            print(f"Patch failed ({result.patch_error}); regenerated the full file using {result.output_tokens} output tokens.")
+
+    _run_with_error_handling(args, run)
+
+
+def serve_main(argv: list[str]) -> None:
+    """Entry point for `cli.py serve`: runs the HTTP API server for the web front end."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py serve",
+        description="Serve code generation over HTTP (JSON and Server-Sent Events streaming).",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to listen on. Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on. Default: 8000")
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=256,
+        help="Maximum number of backend calls running at once across all clients. Default: 256",
+    )
+    parser.add_argument(
+        "--per-client-limit",
+        type=int,
+        default=8,
+        help="Maximum in-flight requests per client address. Default: 8",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="Number of generations kept in the shared in-memory response cache (0 disables it). Default: 1024",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        metavar="WORKERS",
+        help=(
+            "Use idle backend capacity to generate likely-next requests (client 'prefetch' hints and the "
+            "languages usually requested next) into the cache with up to WORKERS background requests. "
+            "Prefetches are cancelled as soon as real requests arrive. Default: 0 (off)"
+        ),
+    )
+    parser.add_argument(
+        "--no-feedback",
+        action="store_true",
+        help=(
+            "Ignore ratings: don't accept POST /api/feedback and serve cached generations regardless of "
+            "feedback (by default poorly rated ones are downranked or dropped and well rated ones kept)."
+        ),
+    )
+    _add_service_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.prefetch and args.cache_size <= 0:
+        parser.error("--prefetch needs the response cache (--cache-size > 0)")
+
+    def run() -> None:
+        pool = ServicePool(_build_factory(args, pool_size=args.max_concurrency), default_service=args.service)
+        if args.warmup:
+            _warm_up(pool.get(), "python")
+        feedback = None if args.no_feedback else FeedbackStore()
+        cache = ResponseCache(max_entries=args.cache_size, feedback=feedback) if args.cache_size > 0 else None
+        server = GenerationServer(
+            pool,
+            cache=cache,
+            max_concurrency=args.max_concurrency,
+            per_client_limit=args.per_client_limit,
+            prefetcher=Prefetcher(cache, max_workers=args.prefetch) if args.prefetch else None,
+            feedback=feedback,
+        )
+        print(f"Serving {args.service} code generation on http://{args.host}:{args.port}/api")
+        try:
+            asyncio.run(server.serve_forever(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+
+    _run_with_error_handling(args, run)
+
+
+def _build_factory(args: argparse.Namespace, pool_size: int):
+    """Builds a service factory (see build_service_factory) from the shared service arguments."""
+    if args.adaptive_max_tokens:
+        # Saved by _run_with_error_handling once the command finishes.
+        args.output_stats = OutputLengthStats(path=os.path.join(default_cache_dir(), STATS_FILENAME))
+    if args.record_history:
+        args.history = HistoryStore()
+    factory = build_service_factory(
+        claude_model=args.claude_model,
+        local_url=args.local_url,
+        local_model=args.local_model,
+        api_key=args.api_key,
+        pool_size=pool_size,
+        http2=args.http2,
+        keep_alive=args.keep_alive,
+        output_stats=getattr(args, "output_stats", None),
+        history=getattr(args, "history", None),
+        capabilities=CapabilityCache() if args.probe else None,
+    )
+    if args.record:
+        args.cassette = Cassette(args.record)
+        factory = _recording_factory(factory, args.cassette)
+    return factory
+
+
+def _recording_factory(factory, cassette: Cassette):
+    """Wraps a service factory so every service it builds records to `cassette`."""
+    def recording_factory(service: str, model: str | None) -> LLMService:
+        return record_service(factory(service, model), cassette)
+    return recording_factory
+
+
+def watch_main(argv: list[str]) -> None:
+    """Entry point for `cli.py watch`: regenerates code whenever a prompt file changes."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py watch",
+        description=(
+            "Watch a directory of prompt files and regenerate the changed ones. "
+            "`name.py.prompt` is generated into `name.py` next to it."
+        ),
+    )
+    parser.add_argument("directory", type=str, help="The directory containing *.prompt files (searched recursively).")
+    parser.add_argument(
+        "--language",
+        type=str,
+        default="python",
+        help="Language for prompt files without a recognized inner extension (e.g. `name.prompt`). Default: python",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        help="Seconds a prompt file must stay unchanged before it is regenerated. Default: 0.5",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Maximum number of files generated concurrently. Default: 4",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for the persistent response cache. Default: <cache dir>/responses",
+    )
+    parser.add_argument(
+        "--no-feedback",
+        action="store_true",
+        help=(
+            "Restore cached outputs regardless of their ratings (by default outputs rated down with "
+            "`cli.py feedback` are regenerated instead)."
+        ),
+    )
+    _add_service_arguments(parser)
+    args = parser.parse_args(argv)
+
+    def report(result) -> None:
+        if result.status == "failed":
+            print(f"  {result.output_path}: failed ({result.error})", file=sys.stderr)
+        elif result.status == "cancelled":
+            print(f"  {result.output_path}: cancelled in {result.duration:.2f}s")
+        else:
+            print(f"  {result.output_path}: {result.status} in {result.duration:.2f}s (id {result.generation_id})")
+
+    def run() -> None:
+        llm = _create_service(args)
+        cache = ResponseCache(
+            directory=args.cache_dir or os.path.join(default_cache_dir(), "responses"),
+            feedback=None if args.no_feedback else FeedbackStore(),
+        )
+        watcher = PromptWatcher(
+            llm,
+            args.directory,
+            language=args.language,
+            cache=cache,
+            debounce=args.debounce,
+            max_workers=args.jobs,
+            on_result=report,
+        )
+        print(f"Watching {args.directory} for *.prompt changes (Ctrl+C to stop)")
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        print(
+            f"Generated {watcher.generated}, served {watcher.cache_hits} from cache, "
+            f"cancelled {watcher.cancelled} superseded generations."
+        )
+
+    _run_with_error_handling(args, run)
+
+
+def docs_main(argv: list[str]) -> None:
+    """Entry point for `cli.py docs`: generates Markdown API documentation for a source tree."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py docs",
+        description=(
+            "Generate Markdown documentation for the functions, classes and methods of a Python "
+            "source tree. Documentation is cached per symbol, so reruns only regenerate changed code."
+        ),
+    )
+    parser.add_argument("source", type=str, help="The source directory to document (searched recursively for *.py files).")
+    parser.add_argument("--output-dir", type=str, default="docs", help="Directory for the Markdown files. Default: docs")
+    parser.add_argument("--jobs", type=int, default=4, help="Maximum concurrent requests. Default: 4")
+    parser.add_argument(
+        "--batch-tokens",
+        type=int,
+        default=3000,
+        help="Estimated source tokens packed into one request (small symbols share requests). Default: 3000",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for the documentation cache and file index. Default: <cache dir>",
+    )
+    _add_service_arguments(parser)
+    args = parser.parse_args(argv)
+
+    def run() -> None:
+        llm = _create_service(args)
+        generator = DocsGenerator(
+            llm,
+            args.source,
+            args.output_dir,
+            cache_dir=args.cache_dir,
+            max_workers=args.jobs,
+            batch_tokens=args.batch_tokens,
+        )
+        report = generator.run()
+        for symbol, error in report.failed.items():
+            print(f"  {symbol}: failed ({error})", file=sys.stderr)
+        print(
+            f"Documented {report.symbols} symbols in {report.files} files: {report.generated} generated "
+            f"in {report.requests} requests, {report.cached} from cache, {len(report.failed)} failed "
+            f"({report.wall_time:.1f}s). {len(report.written)} page(s) written to {args.output_dir}"
+        )
+
+    _run_with_error_handling(args, run)
+
+
+def token_stats_main(argv: list[str]) -> None:
+    """Entry point for `cli.py token-stats`: shows the learned output-length statistics."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py token-stats",
+        description="Show output-length statistics learned by --adaptive-max-tokens, per model and language.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the statistics as JSON.")
+    args = parser.parse_args(argv)
+
+    snapshot = OutputLengthStats(path=os.path.join(default_cache_dir(), STATS_FILENAME)).snapshot()
+    if args.json:
+        print(json.dumps(snapshot, indent=2))
+        return
+    if not snapshot:
+        print("No output-length statistics recorded yet (run generations with --adaptive-max-tokens).")
+        return
+    print(f"{'model/language':<48} {'samples':>7} {'p50':>6} {'p95':>6} {'max':>6} {'truncated':>9} {'max_tokens':>10}")
+    for key, entry in snapshot.items():
+        print(
+            f"{key:<48} {entry['samples']:>7} {entry['p50']:>6} {entry['p95']:>6} {entry['max']:>6} "
+            f"{entry.get('truncations', 0):>9} {entry['suggested_max_tokens']:>10}"
+        )
+
+
+def history_main(argv: list[str]) -> None:
+    """Entry point for `cli.py history`: searches recorded generations."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py history",
+        description="Search past generations by prompt/code text and metadata.",
+    )
+    parser.add_argument("query", type=str, nargs="*", help="Words to search for in prompts and code (`word*` matches prefixes).")
+    parser.add_argument("--language", type=str, help="Only generations in this language.")
+    parser.add_argument("--model", type=str, help="Only generations from this model.")
+    parser.add_argument("--days", type=float, help="Only generations from the last N days.")
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of results. Default: 20")
+    parser.add_argument("--show", type=str, metavar="ID", help="Print the prompt and code of one generation (id or unique prefix).")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore()
+    try:
+        if args.show:
+            record = store.get(args.show)
+            if record is None:
+                print(f"No unique generation matches id {args.show!r}.", file=sys.stderr)
+                sys.exit(1)
+            print(f"Prompt ({record.language}, {record.model}): {record.prompt}")
+            print("--- Generated Code ---")
+            print(record.code)
+            print("--- End of Code ---")
+            return
+
+        started = time.perf_counter()
+        records = store.search(
+            " ".join(args.query) or None,
+            language=args.language,
+            model=args.model,
+            since=time.time() - args.days * 86400 if args.days else None,
+            limit=args.limit,
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for record in records:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(record.created_at))
+            duration = f"{record.duration:.1f}s" if record.duration is not None else "-"
+            tokens = record.output_tokens if record.output_tokens is not None else "-"
+            prompt = " ".join(record.prompt.split())
+            print(f"{record.id[:12]}  {when}  {record.language:<10} {record.model:<28} {duration:>6} {tokens:>6}  {prompt[:60]}")
+        print(f"{len(records)} result(s) in {elapsed_ms:.1f} ms")
+    finally:
+        store.close()
+
+
+def feedback_main(argv: list[str]) -> None:
+    """Entry point for `cli.py feedback`: rates a generation or shows its feedback."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py feedback",
+        description=(
+            "Rate a past generation (see `cli.py history` for ids). Ratings decide whether the response "
+            "cache of `cli.py serve` keeps serving the generation, serves it only as a fallback, or drops it."
+        ),
+    )
+    parser.add_argument("generation_id", type=str, help="Generation id, or a unique prefix of a recorded one.")
+    parser.add_argument("rating", type=str, nargs="?", choices=["up", "down"], help="Omit to show the current feedback.")
+    args = parser.parse_args(argv)
+
+    generation_id = args.generation_id
+    history = HistoryStore()
+    try:
+        record = history.get(generation_id)
+    finally:
+        history.close()
+    if record is not None:
+        generation_id = record.id
+
+    store = FeedbackStore()
+    if args.rating:
+        try:
+            store.record(generation_id, 1 if args.rating == "up" else -1)
+        except InvalidFeedbackError as e:
+            print(f"Error: {e} (use an id from `cli.py history`)", file=sys.stderr)
+            sys.exit(1)
+    summary = store.summary(generation_id)
+    if summary is None:
+        print(f"No feedback for {generation_id}.")
+        return
+    print(f"{generation_id}: {summary.up} up, {summary.down} down -> {store.verdict(generation_id)}")
+
+
+def replay_main(argv: list[str]) -> None:
+    """Entry point for `cli.py replay`: replays recorded traffic and reports latency and throughput."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py replay",
+        description=(
+            "Replay a cassette recorded with --record through the current code, without a backend. "
+            "Requests are re-issued at their recorded arrival times and answered with the recorded "
+            "responses and timing, so runs are deterministic and comparable across code changes."
+        ),
+    )
+    parser.add_argument("cassette", type=str, help="Cassette file written by --record.")
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="Multiplier for recorded arrival times and backend latencies (0.5 = twice as fast, 0 = no delays). Default: 1.0",
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum requests in flight. Default: 32")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    try:
+        report = replay_traffic(Cassette.load(args.cassette), time_scale=args.time_scale, concurrency=args.concurrency)
+    except LLMConfigurationError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    summary = report.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    recorded = summary["recorded"]
+    print(f"Replayed {summary['requests']} request(s), {summary['errors']} error(s), at time scale {args.time_scale}")
+    print(f"{'':<10} {'wall time':>10} {'p50':>10} {'p95':>10}")
+    print(f"{'replay':<10} {summary['wall_time_s']:>9.3f}s {summary['p50_ms']:>8}ms {summary['p95_ms']:>8}ms")
+    print(f"{'recorded':<10} {recorded['wall_time_s']:>9.3f}s {recorded['p50_ms']:>8}ms {recorded['p95_ms']:>8}ms")
+    print(f"Throughput: {summary['throughput_rps']} requests/s")
+
+
+def probe_main(argv: list[str]) -> None:
+    """Entry point for `cli.py probe`: shows the capability profile of a local server."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py probe",
+        description=(
+            "Probe a local OpenAI-compatible server for its models and for streaming, n, stop-sequence, "
+            "prompt-caching and keep-alive support. The profile is cached per endpoint and reused by --probe."
+        ),
+    )
+    parser.add_argument(
+        "--local-url",
+        type=str,
+        default=LOCAL_DEFAULT_API_BASE,
+        help=f"Base URL for the local LLM API. Default: {LOCAL_DEFAULT_API_BASE}",
+    )
+    parser.add_argument("--local-model", type=str, help="Model for the chat probes. Default: the server's first model")
+    parser.add_argument("--api-key", type=str, help="API key for a secured local server.")
+    parser.add_argument("--refresh", action="store_true", help="Probe again even if a cached profile is still valid.")
+    parser.add_argument("--json", action="store_true", help="Print the profile as JSON.")
+    args = parser.parse_args(argv)
+
+    cache = CapabilityCache()
+    try:
+        profile = cache.get_or_probe(args.local_url, api_key=args.api_key, model=args.local_model, refresh=args.refresh)
+    except requests.exceptions.RequestException as e:
+        print(f"API Error: could not probe {args.local_url}: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(asdict(profile), indent=2))
+        return
+    age = time.time() - profile.probed_at
+    print(f"Endpoint: {profile.api_base_url} ({'probed now' if cache.probes else f'cached {age / 60:.0f} min ago'})")
+    print(f"Models: {', '.join(profile.models) or '-'}")
+    for name in ("streaming", "n", "keep_alive"):
+        print(f"{name:<16} {'yes' if getattr(profile, name) else 'no'}")
+
+
+def eval_main(argv: list[str]) -> None:
+    """Entry point for `cli.py eval`: measures pass@k, latency and throughput over a task corpus."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py eval",
+        description=(
+            "Run a corpus of coding tasks through one or more models, execute each task's tests against "
+            "the generated code in sandboxed processes, and report pass@k next to latency and throughput."
+        ),
+    )
+    parser.add_argument("corpus", type=str, help="JSON Lines file of tasks with 'id', 'prompt' and 'tests' (Python).")
+    parser.add_argument(
+        "--models",
+        type=str,
+        nargs="+",
+        metavar="SERVICE[:MODEL]",
+        help=(
+            "Models to compare, e.g. local:qwen2.5-coder claude:claude-3-haiku-20240307, or `fake` for an "
+            "in-process fake server answering with the corpus's canonical solutions (fully offline). "
+            "Default: --service with its configured model."
+        ),
+    )
+    parser.add_argument("--samples", type=int, default=1, help="Generations per task (n for pass@k). Default: 1")
+    parser.add_argument(
+        "--k",
+        type=str,
+        help="Comma-separated k values for pass@k, each at most --samples. Default: 1 and --samples",
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum generation requests in flight. Default: 4")
+    parser.add_argument("--test-workers", type=int, help="Maximum concurrent test processes. Default: CPU count")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds each test run may take. Default: 10")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON.")
+    _add_service_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.samples < 1:
+        parser.error("--samples must be at least 1")
+    try:
+        ks = sorted({int(k) for k in args.k.split(",")}) if args.k else sorted({1, args.samples})
+    except ValueError:
+        parser.error("--k must be a comma-separated list of integers")
+    if not all(1 <= k <= args.samples for k in ks):
+        parser.error("every --k value must be between 1 and --samples")
+
+    def run() -> None:
+        tasks = load_corpus(args.corpus)
+        factory = _build_factory(args, pool_size=args.concurrency)
+        evaluator = Evaluator(tasks, samples=args.samples, concurrency=args.concurrency, test_workers=args.test_workers, timeout=args.timeout)
+        summaries = []
+        for spec in args.models or [args.service]:
+            service, _, model = spec.partition(":")
+            if service == "fake":
+                with FakeLLMServer(responder=solution_responder(tasks)) as fake:
+                    llm = LocalLLMService(api_base_url=fake.url, model=fake.model, history=getattr(args, "history", None))
+                    report = evaluator.evaluate(llm, label="fake")
+            elif service in ("claude", "local"):
+                llm = factory(service, model or None)
+                if args.warmup:
+                    _warm_up(llm, "python")
+                print(f"Evaluating {spec} on {len(tasks)} tasks x {args.samples} samples...", file=sys.stderr)
+                report = evaluator.evaluate(llm)
+            else:
+                raise LLMConfigurationError(f"Unknown service in --models: {spec} (use claude, local or fake)")
+            summaries.append(report.summary(ks))
+
+        if args.json:
+            print(json.dumps(summaries, indent=2))
+            return
+        columns = [f"pass@{k}" for k in ks] + ["p50_ms", "p95_ms", "tokens_per_s", "throughput_per_s", "errors"]
+        print(f"{'model':<32} " + " ".join(f"{column:>16}" for column in columns))
+        for summary in summaries:
+            cells = ["-" if summary[column] is None else str(summary[column]) for column in columns]
+            print(f"{summary['model']:<32} " + " ".join(f"{cell:>16}" for cell in cells))
+
+    _run_with_error_handling(args, run)
+
+
+# Subcommands are dispatched on the first argument, so `cli.py "<prompt>"` keeps working.
+SUBCOMMANDS = {
+    "project": project_main,
+    "refine": refine_main,
+    "serve": serve_main,
+    "watch": watch_main,
+    "docs": docs_main,
+    "token-stats": token_stats_main,
+    "history": history_main,
+    "feedback": feedback_main,
+    "replay": replay_main,
+    "eval": eval_main,
+    "probe": probe_main,
+}
+
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in SUBCOMMANDS:
+        SUBCOMMANDS[argv[0]](argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Generate code using an LLM.",
+        epilog=f"Subcommands: {', '.join(SUBCOMMANDS)} (run `cli.py <subcommand> --help` for details).",
+    )
+    parser.add_argument("prompt", type=str, help="The natural language prompt for code generation.")
+    parser.add_argument(
+        "--language",
+        type=str,
+        nargs="+",
+        default=["python"],
+        help=(
+            "The programming language(s) for the generated code. Several languages "
+            "(space- or comma-separated) are generated in a single request. Default: python"
+        ),
+    )
+    _add_service_arguments(parser)
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Number of candidates to generate in parallel; the first one that passes validation is returned. Default: 1",
+    )
+
+    parser.add_argument(
+        "--context",
+        type=str,
+        action="append",
+        default=[],
+        metavar="PATH_OR_GLOB",
+        help="Existing source files to give the model as context (file, directory or glob such as 'src/**/*.py'). Repeatable.",
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=DEFAULT_CONTEXT_BUDGET,
+        help=f"Maximum estimated tokens of context files to include. Default: {DEFAULT_CONTEXT_BUDGET}",
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
+        "--output",
+        type=str,
+        metavar="PATH",
+        help="Stream the generated code into this file (replaced atomically when complete) instead of printing it.",
+    )
+    output.add_argument(
+        "--output-dir",
+        type=str,
+        metavar="DIR",
+        help=(
+            "Stream the response into this directory, one file per fenced code block. Blocks naming "
+            "a file (```python path=src/app.py) are written there; each file appears as soon as it is complete."
+        ),
+    )
+
+    args = parser.parse_args(argv)
+    languages = [language for value in args.language for language in value.split(",") if language.strip()]
+    if len(languages) > 1 and args.candidates > 1:
+        parser.error("--candidates cannot be combined with multiple languages")
+    if len(languages) > 1 and args.output:
+        parser.error("--output writes a single file; use --output-dir with multiple languages")
+    args.language = languages[0] if len(languages) == 1 else languages
+
+    def run() -> None:
+        with phase("setup"):
+            llm = _create_service(args)
+
+        prompt = args.prompt
+        if args.context:
+            with phase("context"):
+                packed = ContextPacker().pack(args.prompt, args.context, args.context_budget)
+            print(
+                f"Packed {len(packed.files)} context files (~{packed.tokens}/{packed.budget} tokens)"
+                + (f", skipped {len(packed.skipped)} that didn't fit" if packed.skipped else "")
+            )
+            prompt = packed.render(args.prompt)
+
+        if len(languages) > 1:
+            print(f"Generating {', '.join(languages)} code for prompt: '{args.prompt}'")
+            with phase("generate"):
+                results = llm.generate_multi_language(prompt, languages)
+            with phase("output"):
+                for language, code in results.items():
+                    if args.output_dir:
+                        path = os.path.join(args.output_dir, f"generated{default_extension(language)}")
+                        atomic_write_text(path, code)
+                        print(f"Wrote {path}")
+                        continue
+                    print(f"\n--- Generated Code ({language}) ---")
+                    print(code)
+                    print("--- End of Code ---")
+            return
+
+        print(f"Generating {args.language} code for prompt: '{args.prompt}'")
+        if (args.output or args.output_dir) and args.candidates == 1:
+            with phase("generate"):
+                _stream_to_disk(llm, prompt, args)
+            return
+        with phase("generate"):
+            if args.candidates > 1:
+                generated_code = llm.generate_code(prompt, args.language, candidates=args.candidates)
+            else:
+                generated_code = llm.generate_code(prompt, args.language)
+
+        with phase("output"):
+            if args.output or args.output_dir:
+                # Candidates are validated as a whole, so there is nothing to stream.
+                path = args.output or os.path.join(args.output_dir, f"generated{default_extension(args.language)}")
+                atomic_write_text(path, generated_code)
+                print(f"Wrote {path}")
+                return
+            print("\n--- Generated Code ---")
+            print(generated_code)
+            print("--- End of Code ---")
+
+    _run_with_error_handling(args, run)
 
 
 if __name__ == "__main__":
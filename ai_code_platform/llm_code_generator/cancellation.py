@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+
+class CancelScope:
+    """Cancellation state of one request, with callbacks that abort its backend call."""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """Registers an abort callback; it runs immediately if the scope is already cancelled."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        _run_callback(callback)
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _run_callback(callback)
+
+
+_local = threading.local()
+
+
+def on_cancel(callback: Callable[[], None]) -> None:
+    """
+    Registers a callback that aborts the current backend call if its request is cancelled.
+
+    Backends call this once they hold something that can be aborted from another
+    thread (a socket, an SDK stream). The callback runs on the cancelling thread,
+    so it must not block. Outside a cancel scope this is a no-op.
+    """
+    scope = getattr(_local, "scope", None)
+    if scope is not None:
+        scope.add_callback(callback)
+
+
+def cancelled() -> bool:
+    """Returns whether the cancel scope entered on this thread has been cancelled."""
+    scope = getattr(_local, "scope", None)
+    return scope is not None and scope.cancelled
+
+
+@contextmanager
+def entered(scope: CancelScope):
+    """Makes `scope` the current cancel scope of this thread inside the block."""
+    previous = getattr(_local, "scope", None)
+    _local.scope = scope
+    try:
+        yield
+    finally:
+        _local.scope = previous
+
+
+def _run_callback(callback: Callable[[], None]) -> None:
+    try:
+        callback()
+    except Exception:
+        pass  # aborting is best effort; the request still stops at its next chunk
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+
+import requests
+
+from .storage import atomic_write_text, default_cache_dir
+
+CAPABILITIES_FILENAME = "local_capabilities.json"
+CAPABILITIES_VERSION = 1
+DEFAULT_CAPABILITY_TTL = 24 * 3600.0  # seconds a probed profile is trusted
+PROBE_TIMEOUT = 60.0  # the first chat request may have to load the model
+
+_PROBE_MESSAGES = [
+    {"role": "system", "content": "You are a capability probe. Follow the instruction exactly and be brief."},
+    {"role": "user", "content": "Reply with exactly these words: alpha beta gamma"},
+]
+
+
+@dataclass
+class ServerCapabilities:
+    """What an OpenAI-compatible server supports, as found by probe_server."""
+    api_base_url: str  # the base URL that answered /models (with or without /v1)
+    models: list[str] = field(default_factory=list)
+    streaming: bool = False  # `stream: true` returns Server-Sent Events
+    n: bool = False  # `n` > 1 returns several choices in one response
+    keep_alive: bool = False  # HTTP/1.1 connections are kept open between requests
+    probed_at: float = field(default_factory=time.time)
+
+
+def probe_server(api_base_url: str, api_key: str | None = None, model: str | None = None, timeout: float = PROBE_TIMEOUT) -> ServerCapabilities:
+    """
+    Probes an OpenAI-compatible server with a handful of tiny requests.
+
+    The base URL is tried with /v1 appended (the usual OpenAI-compatible
+    prefix) and as given; the first one whose /models endpoint answers is
+    used. Then three one-token-scale chat requests test the features that
+    pick LocalLLMService's request path (`n` and streaming), all over one
+    session so the keep-alive behaviour shows as well.
+
+    Args:
+        api_base_url: The configured base URL.
+        api_key: Optional bearer token.
+        model: Model used for the chat probes (default: the first listed model).
+        timeout: Seconds each probe request may take.
+
+    Returns:
+        The ServerCapabilities.
+
+    Raises:
+        requests.exceptions.RequestException: If the server can't be reached at all.
+    """
+    headers = {"Content-Type": "application/json"}
+    if api_key and api_key != "not-needed":
+        headers["Authorization"] = f"Bearer {api_key}"
+    base = api_base_url.rstrip("/")
+    candidates = [base] if base.endswith("/v1") else [f"{base}/v1", base]
+
+    with requests.Session() as session:
+        capabilities, models_response = None, None
+        for candidate in candidates:
+            response = session.get(f"{candidate}/models", headers=headers, timeout=timeout)
+            if response.ok:
+                models_response = response
+                capabilities = ServerCapabilities(api_base_url=candidate, models=_model_ids(response))
+                break
+        if capabilities is None:
+            # No /models endpoint; keep the URL as configured and probe chat directly.
+            capabilities = ServerCapabilities(api_base_url=base)
+        url = f"{capabilities.api_base_url}/chat/completions"
+        payload = {
+            "model": model or (capabilities.models[0] if capabilities.models else "local-model"),
+            "messages": _PROBE_MESSAGES,
+            "temperature": 0,
+            "max_tokens": 8,
+        }
+
+        def chat(**extra) -> requests.Response:
+            return session.post(url, headers=headers, data=json.dumps({**payload, **extra}), timeout=timeout, stream=extra.get("stream", False))
+
+        first = chat()
+        first.raise_for_status()
+        capabilities.keep_alive = _keeps_alive(first) and (models_response is None or _keeps_alive(models_response))
+
+        several = chat(n=2, temperature=0.7)
+        capabilities.n = several.ok and len(_json(several).get("choices") or []) == 2
+
+        streamed = chat(stream=True)
+        with streamed:
+            capabilities.streaming = streamed.ok and any(
+                line.startswith("data:") for line in streamed.iter_lines(decode_unicode=True) if line
+            )
+    return capabilities
+
+
+class CapabilityCache:
+    """
+    On-disk cache of probed server capabilities, one entry per endpoint.
+
+    Entries older than `ttl` seconds are probed again, so a service can rely on
+    a profile without paying for the probe requests on every start.
+    """
+
+    def __init__(self, path: str | None = None, ttl: float = DEFAULT_CAPABILITY_TTL):
+        """
+        Initializes the CapabilityCache.
+
+        Args:
+            path: JSON file holding the profiles (default: local_capabilities.json in the cache dir).
+            ttl: Seconds a profile stays valid.
+        """
+        self.path = path or os.path.join(default_cache_dir(), CAPABILITIES_FILENAME)
+        self.ttl = ttl
+        self.probes = 0  # probes run through this cache
+        self._profiles: dict[str, ServerCapabilities] = {}  # read or probed by this process
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str) -> ServerCapabilities | None:
+        """Returns the cached profile for `endpoint`, or None if missing or expired."""
+        endpoint = endpoint.rstrip("/")
+        capabilities = self._profiles.get(endpoint)
+        if capabilities is None:
+            entry = self._load().get(endpoint)
+            if not isinstance(entry, dict):
+                return None
+            known = {f.name for f in fields(ServerCapabilities)}
+            try:
+                capabilities = ServerCapabilities(**{key: value for key, value in entry.items() if key in known})
+            except TypeError:
+                return None
+            self._profiles[endpoint] = capabilities
+        if time.time() - capabilities.probed_at > self.ttl:
+            return None
+        return capabilities
+
+    def put(self, endpoint: str, capabilities: ServerCapabilities) -> None:
+        """Stores a profile for `endpoint`."""
+        endpoint = endpoint.rstrip("/")
+        with self._lock:
+            self._profiles[endpoint] = capabilities
+            endpoints = self._load()
+            endpoints[endpoint] = asdict(capabilities)
+            atomic_write_text(self.path, json.dumps({"version": CAPABILITIES_VERSION, "endpoints": endpoints}, indent=2, sort_keys=True))
+
+    def get_or_probe(
+        self,
+        endpoint: str,
+        api_key: str | None = None,
+        model: str | None = None,
+        refresh: bool = False,
+    ) -> ServerCapabilities:
+        """
+        Returns the cached profile for `endpoint`, probing (and caching) it when missing, expired or `refresh` is set.
+
+        Raises:
+            requests.exceptions.RequestException: If a probe was needed and the server can't be reached.
+        """
+        if not refresh:
+            cached = self.get(endpoint)
+            if cached is not None:
+                return cached
+        capabilities = probe_server(endpoint, api_key=api_key, model=model)
+        self.probes += 1
+        self.put(endpoint, capabilities)
+        return capabilities
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != CAPABILITIES_VERSION:
+            return {}
+        return data.get("endpoints") or {}
+
+
+def _json(response: requests.Response) -> dict:
+    try:
+        data = response.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _model_ids(response: requests.Response) -> list[str]:
+    data = _json(response).get("data")
+    if not isinstance(data, list):
+        return []
+    return [entry["id"] for entry in data if isinstance(entry, dict) and isinstance(entry.get("id"), str)]
+
+
+def _keeps_alive(response: requests.Response) -> bool:
+    # urllib3 reports the protocol as 10 or 11; HTTP/1.1 keeps connections open unless told otherwise.
+    version = getattr(response.raw, "version", 11)
+    return version != 10 and response.headers.get("Connection", "").lower() != "close"
@@ -0,0 +1,696 @@
+import contextvars
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import anthropic
+import requests
+
+from .claude_service import ClaudeService
+from .llm_service import CompletionStream, LLMConfigurationError, LLMService, LLMServiceError
+from .local_llm_service import LocalLLMService
+from .local_transport import abort_response
+from .storage import atomic_write_bytes
+
+CASSETTE_VERSION = 2
+# Public service methods whose calls are recorded and replayed.
+RECORDED_METHODS = ("generate_code", "stream_code", "generate_multi_language", "refine_code", "complete", "stream_complete")
+_STREAMING_METHODS = {"stream_code", "stream_complete"}
+
+
+class CassetteMissError(LLMConfigurationError):
+    """Raised when a replayed request has no recorded exchange."""
+    pass
+
+
+def exchange_key(service: str, request: dict) -> str:
+    """
+    Identifies a request for replay matching.
+
+    Only the conversation (system prompt, messages) and whether it streams are
+    keyed, so tuning parameters such as temperature or max_tokens can change
+    between code versions without breaking replay.
+    """
+    identity = {
+        "service": service,
+        "system": request.get("system"),
+        "messages": request.get("messages"),
+        "stream": bool(request.get("stream")),
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Exchange:
+    """One recorded request/response exchange. Times are in seconds."""
+    service: str  # "local" or "claude"
+    request: dict
+    offset: float  # when the request was sent, relative to the first recorded request
+    latency: float  # until the response (headers for streams) arrived
+    status: int = 200
+    body: str | dict | None = None  # response text (local) or message dict (claude)
+    chunks: list[list] | None = None  # streamed [seconds since request, line or text] pairs
+    error: str | None = None  # "ExceptionClass: message" when the request failed
+    url: str | None = None
+
+    @property
+    def key(self) -> str:
+        return exchange_key(self.service, self.request)
+
+    @property
+    def duration(self) -> float:
+        """Total time until the last byte of the response."""
+        return self.chunks[-1][0] if self.chunks else self.latency
+
+
+@dataclass
+class Call:
+    """One recorded call of a public service method (see RECORDED_METHODS). Times are in seconds."""
+    service: str  # "local" or "claude"
+    method: str
+    args: dict  # keyword arguments of the call
+    offset: float  # when the call was made, relative to the first recorded request
+    latency: float = 0.0  # until the call returned; for streams, until the stream ended
+    error: str | None = None
+
+
+class Cassette:
+    """
+    Recorded service calls and backend exchanges, stored as gzip-compressed JSON lines.
+
+    A cassette with a path is recorded incrementally: each call and exchange is
+    appended to the file as its own gzip member and flushed as soon as it
+    finishes, so memory stays flat however long the recording runs and a crash
+    loses only what was in flight. Without a path, records are kept in memory
+    (`calls`, `exchanges`). Recording is thread-safe.
+    """
+
+    def __init__(self, path: str | None = None, exchanges: list[Exchange] | None = None, calls: list[Call] | None = None):
+        self.path = path
+        self.exchanges: list[Exchange] = exchanges or []
+        self.calls: list[Call] = calls or []
+        self.recorded_calls = 0
+        self.recorded_exchanges = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._started: float | None = None
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        """
+        Loads a cassette file into memory.
+
+        A final record cut off by a crash during recording is skipped.
+
+        Raises:
+            LLMConfigurationError: If the file is missing or not a cassette.
+        """
+        lines = []
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                try:
+                    for line in f:
+                        lines.append(line)
+                except (EOFError, gzip.BadGzipFile):
+                    pass  # the last gzip member was not finished
+            if lines and not lines[-1].endswith("\n"):
+                lines.pop()
+            header = json.loads(lines[0]) if lines else {}
+            if header.get("version") != CASSETTE_VERSION:
+                raise LLMConfigurationError(f"Unsupported cassette version in {path}: {header.get('version')}")
+            exchanges, calls = [], []
+            for line in lines[1:]:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.pop("kind", None) == "call":
+                    calls.append(Call(**record))
+                else:
+                    exchanges.append(Exchange(**record))
+        except (OSError, ValueError, TypeError) as e:
+            raise LLMConfigurationError(f"Could not read cassette {path}: {e}")
+        # Records are appended as they finish; replay wants them in arrival order.
+        return cls(exchanges=sorted(exchanges, key=lambda e: e.offset), calls=sorted(calls, key=lambda c: c.offset))
+
+    def clock(self) -> float:
+        """Returns the offset to record for a request starting now."""
+        now = time.monotonic()
+        with self._lock:
+            if self._started is None:
+                self._started = now
+            return now - self._started
+
+    def add(self, record: Exchange | Call) -> None:
+        """Records a finished exchange or call: appended to the file, or kept in memory without a path."""
+        with self._lock:
+            if isinstance(record, Call):
+                self.recorded_calls += 1
+            else:
+                self.recorded_exchanges += 1
+            if self.path is None:
+                (self.calls if isinstance(record, Call) else self.exchanges).append(record)
+                return
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "wb")
+                self._file.write(gzip.compress(_header_line()))
+            self._file.write(gzip.compress(_record_line(record)))
+            self._file.flush()
+
+    def close(self) -> None:
+        """Closes the file of an incremental recording."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def save(self, path: str | None = None) -> None:
+        """Writes the in-memory calls and exchanges to `path` (default: the cassette's path) atomically."""
+        path = path or self.path
+        with self._lock:
+            records = sorted([*self.calls, *self.exchanges], key=lambda r: r.offset)
+        data = _header_line() + b"".join(_record_line(record) for record in records)
+        atomic_write_bytes(path, gzip.compress(data))
+
+
+def _header_line() -> bytes:
+    return (json.dumps({"version": CASSETTE_VERSION}) + "\n").encode("utf-8")
+
+
+def _record_line(record: Exchange | Call) -> bytes:
+    fields = {k: v for k, v in record.__dict__.items() if v is not None}
+    if isinstance(record, Call):
+        fields = {"kind": "call", **fields}
+    return (json.dumps(fields, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _elapsed(started: float) -> float:
+    return round(time.monotonic() - started, 4)
+
+
+class _Player:
+    """Hands out recorded exchanges by key, in recording order; the last one is reused once exhausted."""
+
+    def __init__(self, cassette: Cassette, time_scale: float):
+        self.time_scale = time_scale
+        self._queues: dict[str, deque[Exchange]] = {}
+        self._lock = threading.Lock()
+        for exchange in cassette.exchanges:
+            self._queues.setdefault(exchange.key, deque()).append(exchange)
+
+    def next(self, service: str, request: dict) -> Exchange:
+        with self._lock:
+            exchanges = self._queues.get(exchange_key(service, request))
+            if not exchanges:
+                raise CassetteMissError(f"No recorded {service} exchange matches this request.")
+            return exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+
+    def sleep_until(self, started: float, offset: float, interrupt: threading.Event | None = None) -> None:
+        delay = offset * self.time_scale - (time.monotonic() - started)
+        if delay > 0:
+            if interrupt is not None:
+                interrupt.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+# --- Local (OpenAI-compatible HTTP) --------------------------------------------------------------
+
+
+class RecordingTransport:
+    """
+    Transport for LocalLLMService that records every chat-completion exchange.
+
+    Requests are passed to `inner` (requests, a Session or a LocalTransport)
+    unchanged; streamed responses are recorded line by line with their timing.
+    """
+
+    def __init__(self, cassette: Cassette, inner=requests):
+        self.cassette = cassette
+        self.inner = inner
+
+    def get(self, url: str, **kwargs):
+        return self.inner.get(url, **kwargs)
+
+    def post(self, url: str, headers: dict | None = None, data: str | bytes | None = None, timeout: float | None = None, stream: bool = False):
+        offset = self.cassette.clock()
+        started = time.monotonic()
+        payload = json.loads(data) if data else {}
+        exchange = Exchange(service="local", request=payload, offset=round(offset, 4), latency=0.0, url=url)
+        try:
+            response = self.inner.post(url, headers=headers, data=data, timeout=timeout, stream=stream)
+        except Exception as e:
+            exchange.latency, exchange.error = _elapsed(started), f"{type(e).__name__}: {e}"
+            self.cassette.add(exchange)
+            raise
+        exchange.latency, exchange.status = _elapsed(started), response.status_code
+        if stream and response.status_code < 400:
+            return _RecordingStream(response, exchange, self.cassette, started)
+        exchange.body = response.text
+        self.cassette.add(exchange)
+        return response
+
+
+class _RecordingStream:
+    def __init__(self, response, exchange: Exchange, cassette: Cassette, started: float):
+        self._response = response
+        self._exchange = exchange
+        self._cassette = cassette
+        self._started = started
+        self._recorded = False
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def raise_for_status(self) -> None:
+        self._response.raise_for_status()
+
+    def iter_lines(self, decode_unicode: bool = False):
+        chunks = self._exchange.chunks = []
+        try:
+            for line in self._response.iter_lines(decode_unicode=decode_unicode):
+                text = line if isinstance(line, str) else line.decode("utf-8")
+                chunks.append([_elapsed(self._started), text])
+                yield line
+        finally:
+            self._finish()
+
+    def close(self) -> None:
+        self._finish()
+        self._response.close()
+
+    def abort(self) -> None:
+        abort_response(self._response)
+
+    def _finish(self) -> None:
+        if not self._recorded:
+            self._recorded = True
+            self._cassette.add(self._exchange)
+
+
+class ReplayTransport:
+    """
+    Transport for LocalLLMService that answers from a cassette instead of a server.
+
+    Each response is delayed like the original (latency, then every streamed
+    line at its recorded time), multiplied by `time_scale`: 1.0 reproduces the
+    original timing, 0.5 runs twice as fast and 0 replays instantly.
+    """
+
+    def __init__(self, cassette: Cassette, time_scale: float = 1.0):
+        self._player = _Player(cassette, time_scale)
+
+    def get(self, url: str, **kwargs):
+        return _ReplayResponse(200, "{}", None, self._player, time.monotonic())
+
+    def post(self, url: str, headers: dict | None = None, data: str | bytes | None = None, timeout: float | None = None, stream: bool = False):
+        started = time.monotonic()
+        exchange = self._player.next("local", json.loads(data) if data else {})
+        self._player.sleep_until(started, exchange.latency)
+        if exchange.error:
+            error_type, _, message = exchange.error.partition(": ")
+            if error_type in ("Timeout", "ReadTimeout", "ConnectTimeout"):
+                raise requests.exceptions.Timeout(message)
+            raise requests.exceptions.ConnectionError(message)
+        return _ReplayResponse(exchange.status, exchange.body or "", exchange.chunks, self._player, started)
+
+
+class _ReplayResponse:
+    def __init__(self, status_code: int, text: str, chunks: list[list] | None, player: _Player, started: float):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+        self._chunks = chunks or []
+        self._player = player
+        self._started = started
+        self._aborted = threading.Event()
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (replayed)", response=self)
+
+    def iter_lines(self, decode_unicode: bool = False):
+        for offset, line in self._chunks:
+            self._player.sleep_until(self._started, offset, self._aborted)
+            if self._aborted.is_set():
+                return
+            yield line if decode_unicode else line.encode("utf-8")
+
+    def close(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        self._aborted.set()
+
+
+# --- Claude (Anthropic SDK) ----------------------------------------------------------------------
+
+
+def _claude_request(kwargs: dict, stream: bool) -> dict:
+    request = {k: kwargs[k] for k in ("model", "system", "messages", "max_tokens") if k in kwargs}
+    if stream:
+        request["stream"] = True
+    return request
+
+
+class RecordingAnthropicClient:
+    """Wraps an Anthropic client, recording messages.create and messages.stream exchanges."""
+
+    def __init__(self, client, cassette: Cassette):
+        self._client = client
+        self.messages = _RecordingMessages(client.messages, cassette)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _RecordingMessages:
+    def __init__(self, messages, cassette: Cassette):
+        self._messages = messages
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        exchange = Exchange(service="claude", request=_claude_request(kwargs, False), offset=round(self._cassette.clock(), 4), latency=0.0)
+        started = time.monotonic()
+        try:
+            response = self._messages.create(**kwargs)
+        except Exception as e:
+            exchange.latency, exchange.error = _elapsed(started), f"{type(e).__name__}: {e}"
+            self._cassette.add(exchange)
+            raise
+        exchange.latency = _elapsed(started)
+        exchange.body = response.model_dump(mode="json", exclude_none=True) if hasattr(response, "model_dump") else None
+        self._cassette.add(exchange)
+        return response
+
+    def stream(self, **kwargs):
+        exchange = Exchange(service="claude", request=_claude_request(kwargs, True), offset=round(self._cassette.clock(), 4), latency=0.0, chunks=[])
+        return _RecordingClaudeStream(self._messages.stream(**kwargs), exchange, self._cassette)
+
+
+class _RecordingClaudeStream:
+    def __init__(self, manager, exchange: Exchange, cassette: Cassette):
+        self._manager = manager
+        self._exchange = exchange
+        self._cassette = cassette
+        self._started = time.monotonic()
+
+    def __enter__(self):
+        try:
+            self._stream = self._manager.__enter__()
+        except Exception as e:
+            self._exchange.error = f"{type(e).__name__}: {e}"
+            self._exchange.latency = _elapsed(self._started)
+            self._cassette.add(self._exchange)
+            raise
+        self._exchange.latency = _elapsed(self._started)
+        return self
+
+    @property
+    def text_stream(self):
+        for text in self._stream.text_stream:
+            self._exchange.chunks.append([_elapsed(self._started), text])
+            yield text
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        self._exchange.body = message.model_dump(mode="json", exclude_none=True) if hasattr(message, "model_dump") else None
+        return message
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def __exit__(self, *exc_info):
+        self._cassette.add(self._exchange)
+        return self._manager.__exit__(*exc_info)
+
+
+class ReplayAnthropicClient:
+    """Stands in for an Anthropic client, answering messages.create/stream from a cassette."""
+
+    def __init__(self, cassette: Cassette, time_scale: float = 1.0):
+        player = _Player(cassette, time_scale)
+        self.messages = _ReplayMessages(player)
+        self.models = _ReplayModels()
+
+
+class _ReplayModels:
+    def list(self, **kwargs):
+        return []
+
+
+class _ReplayMessages:
+    def __init__(self, player: _Player):
+        self._player = player
+
+    def _next(self, kwargs: dict, stream: bool) -> tuple[Exchange, float]:
+        started = time.monotonic()
+        exchange = self._player.next("claude", _claude_request(kwargs, stream))
+        self._player.sleep_until(started, exchange.latency)
+        if exchange.error:
+            # SDK errors need live HTTP objects to construct; a plain error keeps the message.
+            raise RuntimeError(exchange.error)
+        return exchange, started
+
+    def create(self, **kwargs):
+        exchange, _ = self._next(kwargs, stream=False)
+        return anthropic.types.Message.model_validate(exchange.body)
+
+    def stream(self, **kwargs):
+        return _ReplayClaudeStream(self, kwargs)
+
+
+class _ReplayClaudeStream:
+    def __init__(self, messages: _ReplayMessages, kwargs: dict):
+        self._messages = messages
+        self._kwargs = kwargs
+        self._closed = False
+
+    def __enter__(self):
+        self._exchange, self._started = self._messages._next(self._kwargs, stream=True)
+        return self
+
+    @property
+    def text_stream(self):
+        for offset, text in self._exchange.chunks or []:
+            if self._closed:
+                return
+            self._messages._player.sleep_until(self._started, offset)
+            yield text
+
+    def get_final_message(self):
+        if self._exchange.body is None:
+            return None  # recorded before final messages were kept
+        return anthropic.types.Message.model_validate(self._exchange.body)
+
+    def close(self) -> None:
+        self._closed = True
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# --- Wiring and traffic replay --------------------------------------------------------------------
+
+
+def record_service(llm: LLMService, cassette: Cassette) -> LLMService:
+    """
+    Switches a service into capture mode, recording to `cassette`.
+
+    Every backend exchange is recorded, and so is every call of the service's
+    public methods (RECORDED_METHODS) made from outside the service; replay
+    re-issues those calls, so the client-side code under test (continuations,
+    candidates, extraction) runs again.
+
+    Returns:
+        The same service, for chaining.
+
+    Raises:
+        LLMConfigurationError: If the service type can't be recorded.
+    """
+    if isinstance(llm, LocalLLMService):
+        service = "local"
+        llm.transport = RecordingTransport(cassette, inner=llm._http)
+    elif isinstance(llm, ClaudeService):
+        service = "claude"
+        llm.client = RecordingAnthropicClient(llm.client, cassette)
+    else:
+        raise LLMConfigurationError(f"Recording is not supported for {type(llm).__name__}.")
+    for name in RECORDED_METHODS:
+        setattr(llm, name, _recording_method(getattr(llm, name), name, service, cassette))
+    return llm
+
+
+# Set while a recorded call runs, so the calls it makes to other public methods aren't recorded as well.
+_in_recorded_call = contextvars.ContextVar("in_recorded_call", default=False)
+
+
+def _recording_method(method, name: str, service: str, cassette: Cassette):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def record(*args, **kwargs):
+        if _in_recorded_call.get():
+            return method(*args, **kwargs)
+        call = Call(service=service, method=name, args=dict(signature.bind(*args, **kwargs).arguments), offset=round(cassette.clock(), 4))
+        started = time.monotonic()
+        token = _in_recorded_call.set(True)
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            call.latency, call.error = _elapsed(started), f"{type(e).__name__}: {e}"
+            cassette.add(call)
+            raise
+        finally:
+            _in_recorded_call.reset(token)
+        if name not in _STREAMING_METHODS:
+            call.latency = _elapsed(started)
+            cassette.add(call)
+            return result
+        stream = result if isinstance(result, CompletionStream) else CompletionStream(result)
+        stream.chunks = _recording_chunks(stream.chunks, call, cassette, started)
+        return stream
+    return record
+
+
+def _recording_chunks(chunks, call: Call, cassette: Cassette, started: float):
+    try:
+        yield from chunks
+    except Exception as e:
+        call.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        call.latency = _elapsed(started)
+        cassette.add(call)
+
+
+def replay_services(cassette: Cassette, time_scale: float = 1.0) -> dict[str, LLMService]:
+    """
+    Builds services that answer from the cassette, one per recorded service type.
+
+    Returns:
+        A dict mapping "local"/"claude" to a service wired to a replay transport.
+    """
+    services: dict[str, LLMService] = {}
+    kinds = {exchange.service for exchange in cassette.exchanges}
+    if "local" in kinds:
+        first = next(e for e in cassette.exchanges if e.service == "local")
+        services["local"] = LocalLLMService(
+            api_base_url=first.url.rsplit("/chat/completions", 1)[0],
+            model=first.request.get("model"),
+            transport=ReplayTransport(cassette, time_scale),
+        )
+    if "claude" in kinds:
+        first = next(e for e in cassette.exchanges if e.service == "claude")
+        claude = ClaudeService(api_key="replay", model=first.request.get("model"))
+        claude.client = ReplayAnthropicClient(cassette, time_scale)
+        services["claude"] = claude
+    return services
+
+
+@dataclass
+class ReplayReport:
+    """Latency and throughput of a traffic replay, next to the recorded originals (seconds)."""
+    requests: int  # replayed service calls
+    errors: int
+    wall_time: float
+    latencies: list[float] = field(default_factory=list)
+    recorded_latencies: list[float] = field(default_factory=list)
+    recorded_wall_time: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.wall_time if self.wall_time else 0.0
+
+    def summary(self) -> dict:
+        def quantiles(values: list[float]) -> dict:
+            if not values:
+                return {"p50_ms": None, "p95_ms": None}
+            ordered = sorted(values)
+            return {
+                "p50_ms": round(statistics.median(ordered) * 1000, 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 1),
+            }
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "wall_time_s": round(self.wall_time, 3),
+            "throughput_rps": round(self.throughput, 2),
+            **quantiles(self.latencies),
+            "recorded": {"wall_time_s": round(self.recorded_wall_time, 3), **quantiles(self.recorded_latencies)},
+        }
+
+
+def _replay_call(llm: LLMService, call: Call) -> None:
+    """Re-issues one recorded call through the service's public method, consuming streams."""
+    result = getattr(llm, call.method)(**call.args)
+    if call.method in _STREAMING_METHODS:
+        for _ in result:
+            pass
+
+
+def replay_traffic(cassette: Cassette, time_scale: float = 1.0, concurrency: int = 32) -> ReplayReport:
+    """
+    Replays recorded traffic through the current service code.
+
+    The recorded service calls are re-issued through the same public methods
+    at their recorded arrival offsets (scaled by `time_scale`), against replay
+    transports that reproduce the recorded backend timing, so differences in
+    latency and throughput come from the client-side code under test.
+
+    Args:
+        cassette: The recorded traffic.
+        time_scale: Multiplier for arrival offsets and backend timing (0 = as fast as possible).
+        concurrency: Maximum calls in flight.
+
+    Returns:
+        A ReplayReport.
+    """
+    services = replay_services(cassette, time_scale)
+    calls = sorted(cassette.calls, key=lambda c: c.offset)
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def run(call: Call) -> None:
+        nonlocal errors
+        delay = call.offset * time_scale - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+        request_started = time.monotonic()
+        llm = services.get(call.service)
+        try:
+            if llm is None:
+                raise CassetteMissError(f"No recorded {call.service} exchanges to replay {call.method} against.")
+            _replay_call(llm, call)
+            failed = bool(call.error)
+        except LLMServiceError:
+            failed = True
+        with lock:
+            latencies.append(time.monotonic() - request_started)
+            errors += failed
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as executor:
+        list(executor.map(run, calls))
+
+    recorded_wall = max((c.offset + c.latency for c in calls), default=0.0)
+    return ReplayReport(
+        requests=len(calls),
+        errors=errors,
+        wall_time=time.monotonic() - started,
+        latencies=latencies,
+        recorded_latencies=[c.latency for c in calls],
+        recorded_wall_time=recorded_wall,
+    )
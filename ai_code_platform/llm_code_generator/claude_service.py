@@ -1,8 +1,13 @@
 import os
-import os
+from typing import Iterator
 import anthropic
-import re # For markdown stripping
-from .llm_service import LLMService, LLMAPIError, LLMConfigurationError
+from .client_registry import CLIENT_REGISTRY, AnthropicClientRegistry
+from .code_extraction import extract_code
+from .history_store import HistoryStore
+from .cancellation import on_cancel
+from .llm_service import Completion, CompletionStream, LLMService, LLMAPIError, LLMConfigurationError
+from .output_stats import OutputLengthStats
+from .profiling import phase
 
 class ClaudeService(LLMService):
     """
@@ -10,7 +15,15 @@ class ClaudeService(LLMService):
     """
     DEFAULT_MODEL = "claude-3-opus-20240229" # Or a smaller/faster model like claude-3-haiku-20240307
 
-    def __init__(self, api_key: str | None = None, model: str | None = None):
+    def __init__(
+        self,
+        api_key: str | None = None,
+        model: str | None = None,
+        output_stats: OutputLengthStats | None = None,
+        history: HistoryStore | None = None,
+        base_url: str | None = None,
+        registry: AnthropicClientRegistry | None = None,
+    ):
         """
         Initializes the ClaudeService.
 
@@ -19,6 +32,13 @@ class ClaudeService(LLMService):
                      the ANTHROPIC_API_KEY environment variable.
             model: The Claude model to use (e.g., "claude-3-opus-20240229").
                    Defaults to ClaudeService.DEFAULT_MODEL.
+            output_stats: Optional OutputLengthStats used to size max_tokens adaptively.
+            history: Optional HistoryStore recording every generation.
+            base_url: Optional API base URL (e.g., a proxy). Defaults to the SDK's.
+            registry: Registry providing the client. Services with the same API key
+                      and base URL share one client and its connection pool.
+                      Defaults to the process-wide CLIENT_REGISTRY. A service
+                      used after fork() fetches the child's client from it.
 
         Raises:
             LLMConfigurationError: If the API key is not provided or found in env variables.
@@ -29,94 +49,193 @@ class ClaudeService(LLMService):
                 "Anthropic API key not provided or found in ANTHROPIC_API_KEY environment variable."
             )
         self.model = model or self.DEFAULT_MODEL
+        self.output_stats = output_stats
+        self.history = history
+        self.base_url = base_url
+        self._registry = registry if registry is not None else CLIENT_REGISTRY
+        self._client = None
+        self._client_pid = None
+        self._client_assigned = False
         try:
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+            self.client  # build (or fetch) it now, so configuration errors surface here
         except Exception as e:
             raise LLMConfigurationError(f"Failed to initialize Anthropic client: {e}")
 
+    @property
+    def client(self) -> anthropic.Anthropic:
+        """
+        The Anthropic client, from the registry.
 
-    def generate_code(self, prompt: str, language: str) -> str:
+        Pooled connections must not be shared with a forked child, so in a new
+        process the client is fetched again (the registry starts empty there).
+        A client assigned to the attribute (e.g. a cassette wrapper) is kept as is.
         """
-        Generates code using the Claude API.
+        pid = os.getpid()
+        if self._client_pid != pid and not self._client_assigned:
+            self._client = self._registry.get(self.api_key, self.base_url)
+            self._client_pid = pid
+        return self._client
 
-        Args:
-            prompt: The natural language prompt.
-            language: The programming language (e.g., "python").
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+        self._client_assigned = True
 
-        Returns:
-            The generated code as a string.
+
+    def _create_message(self, system_prompt: str, messages: list[dict], max_tokens: int = 2048) -> Completion:
+        """
+        Sends one Messages API request and returns the first text block.
 
         Raises:
             LLMAPIError: If there's an error during the API call.
         """
-        system_prompt = f"You are a helpful coding assistant. Generate only the {language} code for the following prompt. Do not include any explanatory text or markdown formatting around the code. Just output the raw code."
-
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2048, # Adjust as needed
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-            )
+            with phase("sdk"):
+                response = self.client.messages.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    system=system_prompt,
+                    messages=messages,
+                )
 
             if response.content and isinstance(response.content, list) and len(response.content) > 0:
                 # Assuming the first content block is the code
                 # Further checks might be needed if Claude sends multiple blocks or non-text blocks
                 block = response.content[0]
                 if hasattr(block, 'text'):
-                    raw_code = block.text.strip()
-                    # Unit tests may provide mocked responses where newline
-                    # characters are escaped ("\\n") instead of real newlines.
-                    # Normalize for parsing and restore the original form when
-                    # returning the final code string.
-                    escaped_newlines = "\\n" in raw_code and "\n" not in raw_code
-                    if escaped_newlines:
-                        raw_code = raw_code.replace("\\n", "\n")
-
-                    # Try to extract from language-specific block first
-                    # Pattern: ```python\n(.*?)```
-                    match_lang = re.search(f"```{re.escape(language)}\\s*\\n(.*?)\\n```", raw_code, re.DOTALL)
-                    if match_lang:
-                        result = match_lang.group(1).strip()
-                        return result.replace("\n", "\\n") if escaped_newlines else result
-
-                    # If not found, try to extract from a generic block: ```\n(.*?)```
-                    match_generic = re.search(r"```\s*\\n(.*?)\\n```", raw_code, re.DOTALL)
-                    if match_generic:
-                        result = match_generic.group(1).strip()
-                        return result.replace("\n", "\\n") if escaped_newlines else result
-
-                    # If still no fenced block, but it starts/ends with ``` (e.g. ```code``` on one line, or ```\ncode\n```)
-                    if raw_code.startswith("```") and raw_code.endswith("```"):
-                        # Strip initial ``` and final ```
-                        stripped_code = raw_code[3:-3].strip()
-                        # If what remains starts with the language (e.g. "python\n..."), remove that line.
-                        # This handles cases like ```python\ncode``` where the earlier regex didn't match due to no newline after lang.
-                        lines = stripped_code.splitlines()
-                        if lines and lines[0].strip().lower() == language.lower(): # Check if first line is just the language
-                            stripped_code = "\n".join(lines[1:]).strip()
-                        return stripped_code.replace("\n", "\\n") if escaped_newlines else stripped_code
-
-                    # If none of the above, assume it's raw code or LLM didn't use fences as expected
-                    return raw_code.replace("\n", "\\n") if escaped_newlines else raw_code
+                    usage = getattr(response, "usage", None)
+                    return Completion(
+                        text=block.text,
+                        finish_reason=_str_or_none(getattr(response, "stop_reason", None)),
+                        input_tokens=_int_or_none(getattr(usage, "input_tokens", None)),
+                        output_tokens=_int_or_none(getattr(usage, "output_tokens", None)),
+                    )
                 else:
                     raise LLMAPIError("Claude API response content block does not have text.")
             else:
                 raise LLMAPIError("Claude API returned an empty or unexpected response content.")
 
-        except anthropic.APIConnectionError as e:
-            raise LLMAPIError(f"Claude API connection error: {e}")
-        except anthropic.RateLimitError as e:
-            raise LLMAPIError(f"Claude API rate limit exceeded: {e}")
-        except anthropic.APIStatusError as e:
-            raise LLMAPIError(f"Claude API status error (status {e.status_code}): {e.response}")
+        except LLMAPIError:
+            raise
+        except Exception as e:
+            raise self._api_error(e)
+
+    def _preconnect(self) -> None:
+        """
+        Opens the client's pooled TLS connection with a cheap model-list request.
+
+        Raises:
+            LLMAPIError: If the API can't be reached or rejects the key.
+        """
+        try:
+            self.client.models.list(limit=1)
         except Exception as e:
-            raise LLMAPIError(f"An unexpected error occurred while calling Claude API: {e}")
+            raise self._api_error(e)
+
+    def _api_error(self, e: Exception) -> LLMAPIError:
+        """Translates an exception raised by the Anthropic client into an LLMAPIError."""
+        if isinstance(e, anthropic.APIConnectionError):
+            return LLMAPIError(f"Claude API connection error: {e}")
+        if isinstance(e, anthropic.RateLimitError):
+            return LLMAPIError(f"Claude API rate limit exceeded: {e}")
+        if isinstance(e, anthropic.APIStatusError):
+            return LLMAPIError(f"Claude API status error (status {e.status_code}): {e.response}")
+        return LLMAPIError(f"An unexpected error occurred while calling Claude API: {e}")
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> Completion:
+        """
+        Sends a raw single-turn request to the Claude API.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        return self._create_message(system_prompt, [{"role": "user", "content": prompt}], max_tokens=max_tokens)
+
+    def _continue(self, system_prompt: str, prompt: str, partial: str, max_tokens: int) -> tuple[str, Completion]:
+        """
+        Continues a truncated reply by prefilling it as the assistant turn.
+
+        The model picks up exactly where the prefill ends, so the parts are simply
+        concatenated. The API rejects prefills ending in whitespace, hence the rstrip.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        prefill = partial.rstrip()
+        messages = [{"role": "user", "content": prompt}, {"role": "assistant", "content": prefill}]
+        completion = self._create_message(system_prompt, messages, max_tokens=max_tokens)
+        return prefill + completion.text, completion
+
+    def stream_complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> CompletionStream:
+        """
+        Streams a raw single-turn completion from the Claude API.
+
+        Closing the returned stream closes the underlying HTTP stream, and so does
+        cancelling the cancel scope the request runs in (see cancellation.on_cancel).
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        result = CompletionStream()
+        result.chunks = self._stream_message(system_prompt, prompt, max_tokens, result)
+        return result
+
+    def _stream_message(self, system_prompt: str, prompt: str, max_tokens: int, result: CompletionStream) -> Iterator[str]:
+        try:
+            with self.client.messages.stream(
+                model=self.model,
+                max_tokens=max_tokens,
+                system=system_prompt,
+                messages=[{"role": "user", "content": prompt}],
+            ) as stream:
+                on_cancel(stream.close)
+                for text in stream.text_stream:
+                    yield text
+                message = stream.get_final_message()
+                usage = getattr(message, "usage", None)
+                result.finish_reason = _str_or_none(getattr(message, "stop_reason", None))
+                result.input_tokens = _int_or_none(getattr(usage, "input_tokens", None))
+                result.output_tokens = _int_or_none(getattr(usage, "output_tokens", None))
+        except Exception as e:
+            raise self._api_error(e)
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        """
+        Generates code using the Claude API.
+
+        Args:
+            prompt: The natural language prompt.
+            language: The programming language (e.g., "python").
+            candidates: Number of candidates to request. The Messages API has no
+                        `n` parameter, so candidates are requested concurrently and
+                        the first one to pass validation is returned.
+
+        Returns:
+            The generated code as a string.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+            LLMValidationError: If candidates > 1 and none passes validation.
+        """
+        system_prompt = self._system_prompt(language)
+
+        def produce(streamed: bool = False) -> str:
+            text = self._complete_code(system_prompt, prompt, language, streamed=streamed).text
+            with phase("extract"):
+                return extract_code(text, language)
+
+        if candidates > 1:
+            # Streamed, so the candidates still running when one passes are aborted.
+            return self._select_first_valid([lambda: produce(streamed=True)] * candidates, language)
+        return produce()
+
+
+def _int_or_none(value) -> int | None:
+    return value if isinstance(value, int) else None
+
+
+def _str_or_none(value) -> str | None:
+    return value if isinstance(value, str) else None
 
 if __name__ == '__main__':
     # This is for basic manual testing.
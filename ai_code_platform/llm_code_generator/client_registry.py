@@ -0,0 +1,135 @@
+import os
+import threading
+from dataclasses import dataclass, replace
+
+import anthropic
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    """Connection tuning for registry clients. None keeps the SDK default."""
+    max_connections: int | None = None
+    max_keepalive_connections: int | None = None
+    keepalive_expiry: float | None = None  # seconds an idle pooled connection is kept open
+    timeout: float | None = None  # read, write and pool timeout in seconds
+    connect_timeout: float | None = None
+    max_retries: int | None = None
+
+    def client_kwargs(self) -> dict:
+        """Returns the extra anthropic.Anthropic() arguments these settings need."""
+        kwargs = {}
+        if self.timeout is not None or self.connect_timeout is not None:
+            default = anthropic.DEFAULT_TIMEOUT
+            kwargs["timeout"] = anthropic.Timeout(
+                self.timeout if self.timeout is not None else default.read,
+                connect=self.connect_timeout if self.connect_timeout is not None else default.connect,
+            )
+        if self.max_retries is not None:
+            kwargs["max_retries"] = self.max_retries
+        if any(value is not None for value in (self.max_connections, self.max_keepalive_connections, self.keepalive_expiry)):
+            default = anthropic.DEFAULT_CONNECTION_LIMITS
+            # The SDK re-exports its HTTP library's Limits only through this default instance.
+            limits = type(default)(
+                max_connections=self.max_connections if self.max_connections is not None else default.max_connections,
+                max_keepalive_connections=(
+                    self.max_keepalive_connections if self.max_keepalive_connections is not None else default.max_keepalive_connections
+                ),
+                keepalive_expiry=self.keepalive_expiry if self.keepalive_expiry is not None else default.keepalive_expiry,
+            )
+            kwargs["http_client"] = anthropic.DefaultHttpxClient(limits=limits, timeout=kwargs.get("timeout", anthropic.DEFAULT_TIMEOUT))
+        return kwargs
+
+
+class AnthropicClientRegistry:
+    """
+    Process-wide cache of Anthropic clients, one per API key and base URL.
+
+    An anthropic.Anthropic client owns a connection pool and is safe to share
+    between threads, so ClaudeService instances created per request or per
+    thread reuse one client (and its keep-alive connections) instead of
+    building a new client and TLS connection every time.
+
+    Pooled connections must not be shared between processes. After a fork the
+    registry notices the new process id and starts empty, without closing the
+    parent's clients, whose sockets the child inherited.
+    """
+
+    def __init__(self, settings: ClientSettings | None = None):
+        """
+        Initializes the AnthropicClientRegistry.
+
+        Args:
+            settings: Connection tuning for the clients it creates.
+        """
+        self.settings = settings or ClientSettings()
+        self.created = 0  # clients constructed in this process
+        self._lock = threading.Lock()
+        self._clients: dict[tuple[str, str | None], anthropic.Anthropic] = {}
+        self._pid = os.getpid()
+
+    def get(self, api_key: str, base_url: str | None = None) -> anthropic.Anthropic:
+        """
+        Returns the shared client for this API key and base URL, creating it on first use.
+
+        Raises:
+            Exception: Whatever anthropic.Anthropic raises if the client can't be built.
+        """
+        self._check_fork()
+        key = (api_key, base_url)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                kwargs = {"api_key": api_key}
+                if base_url is not None:
+                    kwargs["base_url"] = base_url
+                client = anthropic.Anthropic(**kwargs, **self.settings.client_kwargs())
+                self._clients[key] = client
+                self.created += 1
+            return client
+
+    def configure(self, **settings) -> None:
+        """
+        Changes connection settings (see ClientSettings) for clients created from now on.
+
+        Existing clients are dropped from the registry, so every later get() uses
+        the new settings. They are not closed: services that already hold one keep
+        working with the old settings until they are discarded.
+        """
+        self.settings = replace(self.settings, **settings)
+        self.clear()
+
+    def clear(self) -> None:
+        """Forgets every client, leaving them open for the services still using them."""
+        self._check_fork()
+        with self._lock:
+            self._clients = {}
+
+    def close(self) -> None:
+        """Closes and forgets every client. Only for shutdown, when no service uses them anymore."""
+        self._check_fork()
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+
+    def __len__(self) -> int:
+        self._check_fork()
+        return len(self._clients)
+
+    def _check_fork(self) -> None:
+        pid = os.getpid()
+        if pid != self._pid:
+            # The lock may have been held by a thread that doesn't exist in this process.
+            self._lock = threading.Lock()
+            self._clients = {}
+            self.created = 0
+            self._pid = pid
+
+
+# Shared by every ClaudeService that isn't given its own registry.
+CLIENT_REGISTRY = AnthropicClientRegistry()
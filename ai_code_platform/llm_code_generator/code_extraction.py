@@ -0,0 +1,106 @@
+import re
+from dataclasses import dataclass
+
+
+def extract_code(raw_text: str, language: str) -> str:
+    """
+    Extracts the code from a raw LLM response, stripping markdown fences.
+
+    Args:
+        raw_text: The raw text returned by the model.
+        language: The programming language that was requested (e.g., "python").
+
+    Returns:
+        The code with any surrounding markdown fences removed.
+    """
+    raw_code = raw_text.strip()
+    # Unit tests may provide mocked responses where newline characters are
+    # escaped ("\\n") instead of real newlines. Normalize for parsing and
+    # restore the original form when returning the final code string.
+    escaped_newlines = "\\n" in raw_code and "\n" not in raw_code
+    if escaped_newlines:
+        raw_code = raw_code.replace("\\n", "\n")
+
+    def restore(code: str) -> str:
+        return code.replace("\n", "\\n") if escaped_newlines else code
+
+    # Try to extract from language-specific block first
+    # Pattern: ```python\n(.*?)```
+    match_lang = re.search(f"```{re.escape(language)}\\s*\\n(.*?)\\n```", raw_code, re.DOTALL)
+    if match_lang:
+        return restore(match_lang.group(1).strip())
+
+    # If not found, try to extract from a generic block: ```\n(.*?)```
+    match_generic = re.search(r"```[ \t]*\n(.*?)\n```", raw_code, re.DOTALL)
+    if match_generic:
+        return restore(match_generic.group(1).strip())
+
+    # If still no fenced block, but it starts/ends with ``` (e.g. ```code``` on one line, or ```\ncode\n```)
+    if raw_code.startswith("```") and raw_code.endswith("```"):
+        stripped_code = raw_code[3:-3].strip()
+        # If what remains starts with the language (e.g. "python\n..."), remove that line.
+        lines = stripped_code.splitlines()
+        if lines and lines[0].strip().lower() == language.lower():
+            stripped_code = "\n".join(lines[1:]).strip()
+        return restore(stripped_code)
+
+    # If none of the above, assume it's raw code or LLM didn't use fences as expected
+    return restore(raw_code)
+
+
+@dataclass
+class CodeBlock:
+    """A fenced code block. `info` is the text after the opening fence (e.g. "python")."""
+    info: str
+    code: str
+
+    @property
+    def language(self) -> str:
+        """The first word of the info string, lower-cased ("" for untagged fences)."""
+        return self.info.split()[0].lower() if self.info.split() else ""
+
+
+_BLOCK_RE = re.compile(r"^[ \t]*```[ \t]*([^\n`]*)\n(.*?)\n[ \t]*```[ \t]*$", re.DOTALL | re.MULTILINE)
+
+
+def extract_code_blocks(raw_text: str) -> list[CodeBlock]:
+    """
+    Extracts every fenced code block from a raw LLM response.
+
+    Args:
+        raw_text: The raw text returned by the model.
+
+    Returns:
+        The blocks in the order they appear in the response.
+    """
+    return [CodeBlock(info=m.group(1).strip(), code=m.group(2)) for m in _BLOCK_RE.finditer(raw_text)]
+
+
+MIN_CONTINUATION_OVERLAP = 16  # shorter matches are too likely to be coincidental
+MAX_CONTINUATION_OVERLAP = 400
+
+
+def stitch_continuation(partial: str, continuation: str) -> str:
+    """
+    Joins a truncated reply and the model's continuation of it.
+
+    Models asked to continue often re-open the code fence or repeat the last few
+    lines before carrying on. A re-opened fence is dropped when the partial reply
+    is inside an unclosed fence, and the longest overlap between the end of the
+    partial reply and the start of the continuation is removed.
+
+    Args:
+        partial: The reply so far, cut off at the token limit.
+        continuation: The text generated by the continuation request.
+
+    Returns:
+        The stitched reply.
+    """
+    inside_fence = partial.count("```") % 2 == 1
+    if inside_fence and continuation.lstrip().startswith("```"):
+        _, _, continuation = continuation.lstrip().partition("\n")
+
+    for size in range(min(len(partial), len(continuation), MAX_CONTINUATION_OVERLAP), MIN_CONTINUATION_OVERLAP - 1, -1):
+        if partial.endswith(continuation[:size]):
+            return partial + continuation[size:]
+    return partial + continuation
@@ -0,0 +1,83 @@
+import re
+from dataclasses import dataclass
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER_MARKER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+PATCH_FORMAT_INSTRUCTIONS = f"""Describe the change as one or more search/replace edits, and output nothing else:
+
+{SEARCH_MARKER}
+<exact lines copied from the current code>
+{DIVIDER_MARKER}
+<the lines that replace them>
+{REPLACE_MARKER}
+
+Each SEARCH section must match the current code exactly, including indentation, and must be unique in the file. Keep SEARCH sections as short as possible while staying unique. To delete code, leave the replacement empty."""
+
+_EDIT_RE = re.compile(
+    rf"^{re.escape(SEARCH_MARKER)}[ \t]*\n(.*?)^{re.escape(DIVIDER_MARKER)}[ \t]*\n(.*?)^{re.escape(REPLACE_MARKER)}[ \t]*$",
+    re.DOTALL | re.MULTILINE,
+)
+
+
+class PatchError(ValueError):
+    """Raised when a patch cannot be parsed or does not apply cleanly."""
+    pass
+
+
+@dataclass
+class Edit:
+    """A single search/replace edit."""
+    search: str
+    replace: str
+
+
+def parse_patch(text: str) -> list[Edit]:
+    """
+    Parses search/replace edits from a model response.
+
+    Args:
+        text: The raw response, possibly wrapped in a markdown fence.
+
+    Returns:
+        The edits in the order they appear.
+
+    Raises:
+        PatchError: If the response contains no edits.
+    """
+    edits = [Edit(search=m.group(1), replace=m.group(2)) for m in _EDIT_RE.finditer(text)]
+    if not edits:
+        raise PatchError("Response contains no search/replace edits.")
+    return edits
+
+
+def apply_patch(code: str, edits: list[Edit]) -> str:
+    """
+    Applies edits to code. Every edit must match exactly once.
+
+    Args:
+        code: The code to patch.
+        edits: Edits returned by parse_patch.
+
+    Returns:
+        The patched code.
+
+    Raises:
+        PatchError: If an edit's search text is missing or ambiguous.
+    """
+    for index, edit in enumerate(edits, start=1):
+        search, replace = edit.search, edit.replace
+        if not search.strip():
+            raise PatchError(f"Edit {index} has an empty SEARCH section.")
+        # The parser keeps each section's final newline; the last line of a file may not have one.
+        if search not in code and search.endswith("\n") and code.endswith(search[:-1]):
+            search = search[:-1]
+            replace = replace[:-1] if replace.endswith("\n") else replace
+        count = code.count(search)
+        if count == 0:
+            raise PatchError(f"Edit {index} SEARCH text not found in the code.")
+        if count > 1:
+            raise PatchError(f"Edit {index} SEARCH text matches {count} times; it must be unique.")
+        code = code.replace(search, replace, 1)
+    return code
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+
+# Normalizes common aliases so callers can pass whatever the user typed on the CLI.
+LANGUAGE_ALIASES = {
+    "py": "python",
+    "python3": "python",
+    "js": "javascript",
+    "node": "javascript",
+    "ts": "typescript",
+    "golang": "go",
+    "rb": "ruby",
+    "sh": "bash",
+    "shell": "bash",
+}
+
+# External syntax checkers, used only when the tool is available on PATH.
+# Each entry is (command prefix, file suffix); the source file path is appended.
+EXTERNAL_CHECKERS = {
+    "javascript": (["node", "--check"], ".js"),
+    "typescript": (["tsc", "--noEmit", "--pretty", "false"], ".ts"),
+    "go": (["gofmt", "-e", "-l"], ".go"),
+    "ruby": (["ruby", "-c"], ".rb"),
+    "bash": (["bash", "-n"], ".sh"),
+}
+
+
+@dataclass
+class ValidationResult:
+    """Outcome of validating a piece of generated code."""
+    valid: bool
+    language: str
+    errors: str = ""
+    checked: bool = True  # False when no checker exists for the language
+
+
+def normalize_language(language: str) -> str:
+    """Returns the canonical lower-case name for a language or one of its aliases."""
+    key = language.strip().lower()
+    return LANGUAGE_ALIASES.get(key, key)
+
+
+def validate_code(code: str, language: str, timeout: float = 30.0) -> ValidationResult:
+    """
+    Checks that generated code at least parses/compiles for its language.
+
+    Python and JSON are checked in-process. Other languages are checked with an
+    external tool (see EXTERNAL_CHECKERS) when one is installed; otherwise the
+    code is accepted unchecked.
+
+    Args:
+        code: The code to validate.
+        language: The programming language of the code.
+        timeout: Seconds to wait for an external checker before failing.
+
+    Returns:
+        A ValidationResult describing whether the code is valid.
+    """
+    lang = normalize_language(language)
+
+    if lang == "python":
+        try:
+            compile(code, "<generated>", "exec")
+        except (SyntaxError, ValueError) as e:
+            return ValidationResult(valid=False, language=lang, errors=str(e))
+        return ValidationResult(valid=True, language=lang)
+
+    if lang == "json":
+        try:
+            json.loads(code)
+        except json.JSONDecodeError as e:
+            return ValidationResult(valid=False, language=lang, errors=str(e))
+        return ValidationResult(valid=True, language=lang)
+
+    checker = EXTERNAL_CHECKERS.get(lang)
+    if checker is None or shutil.which(checker[0][0]) is None:
+        return ValidationResult(valid=True, language=lang, checked=False)
+
+    command, suffix = checker
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="generated_")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(code)
+        try:
+            proc = subprocess.run(command + [path], capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return ValidationResult(valid=False, language=lang, errors=f"{command[0]} timed out after {timeout}s")
+        if proc.returncode != 0:
+            return ValidationResult(valid=False, language=lang, errors=(proc.stderr or proc.stdout).strip())
+        return ValidationResult(valid=True, language=lang)
+    finally:
+        os.unlink(path)
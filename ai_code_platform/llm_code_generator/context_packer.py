@@ -0,0 +1,234 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+from .storage import atomic_write_text, default_cache_dir
+from .token_estimator import estimate_tokens
+
+INDEX_FILENAME = "context_index.json"
+INDEX_VERSION = 1
+MAX_TERMS_PER_FILE = 200  # most frequent identifiers kept per file for relevance scoring
+BINARY_SNIFF_BYTES = 8192
+
+_TERM_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+_SUBWORD_RE = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+
+
+@dataclass
+class ContextFile:
+    """A context file selected for the prompt."""
+    path: str
+    sha256: str
+    tokens: int
+    mtime_ns: int
+    score: float
+    content: str = ""
+
+
+@dataclass
+class PackedContext:
+    """The result of packing context files into a token budget."""
+    files: list[ContextFile]
+    tokens: int
+    budget: int
+    skipped: list[str]  # candidate files that didn't fit, most relevant first
+
+    def render(self, prompt: str) -> str:
+        """
+        Builds the final prompt with the packed files in front of the task.
+
+        Files come first, in stable order, so successive prompts share the
+        longest possible prefix and servers with prefix caching can reuse it.
+        """
+        if not self.files:
+            return prompt
+        sections = ["Use the following existing source files as context."]
+        for context_file in self.files:
+            sections.append(f"\n--- {context_file.path} ---\n```\n{context_file.content}\n```")
+        sections.append(f"\nTask: {prompt}")
+        return "\n".join(sections)
+
+
+def terms(text: str) -> Counter:
+    """Splits text into lower-case identifier terms, including camelCase/snake_case parts."""
+    counts: Counter = Counter()
+    for identifier in _TERM_RE.findall(text):
+        counts[identifier.lower()] += 1
+        parts = [part.lower() for chunk in identifier.split("_") for part in _SUBWORD_RE.findall(chunk)]
+        if len(parts) > 1:
+            counts.update(part for part in parts if len(part) > 2)
+    return counts
+
+
+def resolve_context_paths(patterns: list[str]) -> list[str]:
+    """
+    Expands file paths, directories and glob patterns (including `**`) into files.
+
+    Args:
+        patterns: Paths or glob patterns as given on the command line.
+
+    Returns:
+        Unique file paths in the order they were first matched.
+    """
+    paths: dict[str, None] = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*")
+        for match in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isfile(match):
+                paths.setdefault(os.path.normpath(match), None)
+    return list(paths)
+
+
+def read_mapped(path: str) -> tuple[bytes, str]:
+    """
+    Reads a file through a read-only memory map and hashes it.
+
+    Returns:
+        The file content and its SHA-256 hex digest.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b"", hashlib.sha256(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # Hash straight from the mapping; the copy below is the only one made.
+            return mapped[:], hashlib.sha256(mapped).hexdigest()
+
+
+class ContextPacker:
+    """
+    Selects the most relevant source files that fit into a prompt token budget.
+
+    Per-file metadata (content hash, token estimate, frequent identifiers) is kept
+    in an on-disk index keyed by path, size and modification time, so unchanged
+    files are neither re-read nor re-tokenized on later runs. Only the files that
+    are finally selected are read.
+    """
+
+    def __init__(self, cache_dir: str | None = None):
+        """
+        Initializes the ContextPacker.
+
+        Args:
+            cache_dir: Directory holding the index. Defaults to default_cache_dir().
+        """
+        self.index_path = os.path.join(cache_dir or default_cache_dir(), INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._dirty = False
+        self.files_scanned = 0  # files read and tokenized during this packer's lifetime
+
+    def pack(self, prompt: str, patterns: list[str], token_budget: int) -> PackedContext:
+        """
+        Packs the files matching `patterns` that are most relevant to `prompt`.
+
+        Files are ranked by identifier overlap with the prompt (plus a bonus when
+        the prompt mentions the file name) and added greedily while they fit the
+        budget. The selection is then ordered oldest-modified first, so content
+        that rarely changes forms a stable prompt prefix.
+
+        Args:
+            prompt: The generation prompt, used for relevance.
+            patterns: File paths, directories or glob patterns.
+            token_budget: Maximum estimated tokens of file content to include.
+
+        Returns:
+            The PackedContext.
+        """
+        prompt_terms = terms(prompt)
+        candidates = []
+        for path in resolve_context_paths(patterns):
+            entry = self._entry(path)
+            if entry is None or entry["binary"]:
+                continue
+            candidates.append(ContextFile(
+                path=path,
+                sha256=entry["sha256"],
+                tokens=entry["tokens"],
+                mtime_ns=entry["mtime_ns"],
+                score=self._score(path, entry, prompt_terms),
+            ))
+        self.save()
+
+        candidates.sort(key=lambda c: (-c.score, c.tokens, c.path))
+        selected, skipped, used = [], [], 0
+        for candidate in candidates:
+            if used + candidate.tokens <= token_budget:
+                selected.append(candidate)
+                used += candidate.tokens
+            else:
+                skipped.append(candidate.path)
+
+        selected.sort(key=lambda c: (c.mtime_ns, c.path))
+        for context_file in selected:
+            data, _ = read_mapped(context_file.path)
+            context_file.content = data.decode("utf-8", errors="replace").rstrip("\n")
+        return PackedContext(files=selected, tokens=used, budget=token_budget, skipped=skipped)
+
+    def save(self) -> None:
+        """Persists the index if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            atomic_write_text(self.index_path, json.dumps({"version": INDEX_VERSION, "files": self._index}))
+            self._dirty = False
+
+    def _entry(self, path: str) -> dict | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry
+
+        data, digest = read_mapped(path)
+        self.files_scanned += 1
+        if entry and entry["sha256"] == digest:
+            # Touched but unchanged: keep the tokenization, refresh the stat key.
+            entry = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        elif b"\0" in data[:BINARY_SNIFF_BYTES]:
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest, "binary": True, "tokens": 0, "terms": []}
+        else:
+            text = data.decode("utf-8", errors="replace")
+            entry = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "binary": False,
+                "tokens": estimate_tokens(text),
+                "terms": [term for term, _ in terms(text).most_common(MAX_TERMS_PER_FILE)],
+            }
+        with self._lock:
+            self._index[key] = entry
+            self._dirty = True
+        return entry
+
+    @staticmethod
+    def _score(path: str, entry: dict, prompt_terms: Counter) -> float:
+        if not prompt_terms:
+            return 0.0
+        file_terms = set(entry["terms"])
+        score = sum(1.0 for term in prompt_terms if term in file_terms)
+        stem = os.path.splitext(os.path.basename(path))[0].lower()
+        if stem in prompt_terms:
+            score += 5.0
+        return score
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return data.get("files", {})
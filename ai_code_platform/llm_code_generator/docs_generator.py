@@ -0,0 +1,437 @@
+import ast
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+
+from .llm_service import LLMService, LLMServiceError
+from .response_cache import ResponseCache, make_cache_key
+from .storage import atomic_write_text, default_cache_dir
+from .token_estimator import estimate_tokens
+
+INDEX_FILENAME = "docs_index.json"
+INDEX_VERSION = 1
+DOCS_PROMPT_VERSION = 1  # bump when the prompt changes, so cached docs are regenerated
+SKIPPED_DIRECTORIES = {"__pycache__", "node_modules", "venv", "build", "dist", "site-packages"}
+
+DOCS_SYSTEM_PROMPT = (
+    "You are a technical writer documenting Python code. For every symbol you are given, "
+    "write a concise Google-style docstring body: a one-line summary, then Args, Returns and "
+    "Raises sections where they apply. Do not repeat the signature and do not wrap the text "
+    "in quotes. Reply with only a JSON object mapping each symbol id to its docstring."
+)
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+@dataclass
+class Symbol:
+    """A documentable function, method or class."""
+    path: str  # relative to the documented root
+    qualname: str
+    kind: str  # "function", "method" or "class"
+    signature: str
+    lineno: int
+    ast_hash: str
+    source: str = ""  # what is sent to the model; not kept in the index
+
+
+@dataclass
+class DocsReport:
+    """Summary of a documentation run."""
+    files: int
+    symbols: int
+    cached: int
+    generated: int
+    requests: int
+    wall_time: float
+    written: list[str] = field(default_factory=list)  # Markdown files created or changed
+    failed: dict[str, str] = field(default_factory=dict)  # qualified symbol -> error
+
+
+def _strip_docstrings(tree: ast.AST) -> ast.AST:
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return tree
+
+
+def _class_outline(node: ast.ClassDef) -> ast.ClassDef:
+    """Copies a class with docstrings removed and method bodies replaced by `...`."""
+    outline = _strip_docstrings(copy.deepcopy(node))
+    for child in outline.body:
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            child.body = [ast.Expr(ast.Constant(Ellipsis))]
+    return outline
+
+
+def normalized_ast_hash(node: ast.AST) -> str:
+    """
+    Hashes a syntax tree so that only meaningful code changes alter the hash.
+
+    Formatting, comments and docstrings don't survive parsing or are stripped,
+    and line/column attributes are left out, so reformatting a file or
+    regenerating its docstrings keeps every hash stable.
+    """
+    tree = _strip_docstrings(copy.deepcopy(node))
+    dump = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+def _signature(node: ast.FunctionDef | ast.AsyncFunctionDef) -> str:
+    prefix = "async " if isinstance(node, ast.AsyncFunctionDef) else ""
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ""
+    return f"{prefix}{node.name}({ast.unparse(node.args)}){returns}"
+
+
+def extract_symbols(source: str, path: str) -> list[Symbol]:
+    """
+    Extracts the module-level functions and classes and the methods of those classes.
+
+    Functions are hashed and sent in full. Classes are hashed and sent as an
+    outline (bases, class attributes, method signatures), so changing a method
+    body regenerates that method's documentation but not the class's.
+
+    Args:
+        source: Python source code.
+        path: The file's path, recorded on each symbol.
+
+    Returns:
+        The symbols in source order.
+
+    Raises:
+        SyntaxError: If the source doesn't parse.
+    """
+    tree = ast.parse(source)
+    symbols = []
+
+    def add_function(node, qualname: str, kind: str) -> None:
+        symbols.append(Symbol(
+            path=path,
+            qualname=qualname,
+            kind=kind,
+            signature=_signature(node),
+            lineno=node.lineno,
+            ast_hash=normalized_ast_hash(node),
+            source=ast.get_source_segment(source, node) or ast.unparse(node),
+        ))
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add_function(node, node.name, "function")
+        elif isinstance(node, ast.ClassDef):
+            outline = _class_outline(node)
+            bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+            symbols.append(Symbol(
+                path=path,
+                qualname=node.name,
+                kind="class",
+                signature=f"class {node.name}({bases})" if bases else f"class {node.name}",
+                lineno=node.lineno,
+                ast_hash=normalized_ast_hash(outline),
+                source=ast.unparse(outline),
+            ))
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    add_function(child, f"{node.name}.{child.name}", "method")
+    return symbols
+
+
+def pack_batches(symbols: list[Symbol], token_budget: int, max_symbols: int) -> list[list[Symbol]]:
+    """
+    Groups symbols into requests of at most `token_budget` estimated source tokens.
+
+    Symbols are packed in order (so related symbols of one file tend to share a
+    request); a symbol larger than the budget gets a request of its own.
+    """
+    batches, current, used = [], [], 0
+    for symbol in symbols:
+        tokens = estimate_tokens(symbol.source)
+        if current and (used + tokens > token_budget or len(current) >= max_symbols):
+            batches.append(current)
+            current, used = [], 0
+        current.append(symbol)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(batch: list[Symbol]) -> str:
+    """Renders one documentation request; symbol ids are their positions in the batch."""
+    sections = [f"Document these {len(batch)} Python symbol(s). Ids are s1..s{len(batch)}."]
+    for i, symbol in enumerate(batch, 1):
+        sections.append(f"\n### s{i}: {symbol.kind} `{symbol.qualname}` in {symbol.path}\n```python\n{symbol.source}\n```")
+    return "\n".join(sections)
+
+
+def parse_batch_response(text: str, count: int) -> dict[int, str]:
+    """
+    Parses the JSON object mapping symbol ids to docstrings.
+
+    Returns:
+        Docstrings by zero-based batch position. Ids that are missing or not
+        strings are left out; an unparseable reply gives an empty dict, except
+        that a single-symbol batch falls back to the whole reply.
+    """
+    match = _JSON_OBJECT_RE.search(text)
+    try:
+        data = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        stripped = text.strip().strip("`").strip()
+        return {0: stripped} if count == 1 and stripped else {}
+    docs = {}
+    for i in range(count):
+        value = data.get(f"s{i + 1}")
+        if isinstance(value, str) and value.strip():
+            docs[i] = value.strip()
+    return docs
+
+
+def render_markdown(path: str, symbols: list[Symbol], docs: dict[str, str]) -> str:
+    """Renders the documentation page of one source file."""
+    lines = [f"# `{path}`", ""]
+    for symbol in symbols:
+        if symbol.kind == "method":
+            heading, title = "###", f"{symbol.qualname.rsplit('.', 1)[0]}.{symbol.signature}"
+        else:
+            heading, title = "##", symbol.signature
+        lines.append(f"{heading} `{title}`")
+        lines.append("")
+        lines.append(docs.get(symbol.ast_hash) or "_No documentation generated._")
+        lines.append("")
+    return "\n".join(lines)
+
+
+class DocsGenerator:
+    """
+    Generates Markdown API documentation for a Python source tree.
+
+    Symbols are extracted with `ast` and their documentation is cached under a
+    hash of their normalized syntax tree, so later runs over a large tree only
+    send symbols whose code actually changed. A per-file index keyed by size and
+    modification time lets unchanged files skip reading and parsing entirely.
+
+    Cache misses from all files are packed into batched requests (several small
+    symbols per request), and the batches run concurrently.
+    """
+
+    def __init__(
+        self,
+        llm: LLMService,
+        root: str,
+        output_dir: str,
+        cache: ResponseCache | None = None,
+        cache_dir: str | None = None,
+        max_workers: int = 4,
+        batch_tokens: int = 3000,
+        max_batch_symbols: int = 12,
+    ):
+        """
+        Initializes the DocsGenerator.
+
+        Args:
+            llm: The service used to write documentation.
+            root: The source tree to document (searched recursively for *.py files).
+            output_dir: Directory receiving one Markdown file per source file plus index.md.
+            cache: Cache of generated documentation. Defaults to a persistent cache in cache_dir.
+            cache_dir: Directory for the file index (and the default cache). Defaults to default_cache_dir().
+            max_workers: Maximum concurrent requests (and file parses).
+            batch_tokens: Estimated source tokens packed into one request.
+            max_batch_symbols: Maximum symbols per request.
+        """
+        cache_dir = cache_dir or default_cache_dir()
+        self.llm = llm
+        self.root = root
+        self.output_dir = output_dir
+        self.cache = cache if cache is not None else ResponseCache(directory=os.path.join(cache_dir, "docs"))
+        self.max_workers = max(1, max_workers)
+        self.batch_tokens = batch_tokens
+        self.max_batch_symbols = max(1, max_batch_symbols)
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self._index = self._load_index()
+        self._index_dirty = False
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def discover(self) -> list[str]:
+        """Returns the Python files under root, relative to it, in sorted order."""
+        found = []
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d not in SKIPPED_DIRECTORIES)
+            for name in files:
+                if name.endswith(".py"):
+                    found.append(os.path.relpath(os.path.join(directory, name), self.root))
+        return sorted(found)
+
+    def run(self) -> DocsReport:
+        """
+        Documents the tree, regenerating only symbols that changed since the last run.
+
+        Failed batches don't abort the run; their symbols are reported in
+        `DocsReport.failed` and rendered without documentation.
+
+        Returns:
+            The DocsReport.
+        """
+        started = time.monotonic()
+        self._requests = 0
+        paths = self.discover()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="docs") as executor:
+            symbols_by_file = dict(zip(paths, executor.map(self._symbols, paths)))
+            self._save_index()
+
+            docs: dict[str, str] = {}
+            missing: dict[str, Symbol] = {}  # one symbol per distinct hash
+            for path, symbols in symbols_by_file.items():
+                for symbol in symbols:
+                    if symbol.ast_hash in docs or symbol.ast_hash in missing:
+                        continue
+                    entry = self.cache.get(self._cache_key(symbol))
+                    if entry is not None:
+                        docs[symbol.ast_hash] = entry.code
+                    else:
+                        missing[symbol.ast_hash] = symbol
+            cached = sum(1 for symbols in symbols_by_file.values() for s in symbols if s.ast_hash in docs)
+
+            self._load_sources(list(missing.values()))
+            failed: dict[str, str] = {}
+            batches = pack_batches(list(missing.values()), self.batch_tokens, self.max_batch_symbols)
+            futures = [executor.submit(self._document, batch) for batch in batches]
+            for future in as_completed(futures):
+                generated, errors = future.result()
+                docs.update(generated)
+                failed.update(errors)
+
+        written = self._write(symbols_by_file, docs)
+        return DocsReport(
+            files=len(paths),
+            symbols=sum(len(symbols) for symbols in symbols_by_file.values()),
+            cached=cached,
+            generated=len(missing) - len(failed),
+            requests=self._requests,
+            wall_time=time.monotonic() - started,
+            written=written,
+            failed=failed,
+        )
+
+    def _cache_key(self, symbol: Symbol) -> str:
+        return make_cache_key(self.llm, symbol.ast_hash, "python", task="docs", version=DOCS_PROMPT_VERSION)
+
+    def _symbols(self, path: str) -> list[Symbol]:
+        full_path = os.path.join(self.root, path)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return []
+        key = os.path.abspath(full_path)
+        with self._lock:
+            entry = self._index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return [Symbol(**dict(symbol, path=path)) for symbol in entry["symbols"]]
+
+        symbols = self._parse(path)
+        with self._lock:
+            self._index[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "symbols": [dict(asdict(symbol), source="") for symbol in symbols],
+            }
+            self._index_dirty = True
+        return symbols
+
+    def _parse(self, path: str) -> list[Symbol]:
+        try:
+            with open(os.path.join(self.root, path), "r", encoding="utf-8") as f:
+                return extract_symbols(f.read(), path)
+        except (OSError, UnicodeDecodeError, SyntaxError, ValueError):
+            return []
+
+    def _load_sources(self, symbols: list[Symbol]) -> None:
+        """Re-parses the files of symbols that came from the index without their source."""
+        by_path: dict[str, list[Symbol]] = {}
+        for symbol in symbols:
+            if not symbol.source:
+                by_path.setdefault(symbol.path, []).append(symbol)
+        for path, needed in by_path.items():
+            parsed = {(s.qualname, s.ast_hash): s.source for s in self._parse(path)}
+            for symbol in needed:
+                symbol.source = parsed.get((symbol.qualname, symbol.ast_hash), symbol.signature)
+
+    def _document(self, batch: list[Symbol]) -> tuple[dict[str, str], dict[str, str]]:
+        """Documents one batch; symbols the batched reply left out are retried one at a time."""
+        generated, failed = {}, {}
+        pending = batch
+        for attempt in range(2):
+            retry = []
+            for group in ([pending] if attempt == 0 else [[symbol] for symbol in pending]):
+                try:
+                    with self._lock:
+                        self._requests += 1
+                    completion = self.llm.complete(DOCS_SYSTEM_PROMPT, build_batch_prompt(group), max_tokens=min(4096, 256 + 200 * len(group)))
+                except LLMServiceError as e:
+                    for symbol in group:
+                        failed[f"{symbol.path}:{symbol.qualname}"] = str(e)
+                    continue
+                docs = parse_batch_response(completion.text, len(group))
+                for i, symbol in enumerate(group):
+                    if i in docs:
+                        generated[symbol.ast_hash] = docs[i]
+                        self.cache.put(self._cache_key(symbol), docs[i], language="markdown", symbol=symbol.qualname)
+                    elif attempt == 0 and len(group) > 1:
+                        retry.append(symbol)
+                    else:
+                        failed[f"{symbol.path}:{symbol.qualname}"] = "No documentation in the reply."
+            if not retry:
+                break
+            pending = retry
+        return generated, failed
+
+    def _write(self, symbols_by_file: dict[str, list[Symbol]], docs: dict[str, str]) -> list[str]:
+        pages = {}
+        index_lines = ["# API documentation", ""]
+        for path, symbols in symbols_by_file.items():
+            if symbols:
+                pages[f"{path}.md"] = render_markdown(path, symbols, docs)
+                index_lines.append(f"- [`{path}`]({path}.md) ({len(symbols)} symbols)")
+        pages["index.md"] = "\n".join(index_lines) + "\n"
+
+        written = []
+        for page, content in pages.items():
+            target = os.path.join(self.output_dir, page)
+            try:
+                with open(target, "r", encoding="utf-8") as f:
+                    if f.read() == content:
+                        continue
+            except OSError:
+                pass
+            atomic_write_text(target, content)
+            written.append(page)
+        return written
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return data.get("files", {})
+
+    def _save_index(self) -> None:
+        with self._lock:
+            if not self._index_dirty:
+                return
+            payload = {"version": INDEX_VERSION, "files": self._index}
+            self._index_dirty = False
+        atomic_write_text(self.index_path, json.dumps(payload))
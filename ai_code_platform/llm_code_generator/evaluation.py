@@ -0,0 +1,324 @@
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .llm_service import LLMConfigurationError, LLMService, LLMServiceError
+from .token_estimator import estimate_tokens
+
+DEFAULT_TEST_TIMEOUT = 10.0  # seconds per test run
+DEFAULT_MEMORY_LIMIT_MB = 512
+MAX_ERROR_CHARS = 2000
+
+# Runs inside the sandboxed interpreter: applies resource limits, then executes
+# solution.py (generated code followed by the task's tests) as __main__.
+_SANDBOX_BOOTSTRAP = """
+import runpy, sys
+try:
+    import resource
+except ImportError:
+    resource = None
+if resource is not None:
+    cpu, memory = int(sys.argv[1]), int(sys.argv[2])
+    for limit, value in ((resource.RLIMIT_CPU, cpu), (resource.RLIMIT_AS, memory), (resource.RLIMIT_FSIZE, 16 << 20)):
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+runpy.run_path("solution.py", run_name="__main__")
+"""
+
+
+class EvaluationCorpusError(LLMConfigurationError):
+    """Raised when an evaluation corpus is unreadable or malformed."""
+    pass
+
+
+@dataclass
+class EvalTask:
+    """A coding task: a prompt plus Python tests that run after the generated code."""
+    id: str
+    prompt: str
+    tests: str
+    language: str = "python"
+    canonical_solution: str | None = None  # used by the offline fake backend
+
+
+@dataclass
+class TestOutcome:
+    """Result of running a task's tests against one generated solution."""
+    passed: bool
+    duration: float
+    error: str | None = None
+
+
+@dataclass
+class Sample:
+    """One generation for a task and its test outcome."""
+    task_id: str
+    latency: float  # seconds for the generate_code call
+    tokens: int = 0  # estimated output tokens of the generated code
+    passed: bool = False
+    generation_error: str | None = None
+    test_error: str | None = None
+
+
+@dataclass
+class ModelReport:
+    """Quality, latency and throughput of one model over a corpus."""
+    model: str
+    samples: list[Sample] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    def pass_at(self, k: int) -> float | None:
+        """
+        Unbiased pass@k averaged over tasks (Chen et al., 2021).
+
+        Returns:
+            The estimate, or None if some task has fewer than k samples.
+        """
+        by_task: dict[str, list[bool]] = {}
+        for sample in self.samples:
+            by_task.setdefault(sample.task_id, []).append(sample.passed)
+        if not by_task or any(len(results) < k for results in by_task.values()):
+            return None
+        scores = []
+        for results in by_task.values():
+            n, c = len(results), sum(results)
+            scores.append(1.0 if n - c < k else 1.0 - math.comb(n - c, k) / math.comb(n, k))
+        return sum(scores) / len(scores)
+
+    def latency_quantile(self, q: float) -> float | None:
+        """Latency quantile in seconds over successful generations (None if there are none)."""
+        latencies = sorted(sample.latency for sample in self.samples if sample.generation_error is None)
+        if not latencies:
+            return None
+        if q == 0.5:
+            return statistics.median(latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Output tokens per second of request latency (per-request generation speed)."""
+        latency = sum(sample.latency for sample in self.samples)
+        return sum(sample.tokens for sample in self.samples) / latency if latency else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Completed samples per second of wall time, with requests running concurrently."""
+        return len(self.samples) / self.wall_time if self.wall_time else 0.0
+
+    def summary(self, ks: list[int]) -> dict:
+        p50, p95 = self.latency_quantile(0.5), self.latency_quantile(0.95)
+        return {
+            "model": self.model,
+            "tasks": len({sample.task_id for sample in self.samples}),
+            "samples": len(self.samples),
+            **{f"pass@{k}": _round(self.pass_at(k), 3) for k in ks},
+            "p50_ms": _round(p50 * 1000 if p50 is not None else None, 1),
+            "p95_ms": _round(p95 * 1000 if p95 is not None else None, 1),
+            "tokens_per_s": round(self.tokens_per_second, 1),
+            "throughput_per_s": round(self.throughput, 2),
+            "wall_time_s": round(self.wall_time, 3),
+            "errors": sum(1 for sample in self.samples if sample.generation_error is not None),
+        }
+
+
+def load_corpus(path: str) -> list[EvalTask]:
+    """
+    Loads evaluation tasks from a JSON Lines file (or a JSON list).
+
+    Each task looks like::
+
+        {"id": "add", "prompt": "Write add(a, b) ...", "tests": "assert add(1, 2) == 3",
+         "canonical_solution": "def add(a, b):\\n    return a + b"}
+
+    Raises:
+        EvaluationCorpusError: If the file is unreadable or a task is invalid.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if text.lstrip().startswith("["):
+            entries = json.loads(text)
+        else:
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    except (OSError, json.JSONDecodeError) as e:
+        raise EvaluationCorpusError(f"Could not read evaluation corpus {path}: {e}")
+
+    tasks, seen = [], set()
+    for entry in entries:
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(name), str) and entry[name].strip() for name in ("id", "prompt", "tests")):
+            raise EvaluationCorpusError(f"Every task needs non-empty 'id', 'prompt' and 'tests': {entry!r}")
+        if entry.get("language", "python") != "python":
+            raise EvaluationCorpusError(f"Task {entry['id']}: only Python tests can be executed.")
+        if entry["id"] in seen:
+            raise EvaluationCorpusError(f"Duplicate task id in corpus: {entry['id']}")
+        seen.add(entry["id"])
+        tasks.append(EvalTask(
+            id=entry["id"],
+            prompt=entry["prompt"],
+            tests=entry["tests"],
+            canonical_solution=entry.get("canonical_solution"),
+        ))
+    if not tasks:
+        raise EvaluationCorpusError(f"Evaluation corpus {path} contains no tasks.")
+    return tasks
+
+
+def run_tests(code: str, tests: str, timeout: float = DEFAULT_TEST_TIMEOUT, memory_mb: int = DEFAULT_MEMORY_LIMIT_MB) -> TestOutcome:
+    """
+    Runs generated code followed by its tests in a sandboxed Python process.
+
+    The process runs in isolated mode (-I: no user site-packages, no PYTHON*
+    variables) with a minimal environment, in an empty temporary directory,
+    with CPU, memory and file-size limits where the platform supports them. It
+    gets its own process group, which is killed on timeout. This contains
+    accidents (infinite loops, runaway allocations, stray files); it is not a
+    security boundary against deliberately hostile code.
+    """
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="eval-") as directory:
+        with open(os.path.join(directory, "solution.py"), "w", encoding="utf-8") as f:
+            f.write(f"{code}\n\n\n{tests}\n")
+        command = [sys.executable, "-I", "-B", "-c", _SANDBOX_BOOTSTRAP, str(math.ceil(timeout) + 1), str(memory_mb << 20)]
+        env = {"PATH": os.environ.get("PATH", "")}
+        kwargs = {"start_new_session": True} if os.name == "posix" else {}
+        process = subprocess.Popen(
+            command, cwd=directory, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **kwargs,
+        )
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            return TestOutcome(passed=False, duration=time.perf_counter() - started, error=f"Timed out after {timeout:g}s")
+    duration = time.perf_counter() - started
+    if process.returncode == 0:
+        return TestOutcome(passed=True, duration=duration)
+    message = stderr.decode("utf-8", "replace").strip() or f"Exited with status {process.returncode}"
+    return TestOutcome(passed=False, duration=duration, error=message[-MAX_ERROR_CHARS:])
+
+
+def _kill(process: subprocess.Popen) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, 9)
+        else:
+            process.kill()
+    except OSError:
+        pass
+    process.communicate()
+
+
+def solution_responder(tasks: list[EvalTask]):
+    """
+    Returns a FakeLLMServer responder that answers each task with its canonical solution.
+
+    Tasks without one, and unknown prompts, get an empty function, so an offline
+    run exercises the whole harness with a known pass rate.
+    """
+    solutions = {task.prompt: task.canonical_solution for task in tasks}
+
+    def respond(messages: list[dict]) -> str:
+        prompt = messages[-1]["content"] if messages else ""
+        return f"```python\n{solutions.get(prompt) or 'pass'}\n```"
+
+    return respond
+
+
+class Evaluator:
+    """
+    Runs a corpus of coding tasks through an LLMService and tests the results.
+
+    Every task is generated `samples` times with up to `concurrency` requests in
+    flight. Each solution is tested as soon as it arrives, in a sandboxed
+    subprocess (see run_tests) on a pool of `test_workers`, so test execution
+    overlaps with the remaining requests and doesn't distort their latency.
+    """
+
+    def __init__(
+        self,
+        tasks: list[EvalTask],
+        samples: int = 1,
+        concurrency: int = 4,
+        test_workers: int | None = None,
+        timeout: float = DEFAULT_TEST_TIMEOUT,
+        memory_mb: int = DEFAULT_MEMORY_LIMIT_MB,
+    ):
+        """
+        Initializes the Evaluator.
+
+        Args:
+            tasks: The corpus (see load_corpus).
+            samples: Generations per task (n for pass@k).
+            concurrency: Maximum generation requests in flight.
+            test_workers: Maximum concurrent test processes (default: CPU count).
+            timeout: Seconds each test run may take.
+            memory_mb: Address-space limit for each test run.
+        """
+        self.tasks = tasks
+        self.samples = max(1, samples)
+        self.concurrency = max(1, concurrency)
+        self.test_workers = max(1, test_workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+
+    def evaluate(self, llm: LLMService, label: str | None = None) -> ModelReport:
+        """
+        Evaluates one service over the whole corpus.
+
+        Args:
+            llm: The service to evaluate.
+            label: Name used in the report (default: the service's model).
+
+        Returns:
+            A ModelReport with one Sample per generation.
+        """
+        model = getattr(llm, "model", None)
+        report = ModelReport(model=label or (model if isinstance(model, str) else type(llm).__name__))
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.test_workers, thread_name_prefix="eval-test") as testers:
+            test_futures = []
+
+            def generate(task: EvalTask) -> None:
+                request_started = time.perf_counter()
+                try:
+                    code = llm.generate_code(task.prompt, task.language)
+                except LLMServiceError as e:
+                    sample = Sample(task_id=task.id, latency=time.perf_counter() - request_started, generation_error=str(e))
+                else:
+                    sample = Sample(task_id=task.id, latency=time.perf_counter() - request_started, tokens=estimate_tokens(code))
+                    with lock:
+                        test_futures.append(testers.submit(self._test, sample, code, task.tests))
+                with lock:
+                    report.samples.append(sample)
+
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="eval-generate") as generators:
+                for future in [generators.submit(generate, task) for task in self.tasks for _ in range(self.samples)]:
+                    future.result()
+            for future in test_futures:
+                future.result()
+
+        report.wall_time = time.perf_counter() - started
+        order = {task.id: i for i, task in enumerate(self.tasks)}
+        report.samples.sort(key=lambda sample: order[sample.task_id])
+        return report
+
+    def _test(self, sample: Sample, code: str, tests: str) -> None:
+        outcome = run_tests(code, tests, self.timeout, self.memory_mb)
+        sample.passed = outcome.passed
+        sample.test_error = outcome.error
+
+
+def _round(value: float | None, digits: int) -> float | None:
+    return None if value is None else round(value, digits)
@@ -0,0 +1,228 @@
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from .token_estimator import estimate_tokens
+
+
+def default_responder(messages: list[dict]) -> str:
+    """Returns a small fenced Python function derived from the last user message."""
+    prompt = messages[-1]["content"] if messages else ""
+    name = "".join(ch if ch.isalnum() else "_" for ch in prompt.lower().split("\n")[0][:30]).strip("_") or "generated"
+    return f"```python\ndef {name}():\n    return {len(prompt)}\n```"
+
+
+class FakeLLMServer:
+    """
+    In-process OpenAI-compatible server for tests, benchmarks and offline runs.
+
+    Implements GET /v1/models and POST /v1/chat/completions (including `n`,
+    `stream` and `stop`) over HTTP/1.1 with keep-alive; each of the three can be
+    switched off to imitate more limited servers. Request bodies may be gzip-encoded;
+    the server advertises this with an `Accept-Encoding: gzip` response header and
+    gzips responses for clients that accept it. Latency can be simulated per
+    request and per generated token.
+    """
+
+    def __init__(
+        self,
+        responder: Callable[[list[dict]], str] = default_responder,
+        model: str = "fake-model",
+        first_token_latency: float = 0.0,
+        token_latency: float = 0.0,
+        load_latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        supports_n: bool = True,
+        supports_streaming: bool = True,
+        supports_stop: bool = True,
+    ):
+        """
+        Initializes the FakeLLMServer (call start() or use it as a context manager).
+
+        Args:
+            responder: Maps the request messages to the assistant reply.
+            model: Model id reported by /v1/models and in responses.
+            first_token_latency: Seconds to wait before the first token of each choice.
+            token_latency: Seconds to wait per generated token (streaming and non-streaming).
+            load_latency: Extra seconds the first chat-completion request waits, simulating
+                          the server loading the model.
+            host: Interface to bind.
+            port: Port to bind; 0 picks a free port.
+            supports_n: Whether `n` > 1 returns several choices (otherwise one).
+            supports_streaming: Whether `stream` is honored (otherwise a plain JSON response).
+            supports_stop: Whether replies are cut at `stop` sequences.
+        """
+        self.responder = responder
+        self.model = model
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.load_latency = load_latency
+        self.supports_n = supports_n
+        self.supports_streaming = supports_streaming
+        self.supports_stop = supports_stop
+        self.requests: list[dict] = []  # every chat-completion payload received
+        self.gzip_requests = 0
+        self._lock = threading.Lock()
+        self._model_loaded = threading.Event()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """Base URL including /v1, suitable for LocalLLMService(api_base_url=...)."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _record(self, payload: dict, gzipped: bool) -> None:
+        with self._lock:
+            self.requests.append(payload)
+            if gzipped:
+                self.gzip_requests += 1
+
+    def _load_model(self) -> None:
+        # Requests arriving while the model loads all wait for it, like a real server.
+        with self._lock:
+            if not self._model_loaded.is_set():
+                time.sleep(self.load_latency)
+                self._model_loaded.set()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": server.model, "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+                gzipped = self.headers.get("Content-Encoding", "").lower() == "gzip"
+                try:
+                    payload = json.loads(gzip.decompress(body) if gzipped else body)
+                except (OSError, ValueError) as e:
+                    self._send_json(400, {"error": {"message": f"Invalid request body: {e}"}})
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                server._record(payload, gzipped)
+                server._load_model()
+
+                messages = payload.get("messages", [])
+                n = max(1, int(payload.get("n", 1))) if server.supports_n else 1
+                replies = [server.responder(messages) for _ in range(n)]
+                if server.supports_stop and payload.get("stop"):
+                    stops = [payload["stop"]] if isinstance(payload["stop"], str) else payload["stop"]
+                    for stop in stops:
+                        replies = [reply.split(stop)[0] for reply in replies]
+                prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+                if payload.get("stream") and server.supports_streaming:
+                    self._stream(replies[0])
+                    return
+
+                completion_tokens = sum(estimate_tokens(reply) for reply in replies)
+                time.sleep(server.first_token_latency + server.token_latency * completion_tokens / n)
+                self._send_json(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "model": server.model,
+                    "choices": [
+                        {"index": i, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}
+                        for i, reply in enumerate(replies)
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+
+            def _stream(self, reply: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Accept-Encoding", "gzip")
+                self.end_headers()
+                time.sleep(server.first_token_latency)
+                # Roughly one chunk per estimated token.
+                pieces = [reply[i:i + 4] for i in range(0, len(reply), 4)] or [""]
+                try:
+                    for piece in pieces:
+                        time.sleep(server.token_latency)
+                        chunk = {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                    final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                    self._write_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                compress = "gzip" in self.headers.get("Accept-Encoding", "").lower()
+                if compress:
+                    body = gzip.compress(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Accept-Encoding", "gzip")
+                if compress:
+                    self.send_header("Content-Encoding", "gzip")
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--load-latency", type=float, default=0.0)
+    cli_args = parser.parse_args()
+    fake = FakeLLMServer(
+        first_token_latency=cli_args.first_token_latency,
+        token_latency=cli_args.token_latency,
+        load_latency=cli_args.load_latency,
+        host=cli_args.host,
+        port=cli_args.port,
+    )
+    print(f"Fake LLM server listening on {fake.url}")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,192 @@
+import os
+import re
+import struct
+import threading
+import time
+from dataclasses import dataclass
+
+from .llm_service import LLMConfigurationError
+from .storage import default_cache_dir
+
+FEEDBACK_FILENAME = "feedback.log"
+_MAGIC = b"AICPFB01"  # file header: format name and version
+_RECORD = struct.Struct("<16sdb")  # generation id (uuid bytes), Unix time, rating
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Verdicts for cached generations, from best to worst.
+PROMOTED = "promoted"  # well rated: reused even past the cache TTL
+SERVE = "serve"  # no (decisive) feedback
+DOWNRANKED = "downranked"  # poorly rated: only served when regenerating fails
+INVALIDATED = "invalidated"  # clearly bad: never served again
+
+
+class InvalidFeedbackError(LLMConfigurationError):
+    """Raised for feedback with a malformed generation id or rating."""
+    pass
+
+
+@dataclass
+class FeedbackSummary:
+    """Accumulated feedback for one generation."""
+    up: int = 0
+    down: int = 0
+    last_at: float = 0.0
+
+    @property
+    def score(self) -> int:
+        return self.up - self.down
+
+
+class FeedbackStore:
+    """
+    Append-only log of ratings for generations, with in-memory aggregates.
+
+    Each rating is a fixed 25-byte record (generation id, time, +1 or -1)
+    appended to one file, so recording is a single small O_APPEND write that
+    several processes can share. Aggregates per generation are kept in a dict;
+    records appended by other processes are read incrementally, at most every
+    `refresh_interval` seconds. verdict() is therefore a dict lookup and cheap
+    enough for every cache hit.
+
+    Generation ids are 32-digit hex uuids, the ids of history records.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        promote_at: int = 1,
+        downrank_at: int = -1,
+        invalidate_at: int = -2,
+        refresh_interval: float = 1.0,
+    ):
+        """
+        Initializes the FeedbackStore.
+
+        Args:
+            path: Log file. Defaults to feedback.log in default_cache_dir().
+            promote_at: Score (up minus down votes) at or above which a generation is promoted.
+            downrank_at: Score at or below which a generation is downranked.
+            invalidate_at: Score at or below which a generation is invalidated.
+            refresh_interval: Seconds between checks for records appended by other processes.
+        """
+        self.path = path or os.path.join(default_cache_dir(), FEEDBACK_FILENAME)
+        self.promote_at = promote_at
+        self.downrank_at = downrank_at
+        self.invalidate_at = invalidate_at
+        self.refresh_interval = refresh_interval
+        self.ratings = 0
+        self._summaries: dict[str, FeedbackSummary] = {}
+        self._offset = 0  # bytes of the log already aggregated
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def record(self, generation_id: str, rating: int) -> FeedbackSummary:
+        """
+        Appends a rating for a generation.
+
+        Args:
+            generation_id: The generation's id.
+            rating: 1 (good) or -1 (bad).
+
+        Returns:
+            The generation's updated summary.
+
+        Raises:
+            InvalidFeedbackError: If the id or rating is malformed.
+        """
+        if not isinstance(generation_id, str) or not _ID_RE.match(generation_id):
+            raise InvalidFeedbackError(f"Not a generation id: {generation_id!r}")
+        if rating not in (1, -1):
+            raise InvalidFeedbackError(f"Rating must be 1 or -1, not {rating!r}")
+        data = _RECORD.pack(bytes.fromhex(generation_id), time.time(), rating)
+        with self._lock:
+            self._create()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self._refresh(force=True)
+            return self._copy(generation_id)
+
+    def summary(self, generation_id: str | None) -> FeedbackSummary | None:
+        """Returns the accumulated feedback for a generation, or None if it has none."""
+        if generation_id is None:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._copy(generation_id)
+
+    def verdict(self, generation_id: str | None) -> str:
+        """Returns PROMOTED, SERVE, DOWNRANKED or INVALIDATED for a generation."""
+        if generation_id is None:
+            return SERVE
+        with self._lock:
+            self._refresh()
+            summary = self._summaries.get(generation_id)
+        if summary is None:
+            return SERVE
+        score = summary.score
+        if score <= self.invalidate_at:
+            return INVALIDATED
+        if score <= self.downrank_at:
+            return DOWNRANKED
+        if score >= self.promote_at:
+            return PROMOTED
+        return SERVE
+
+    def __len__(self) -> int:
+        """Returns the number of generations with feedback."""
+        with self._lock:
+            self._refresh()
+            return len(self._summaries)
+
+    def _copy(self, generation_id: str) -> FeedbackSummary | None:
+        # Caller holds the lock.
+        summary = self._summaries.get(generation_id)
+        return FeedbackSummary(summary.up, summary.down, summary.last_at) if summary is not None else None
+
+    def _create(self) -> None:
+        # O_EXCL makes exactly one process write the header.
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return
+        try:
+            os.write(fd, _MAGIC)
+        finally:
+            os.close(fd)
+
+    def _refresh(self, force: bool = False) -> None:
+        # Caller holds the lock.
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            return
+        start = max(self._offset, len(_MAGIC))
+        complete = start + (size - start) // _RECORD.size * _RECORD.size  # a concurrent append may be half written
+        if complete <= start:
+            return
+        with open(self.path, "rb") as f:
+            if self._offset == 0 and f.read(len(_MAGIC)) != _MAGIC:
+                self._offset = size  # not a feedback log (or another version); ignore its content
+                return
+            f.seek(start)
+            data = f.read(complete - start)
+        for raw_id, created_at, rating in _RECORD.iter_unpack(data):
+            generation_id = raw_id.hex()
+            summary = self._summaries.get(generation_id)
+            if summary is None:
+                summary = self._summaries[generation_id] = FeedbackSummary()
+            if rating > 0:
+                summary.up += 1
+            else:
+                summary.down += 1
+            summary.last_at = max(summary.last_at, created_at)
+            self.ratings += 1
+        self._offset = complete
@@ -0,0 +1,285 @@
+import atexit
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from .storage import default_cache_dir
+
+HISTORY_FILENAME = "history.sqlite3"
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    service TEXT NOT NULL,
+    model TEXT NOT NULL,
+    language TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    code TEXT NOT NULL,
+    duration REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS generations_created ON generations (created_at);
+CREATE INDEX IF NOT EXISTS generations_language ON generations (language, created_at);
+CREATE INDEX IF NOT EXISTS generations_model ON generations (model, created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5 (
+    prompt, code, content='generations', content_rowid='rowid', tokenize='unicode61', prefix='2 3 4'
+);
+CREATE TRIGGER IF NOT EXISTS generations_ai AFTER INSERT ON generations BEGIN
+    INSERT INTO generations_fts (rowid, prompt, code) VALUES (new.rowid, new.prompt, new.code);
+END;
+CREATE TRIGGER IF NOT EXISTS generations_ad AFTER DELETE ON generations BEGIN
+    INSERT INTO generations_fts (generations_fts, rowid, prompt, code) VALUES ('delete', old.rowid, old.prompt, old.code);
+END;
+"""
+
+_COLUMNS = ("id", "created_at", "service", "model", "language", "prompt", "code", "duration", "input_tokens", "output_tokens")
+_TERM_RE = re.compile(r"\w+\*?", re.UNICODE)
+
+
+@dataclass
+class HistoryRecord:
+    """One recorded generation."""
+    prompt: str
+    language: str
+    code: str
+    service: str = ""
+    model: str = ""
+    duration: float | None = None  # seconds
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.time)
+
+
+def fts_query(text: str) -> str:
+    """
+    Turns free text into an FTS5 query matching all of its words.
+
+    Each word is quoted, so characters with a meaning in FTS5 syntax (quotes,
+    parentheses, AND/OR/NOT, column filters) are searched for literally. A
+    trailing `*` on a word is kept as a prefix search.
+    """
+    terms = []
+    for term in _TERM_RE.findall(text):
+        prefix = term.endswith("*")
+        terms.append(f'"{term.rstrip("*")}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class HistoryStore:
+    """
+    Persistent, searchable history of generations backed by SQLite.
+
+    record() only enqueues the record and returns its id; a background thread
+    writes queued records in batches, one transaction each, so the generation
+    path never waits on disk. The database runs in WAL mode, so searches don't
+    block the writer. Prompts and code are indexed with FTS5 (kept in sync by
+    triggers) and metadata columns with B-tree indexes, so searches touch only
+    matching rows rather than scanning the history.
+
+    The database is opened lazily on first use. A batch that can't be written
+    (e.g. the directory isn't writable) is dropped and counted in `dropped`,
+    with the error kept in `last_error`; the writer keeps serving later
+    batches, so flush() never waits on a dead thread.
+    """
+
+    def __init__(self, path: str | None = None, batch_size: int = 256):
+        """
+        Initializes the HistoryStore.
+
+        Args:
+            path: SQLite database file. Defaults to history.sqlite3 in default_cache_dir().
+            batch_size: Maximum records written per transaction.
+        """
+        self.path = path or os.path.join(default_cache_dir(), HISTORY_FILENAME)
+        self.batch_size = batch_size
+        self._queue: queue.Queue[HistoryRecord | None] = queue.Queue()
+        self.dropped = 0  # records lost to write errors
+        self.last_error: Exception | None = None
+        self._lock = threading.Lock()  # guards the read connection
+        self._writer_lock = threading.Lock()  # guards the writer and _closed; never held during I/O
+        self._writer: threading.Thread | None = None
+        self._reader: sqlite3.Connection | None = None
+        self._closed = False
+
+    def record(self, record: HistoryRecord) -> str:
+        """
+        Queues a generation for writing.
+
+        Returns:
+            The record's id.
+
+        Raises:
+            RuntimeError: If the store is closed.
+        """
+        with self._writer_lock:
+            if self._closed:
+                raise RuntimeError("HistoryStore is closed.")
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+                # Daemon threads are killed at exit; make sure queued records land first.
+                atexit.register(self.close)
+            # Queued under the lock, so it can't land behind close()'s stop marker.
+            self._queue.put(record)
+        return record.id
+
+    def flush(self) -> None:
+        """Blocks until every queued record has been written."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def search(
+        self,
+        query: str | None = None,
+        language: str | None = None,
+        model: str | None = None,
+        service: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 20,
+        by_relevance: bool = False,
+    ) -> list[HistoryRecord]:
+        """
+        Searches the history.
+
+        Args:
+            query: Free text matched against prompts and code (all words must match;
+                   `word*` matches prefixes).
+            language: Only records for this language.
+            model: Only records from this model.
+            service: Only records from this service (e.g. "ClaudeService").
+            since: Only records created at or after this Unix time.
+            until: Only records created before this Unix time.
+            limit: Maximum number of records returned.
+            by_relevance: Rank text matches by BM25 instead of recency. This has to
+                          score every match, so it is slower for common words.
+
+        Returns:
+            The matching records, newest first unless ranked by relevance.
+        """
+        self.flush()
+        conditions, params = [], []
+        for column, value in (("language", language), ("model", model), ("service", service)):
+            if value is not None:
+                conditions.append(f"g.{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("g.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("g.created_at < ?")
+            params.append(until)
+
+        columns = ", ".join(f"g.{column}" for column in _COLUMNS)
+        match = fts_query(query) if query else ""
+        if match:
+            sql = f"SELECT {columns} FROM generations_fts JOIN generations g ON g.rowid = generations_fts.rowid WHERE generations_fts MATCH ?"
+            params.insert(0, match)
+            # Walking the index backwards by rowid (insertion order) stops after `limit` matches.
+            order = "generations_fts.rank" if by_relevance else "generations_fts.rowid DESC"
+        else:
+            sql = f"SELECT {columns} FROM generations g WHERE 1"
+            order = "g.created_at DESC"
+        for condition in conditions:
+            sql += f" AND {condition}"
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._read_connection().execute(sql, params).fetchall()
+        return [HistoryRecord(**dict(zip(_COLUMNS, row))) for row in rows]
+
+    def get(self, record_id: str) -> HistoryRecord | None:
+        """Returns the record with this id (or unique id prefix), or None."""
+        self.flush()
+        columns = ", ".join(_COLUMNS)
+        with self._lock:
+            rows = self._read_connection().execute(
+                f"SELECT {columns} FROM generations WHERE id >= ? AND id < ? LIMIT 2",
+                (record_id, record_id + "\uffff"),
+            ).fetchall()
+        if len(rows) != 1:
+            return None
+        return HistoryRecord(**dict(zip(_COLUMNS, rows[0])))
+
+    def count(self) -> int:
+        """Returns the number of recorded generations."""
+        self.flush()
+        with self._lock:
+            return self._read_connection().execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+
+    def close(self) -> None:
+        """Writes pending records and closes the database."""
+        with self._writer_lock:
+            if self._closed:
+                return
+            self._closed = True
+            writer = self._writer
+            if writer is not None:
+                self._queue.put(None)
+        if writer is not None:
+            writer.join()
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            connection.executescript(_SCHEMA)
+            connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        return connection
+
+    def _read_connection(self) -> sqlite3.Connection:
+        # Caller holds the lock.
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader
+
+    def _write_loop(self) -> None:
+        connection = None
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        sql = f"INSERT OR IGNORE INTO generations ({', '.join(_COLUMNS)}) VALUES ({placeholders})"
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in batch if item is not None]
+            stop = len(records) != len(batch)
+            try:
+                if records:
+                    if connection is None:
+                        connection = self._connect()
+                    with connection:
+                        connection.executemany(sql, [tuple(getattr(r, c) for c in _COLUMNS) for r in records])
+            except (OSError, sqlite3.Error) as e:
+                # Drop the batch rather than the writer; the next batch reconnects.
+                self.dropped += len(records)
+                self.last_error = e
+                if connection is not None:
+                    connection.close()
+                    connection = None
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        if connection is not None:
+            connection.close()
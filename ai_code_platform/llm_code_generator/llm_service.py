@@ -1,19 +1,148 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+from .cancellation import CancelScope, cancelled, entered, on_cancel
+from .code_extraction import extract_code, extract_code_blocks
+from .code_patch import PATCH_FORMAT_INSTRUCTIONS, PatchError, apply_patch, parse_patch
+from .code_validator import ValidationResult, normalize_language, validate_code
+from .history_store import HistoryRecord, HistoryStore
+from .output_stats import OutputLengthStats
+from .profiling import phase
+from .token_estimator import estimate_tokens
+
+WARMUP_PROMPT = "Reply with OK."
+DEFAULT_MAX_TOKENS = 2048
+# finish_reason values meaning the reply was cut off by max_tokens (OpenAI-style and Anthropic).
+TRUNCATION_FINISH_REASONS = {"length", "max_tokens"}
+
+_generation = threading.local()
+
+
+@dataclass
+class Completion:
+    """A single raw completion returned by an LLM backend."""
+    text: str
+    finish_reason: str | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+
+
+class CompletionStream:
+    """
+    The text chunks of a streamed completion.
+
+    Backends fill in finish_reason and token usage as the stream ends, so they
+    are only meaningful once the chunks are exhausted. Closing the stream closes
+    the underlying request.
+    """
+
+    def __init__(self, chunks: Iterable[str] = ()):
+        self.chunks = iter(chunks)
+        self.finish_reason: str | None = None
+        self.input_tokens: int | None = None
+        self.output_tokens: int | None = None
+
+    def __iter__(self) -> "CompletionStream":
+        return self
+
+    def __next__(self) -> str:
+        return next(self.chunks)
+
+    def close(self) -> None:
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+
+@dataclass
+class RefineResult:
+    """Outcome of LLMService.refine_code."""
+    code: str
+    used_patch: bool  # False when the patch failed and the file was regenerated in full
+    output_tokens: int  # output tokens actually spent, including a failed patch attempt
+    full_regeneration_tokens: int  # estimated output tokens a full rewrite costs
+    patch_error: str | None = None
+
+    @property
+    def saved_tokens(self) -> int:
+        """Output tokens saved versus full regeneration (negative if the fallback ran)."""
+        return self.full_regeneration_tokens - self.output_tokens
+
+
+@dataclass
+class WarmupReport:
+    """Timings measured by LLMService.warm_up, in seconds."""
+    preconnect_time: float
+    cold_latency: float | None  # the priming request; None if the backend can't be primed
+    warm_latency: float | None  # an identical request sent right after priming
+
+    @property
+    def saved(self) -> float | None:
+        """First-call latency saved by warming up (cold minus warm)."""
+        if self.cold_latency is None or self.warm_latency is None:
+            return None
+        return self.cold_latency - self.warm_latency
+
+
+@dataclass
+class GenerationCapture:
+    """Receives the id of the generation made inside capture_generation()."""
+    id: str | None = None
+
+
+@contextmanager
+def capture_generation():
+    """
+    Captures the id of the generation made on this thread inside the block.
+
+    Generations made through _complete_code or a fully consumed stream_code get
+    the id of their history record, so feedback on them can be linked to the
+    history; with several candidates, that of the one returned. If the block
+    makes no such generation (e.g. a cache hit), a fresh id is assigned on
+    exit, so the capture always ends up with an id.
+    """
+    capture = GenerationCapture()
+    previous = getattr(_generation, "capture", None)
+    _generation.capture = capture
+    try:
+        yield capture
+    finally:
+        _generation.capture = previous
+        if capture.id is None:
+            capture.id = uuid.uuid4().hex
+
 
 class LLMService(ABC):
     """
     Abstract base class for LLM services.
     This interface allows for different LLM backends to be used interchangeably.
     """
+    # Learned output lengths used to size max_tokens; None keeps DEFAULT_MAX_TOKENS.
+    output_stats: OutputLengthStats | None = None
+    # Continuation requests allowed when a reply is cut off by max_tokens.
+    max_continuations: int = 2
+    # Where generations are recorded; None records nothing.
+    history: HistoryStore | None = None
 
     @abstractmethod
-    def generate_code(self, prompt: str, language: str) -> str:
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
         """
         Generates code based on a natural language prompt and a specified language.
 
         Args:
             prompt: The natural language prompt describing the code to be generated.
             language: The programming language for the generated code (e.g., "python", "javascript").
+            candidates: Number of candidates to request. When greater than 1, the
+                        candidates are validated as they arrive and the first one
+                        that passes validation is returned.
 
         Returns:
             A string containing the generated code.
@@ -24,6 +153,500 @@ class LLMService(ABC):
         """
         pass
 
+    def _system_prompt(self, language: str) -> str:
+        return f"You are a helpful coding assistant. Generate only the {language} code for the following prompt. Do not include any explanatory text or markdown formatting around the code. Just output the raw code."
+
+    def warm_up(self, language: str = "python") -> WarmupReport:
+        """
+        Prepares the backend so the first real generation doesn't pay start-up costs.
+
+        Opens (pooled) connections to the backend, then sends a minimal priming
+        request with the same system prompt generate_code uses, which makes the
+        server load the model and lets servers with prefix caching cache that
+        prompt. A second, identical request measures the warm latency.
+
+        Args:
+            language: The language whose system prompt is primed.
+
+        Returns:
+            A WarmupReport with preconnect time and cold versus warm latency.
+
+        Raises:
+            LLMAPIError: If the backend can't be reached.
+        """
+        started = time.perf_counter()
+        self._preconnect()
+        preconnect_time = time.perf_counter() - started
+
+        system_prompt = self._system_prompt(language)
+        latencies = []
+        for _ in range(2):
+            started = time.perf_counter()
+            try:
+                self.complete(system_prompt, WARMUP_PROMPT, max_tokens=1)
+            except NotImplementedError:
+                return WarmupReport(preconnect_time, None, None)
+            latencies.append(time.perf_counter() - started)
+        return WarmupReport(preconnect_time, *latencies)
+
+    def _preconnect(self) -> None:
+        """Opens connections to the backend ahead of the first request. No-op by default."""
+
+    def stream_code(self, prompt: str, language: str) -> Iterator[str]:
+        """
+        Streams the raw response text of a code generation request as it arrives.
+
+        Joining the chunks and passing the result through extract_code yields the
+        same code generate_code would return. As in generate_code, the request is
+        sized with _max_tokens_for(language), a reply cut off by max_tokens is
+        continued (each continuation arrives as one more chunk), and the
+        generation is recorded in output_stats and history when enabled.
+        Backends without streaming support produce a single chunk.
+
+        Args:
+            prompt: The natural language prompt.
+            language: The programming language (e.g., "python").
+
+        Returns:
+            An iterator of text chunks. Closing it early aborts the request where
+            the backend supports that.
+        """
+        system_prompt = self._system_prompt(language)
+        try:
+            stream = self.stream_complete(system_prompt, prompt, max_tokens=self._max_tokens_for(language))
+        except NotImplementedError:
+            return iter([self.generate_code(prompt, language)])
+        return self._stream_continued(system_prompt, prompt, language, stream)
+
+    def _stream_continued(self, system_prompt: str, prompt: str, language: str, stream: Iterator[str]) -> Iterator[str]:
+        started = time.perf_counter()
+        parts = []
+        try:
+            for chunk in stream:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        text = "".join(parts)
+        finish_reason = getattr(stream, "finish_reason", None)
+        reported = getattr(stream, "output_tokens", None)
+        truncated = finish_reason in TRUNCATION_FINISH_REASONS
+        output_tokens, continuations = reported if reported is not None else estimate_tokens(text), 0
+        while finish_reason in TRUNCATION_FINISH_REASONS and continuations < self.max_continuations:
+            try:
+                with phase("continuation"):
+                    stitched, completion = self._continue(system_prompt, prompt, text, DEFAULT_MAX_TOKENS)
+            except NotImplementedError:
+                break
+            delta = _continuation_delta(text, stitched)
+            if delta:
+                yield delta
+            text += delta
+            finish_reason = completion.finish_reason
+            output_tokens += _output_tokens(completion)
+            continuations += 1
+        self._record_generation(
+            prompt, language, text, time.perf_counter() - started,
+            getattr(stream, "input_tokens", None), output_tokens, truncated, continuations,
+        )
+
+    def stream_complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> CompletionStream:
+        """
+        Streams a raw single-turn completion as text chunks.
+
+        The default implementation makes one complete() call and returns its text
+        as a single chunk; backends with native streaming override it.
+
+        Raises:
+            NotImplementedError: If the backend doesn't support raw completions.
+        """
+        completion = self.complete(system_prompt, prompt, max_tokens=max_tokens)
+        stream = CompletionStream([completion.text])
+        stream.finish_reason = completion.finish_reason
+        stream.input_tokens = completion.input_tokens
+        stream.output_tokens = completion.output_tokens
+        return stream
+
+    def _stream_completion(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> Completion:
+        """
+        Makes a raw completion through stream_complete, so it can be cancelled midway.
+
+        Inside a cancel scope (see cancellation.entered) the stream is closed as
+        soon as the scope is cancelled; backends also register on_cancel callbacks
+        that interrupt a read still waiting for the next chunk.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+            RequestCancelledError: If the scope was cancelled before the reply was complete.
+        """
+        stream = self.stream_complete(system_prompt, prompt, max_tokens=max_tokens)
+        parts = []
+        try:
+            for chunk in stream:
+                if cancelled():
+                    break
+                parts.append(chunk)
+        except LLMServiceError:
+            if not cancelled():
+                raise  # a real failure, not the aborted stream
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        if cancelled():
+            raise RequestCancelledError("The request was cancelled.")
+        return Completion(
+            text="".join(parts),
+            finish_reason=getattr(stream, "finish_reason", None),
+            input_tokens=getattr(stream, "input_tokens", None),
+            output_tokens=getattr(stream, "output_tokens", None),
+        )
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> Completion:
+        """
+        Sends a raw single-turn request and returns the model's reply unmodified.
+
+        Used by features that need a custom prompt shape (patches, multi-file
+        output, ...). Backends that only support generate_code don't override it.
+
+        Args:
+            system_prompt: The system prompt.
+            prompt: The user message.
+            max_tokens: Maximum tokens to generate.
+
+        Returns:
+            The Completion, including token usage when the backend reports it.
+
+        Raises:
+            NotImplementedError: If the backend doesn't support raw completions.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support raw completions.")
+
+    def _continue(self, system_prompt: str, prompt: str, partial: str, max_tokens: int) -> tuple[str, Completion]:
+        """
+        Asks the model to continue a reply that was cut off by max_tokens.
+
+        Args:
+            system_prompt: The system prompt of the original request.
+            prompt: The user message of the original request.
+            partial: The reply so far.
+            max_tokens: Maximum tokens to generate for the continuation.
+
+        Returns:
+            The stitched reply and the continuation Completion (for its usage and finish reason).
+
+        Raises:
+            NotImplementedError: If the backend can't continue replies.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support continuations.")
+
+    def _model_name(self) -> str:
+        model = getattr(self, "model", None)
+        return model if isinstance(model, str) else type(self).__name__
+
+    def _max_tokens_for(self, language: str) -> int:
+        """Returns max_tokens for a generation, adapted to past output lengths when stats are enabled."""
+        if self.output_stats is None:
+            return DEFAULT_MAX_TOKENS
+        return self.output_stats.suggest_max_tokens(self._model_name(), language, DEFAULT_MAX_TOKENS)
+
+    def _complete_code(self, system_prompt: str, prompt: str, language: str, streamed: bool = False) -> Completion:
+        """
+        Requests a code completion, continuing it while the reply is cut off by max_tokens.
+
+        The first request uses _max_tokens_for(language); continuations use the full
+        DEFAULT_MAX_TOKENS so an underestimate costs at most one extra round trip.
+        The total output length is recorded in output_stats, and the generation in
+        history, when enabled.
+
+        Args:
+            system_prompt: The system prompt.
+            prompt: The user message.
+            language: The programming language of the code.
+            streamed: Make the first request through _stream_completion, so that
+                      cancelling the current cancel scope aborts it.
+
+        Returns:
+            A Completion with the stitched text and the output tokens of all requests.
+
+        Raises:
+            LLMAPIError: If there's an error during an API call.
+        """
+        started = time.perf_counter()
+        with phase("request"):
+            request = self._stream_completion if streamed else self.complete
+            completion = request(system_prompt, prompt, max_tokens=self._max_tokens_for(language))
+        return self._finish_completion(system_prompt, prompt, language, completion, started)
+
+    def _finish_completion(self, system_prompt: str, prompt: str, language: str, completion: Completion, started: float) -> Completion:
+        """
+        Continues an already received completion while it is cut off, then records it (see _complete_code).
+
+        Backends use this directly for replies they didn't request through
+        _complete_code, e.g. the choices of a single `n` request.
+
+        Args:
+            system_prompt: The system prompt of the request.
+            prompt: The user message of the request.
+            language: The programming language of the code.
+            completion: The reply to the first request.
+            started: perf_counter() time the first request was sent, for the recorded duration.
+        """
+        truncated = completion.finish_reason in TRUNCATION_FINISH_REASONS
+        text, input_tokens, output_tokens, continuations = completion.text, completion.input_tokens, _output_tokens(completion), 0
+        while completion.finish_reason in TRUNCATION_FINISH_REASONS and continuations < self.max_continuations:
+            try:
+                with phase("continuation"):
+                    text, completion = self._continue(system_prompt, prompt, text, DEFAULT_MAX_TOKENS)
+            except NotImplementedError:
+                break
+            output_tokens += _output_tokens(completion)
+            continuations += 1
+
+        self._record_generation(prompt, language, text, time.perf_counter() - started, input_tokens, output_tokens, truncated, continuations)
+        return Completion(text=text, finish_reason=completion.finish_reason, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def _record_generation(
+        self,
+        prompt: str,
+        language: str,
+        text: str,
+        duration: float,
+        input_tokens: int | None,
+        output_tokens: int,
+        truncated: bool,
+        continuations: int,
+    ) -> None:
+        """Records a finished generation in output_stats and history, and gives it its id (see capture_generation)."""
+        generation_id = uuid.uuid4().hex
+        capture = getattr(_generation, "capture", None)
+        if capture is not None:
+            capture.id = generation_id
+        with phase("bookkeeping"):
+            if self.output_stats is not None:
+                self.output_stats.record(self._model_name(), language, output_tokens, truncated, continuations)
+            if self.history is not None:
+                self.history.record(HistoryRecord(
+                    prompt=prompt,
+                    language=language,
+                    code=extract_code(text, language),
+                    service=type(self).__name__,
+                    model=self._model_name(),
+                    duration=duration,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    id=generation_id,
+                ))
+
+    def refine_code(self, previous_code: str, change_request: str, language: str) -> RefineResult:
+        """
+        Applies a change request to previously generated code via a compact patch.
+
+        The model is asked for search/replace edits instead of the whole file, so
+        only the changed lines are generated. The patch is applied and validated
+        locally; if it doesn't apply or breaks validation, the file is regenerated
+        in full with the change request.
+
+        Args:
+            previous_code: The code to change.
+            change_request: A natural language description of the change.
+            language: The programming language of the code.
+
+        Returns:
+            A RefineResult with the new code and output-token accounting.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        full_tokens = estimate_tokens(previous_code)
+        patch_system_prompt = (
+            f"You are a helpful coding assistant that edits existing {language} code. "
+            + PATCH_FORMAT_INSTRUCTIONS
+        )
+        patch_prompt = f"Current code:\n```{language}\n{previous_code}\n```\n\nChange request: {change_request}"
+        patch = self.complete(patch_system_prompt, patch_prompt)
+        spent = _output_tokens(patch)
+
+        try:
+            new_code = apply_patch(previous_code, parse_patch(patch.text))
+            validation = validate_code(new_code, language)
+            if not validation.valid:
+                raise PatchError(f"Patched code failed validation: {validation.errors}")
+            return RefineResult(
+                code=new_code,
+                used_patch=True,
+                output_tokens=spent,
+                full_regeneration_tokens=max(full_tokens, estimate_tokens(new_code)),
+            )
+        except PatchError as e:
+            patch_error = str(e)
+
+        full_system_prompt = (
+            f"You are a helpful coding assistant. Rewrite the following {language} code to apply the requested change. "
+            "Output only the complete updated code, without explanatory text."
+        )
+        full = self.complete(full_system_prompt, patch_prompt)
+        new_code = extract_code(full.text, language)
+        full_spent = _output_tokens(full)
+        return RefineResult(
+            code=new_code,
+            used_patch=False,
+            output_tokens=spent + full_spent,
+            full_regeneration_tokens=full_spent,
+            patch_error=patch_error,
+        )
+
+    def generate_multi_language(self, prompt: str, languages: list[str]) -> dict[str, str]:
+        """
+        Generates the same code in several languages with a single completion.
+
+        The prompt and system prompt are sent once, and the model is asked for one
+        fenced block per language. Blocks are matched to languages by their fence
+        tag. Any language missing from the response is generated with concurrent
+        per-language generate_code calls.
+
+        Args:
+            prompt: The natural language prompt.
+            languages: The target languages (e.g., ["python", "typescript", "go"]).
+
+        Returns:
+            A dict mapping each requested language (as given) to its code.
+
+        Raises:
+            LLMAPIError: If there's an error during an API call.
+        """
+        results: dict[str, str] = {}
+        if len(languages) > 1:
+            system_prompt = (
+                "You are a helpful coding assistant. Implement the following prompt in each of these languages: "
+                + ", ".join(languages)
+                + ". Output exactly one fenced markdown code block per language, tagged with the language name "
+                "(for example ```" + languages[0] + "), in that order. Do not include any explanatory text."
+            )
+            try:
+                completion = self.complete(system_prompt, prompt, max_tokens=min(2048 * len(languages), 8192))
+            except NotImplementedError:
+                completion = None
+            if completion is not None:
+                blocks: dict[str, str] = {}
+                for block in extract_code_blocks(completion.text):
+                    blocks.setdefault(normalize_language(block.language), block.code.strip())
+                for language in languages:
+                    code = blocks.get(normalize_language(language))
+                    if code:
+                        results[language] = code
+
+        missing = [language for language in languages if language not in results]
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing), thread_name_prefix="language") as executor:
+                # Workers run in a copy of the caller's context, so context variables (e.g. cassette recording) carry over.
+                futures = {language: executor.submit(contextvars.copy_context().run, self.generate_code, prompt, language) for language in missing}
+                for language, future in futures.items():
+                    results[language] = future.result()
+        return {language: results[language] for language in languages}
+
+    def _select_first_valid(
+        self,
+        producers: list[Callable[[], str]],
+        language: str,
+        validator: Callable[[str, str], ValidationResult] = validate_code,
+    ) -> str:
+        """
+        Runs candidate producers concurrently and returns the first valid result.
+
+        Each producer returns one extracted code candidate (it may block on an API
+        call or return an already-received choice). Producers that record their
+        generation (_complete_code, _finish_completion) give the winner's id to
+        the caller's capture_generation(). Candidates are validated in the
+        worker that produced them, so validation overlaps with the remaining
+        requests. Each producer runs in its own cancel scope; once a candidate
+        passes, or the caller's own scope is cancelled, the others are cancelled,
+        which aborts their in-flight requests (see _stream_completion) and drops
+        producers that haven't started.
+
+        Args:
+            producers: Callables that each return one code candidate.
+            language: The programming language used for validation.
+            validator: Function validating (code, language); defaults to validate_code.
+
+        Returns:
+            The first candidate to pass validation.
+
+        Raises:
+            LLMAPIError: If every producer failed with an API error.
+            LLMValidationError: If candidates were produced but none passed validation.
+        """
+        def produce_and_validate(producer: Callable[[], str], scope: CancelScope) -> tuple[str, ValidationResult, str | None]:
+            with entered(scope), phase("candidate"), capture_generation() as generation:
+                code = producer()
+                with phase("validate"):
+                    result = validator(code, language)
+            return code, result, generation.id
+
+        scopes = [CancelScope() for _ in producers]
+
+        def cancel_all() -> None:
+            for scope in scopes:
+                scope.cancel()
+
+        on_cancel(cancel_all)  # cancelling the caller's request (e.g. a superseded session) cancels every candidate
+        executor = ThreadPoolExecutor(max_workers=len(producers), thread_name_prefix="candidate")
+        futures = [
+            executor.submit(contextvars.copy_context().run, produce_and_validate, producer, scope)  # see generate_multi_language
+            for producer, scope in zip(producers, scopes)
+        ]
+        api_errors: list[LLMServiceError] = []
+        validation_errors: list[str] = []
+        try:
+            for future in as_completed(futures):
+                try:
+                    code, result, generation_id = future.result()
+                except LLMServiceError as e:
+                    api_errors.append(e)
+                    continue
+                if result.valid:
+                    capture = getattr(_generation, "capture", None)
+                    if capture is not None:
+                        capture.id = generation_id  # the caller's generation is the winning candidate
+                    return code
+                validation_errors.append(result.errors)
+        finally:
+            # Don't wait for stragglers: abort their requests and drop candidates that haven't started.
+            cancel_all()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if not validation_errors and api_errors:
+            raise api_errors[0]
+        raise LLMValidationError(
+            f"None of the {len(producers)} {language} candidates passed validation: "
+            + " | ".join(validation_errors)
+        )
+
+
+def _continuation_delta(emitted: str, stitched: str) -> str:
+    """Returns the text to emit after `emitted` so the stream reads like the stitched reply."""
+    if stitched.startswith(emitted):
+        return stitched[len(emitted):]
+    # Prefill-based continuations (Claude) drop the partial reply's trailing whitespace,
+    # which was already emitted.
+    kept = emitted.rstrip()
+    if stitched.startswith(kept):
+        delta = stitched[len(kept):]
+        trailing = emitted[len(kept):]
+        return delta[len(trailing):] if trailing and delta.startswith(trailing) else delta
+    # The stitched reply rewrote part of what was already sent, which can't be taken back;
+    # emit what follows the shared prefix rather than repeating the whole reply.
+    return stitched[len(os.path.commonprefix([emitted, stitched])):]
+
+
+def _output_tokens(completion: Completion) -> int:
+    """Returns the reported output tokens, estimating them when the backend doesn't say."""
+    if completion.output_tokens is not None:
+        return completion.output_tokens
+    return estimate_tokens(completion.text)
+
 class LLMServiceError(Exception):
     """Custom exception for LLM service-related errors."""
     pass
@@ -32,6 +655,14 @@ class LLMAPIError(LLMServiceError):
     """Raised when there's an error communicating with the LLM API."""
     pass
 
+class RequestCancelledError(LLMServiceError):
+    """Raised when a request is abandoned because its cancel scope was cancelled."""
+    pass
+
 class LLMConfigurationError(LLMServiceError):
     """Raised when the LLM service is not configured correctly (e.g., missing API key)."""
     pass
+
+class LLMValidationError(LLMServiceError):
+    """Raised when no generated candidate passes code validation."""
+    pass
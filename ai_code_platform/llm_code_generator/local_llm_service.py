@@ -1,9 +1,21 @@
 import os
-import os
 import json
+import time
+from typing import Iterator
 import requests
-import re # For markdown stripping
-from .llm_service import LLMService, LLMAPIError, LLMConfigurationError
+from .capabilities import CapabilityCache, ServerCapabilities
+from .code_extraction import extract_code, stitch_continuation
+from .history_store import HistoryStore
+from .local_transport import LocalTransport, abort_response
+from .llm_service import Completion, CompletionStream, LLMService, LLMAPIError, LLMConfigurationError
+from .output_stats import OutputLengthStats
+from .profiling import phase
+from .cancellation import on_cancel
+
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue exactly where it stopped, without "
+    "repeating anything and without any explanatory text."
+)
 
 class LocalLLMService(LLMService):
     """
@@ -13,7 +25,18 @@ class LocalLLMService(LLMService):
     DEFAULT_MODEL = "local-model" # This might not be used if the local server has a default
     DEFAULT_API_BASE = "http://localhost:1234/v1" # Common for LM Studio, Ollama might be 11434
 
-    def __init__(self, api_base_url: str | None = None, model: str | None = None, api_key: str = "not-needed"):
+    def __init__(
+        self,
+        api_base_url: str | None = None,
+        model: str | None = None,
+        api_key: str = "not-needed",
+        session: requests.Session | None = None,
+        transport: LocalTransport | None = None,
+        keep_alive: str | None = None,
+        output_stats: OutputLengthStats | None = None,
+        history: HistoryStore | None = None,
+        capabilities: CapabilityCache | None = None,
+    ):
         """
         Initializes the LocalLLMService.
 
@@ -23,10 +46,31 @@ class LocalLLMService(LLMService):
             model: The model name to use (can often be ignored if the server has a default).
                    If None, tries LOCAL_LLM_MODEL env var, then defaults to DEFAULT_MODEL.
             api_key: API key, if required by the local server (usually not). Defaults to "not-needed".
+            session: Optional requests.Session to send requests through, so connections
+                     are kept alive and pooled (e.g., shared by a long-running server).
+                     Defaults to one-off requests.post calls.
+            transport: Optional LocalTransport adding HTTP/2 multiplexing and gzip
+                       request bodies. Takes precedence over `session`.
+            keep_alive: Optional Ollama-style `keep_alive` duration (e.g. "30m") sent
+                        with every request so the server keeps the model loaded
+                        between calls. Omitted from the payload when None.
+            output_stats: Optional OutputLengthStats used to size max_tokens adaptively.
+            history: Optional HistoryStore recording every generation.
+            capabilities: Optional CapabilityCache. The server's probed capability
+                          profile (cached per endpoint) then replaces the URL
+                          guessing below and selects the request paths the server
+                          supports: see _apply_capabilities. If the server can't be
+                          probed, the service is configured as without it.
         """
         self.api_base_url = api_base_url or os.environ.get("LOCAL_LLM_API_BASE") or self.DEFAULT_API_BASE
         self.model = model or os.environ.get("LOCAL_LLM_MODEL") or self.DEFAULT_MODEL
         self.api_key = api_key # Often not required for local setups, but included for compatibility
+        self.session = session
+        self.transport = transport
+        self.keep_alive = keep_alive
+        self.output_stats = output_stats
+        self.history = history
+        self.server_capabilities: ServerCapabilities | None = None
 
         if not self.api_base_url:
             raise LLMConfigurationError(
@@ -43,102 +87,307 @@ class LocalLLMService(LLMService):
                 self.api_base_url += "/"
             self.api_base_url += "v1"
 
+        if capabilities is not None:
+            configured_url = api_base_url or os.environ.get("LOCAL_LLM_API_BASE") or self.DEFAULT_API_BASE
+            try:
+                profile = capabilities.get_or_probe(configured_url, api_key=self.api_key, model=model)
+            except requests.exceptions.RequestException:
+                profile = None  # keep the guessed URL; the first real request reports the error
+            if profile is not None:
+                self._apply_capabilities(profile, explicit_model=model or os.environ.get("LOCAL_LLM_MODEL"))
+
         self.chat_completions_url = f"{self.api_base_url.rstrip('/')}/chat/completions"
 
+    def _apply_capabilities(self, profile: ServerCapabilities, explicit_model: str | None) -> None:
+        """
+        Configures the service from a probed capability profile.
 
-    def generate_code(self, prompt: str, language: str) -> str:
+        The base URL that answered /models replaces the guessed one, and the
+        placeholder model is replaced by the server's first model. Keep-alive
+        servers get a pooled requests.Session. Whether `n` and streaming are
+        supported is consulted by generate_code and stream_complete.
         """
-        Generates code using a local LLM API (OpenAI-compatible).
+        self.server_capabilities = profile
+        self.api_base_url = profile.api_base_url
+        if not explicit_model and profile.models and self.model not in profile.models:
+            self.model = profile.models[0]
+        if profile.keep_alive and self.session is None and self.transport is None:
+            self.session = requests.Session()
 
-        Args:
-            prompt: The natural language prompt.
-            language: The programming language (e.g., "python").
+    @property
+    def _http(self):
+        # Resolved on every call so `requests.post` can be patched in tests.
+        return self.transport or self.session or requests
 
-        Returns:
-            The generated code as a string.
-
-        Raises:
-            LLMAPIError: If there's an error during the API call.
-            LLMConfigurationError: If the service is not properly configured.
-        """
-        system_prompt = f"You are a helpful coding assistant. Generate only the {language} code for the following prompt. Do not include any explanatory text or markdown formatting around the code. Just output the raw code block."
+    def _system_prompt(self, language: str) -> str:
+        return f"You are a helpful coding assistant. Generate only the {language} code for the following prompt. Do not include any explanatory text or markdown formatting around the code. Just output the raw code block."
 
+    def _headers(self) -> dict:
         headers = {
             "Content-Type": "application/json",
         }
         if self.api_key and self.api_key != "not-needed":
             headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _chat_completion(self, messages: list[dict], max_tokens: int = 2048, n: int = 1) -> list[Completion]:
+        """
+        Sends one chat-completion request and returns every choice it contains.
 
+        Args:
+            messages: The chat messages, including the system prompt.
+            max_tokens: Maximum tokens to generate per choice.
+            n: Number of choices to request. Omitted from the payload when 1.
+
+        Returns:
+            One Completion per returned choice (a server may return fewer than n).
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
         data = {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            "messages": messages,
             "temperature": 0.7, # Adjust as needed
-            "max_tokens": 2048, # Adjust as needed
+            "max_tokens": max_tokens,
             # "stream": False # Explicitly not streaming for this simple implementation
         }
+        if n > 1:
+            data["n"] = n
+        if self.keep_alive:
+            data["keep_alive"] = self.keep_alive
 
         try:
-            response = requests.post(self.chat_completions_url, headers=headers, data=json.dumps(data), timeout=120) # 120s timeout
-            response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
+            with phase("encode"):
+                body = json.dumps(data)
+            with phase("http"):
+                response = self._http.post(self.chat_completions_url, headers=self._headers(), data=body, timeout=120) # 120s timeout
+                response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
 
-            response_json = response.json()
+            with phase("decode"):
+                response_json = response.json()
 
             if response_json.get("choices") and len(response_json["choices"]) > 0:
-                message = response_json["choices"][0].get("message")
-                if message and message.get("content"):
-                    raw_code = message["content"].strip()
-                    # Tests may provide responses where newline characters are
-                    # escaped ("\\n") instead of real newlines. Detect this so
-                    # we can normalize the text for parsing and then restore the
-                    # original form when returning.
-                    escaped_newlines = "\\n" in raw_code and "\n" not in raw_code
-                    if escaped_newlines:
-                        raw_code = raw_code.replace("\\n", "\n")
-
-                    # Try to extract from language-specific block first
-                    match_lang = re.search(f"```{re.escape(language)}\\s*\\n(.*?)\\n```", raw_code, re.DOTALL)
-                    if match_lang:
-                        result = match_lang.group(1).strip()
-                        return result.replace("\n", "\\n") if escaped_newlines else result
-
-                    # If not found, try to extract from a generic block
-                    match_generic = re.search(r"```\s*\\n(.*?)\\n```", raw_code, re.DOTALL)
-                    if match_generic:
-                        result = match_generic.group(1).strip()
-                        return result.replace("\n", "\\n") if escaped_newlines else result
-
-                    # If still no fenced block, but it starts/ends with ```
-                    if raw_code.startswith("```") and raw_code.endswith("```"):
-                        stripped_code = raw_code[3:-3].strip()
-                        lines = stripped_code.splitlines()
-                        if lines and lines[0].strip().lower() == language.lower():
-                            stripped_code = "\n".join(lines[1:]).strip()
-                        return stripped_code.replace("\n", "\\n") if escaped_newlines else stripped_code
-
-                    return raw_code.replace("\n", "\\n") if escaped_newlines else raw_code
-                else:
-                    raise LLMAPIError("Local LLM API response missing message content.")
+                usage = response_json.get("usage") or {}
+                completions = []
+                for choice in response_json["choices"]:
+                    message = choice.get("message")
+                    if not (message and message.get("content")):
+                        raise LLMAPIError("Local LLM API response missing message content.")
+                    completions.append(Completion(
+                        text=message["content"],
+                        finish_reason=choice.get("finish_reason"),
+                        input_tokens=usage.get("prompt_tokens"),
+                        # Usage is reported for the whole response, not per choice.
+                        output_tokens=usage.get("completion_tokens") if len(response_json["choices"]) == 1 else None,
+                    ))
+                return completions
             else:
                 raise LLMAPIError("Local LLM API returned no choices or empty choices array.")
 
-        except requests.exceptions.ConnectionError as e:
-            raise LLMAPIError(f"Local LLM API connection error at {self.chat_completions_url}: {e}")
-        except requests.exceptions.Timeout as e:
-            raise LLMAPIError(f"Local LLM API request timed out: {e}")
-        except requests.exceptions.HTTPError as e:
+        except LLMAPIError:
+            raise
+        except json.JSONDecodeError as e:
+            raise LLMAPIError(f"Failed to decode JSON response from Local LLM API: {e}. Response text: {response.text[:200]}...") # Log snippet of text
+        except Exception as e:
+            raise self._api_error(e)
+
+    def _preconnect(self) -> None:
+        """
+        Opens a pooled keep-alive connection to the server by listing its models.
+
+        Without a session or transport every call would open a fresh connection,
+        so a requests.Session is attached first.
+
+        Raises:
+            LLMAPIError: If the server can't be reached.
+        """
+        if self.session is None and self.transport is None:
+            self.session = requests.Session()
+        try:
+            # Any HTTP status will do; the point is the established connection.
+            self._http.get(f"{self.api_base_url.rstrip('/')}/models", headers=self._headers(), timeout=30).close()
+        except Exception as e:
+            raise self._api_error(e)
+
+    def _api_error(self, e: Exception) -> LLMAPIError:
+        """Translates an exception raised while calling the local server into an LLMAPIError."""
+        if isinstance(e, requests.exceptions.ConnectionError):
+            return LLMAPIError(f"Local LLM API connection error at {self.chat_completions_url}: {e}")
+        if isinstance(e, requests.exceptions.Timeout):
+            return LLMAPIError(f"Local LLM API request timed out: {e}")
+        if isinstance(e, requests.exceptions.HTTPError):
             error_detail = ""
             try:
                 error_detail = e.response.json()
             except json.JSONDecodeError:
                 error_detail = e.response.text
-            raise LLMAPIError(f"Local LLM API HTTP error (status {e.response.status_code}): {error_detail} from {self.chat_completions_url}")
+            return LLMAPIError(f"Local LLM API HTTP error (status {e.response.status_code}): {error_detail} from {self.chat_completions_url}")
+        return LLMAPIError(f"An unexpected error occurred while calling Local LLM API: {e}")
+
+    def _stream_chat_completion(self, messages: list[dict], max_tokens: int = 2048, result: CompletionStream | None = None) -> Iterator[str]:
+        """
+        Streams one chat-completion request, yielding content deltas as they arrive.
+
+        The server's Server-Sent Events are parsed line by line; the finish reason
+        and usage of the final events are stored on `result`, if given. Closing the
+        generator closes the HTTP response, which lets the server stop generating.
+        When the request's cancel scope is cancelled (a superseded session request
+        or a losing candidate), the response is aborted from the cancelling thread
+        (see abort_response), so even a read still waiting for the first token is
+        interrupted.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        if self.keep_alive:
+            data["keep_alive"] = self.keep_alive
+        try:
+            response = self._http.post(self.chat_completions_url, headers=self._headers(), data=json.dumps(data), timeout=120, stream=True)
+            response.raise_for_status()
+        except Exception as e:
+            raise self._api_error(e)
+        on_cancel(lambda: abort_response(response))
+
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                choices = chunk.get("choices") or []
+                if result is not None:
+                    usage = chunk.get("usage") or {}
+                    result.input_tokens = usage.get("prompt_tokens", result.input_tokens)
+                    result.output_tokens = usage.get("completion_tokens", result.output_tokens)
+                if choices:
+                    if result is not None and choices[0].get("finish_reason"):
+                        result.finish_reason = choices[0]["finish_reason"]
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
         except json.JSONDecodeError as e:
-            raise LLMAPIError(f"Failed to decode JSON response from Local LLM API: {e}. Response text: {response.text[:200]}...") # Log snippet of text
+            raise LLMAPIError(f"Failed to decode streamed chunk from Local LLM API: {e}")
+        except LLMAPIError:
+            raise
         except Exception as e:
-            raise LLMAPIError(f"An unexpected error occurred while calling Local LLM API: {e}")
+            raise self._api_error(e)
+        finally:
+            response.close()
+
+    def stream_complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> CompletionStream:
+        """
+        Streams a raw single-turn completion from the local LLM API.
+
+        Servers probed as not streaming get one plain request instead, returned
+        as a single chunk.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        if self.server_capabilities is not None and not self.server_capabilities.streaming:
+            return super().stream_complete(system_prompt, prompt, max_tokens=max_tokens)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        stream = CompletionStream()
+        stream.chunks = self._stream_chat_completion(messages, max_tokens=max_tokens, result=stream)
+        return stream
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> Completion:
+        """
+        Sends a raw single-turn request to the local LLM API.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        return self._chat_completion(messages, max_tokens=max_tokens)[0]
+
+    def _continue(self, system_prompt: str, prompt: str, partial: str, max_tokens: int) -> tuple[str, Completion]:
+        """
+        Continues a truncated reply by sending it back with a follow-up instruction.
+
+        Assistant prefill isn't portable across OpenAI-compatible servers, so the
+        partial reply is sent as a completed assistant turn and the continuation is
+        stitched on, dropping any re-opened fence or repeated lines.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+        completion = self._chat_completion(messages, max_tokens=max_tokens)[0]
+        return stitch_continuation(partial, completion.text), completion
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        """
+        Generates code using a local LLM API (OpenAI-compatible).
+
+        Args:
+            prompt: The natural language prompt.
+            language: The programming language (e.g., "python").
+            candidates: Number of candidates to request. When greater than 1 they
+                        are requested in a single round trip via the `n` parameter
+                        (or as concurrent requests if the server was probed as
+                        ignoring `n`) and the first one to pass validation is returned.
+
+        Returns:
+            The generated code as a string.
+
+        Raises:
+            LLMAPIError: If there's an error during the API call.
+            LLMConfigurationError: If the service is not properly configured.
+            LLMValidationError: If candidates > 1 and none passes validation.
+        """
+        if candidates <= 1:
+            text = self._complete_code(self._system_prompt(language), prompt, language).text
+            with phase("extract"):
+                return extract_code(text, language)
+
+        system_prompt = self._system_prompt(language)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        started = time.perf_counter()
+        if self.server_capabilities is not None and not self.server_capabilities.n:
+            # Asking for n would only produce one choice and delay the rest; request all at once.
+            choices = []
+        else:
+            with phase("request"):
+                choices = self._chat_completion(messages, max_tokens=self._max_tokens_for(language), n=candidates)[:candidates]
+
+        def finish(choice: Completion) -> str:
+            # Each choice is continued (if cut off) and recorded like a single generation.
+            return extract_code(self._finish_completion(system_prompt, prompt, language, choice, started).text, language)
+
+        def request() -> str:
+            return extract_code(self._complete_code(system_prompt, prompt, language, streamed=True).text, language)
+
+        producers = [lambda choice=choice: finish(choice) for choice in choices]
+        # Servers that ignore `n` return a single choice; top up with concurrent requests,
+        # streamed so the losers are aborted as soon as one candidate passes.
+        producers += [request] * (candidates - len(choices))
+        return self._select_first_valid(producers, language)
+
 
 if __name__ == '__main__':
     # This is for basic manual testing.
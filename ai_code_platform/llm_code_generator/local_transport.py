@@ -0,0 +1,253 @@
+import gzip
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    import httpx
+except ImportError:  # Optional: only needed for HTTP/2.
+    httpx = None
+
+try:
+    import h2  # noqa: F401 -- httpx needs it to speak HTTP/2.
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+HTTP2_AVAILABLE = httpx is not None and HAS_H2
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def abort_response(response) -> None:
+    """
+    Interrupts a streamed response from another thread, e.g. when its request is cancelled.
+
+    Responses from LocalTransport, ReplayTransport and the cassette recorder
+    have an abort() method; plain requests responses (a requests session passed
+    as the transport) get their socket shut down.
+    """
+    abort = getattr(response, "abort", None)
+    if abort is not None:
+        abort()
+        return
+    # Closing a requests response from another thread would wait for the blocked read; a shutdown interrupts it.
+    sock = getattr(getattr(getattr(response, "raw", None), "_connection", None), "sock", None)
+    if sock is not None:
+        sock.shutdown(socket.SHUT_RDWR)
+
+
+class _HttpxResponse:
+    """Adapts an httpx response to the subset of requests.Response used by LocalLLMService."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.http_version = response.http_version
+        self._aborted = False
+
+    @property
+    def text(self) -> str:
+        self._response.read()
+        return self._response.text
+
+    def json(self):
+        self._response.read()
+        return self._response.json()
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self._response.url}", response=self)
+
+    def iter_lines(self, decode_unicode: bool = False):
+        try:
+            for line in self._response.iter_lines():
+                if self._aborted:
+                    return
+                yield line if decode_unicode else line.encode("utf-8")
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.TransportError as e:
+            if self._aborted:
+                return
+            raise requests.exceptions.ConnectionError(str(e))
+
+    def close(self) -> None:
+        self._response.close()
+
+    def abort(self) -> None:
+        """Stops the stream from another thread (see abort_response)."""
+        self._aborted = True
+        if self.http_version == "HTTP/2":
+            # The connection is shared with other streams, so it can't be shut down; the reader stops at the
+            # next frame and closes the stream itself.
+            return
+        stream = self._response.extensions.get("network_stream")
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+
+
+class LocalTransport:
+    """
+    Optimized HTTP transport for LocalLLMService.
+
+    - HTTP/2 (when httpx and h2 are installed): concurrent chat-completion requests
+      are multiplexed as streams over one connection per server instead of one
+      HTTP/1.1 connection each. Plain http:// URLs use HTTP/2 prior knowledge (h2c).
+    - Automatic fallback: if HTTP/2 isn't available, or the server fails the first
+      HTTP/2 exchange, that server is switched to a pooled keep-alive requests.Session
+      (the current HTTP/1.1 behavior).
+    - Compression: responses are always requested with `Accept-Encoding: gzip`.
+      Request bodies larger than `min_compress_bytes` are gzipped once the server
+      advertises support with an `Accept-Encoding: gzip` response header (RFC 7694),
+      or always when `compress_requests=True`. A 415 response disables request
+      compression for that server and the request is retried uncompressed.
+
+    Exposes the same `post()` signature as `requests` and raises `requests`
+    exceptions, so LocalLLMService error handling is unchanged.
+    """
+
+    def __init__(
+        self,
+        http2: bool = True,
+        compress_requests: bool | None = None,
+        min_compress_bytes: int = 1024,
+        pool_size: int = 64,
+        compresslevel: int = 5,
+    ):
+        """
+        Initializes the LocalTransport.
+
+        Args:
+            http2: Try HTTP/2 when httpx and h2 are installed.
+            compress_requests: True to always gzip large request bodies, False to
+                               never, None (default) to gzip once the server advertises support.
+            min_compress_bytes: Bodies smaller than this are sent uncompressed.
+            pool_size: Maximum pooled connections per server.
+            compresslevel: gzip level; lower is faster, higher is smaller.
+        """
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.compress_requests = compress_requests
+        self.min_compress_bytes = min_compress_bytes
+        self.pool_size = pool_size
+        self.compresslevel = compresslevel
+        self.bytes_sent = 0
+        self.bytes_before_compression = 0
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._http2_clients: dict[str, object] = {}
+        self._http2_confirmed: set[str] = set()
+        self._http1_only: set[str] = set()
+        self._gzip_origins: set[str] = set()
+        self._no_gzip_origins: set[str] = set()
+        self._lock = threading.Lock()
+
+    def protocol_for(self, url: str) -> str:
+        """Returns the protocol currently used for the server behind `url`."""
+        origin = _origin(url)
+        if self.http2 and origin not in self._http1_only:
+            return "HTTP/2" if origin in self._http2_confirmed else "HTTP/2 (unconfirmed)"
+        return "HTTP/1.1"
+
+    def post(self, url: str, headers: dict | None = None, data: str | bytes | None = None, timeout: float | None = None, stream: bool = False):
+        """
+        Sends a POST request, compressing the body when the server supports it.
+
+        Returns:
+            A requests.Response (HTTP/1.1) or an adapter with the same interface (HTTP/2).
+        """
+        origin = _origin(url)
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip")
+        body = data.encode("utf-8") if isinstance(data, str) else (data or b"")
+        self.bytes_before_compression += len(body)
+
+        if self._should_compress(origin, body):
+            response = self._send("POST", url, {**headers, "Content-Encoding": "gzip"}, gzip.compress(body, self.compresslevel), timeout, stream)
+            if response.status_code != 415:
+                self._learn(origin, response)
+                return response
+            response.close()
+            with self._lock:
+                self._no_gzip_origins.add(origin)
+                self._gzip_origins.discard(origin)
+
+        response = self._send("POST", url, headers, body, timeout, stream)
+        self._learn(origin, response)
+        return response
+
+    def get(self, url: str, headers: dict | None = None, timeout: float | None = None, stream: bool = False):
+        """Sends a GET request over the same pooled connections as post()."""
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip")
+        response = self._send("GET", url, headers, None, timeout, stream)
+        self._learn(_origin(url), response)
+        return response
+
+    def close(self) -> None:
+        self._session.close()
+        for client in self._http2_clients.values():
+            client.close()
+
+    def _should_compress(self, origin: str, body: bytes) -> bool:
+        if len(body) < self.min_compress_bytes or origin in self._no_gzip_origins or self.compress_requests is False:
+            return False
+        return self.compress_requests is True or origin in self._gzip_origins
+
+    def _learn(self, origin: str, response) -> None:
+        advertised = response.headers.get("Accept-Encoding", "")
+        if "gzip" in advertised.lower() and origin not in self._gzip_origins and origin not in self._no_gzip_origins:
+            with self._lock:
+                self._gzip_origins.add(origin)
+
+    def _send(self, method: str, url: str, headers: dict, body: bytes | None, timeout: float | None, stream: bool):
+        self.bytes_sent += len(body or b"")
+        origin = _origin(url)
+        if self.http2 and origin not in self._http1_only:
+            client = self._http2_client(origin)
+            try:
+                request = client.build_request(method, url, headers=headers, content=body, timeout=timeout)
+                response = client.send(request, stream=stream)
+            except httpx.TimeoutException as e:
+                if origin in self._http2_confirmed:
+                    raise requests.exceptions.Timeout(str(e))
+                self._fall_back(origin)
+            except httpx.TransportError as e:
+                if origin in self._http2_confirmed:
+                    raise requests.exceptions.ConnectionError(str(e))
+                # The server may not speak HTTP/2; retry below over HTTP/1.1.
+                self._fall_back(origin)
+            else:
+                with self._lock:
+                    self._http2_confirmed.add(origin)
+                return _HttpxResponse(response)
+        return self._session.request(method, url, headers=headers, data=body, timeout=timeout, stream=stream)
+
+    def _http2_client(self, origin: str):
+        client = self._http2_clients.get(origin)
+        if client is None:
+            with self._lock:
+                client = self._http2_clients.get(origin)
+                if client is None:
+                    limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                    # Plaintext servers can't negotiate HTTP/2 via ALPN, so use prior knowledge.
+                    client = httpx.Client(http1=origin.startswith("https://"), http2=True, limits=limits)
+                    self._http2_clients[origin] = client
+        return client
+
+    def _fall_back(self, origin: str) -> None:
+        with self._lock:
+            self._http1_only.add(origin)
+            client = self._http2_clients.pop(origin, None)
+        if client is not None:
+            client.close()
@@ -0,0 +1,146 @@
+import json
+import math
+import threading
+from collections import deque
+
+from .storage import atomic_write_text
+
+STATS_FILENAME = "output_stats.json"
+STATS_VERSION = 1
+
+
+class OutputLengthStats:
+    """
+    Learns how many output tokens generations need, per model and language.
+
+    Services consult it to size `max_tokens`: once enough samples exist, the
+    limit is a high quantile of recent output lengths times a headroom factor,
+    clamped to [floor, the caller's default]. Until then the default is used.
+    Short snippets then stop reserving the full default budget, while the
+    continuation logic in LLMService catches the rare reply that still runs out.
+
+    Samples are kept in a bounded window per key and can be persisted to JSON so
+    they carry over between runs.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        window: int = 200,
+        min_samples: int = 5,
+        quantile: float = 0.95,
+        headroom: float = 1.5,
+        floor: int = 256,
+    ):
+        """
+        Initializes the OutputLengthStats.
+
+        Args:
+            path: Optional JSON file to load from and save() to.
+            window: Number of recent samples kept per model and language.
+            min_samples: Samples required before max_tokens is adapted.
+            quantile: Quantile of recent output lengths used as the base estimate.
+            headroom: Multiplier applied to the quantile.
+            floor: Smallest max_tokens ever suggested.
+        """
+        self.path = path
+        self.window = window
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.headroom = headroom
+        self.floor = floor
+        self._lock = threading.Lock()
+        self._samples: dict[str, deque[int]] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+        self._dirty = False
+        if path:
+            self._load()
+
+    def record(self, model: str, language: str, output_tokens: int, truncated: bool = False, continuations: int = 0) -> None:
+        """
+        Records one generation.
+
+        Args:
+            model: The model that generated the output.
+            language: The requested language.
+            output_tokens: Output tokens of the complete reply, including continuations.
+            truncated: Whether the first response hit its max_tokens limit.
+            continuations: Number of continuation requests issued.
+        """
+        key = _key(model, language)
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(output_tokens)
+            counters = self._counters.setdefault(key, {"requests": 0, "truncations": 0, "continuations": 0})
+            counters["requests"] += 1
+            counters["truncations"] += int(truncated)
+            counters["continuations"] += continuations
+            self._dirty = True
+
+    def suggest_max_tokens(self, model: str, language: str, default: int) -> int:
+        """Returns the max_tokens to request for the next generation of this model and language."""
+        with self._lock:
+            samples = sorted(self._samples.get(_key(model, language), ()))
+        if len(samples) < self.min_samples:
+            return default
+        estimate = _quantile(samples, self.quantile) * self.headroom
+        return max(self.floor, min(default, math.ceil(estimate)))
+
+    def snapshot(self, default: int = 2048) -> dict[str, dict]:
+        """
+        Returns the statistics per "model/language" key, for tuning and reporting.
+
+        Each entry has the sample count, p50/p95/max output tokens, request,
+        truncation and continuation counters and the currently suggested max_tokens
+        (relative to `default`).
+        """
+        with self._lock:
+            keys = {key: (sorted(samples), dict(self._counters.get(key, {}))) for key, samples in self._samples.items()}
+        result = {}
+        for key, (samples, counters) in sorted(keys.items()):
+            model, language = key.rsplit("/", 1)
+            result[key] = {
+                "samples": len(samples),
+                "p50": _quantile(samples, 0.5),
+                "p95": _quantile(samples, 0.95),
+                "max": samples[-1] if samples else 0,
+                **counters,
+                "suggested_max_tokens": self.suggest_max_tokens(model, language, default),
+            }
+        return result
+
+    def save(self) -> None:
+        """Persists the samples to `path` if anything changed."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {
+                "version": STATS_VERSION,
+                "samples": {key: list(samples) for key, samples in self._samples.items()},
+                "counters": self._counters,
+            }
+            self._dirty = False
+        atomic_write_text(self.path, json.dumps(payload))
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get("version") != STATS_VERSION:
+            return
+        for key, samples in data.get("samples", {}).items():
+            self._samples[key] = deque(samples, maxlen=self.window)
+        self._counters = data.get("counters", {})
+
+
+def _key(model: str, language: str) -> str:
+    return f"{model}/{language.lower()}"
+
+
+def _quantile(sorted_samples: list[int], q: float) -> int:
+    if not sorted_samples:
+        return 0
+    return sorted_samples[min(len(sorted_samples) - 1, math.ceil(q * len(sorted_samples)) - 1)]
@@ -0,0 +1,255 @@
+import hashlib
+import heapq
+import itertools
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from .cancellation import CancelScope, entered
+from .code_extraction import extract_code
+from .llm_service import LLMService, LLMServiceError, capture_generation
+from .response_cache import ResponseCache, make_cache_key
+from .token_estimator import estimate_tokens
+
+
+@dataclass
+class PrefetchStats:
+    """Counters describing how well speculative generations paid off."""
+    scheduled: int = 0  # prefetches accepted into the queue
+    skipped: int = 0  # already cached, already queued or the queue was full
+    completed: int = 0  # generated and stored in the cache
+    cancelled: int = 0  # stopped because real traffic arrived
+    failed: int = 0
+    hits: int = 0  # prefetched entries later served to a real request
+    used_tokens: int = 0  # estimated output tokens of prefetches that were served
+    wasted_tokens: int = 0  # estimated output tokens of cancelled, failed or (so far) unused prefetches
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of completed prefetches that were served to a real request."""
+        return self.hits / self.completed if self.completed else 0.0
+
+
+@dataclass(eq=False)
+class _Task:
+    llm: LLMService
+    prompt: str
+    language: str
+    key: str
+
+    def __post_init__(self):
+        self.scope = CancelScope()
+
+
+class LanguageFollowers:
+    """
+    Learns which language clients ask for next when they reuse a prompt.
+
+    When a client requests the same prompt in Python and then in TypeScript,
+    that is one python -> typescript transition. After `min_count` such
+    transitions, predict("python") suggests TypeScript, so the next Python
+    request can prefetch it.
+    """
+
+    def __init__(self, min_count: int = 2, max_clients: int = 4096):
+        """
+        Initializes the LanguageFollowers.
+
+        Args:
+            min_count: Transitions needed before a language is predicted.
+            max_clients: Clients whose last request is remembered (least recent are forgotten).
+        """
+        self.min_count = min_count
+        self.max_clients = max_clients
+        self._transitions: dict[str, Counter[str]] = {}
+        self._last: OrderedDict[str, tuple[str, str]] = OrderedDict()  # client -> (prompt hash, language)
+        self._lock = threading.Lock()
+
+    def observe(self, client: str, prompt: str, language: str) -> None:
+        """Records a real request."""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            previous = self._last.get(client)
+            if previous is not None and previous[0] == prompt_hash and previous[1] != language:
+                self._transitions.setdefault(previous[1], Counter())[language] += 1
+            self._last[client] = (prompt_hash, language)
+            self._last.move_to_end(client)
+            while len(self._last) > self.max_clients:
+                self._last.popitem(last=False)
+
+    def predict(self, language: str, limit: int = 2) -> list[str]:
+        """Returns up to `limit` languages likely to be requested next for the same prompt."""
+        with self._lock:
+            followers = self._transitions.get(language, Counter()).most_common()
+        return [follower for follower, count in followers if count >= self.min_count][:limit]
+
+
+class Prefetcher:
+    """
+    Generates likely-next requests in the background and stores them in a ResponseCache.
+
+    Prefetches only run while the backend is idle: no more than
+    `idle_threshold` real requests are marked with foreground(). When real
+    traffic arrives, running prefetches are cancelled and dropped and queued ones
+    wait until the backend is idle again, highest priority first. Cancelling
+    aborts a prefetch's backend request at once (see cancellation.on_cancel),
+    even while it waits for a token.
+
+    Results are cached under the same key generate requests use
+    (make_cache_key), with a generation id, so a later real request is a plain
+    cache hit that can be rated like any other generation. Call
+    record_use() on such hits to track the hit rate and the tokens spent on
+    prefetches nobody used.
+    """
+
+    def __init__(self, cache: ResponseCache, max_workers: int = 1, max_queue: int = 64, idle_threshold: int = 0):
+        """
+        Initializes the Prefetcher.
+
+        Args:
+            cache: Cache the prefetched generations are stored in.
+            max_workers: Maximum concurrent prefetches.
+            max_queue: Maximum queued prefetches; further submissions are skipped.
+            idle_threshold: Real requests in flight that still count as idle.
+        """
+        self.cache = cache
+        self.max_queue = max_queue
+        self.idle_threshold = idle_threshold
+        self._stats = PrefetchStats()
+        self._queue: list[tuple[float, int, _Task]] = []  # (-priority, submission order, task)
+        self._pending: set[str] = set()  # keys queued or running
+        self._running: set[_Task] = set()
+        self._unused: dict[str, int] = {}  # prefetched key -> estimated tokens, until served
+        self._foreground = 0
+        self._order = itertools.count()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"prefetch-{i}", daemon=True) for i in range(max(1, max_workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, llm: LLMService, prompt: str, language: str, priority: float = 0.0) -> bool:
+        """
+        Queues a speculative generation.
+
+        Returns:
+            Whether it was queued (False if cached, already pending or the queue is full).
+        """
+        key = make_cache_key(llm, prompt, language)
+        cached = key in self.cache
+        with self._condition:
+            if self._closed or cached or key in self._pending or len(self._queue) >= self.max_queue:
+                self._stats.skipped += 1
+                return False
+            heapq.heappush(self._queue, (-priority, next(self._order), _Task(llm, prompt, language, key)))
+            self._pending.add(key)
+            self._stats.scheduled += 1
+            self._condition.notify()
+        return True
+
+    @contextmanager
+    def foreground(self):
+        """Marks real backend work; prefetches yield to it for its duration."""
+        with self._condition:
+            self._foreground += 1
+            if self._foreground > self.idle_threshold:
+                for task in self._running:
+                    task.scope.cancel()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._foreground -= 1
+                self._condition.notify_all()
+
+    def record_use(self, key: str) -> None:
+        """Records that a real request was served the cache entry under `key`."""
+        with self._condition:
+            tokens = self._unused.pop(key, None)
+            if tokens is not None:
+                self._stats.hits += 1
+                self._stats.used_tokens += tokens
+
+    def stats(self) -> PrefetchStats:
+        """Returns a snapshot of the counters; wasted_tokens includes prefetches not used so far."""
+        with self._condition:
+            snapshot = PrefetchStats(**vars(self._stats))
+            snapshot.wasted_tokens += sum(self._unused.values())
+        return snapshot
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Blocks until no prefetch is queued or running; returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending, timeout)
+
+    def close(self) -> None:
+        """Cancels running prefetches, drops queued ones and stops the workers."""
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            for task in self._running:
+                task.scope.cancel()
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and (not self._queue or self._foreground > self.idle_threshold):
+                    self._condition.wait()
+                if self._closed:
+                    return
+                task = heapq.heappop(self._queue)[2]
+                self._running.add(task)
+            try:
+                if task.key in self.cache:
+                    with self._condition:
+                        self._stats.skipped += 1
+                else:
+                    self._run(task)
+            finally:
+                with self._condition:
+                    self._running.discard(task)
+                    self._pending.discard(task.key)
+                    self._condition.notify_all()
+
+    def _run(self, task: _Task) -> None:
+        chunks = []
+        failed = False
+        stream = None
+        try:
+            # The scope lets foreground() and close() abort the backend request.
+            with entered(task.scope), capture_generation() as generation:
+                stream = task.llm.stream_code(task.prompt, task.language)
+                for chunk in stream:
+                    chunks.append(chunk)
+                    if task.scope.cancelled:
+                        break
+        except LLMServiceError:
+            failed = not task.scope.cancelled  # an aborted request isn't a failure
+        finally:
+            # Closing the generator closes the HTTP stream, so the backend stops too.
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+        text = "".join(chunks)
+        tokens = estimate_tokens(text) if text else 0
+        if failed or task.scope.cancelled:
+            with self._condition:
+                self._stats.wasted_tokens += tokens
+                if failed:
+                    self._stats.failed += 1
+                else:
+                    self._stats.cancelled += 1
+            return
+        self.cache.put(
+            task.key, extract_code(text, task.language), language=task.language, prefetched=True, generation_id=generation.id
+        )
+        with self._condition:
+            self._stats.completed += 1
+            self._unused[task.key] = tokens
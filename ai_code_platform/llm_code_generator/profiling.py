@@ -0,0 +1,334 @@
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .storage import atomic_write_text
+
+DEFAULT_INTERVAL = 0.005  # seconds between CPU samples
+MAX_STACK_DEPTH = 128
+UNPHASED = "(no phase)"
+
+# Per-thread CPU clocks let the sampler weight each sample by the CPU time the
+# thread actually used, so threads blocked on the network don't show up.
+# Platforms without them (macOS, Windows) fall back to wall-clock sampling.
+_HAS_THREAD_CLOCKS = hasattr(time, "pthread_getcpuclockid")
+
+_active: "Profiler | None" = None
+_NO_PHASE = contextlib.nullcontext()
+
+
+def phase(name: str):
+    """
+    Marks a pipeline phase ("request", "extract", ...) for the active profiler.
+
+    Phases nest per thread ("generate/request/http"). Without an active
+    profiler this returns a shared no-op context manager, so instrumented code
+    pays next to nothing.
+    """
+    profiler = _active
+    if profiler is None:
+        return _NO_PHASE
+    return profiler.phase(name)
+
+
+@dataclass
+class PhaseStats:
+    """Totals for one phase path. Memory figures are only collected while tracing memory."""
+    calls: int = 0
+    wall: float = 0.0  # seconds
+    cpu: float = 0.0  # seconds of CPU on the calling thread
+    allocated: int = 0  # net bytes still allocated at phase exit
+    peak: int = 0  # highest traced memory above the level at phase entry, in bytes
+
+
+@dataclass
+class _ActivePhase:
+    path: str
+    sampled: bool
+    started: float = 0.0
+    cpu_started: float = 0.0
+    memory_started: int = 0
+    peak: int = 0  # absolute traced-memory peak seen inside this phase (including children)
+
+
+@dataclass
+class _ThreadState:
+    phases: list[_ActivePhase] = field(default_factory=list)
+    clock: int | None = None  # CPU clock id of the thread
+    last_cpu: float | None = None
+
+
+class Profiler:
+    """
+    Low-overhead sampling profiler with CPU and allocation figures per pipeline phase.
+
+    A background thread samples the Python stacks of the profiled threads every
+    `interval` seconds and weights each sample by the CPU time the thread used
+    since the previous one. Stacks are prefixed with the thread's current phase
+    and can be written as collapsed stacks (flamegraph.pl, speedscope, ...).
+
+    With `memory=True`, tracemalloc records the net and peak allocation of each
+    phase and the top allocation sites. Peaks are exact for phases on a single
+    thread and approximate when phases run concurrently. tracemalloc slows
+    allocation-heavy code considerably, so leave it off for production sampling.
+
+    `sample_rate` profiles only that fraction of top-level phases (e.g. 0.05 of
+    requests on a server); unsampled phases cost one random() call and threads
+    outside a sampled phase are ignored by the sampler, which sleeps while no
+    sampled phase is running. At 1.0, CPU used outside any phase is reported
+    too, under "(no phase)".
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, memory: bool = False, sample_rate: float = 1.0, memory_frames: int = 1):
+        """
+        Initializes the Profiler.
+
+        Args:
+            interval: Seconds between stack samples.
+            memory: Whether to trace allocations with tracemalloc.
+            sample_rate: Fraction of top-level phases to profile.
+            memory_frames: Frames stored per allocation traceback (more is slower).
+        """
+        self.interval = interval
+        self.memory = memory
+        self.sample_rate = sample_rate
+        self.memory_frames = memory_frames
+        self.stacks: Counter[str] = Counter()  # collapsed stack -> CPU microseconds
+        self.phases: dict[str, PhaseStats] = {}
+        self.samples = 0
+        self.duration = 0.0
+        self.allocation_sites: list[tracemalloc.Statistic] = []
+        self._threads: dict[int, _ThreadState] = {}
+        self._labels: dict = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()  # set while a sampled phase runs (or always at sample_rate 1.0)
+        self._running_sampled = 0
+        self._sampler: threading.Thread | None = None
+        self._started = 0.0
+        self._owns_tracemalloc = False
+
+    def start(self) -> "Profiler":
+        """Starts sampling and makes this the active profiler for phase()."""
+        global _active
+        self._started = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.memory_frames)
+            self._owns_tracemalloc = True
+        self._thread_state()  # register the starting thread's CPU clock
+        self._stop.clear()
+        if self.sample_rate >= 1.0:
+            self._wake.set()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._sampler.start()
+        _active = self
+        return self
+
+    def stop(self) -> None:
+        """Stops sampling and, when tracing memory, records the top allocation sites."""
+        global _active
+        if _active is self:
+            _active = None
+        self._stop.set()
+        self._wake.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self.duration += time.perf_counter() - self._started
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            self.allocation_sites = snapshot.statistics("lineno")
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+
+    def __enter__(self) -> "Profiler":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Context manager recording one phase on the current thread (see the module-level phase())."""
+        state = self._thread_state()
+        parent = state.phases[-1] if state.phases else None
+        if parent is None:
+            sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        else:
+            sampled = parent.sampled
+        active = _ActivePhase(path=f"{parent.path}/{name}" if parent else name, sampled=sampled)
+        if sampled:
+            if self.memory and tracemalloc.is_tracing():
+                active.memory_started = active.peak = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            active.cpu_started = state.last_cpu = time.thread_time()
+            active.started = time.perf_counter()
+        state.phases.append(active)
+        wakes = sampled and parent is None and self.sample_rate < 1.0
+        if wakes:
+            with self._lock:
+                self._running_sampled += 1
+                self._wake.set()
+        try:
+            yield
+        finally:
+            state.phases.pop()
+            if wakes:
+                with self._lock:
+                    self._running_sampled -= 1
+                    if not self._running_sampled and not self._stop.is_set():
+                        self._wake.clear()
+            if sampled:
+                self._finish(active, parent)
+                # CPU since the last sample can't be told apart by phase; drop it rather than misattribute it.
+                state.last_cpu = time.thread_time()
+
+    def collapsed(self) -> str:
+        """Returns the samples as collapsed stacks: `phase;frame;...;frame <CPU microseconds>` per line."""
+        with self._lock:
+            items = sorted(self.stacks.items())
+        return "".join(f"{stack} {weight}\n" for stack, weight in items)
+
+    def write_collapsed(self, path: str) -> None:
+        """Writes collapsed stacks to `path`, ready for flamegraph.pl or speedscope."""
+        atomic_write_text(path, self.collapsed())
+
+    def summary(self, top: int = 15) -> str:
+        """Returns a human-readable report: phases, hottest functions and, with memory tracing, allocation sites."""
+        with self._lock:
+            stacks = dict(self.stacks)
+            phases = dict(self.phases)
+        total = sum(stacks.values())
+        clock = "CPU" if _HAS_THREAD_CLOCKS else "wall-clock"
+        lines = [f"Profile: {self.samples} samples, {total / 1e6:.3f}s {clock} over {self.duration:.3f}s"]
+
+        if phases:
+            memory = self.memory
+            header = f"  {'phase':<40} {'calls':>6} {'wall ms':>10} {'cpu ms':>10}"
+            lines += ["", header + (f" {'net KiB':>10} {'peak KiB':>10}" if memory else "")]
+            for path, stats in sorted(phases.items()):
+                row = f"  {path:<40} {stats.calls:>6} {stats.wall * 1000:>10.1f} {stats.cpu * 1000:>10.1f}"
+                if memory:
+                    row += f" {stats.allocated / 1024:>10.1f} {stats.peak / 1024:>10.1f}"
+                lines.append(row)
+
+        if total:
+            self_time: Counter[str] = Counter()
+            inclusive: Counter[str] = Counter()
+            by_phase: Counter[str] = Counter()
+            for stack, weight in stacks.items():
+                phase_label, *frames = stack.split(";")
+                by_phase[phase_label] += weight
+                if frames:
+                    self_time[frames[-1]] += weight
+                for frame in set(frames):
+                    inclusive[frame] += weight
+            for title, counter in (
+                (f"{clock} by phase", by_phase),
+                (f"Top functions by self {clock}", self_time),
+                (f"Top functions by total {clock}", inclusive),
+            ):
+                lines += ["", f"{title}:"]
+                for label, weight in counter.most_common(top):
+                    lines.append(f"  {100 * weight / total:5.1f}% {weight / 1000:>9.1f} ms  {label}")
+
+        if self.allocation_sites:
+            lines += ["", "Top allocation sites (still allocated at the end):"]
+            for statistic in self.allocation_sites[:top]:
+                frame = statistic.traceback[0]
+                lines.append(f"  {statistic.size / 1024:>9.1f} KiB {statistic.count:>7} blocks  {os.path.basename(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
+
+    def _thread_state(self) -> _ThreadState:
+        ident = threading.get_ident()
+        state = self._threads.get(ident)
+        if state is None:
+            state = _ThreadState()
+            if _HAS_THREAD_CLOCKS:
+                # Only a thread can safely look up its own clock; the id stays valid (or fails cleanly) after it exits.
+                try:
+                    state.clock = time.pthread_getcpuclockid(ident)
+                    state.last_cpu = time.clock_gettime(state.clock)
+                except OSError:
+                    pass
+            self._threads[ident] = state
+        return state
+
+    def _finish(self, active: _ActivePhase, parent: _ActivePhase | None) -> None:
+        wall = time.perf_counter() - active.started
+        cpu = time.thread_time() - active.cpu_started
+        allocated = peak = 0
+        if self.memory and tracemalloc.is_tracing():
+            current, traced_peak = tracemalloc.get_traced_memory()
+            absolute_peak = max(active.peak, traced_peak)
+            allocated = current - active.memory_started
+            peak = absolute_peak - active.memory_started
+            if parent is not None:
+                # reset_peak() above wiped the parent's peak; hand it the child's.
+                parent.peak = max(parent.peak, absolute_peak)
+        with self._lock:
+            stats = self.phases.setdefault(active.path, PhaseStats())
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.allocated += allocated
+            stats.peak = max(stats.peak, peak)
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()  # idle until a sampled phase starts
+            if self._stop.wait(self.interval):
+                break
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                state = self._threads.get(ident)
+                phases = state.phases if state is not None else None
+                active = phases[-1] if phases else None
+                if active is None and self.sample_rate < 1.0 or active is not None and not active.sampled:
+                    continue
+                weight = self._cpu_weight(state)
+                if weight <= 0:
+                    continue
+                stack = self._collapse(frame, active.path if active else UNPHASED)
+                with self._lock:
+                    self.stacks[stack] += weight
+                    self.samples += 1
+            del frames
+
+    def _cpu_weight(self, state: _ThreadState | None) -> int:
+        """Microseconds of CPU the thread used since its last sample (the interval without thread clocks)."""
+        if state is None or state.clock is None:
+            return 0 if _HAS_THREAD_CLOCKS else int(self.interval * 1e6)
+        try:
+            now = time.clock_gettime(state.clock)
+        except OSError:  # the thread has exited
+            state.clock = None
+            return 0
+        previous, state.last_cpu = state.last_cpu, now
+        return 0 if previous is None else int((now - previous) * 1e6)
+
+    def _collapse(self, frame, phase_path: str) -> str:
+        labels = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+                self._labels[code] = label
+            labels.append(label)
+            frame = frame.f_back
+        labels.append(f"phase:{phase_path}")
+        return ";".join(reversed(labels))
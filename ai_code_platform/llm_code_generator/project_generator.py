@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from .llm_service import LLMConfigurationError, LLMService
+from .storage import atomic_write_text
+
+CHECKPOINT_FILENAME = ".project_checkpoint.json"
+CHECKPOINT_VERSION = 1
+
+
+class ProjectManifestError(LLMConfigurationError):
+    """Raised when a project manifest is malformed (missing fields, unknown dependencies, cycles)."""
+    pass
+
+
+@dataclass
+class ProjectNode:
+    """One file to generate. `path` is relative to the output directory and doubles as the node name."""
+    path: str
+    prompt: str
+    language: str
+    depends_on: list[str] = field(default_factory=list)
+
+
+@dataclass
+class NodeResult:
+    """Outcome of generating (or reusing) one node."""
+    path: str
+    code: str
+    duration: float  # seconds spent generating in this run; 0.0 when reused
+    reused: bool = False
+
+
+@dataclass
+class ProjectReport:
+    """Summary of a project generation run."""
+    results: dict[str, NodeResult]
+    wall_time: float
+    critical_path: list[str]
+    critical_path_time: float
+
+    @property
+    def generated(self) -> list[str]:
+        return [path for path, result in self.results.items() if not result.reused]
+
+    @property
+    def reused(self) -> list[str]:
+        return [path for path, result in self.results.items() if result.reused]
+
+    @property
+    def serial_time(self) -> float:
+        """Time the run would have taken generating one file at a time."""
+        return sum(result.duration for result in self.results.values())
+
+
+def load_manifest(path: str) -> list[ProjectNode]:
+    """
+    Loads a project manifest from a JSON file.
+
+    The manifest looks like::
+
+        {
+          "language": "python",
+          "files": [
+            {"path": "models.py", "prompt": "..."},
+            {"path": "services.py", "prompt": "...", "depends_on": ["models.py"]}
+          ]
+        }
+
+    A per-file "language" overrides the top-level default.
+
+    Args:
+        path: Path to the manifest file.
+
+    Returns:
+        The nodes in manifest order.
+
+    Raises:
+        ProjectManifestError: If the manifest is unreadable or invalid.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ProjectManifestError(f"Could not read project manifest {path}: {e}")
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), list):
+        raise ProjectManifestError(f"Project manifest {path} must be an object with a 'files' list.")
+
+    default_language = manifest.get("language", "python")
+    nodes = []
+    for entry in manifest["files"]:
+        if not isinstance(entry, dict) or not entry.get("path") or not entry.get("prompt"):
+            raise ProjectManifestError(f"Every manifest file entry needs 'path' and 'prompt': {entry!r}")
+        nodes.append(ProjectNode(
+            path=entry["path"],
+            prompt=entry["prompt"],
+            language=entry.get("language", default_language),
+            depends_on=list(entry.get("depends_on", [])),
+        ))
+    validate_graph(nodes)
+    return nodes
+
+
+def validate_graph(nodes: list[ProjectNode]) -> None:
+    """
+    Checks that node paths are unique and relative, dependencies exist and there are no cycles.
+
+    Raises:
+        ProjectManifestError: If the graph is invalid.
+    """
+    by_path = {}
+    for node in nodes:
+        normalized = os.path.normpath(node.path)
+        if os.path.isabs(node.path) or normalized == ".." or normalized.startswith(".." + os.sep):
+            raise ProjectManifestError(f"Manifest paths must stay inside the output directory: {node.path}")
+        if node.path in by_path:
+            raise ProjectManifestError(f"Duplicate file in manifest: {node.path}")
+        by_path[node.path] = node
+    for node in nodes:
+        for dep in node.depends_on:
+            if dep not in by_path:
+                raise ProjectManifestError(f"{node.path} depends on unknown file {dep}")
+
+    # Iterative three-colour DFS so deep manifests don't hit the recursion limit.
+    state = {path: 0 for path in by_path}  # 0 = unvisited, 1 = on stack, 2 = done
+    for root in by_path:
+        if state[root]:
+            continue
+        stack = [(root, iter(by_path[root].depends_on))]
+        state[root] = 1
+        while stack:
+            path, deps = stack[-1]
+            dep = next(deps, None)
+            if dep is None:
+                state[path] = 2
+                stack.pop()
+            elif state[dep] == 1:
+                raise ProjectManifestError(f"Dependency cycle in manifest involving {dep}")
+            elif state[dep] == 0:
+                state[dep] = 1
+                stack.append((dep, iter(by_path[dep].depends_on)))
+
+
+def critical_path(nodes: list[ProjectNode], durations: dict[str, float]) -> tuple[list[str], float]:
+    """
+    Finds the longest duration-weighted dependency chain.
+
+    This is the lower bound on wall time no matter how many workers are used.
+
+    Args:
+        nodes: The project nodes.
+        durations: Seconds spent per node path.
+
+    Returns:
+        The chain of node paths (dependencies first) and its total duration.
+    """
+    by_path = {node.path: node for node in nodes}
+    finish: dict[str, float] = {}
+    previous: dict[str, str | None] = {}
+
+    def resolve(path: str) -> float:
+        # Nodes are resolved in topological order below, so dependencies are known.
+        best_dep, best_time = None, 0.0
+        for dep in by_path[path].depends_on:
+            if finish[dep] > best_time:
+                best_dep, best_time = dep, finish[dep]
+        previous[path] = best_dep
+        return best_time + durations.get(path, 0.0)
+
+    for path in _topological_order(nodes):
+        finish[path] = resolve(path)
+
+    if not finish:
+        return [], 0.0
+    end = max(finish, key=finish.get)
+    chain = []
+    cursor: str | None = end
+    while cursor is not None:
+        chain.append(cursor)
+        cursor = previous[cursor]
+    return list(reversed(chain)), finish[end]
+
+
+def _topological_order(nodes: list[ProjectNode]) -> list[str]:
+    remaining = {node.path: len(node.depends_on) for node in nodes}
+    dependents: dict[str, list[str]] = {node.path: [] for node in nodes}
+    for node in nodes:
+        for dep in node.depends_on:
+            dependents[dep].append(node.path)
+    ready = [path for path, count in remaining.items() if count == 0]
+    order = []
+    while ready:
+        path = ready.pop()
+        order.append(path)
+        for dependent in dependents[path]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    return order
+
+
+class ProjectGenerator:
+    """
+    Generates a multi-file project from a dependency graph of prompts.
+
+    Independent files are generated concurrently against a single LLMService.
+    When a file completes, its code is appended as context to the prompts of the
+    files that depend on it. Progress is checkpointed in the output directory,
+    so a rerun only regenerates files whose prompt, language, model or upstream
+    outputs changed.
+    """
+
+    def __init__(self, llm: LLMService, output_dir: str, max_workers: int = 4):
+        """
+        Initializes the ProjectGenerator.
+
+        Args:
+            llm: The service used to generate every file.
+            output_dir: Directory the generated files (and checkpoint) are written to.
+            max_workers: Maximum number of files generated concurrently.
+        """
+        self.llm = llm
+        self.output_dir = output_dir
+        self.max_workers = max(1, max_workers)
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+        self._checkpoint_lock = threading.Lock()
+
+    def build_prompt(self, node: ProjectNode, completed: dict[str, NodeResult], nodes_by_path: dict[str, ProjectNode]) -> str:
+        """Returns the node's prompt with the code of its dependencies appended."""
+        if not node.depends_on:
+            return node.prompt
+        sections = [node.prompt, "", "The following files have already been generated and can be imported or used:"]
+        for dep in node.depends_on:
+            sections.append(f"\n--- {dep} ({nodes_by_path[dep].language}) ---\n{completed[dep].code}")
+        return "\n".join(sections)
+
+    def fingerprint(self, node: ProjectNode, completed: dict[str, NodeResult]) -> str:
+        """Hashes everything that influences a node's output."""
+        model = getattr(self.llm, "model", None)
+        payload = {
+            "prompt": node.prompt,
+            "language": node.language,
+            "model": model if isinstance(model, str) else None,
+            "service": type(self.llm).__name__,
+            "depends_on": [[dep, _sha256(completed[dep].code)] for dep in node.depends_on],
+        }
+        return _sha256(json.dumps(payload, sort_keys=True))
+
+    def generate(self, nodes: list[ProjectNode]) -> ProjectReport:
+        """
+        Generates every node, respecting dependency order.
+
+        Args:
+            nodes: The project nodes (validated with validate_graph).
+
+        Returns:
+            A ProjectReport with per-file results and critical-path timing.
+
+        Raises:
+            ProjectManifestError: If the graph is invalid.
+            LLMServiceError: If generating any file fails. Files completed before
+                             the failure stay checkpointed.
+        """
+        validate_graph(nodes)
+        nodes_by_path = {node.path: node for node in nodes}
+        dependents: dict[str, list[str]] = {node.path: [] for node in nodes}
+        for node in nodes:
+            for dep in node.depends_on:
+                dependents[dep].append(node.path)
+        remaining = {node.path: len(node.depends_on) for node in nodes}
+
+        checkpoint = self._load_checkpoint()
+        completed: dict[str, NodeResult] = {}
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="project") as executor:
+            running: dict[Future, str] = {}
+
+            def schedule(path: str) -> None:
+                node = nodes_by_path[path]
+                # Dependencies are complete here, so the prompt and fingerprint are final.
+                prompt = self.build_prompt(node, completed, nodes_by_path)
+                fingerprint = self.fingerprint(node, completed)
+                running[executor.submit(self._run_node, node, prompt, fingerprint, checkpoint)] = path
+
+            for node in nodes:
+                if remaining[node.path] == 0:
+                    schedule(node.path)
+
+            try:
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path = running.pop(future)
+                        completed[path] = future.result()
+                        for dependent in dependents[path]:
+                            remaining[dependent] -= 1
+                            if remaining[dependent] == 0:
+                                schedule(dependent)
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+
+        wall_time = time.perf_counter() - started
+        ordered = {node.path: completed[node.path] for node in nodes}
+        chain, chain_time = critical_path(nodes, {path: result.duration for path, result in ordered.items()})
+        return ProjectReport(results=ordered, wall_time=wall_time, critical_path=chain, critical_path_time=chain_time)
+
+    def _run_node(self, node: ProjectNode, prompt: str, fingerprint: str, checkpoint: dict) -> NodeResult:
+        output_path = os.path.join(self.output_dir, node.path)
+        entry = checkpoint.get(node.path)
+        if entry and entry.get("fingerprint") == fingerprint:
+            existing = _read_if_exists(output_path)
+            if existing is not None and _sha256(existing) == entry.get("output_sha256"):
+                return NodeResult(path=node.path, code=existing, duration=0.0, reused=True)
+
+        start = time.perf_counter()
+        code = self.llm.generate_code(prompt, node.language)
+        duration = time.perf_counter() - start
+
+        atomic_write_text(output_path, code)
+        self._record_checkpoint(checkpoint, node.path, {
+            "fingerprint": fingerprint,
+            "output_sha256": _sha256(code),
+            "duration": duration,
+        })
+        return NodeResult(path=node.path, code=code, duration=duration)
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != CHECKPOINT_VERSION:
+            return {}
+        return data.get("nodes", {})
+
+    def _record_checkpoint(self, checkpoint: dict, path: str, entry: dict) -> None:
+        # Written after every node so an interrupted run resumes where it stopped.
+        with self._checkpoint_lock:
+            checkpoint[path] = entry
+            atomic_write_text(
+                self.checkpoint_path,
+                json.dumps({"version": CHECKPOINT_VERSION, "nodes": checkpoint}, indent=2, sort_keys=True),
+            )
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _read_if_exists(path: str) -> str | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
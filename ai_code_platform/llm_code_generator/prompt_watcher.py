@@ -0,0 +1,295 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from .cancellation import CancelScope, entered
+from .code_extraction import extract_code
+from .llm_service import LLMService, LLMServiceError, capture_generation
+from .response_cache import ResponseCache, make_cache_key
+from .storage import atomic_write_text
+
+PROMPT_SUFFIX = ".prompt"
+
+# Maps the output file extension (`handlers.py.prompt` -> `.py`) to the generation language.
+EXTENSION_LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".ts": "typescript",
+    ".go": "go",
+    ".rb": "ruby",
+    ".sh": "bash",
+    ".json": "json",
+    ".java": "java",
+    ".rs": "rust",
+    ".c": "c",
+    ".cpp": "cpp",
+}
+
+
+@dataclass
+class WatchResult:
+    """Outcome of handling one prompt-file change."""
+    prompt_path: str
+    output_path: str
+    status: str  # "generated", "cached", "cancelled" or "failed"
+    duration: float
+    error: str | None = None
+    generation_id: str | None = None  # for feedback on the output (see FeedbackStore)
+
+
+def output_path_for(prompt_path: str, default_language: str) -> tuple[str, str]:
+    """
+    Derives the output file and language for a prompt file.
+
+    `name.py.prompt` generates Python into `name.py`. Prompt files without a known
+    inner extension use `default_language` and get its extension (or `.txt`).
+
+    Returns:
+        The output path and the language to generate.
+    """
+    stem = prompt_path[:-len(PROMPT_SUFFIX)]
+    extension = os.path.splitext(stem)[1].lower()
+    if extension in EXTENSION_LANGUAGES:
+        return stem, EXTENSION_LANGUAGES[extension]
+    default_extension = next((ext for ext, lang in EXTENSION_LANGUAGES.items() if lang == default_language), ".txt")
+    return stem + default_extension, default_language
+
+
+class _Job:
+    def __init__(self, prompt_hash: str):
+        self.prompt_hash = prompt_hash
+        self.scope = CancelScope()
+
+
+class PromptWatcher:
+    """
+    Regenerates code whenever a prompt file in a directory changes.
+
+    The directory is polled for `*.prompt` files (no extra dependencies). A change
+    is acted on once the file has been stable for `debounce` seconds, so editors
+    that save in several steps trigger a single generation. Touching a file
+    without changing its content does nothing.
+
+    Generations are streamed. If a prompt changes again while its generation is
+    in flight, its cancel scope is cancelled, which aborts the backend request
+    at once (even before the first token, see cancellation.on_cancel), and the
+    result is discarded. Results go through a ResponseCache, so reverting an edit
+    restores the previous output without a request, and outputs are written
+    atomically next to their prompt files. Cached results keep their generation
+    id, so a cache with a FeedbackStore regenerates poorly rated outputs instead
+    of restoring them.
+    """
+
+    def __init__(
+        self,
+        llm: LLMService,
+        directory: str,
+        language: str = "python",
+        cache: ResponseCache | None = None,
+        debounce: float = 0.5,
+        poll_interval: float = 0.25,
+        max_workers: int = 4,
+        on_result: Callable[[WatchResult], None] | None = None,
+    ):
+        """
+        Initializes the PromptWatcher.
+
+        Args:
+            llm: The service used to generate code.
+            directory: The directory to watch (recursively).
+            language: Language for prompt files without a recognized inner extension.
+            cache: Optional response cache consulted before each request.
+            debounce: Seconds a file must stay unchanged before it is regenerated.
+            poll_interval: Seconds between directory scans in run().
+            max_workers: Maximum concurrent generations.
+            on_result: Optional callback invoked (from a worker thread) for every WatchResult.
+        """
+        self.llm = llm
+        self.directory = directory
+        self.language = language
+        self.cache = cache
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.on_result = on_result
+        self.generated = 0
+        self.cache_hits = 0
+        self.cancelled = 0
+        self.failed = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="watch")
+        self._lock = threading.Lock()
+        self._signatures: dict[str, tuple[int, int]] = {}  # path -> (mtime_ns, size) last seen
+        self._changed_at: dict[str, float] = {}  # paths waiting for the debounce delay
+        self._done_hashes: dict[str, str] = {}  # path -> prompt hash its output was generated from
+        self._jobs: dict[str, _Job] = {}
+        self._futures = []
+        self._scanned = False
+
+    def poll_once(self, now: float | None = None) -> None:
+        """Scans the directory once and starts generations for settled changes."""
+        now = time.monotonic() if now is None else now
+        current = self._scan()
+        first_scan = not self._scanned
+        self._scanned = True
+
+        for path in set(self._signatures) - set(current):
+            self._signatures.pop(path)
+            self._changed_at.pop(path, None)
+            self._cancel(path)
+
+        for path, signature in current.items():
+            if self._signatures.get(path) == signature:
+                continue
+            self._signatures[path] = signature
+            self._cancel(path)
+            if first_scan and self._output_is_current(path):
+                self._done_hashes[path] = _hash_file(path)
+                continue
+            self._changed_at[path] = now
+
+        for path, changed_at in list(self._changed_at.items()):
+            if now - changed_at < self.debounce:
+                continue
+            del self._changed_at[path]
+            try:
+                prompt = _read_prompt(path)
+            except OSError:
+                continue
+            prompt_hash = _hash_prompt(prompt)
+            if self._done_hashes.get(path) == prompt_hash:
+                continue
+            job = _Job(prompt_hash)
+            with self._lock:
+                self._jobs[path] = job
+            self._futures = [future for future in self._futures if not future.done()]
+            self._futures.append(self._executor.submit(self._generate, path, prompt, job))
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """Polls until `stop` is set (or forever), then cancels in-flight generations."""
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                self.poll_once()
+                stop.wait(self.poll_interval)
+        finally:
+            self.close()
+
+    def wait_idle(self, timeout: float | None = None) -> None:
+        """Blocks until every generation started so far has finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in list(self._futures):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            future.result(remaining)
+        self._futures = [future for future in self._futures if not future.done()]
+
+    def close(self) -> None:
+        """Cancels in-flight generations and stops the workers."""
+        for path in list(self._jobs):
+            self._cancel(path)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        found = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.endswith(PROMPT_SUFFIX):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found[path] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def _output_is_current(self, path: str) -> bool:
+        output_path, _ = output_path_for(path, self.language)
+        try:
+            return os.stat(output_path).st_mtime_ns >= os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+
+    def _cancel(self, path: str) -> None:
+        with self._lock:
+            job = self._jobs.pop(path, None)
+        if job is not None:
+            job.scope.cancel()
+
+    def _generate(self, path: str, prompt: str, job: _Job) -> None:
+        output_path, language = output_path_for(path, self.language)
+        started = time.monotonic()
+        status, error, generation_id = "generated", None, None
+        try:
+            key = make_cache_key(self.llm, prompt, language) if self.cache is not None else None
+            entry = self.cache.get(key) if self.cache is not None else None  # feedback-ranked
+            if entry is not None:
+                code, status, generation_id = entry.code, "cached", entry.metadata.get("generation_id")
+            else:
+                with capture_generation() as generation:
+                    code = self._stream(prompt, language, job)
+                generation_id = generation.id
+                if code is None:
+                    status = "cancelled"
+                elif self.cache is not None:
+                    self.cache.put(key, code, language=language, generation_id=generation_id)
+            if status != "cancelled":
+                if job.scope.cancelled:
+                    status = "cancelled"
+                else:
+                    atomic_write_text(output_path, code)
+        except (LLMServiceError, OSError) as e:  # OSError: the output (or cache) couldn't be written
+            status, error = "failed", str(e)
+
+        with self._lock:
+            if self._jobs.get(path) is job:
+                del self._jobs[path]
+                if status in ("generated", "cached"):
+                    self._done_hashes[path] = job.prompt_hash
+            self.generated += status == "generated"
+            self.cache_hits += status == "cached"
+            self.cancelled += status == "cancelled"
+            self.failed += status == "failed"
+        if self.on_result is not None:
+            self.on_result(WatchResult(path, output_path, status, time.monotonic() - started, error, generation_id))
+
+    def _stream(self, prompt: str, language: str, job: _Job) -> str | None:
+        """Streams one generation, returning None if the job was cancelled meanwhile."""
+        chunks = []
+        stream = None
+        try:
+            with entered(job.scope):  # lets _cancel() abort the backend request
+                stream = self.llm.stream_code(prompt, language)
+                for chunk in stream:
+                    if job.scope.cancelled:
+                        return None
+                    chunks.append(chunk)
+        except LLMServiceError:
+            if not job.scope.cancelled:
+                raise  # a real failure, not the aborted stream
+            return None
+        finally:
+            # Closing the generator closes the HTTP stream, so the backend stops too.
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        if job.scope.cancelled:
+            return None
+        return extract_code("".join(chunks), language)
+
+
+def _read_prompt(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _hash_prompt(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _hash_file(path: str) -> str:
+    # Hash the prompt as it is read for generation (newlines translated), so CRLF files compare equal.
+    return _hash_prompt(_read_prompt(path))
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+
+from .feedback import DOWNRANKED, INVALIDATED, PROMOTED, FeedbackStore
+from .llm_service import LLMService
+from .storage import atomic_write_text
+
+CACHE_KEY_VERSION = 1
+
+
+@dataclass
+class CacheEntry:
+    """A cached generation."""
+    key: str
+    code: str
+    created_at: float = field(default_factory=time.time)
+    metadata: dict = field(default_factory=dict)
+
+
+def service_identity(llm: LLMService) -> dict:
+    """
+    Describes the backend configuration that influences generated output.
+
+    Two services with the same identity are expected to produce interchangeable
+    results for the same prompt, so they can share cache entries.
+    """
+    identity = {"service": type(llm).__name__}
+    for attribute in ("model", "api_base_url"):
+        value = getattr(llm, attribute, None)
+        if isinstance(value, str):
+            identity[attribute] = value
+    return identity
+
+
+def make_cache_key(llm: LLMService, prompt: str, language: str, **params) -> str:
+    """
+    Builds a cache key from the backend identity, prompt, language and any extra parameters.
+
+    Args:
+        llm: The service that generates (or generated) the code.
+        prompt: The prompt as sent to the service.
+        language: The requested language.
+        **params: Additional request parameters that affect the output (JSON-serializable).
+
+    Returns:
+        A hex digest usable as a cache key.
+    """
+    payload = {
+        "v": CACHE_KEY_VERSION,
+        "backend": service_identity(llm),
+        "prompt": prompt,
+        "language": language,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of generated code, optionally persisted to disk.
+
+    The in-memory tier bounds memory use to `max_entries`. When a directory is
+    given, every entry is also written there (one JSON file per key, sharded by
+    the first two hex digits) so the cache survives restarts; disk entries are
+    promoted back into memory on first use.
+
+    With a FeedbackStore, entries stored with a `generation_id` are ranked by
+    their feedback on every lookup: promoted entries are served even past the
+    TTL, downranked ones only to callers that allow them (e.g. as a fallback
+    when regenerating fails), and invalidated ones are removed. Promoted
+    entries are also kept in memory when the LRU tier is full, ahead of
+    unrated ones, so they are reused with or without a TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        directory: str | None = None,
+        ttl: float | None = None,
+        feedback: FeedbackStore | None = None,
+    ):
+        """
+        Initializes the ResponseCache.
+
+        Args:
+            max_entries: Maximum number of entries kept in memory.
+            directory: Optional directory for persistent entries.
+            ttl: Optional maximum entry age in seconds. None keeps entries forever.
+            feedback: Optional FeedbackStore deciding which entries are served.
+        """
+        self.max_entries = max(1, max_entries)
+        self.directory = directory
+        self.ttl = ttl
+        self.feedback = feedback
+        self.hits = 0
+        self.misses = 0
+        self.downranked = 0  # lookups that skipped a downranked entry
+        self.invalidated = 0  # entries removed because of feedback
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, allow_downranked: bool = False) -> CacheEntry | None:
+        """
+        Returns the entry for `key`, or None if it is missing, expired or rejected by feedback.
+
+        Args:
+            key: The cache key.
+            allow_downranked: Also return entries downranked by feedback.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._read_from_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._store_in_memory(entry)
+
+        if entry is not None:
+            entry = self._check(entry, allow_downranked)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, code: str, **metadata) -> CacheEntry:
+        """Stores generated code under `key`, replacing any previous entry."""
+        entry = CacheEntry(key=key, code=code, metadata=metadata)
+        with self._lock:
+            self._store_in_memory(entry)
+        if self.directory:
+            atomic_write_text(self._path(key), json.dumps(asdict(entry)))
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        """Removes an entry from memory and disk."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.directory:
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, key: str) -> bool:
+        """Returns whether a live entry exists, without counting a hit or miss or changing LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._read_from_disk(key)
+        if entry is None:
+            return False
+        verdict = self._verdict(entry)
+        return verdict not in (DOWNRANKED, INVALIDATED) and not self._expired(entry, verdict)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _verdict(self, entry: CacheEntry) -> str | None:
+        if self.feedback is None:
+            return None
+        return self.feedback.verdict(entry.metadata.get("generation_id"))
+
+    def _expired(self, entry: CacheEntry, verdict: str | None = None) -> bool:
+        return self.ttl is not None and verdict != PROMOTED and time.time() - entry.created_at > self.ttl
+
+    def _check(self, entry: CacheEntry, allow_downranked: bool) -> CacheEntry | None:
+        """Returns the entry if it may be served, removing it if expired or invalidated."""
+        verdict = self._verdict(entry)
+        if verdict == INVALIDATED or self._expired(entry, verdict):
+            self.invalidate(entry.key)
+            if verdict == INVALIDATED:
+                with self._lock:
+                    self.invalidated += 1
+            return None
+        if verdict == DOWNRANKED and not allow_downranked:
+            with self._lock:
+                self.downranked += 1
+            return None
+        return entry
+
+    def _store_in_memory(self, entry: CacheEntry) -> None:
+        # Caller holds the lock.
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        spared = 0
+        while len(self._entries) > self.max_entries:
+            key, oldest = next(iter(self._entries.items()))
+            if spared < len(self._entries) - 1 and self._verdict(oldest) == PROMOTED:
+                # A promoted entry gets another round at the recent end instead of being evicted.
+                self._entries.move_to_end(key)
+                spared += 1
+                continue
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_from_disk(self, key: str) -> CacheEntry | None:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return CacheEntry(**json.load(f))
+        except (OSError, json.JSONDecodeError, TypeError):
+            return None
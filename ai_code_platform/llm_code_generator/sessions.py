@@ -0,0 +1,158 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+from .cancellation import CancelScope, entered, on_cancel  # noqa: F401 -- on_cancel is re-exported for backends.
+from .code_extraction import extract_code
+from .llm_service import LLMService, LLMServiceError, RequestCancelledError
+
+
+class SupersededError(RequestCancelledError):
+    """Raised to the caller of a session request that was cancelled by a newer request in the same session."""
+    pass
+
+
+@dataclass
+class SessionStats:
+    """Counters describing the backend time saved by cancelling superseded requests."""
+    requests: int = 0
+    completed: int = 0
+    superseded: int = 0  # stopped early because a newer request arrived
+    backend_seconds: float = 0.0  # backend time of completed requests
+    cancelled_seconds: float = 0.0  # backend time superseded requests ran before they were stopped
+    reclaimed_seconds: float = 0.0  # estimated backend time not spent thanks to the cancellations
+
+
+class SessionRequests:
+    """
+    Runs generation requests so that a newer request in a session cancels the older one.
+
+    Interactive clients (an editor regenerating as the user refines a prompt)
+    only want the latest result. Requests are streamed, so when a new request
+    arrives for the same session key, the in-flight one is aborted: its abort
+    callbacks (see on_cancel) interrupt the backend stream at once, and in any
+    case it stops at its next chunk and closes the stream. Either way the
+    backend stops generating and its slot is freed, and the superseded caller
+    gets a SupersededError.
+
+    Reclaimed backend time is estimated per cancellation as the mean duration
+    of completed session requests minus the time the cancelled one had run.
+    """
+
+    def __init__(self):
+        self._active: dict[str, CancelScope] = {}
+        self._stats = SessionStats()
+        self._lock = threading.Lock()
+
+    def stream(self, session: str, llm: LLMService, prompt: str, language: str) -> Iterator[str]:
+        """
+        Streams a generation in `session`, cancelling the session's in-flight request.
+
+        Returns:
+            An iterator of raw text chunks (see LLMService.stream_code).
+
+        Raises:
+            SupersededError: When iterated, if a newer request in the session cancelled this one.
+        """
+        scope = self._begin(session)
+        return self._stream(session, scope, llm, prompt, language)
+
+    def generate(self, session: str, llm: LLMService, prompt: str, language: str, candidates: int = 1) -> str:
+        """
+        Generates code in `session`, cancelling the session's in-flight request.
+
+        With `candidates` > 1 the backend's candidate race (generate_code) runs as
+        the session's request, and superseding it cancels every candidate.
+
+        Returns:
+            The extracted code.
+
+        Raises:
+            SupersededError: If a newer request in the session cancelled this one.
+        """
+        if candidates > 1:
+            return self._generate_candidates(session, llm, prompt, language, candidates)
+        return extract_code("".join(self.stream(session, llm, prompt, language)), language)
+
+    def cancel(self, session: str) -> bool:
+        """Cancels the session's in-flight request; returns whether there was one."""
+        with self._lock:
+            scope = self._active.pop(session, None)
+        if scope is None:
+            return False
+        scope.cancel()
+        return True
+
+    def stats(self) -> SessionStats:
+        """Returns a snapshot of the counters."""
+        with self._lock:
+            return SessionStats(**vars(self._stats))
+
+    def _begin(self, session: str) -> CancelScope:
+        scope = CancelScope()
+        with self._lock:
+            previous = self._active.get(session)
+            self._active[session] = scope
+            self._stats.requests += 1
+        if previous is not None:
+            previous.cancel()
+        return scope
+
+    def _stream(self, session: str, scope: CancelScope, llm: LLMService, prompt: str, language: str) -> Iterator[str]:
+        started = time.perf_counter()
+        chunks = None
+        finished = False
+        try:
+            # The scope is entered only while the backend runs, so on_cancel() registrations
+            # land on this request even if the caller interleaves several streams on one thread.
+            with entered(scope):
+                chunks = iter(llm.stream_code(prompt, language))
+            while not scope.cancelled:
+                with entered(scope):
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration:
+                        finished = True
+                        break
+                yield chunk
+        except LLMServiceError:
+            if not scope.cancelled:
+                raise  # a real failure, not the aborted stream
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()  # closes the HTTP stream if the backend is still generating
+            self._end(session, scope, time.perf_counter() - started, finished)
+        if not finished:
+            raise SupersededError(f"Request in session {session!r} was superseded by a newer request.")
+
+    def _generate_candidates(self, session: str, llm: LLMService, prompt: str, language: str, candidates: int) -> str:
+        scope = self._begin(session)
+        started = time.perf_counter()
+        finished = False
+        try:
+            with entered(scope):
+                code = llm.generate_code(prompt, language, candidates=candidates)
+            finished = True
+            return code
+        except LLMServiceError:
+            if not scope.cancelled:
+                raise
+        finally:
+            self._end(session, scope, time.perf_counter() - started, finished)
+        raise SupersededError(f"Request in session {session!r} was superseded by a newer request.")
+
+    def _end(self, session: str, scope: CancelScope, elapsed: float, finished: bool) -> None:
+        with self._lock:
+            if self._active.get(session) is scope:
+                del self._active[session]
+            stats = self._stats
+            if finished:
+                stats.completed += 1
+                stats.backend_seconds += elapsed
+            elif scope.cancelled:
+                stats.superseded += 1
+                stats.cancelled_seconds += elapsed
+                if stats.completed:
+                    stats.reclaimed_seconds += max(0.0, stats.backend_seconds / stats.completed - elapsed)
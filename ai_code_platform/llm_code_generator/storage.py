@@ -0,0 +1,137 @@
+import os
+import stat
+import tempfile
+import threading
+
+
+CACHE_DIR_ENV_VAR = "AI_CODE_PLATFORM_CACHE_DIR"
+
+
+def default_cache_dir() -> str:
+    """
+    Returns the directory used for on-disk caches and indexes.
+
+    Uses AI_CODE_PLATFORM_CACHE_DIR if set, otherwise $XDG_CACHE_HOME/ai_code_platform
+    (falling back to ~/.cache/ai_code_platform). The directory is not created here.
+    """
+    override = os.environ.get(CACHE_DIR_ENV_VAR)
+    if override:
+        return override
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ai_code_platform")
+
+
+def atomic_write_text(path: str, text: str, encoding: str = "utf-8") -> None:
+    """
+    Writes text to a file atomically.
+
+    The content is written to a temporary file in the same directory and then
+    renamed over the target, so readers never observe a partially written file.
+    The file keeps the target's permissions, or gets the usual ones for a new
+    file (0666 minus the umask), not the private mode of temporary files.
+
+    Args:
+        path: Destination file path. Parent directories are created if needed.
+        text: The content to write.
+        encoding: Text encoding to use.
+    """
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """
+    Writes bytes to a file atomically, like atomic_write_text().
+
+    Args:
+        path: Destination file path. Parent directories are created if needed.
+        data: The content to write.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class AtomicWriter:
+    """
+    Incrementally writes a file that only appears (atomically) once committed.
+
+    Content goes to a temporary file in the target's directory; commit() renames
+    it over the target, abort() deletes it. Readers see either the previous file
+    or the complete new one, never a partial write. Permissions are handled as
+    in atomic_write_text().
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8"):
+        """
+        Initializes the AtomicWriter and creates its temporary file.
+
+        Args:
+            path: Destination file path. Parent directories are created if needed.
+            encoding: Text encoding to use.
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding=encoding)
+
+    def write(self, text: str) -> None:
+        self._file.write(text)
+
+    def truncate(self) -> None:
+        """Discards everything written so far."""
+        self._file.seek(0)
+        self._file.truncate()
+
+    def commit(self) -> None:
+        """Closes the temporary file and renames it over the target."""
+        self._file.close()
+        try:
+            os.chmod(self._tmp_path, _target_mode(self.path))
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Closes and deletes the temporary file, leaving the target untouched."""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+    def __enter__(self) -> "AtomicWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+_umask: int | None = None
+_umask_lock = threading.Lock()
+
+
+def _target_mode(path: str) -> int:
+    """Returns the permission bits a file written to `path` should get."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        pass
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            # The umask can only be read by setting it; do that once and restore it at once.
+            _umask = os.umask(0o022)
+            os.umask(_umask)
+    return 0o666 & ~_umask
@@ -0,0 +1,288 @@
+import os
+import re
+from typing import Callable, Iterable
+
+from .llm_service import LLMConfigurationError
+from .prompt_watcher import EXTENSION_LANGUAGES
+from .storage import AtomicWriter
+
+# Appended to the prompt in --output-dir mode so multi-file answers name their files.
+MULTI_FILE_INSTRUCTION = (
+    "If the answer consists of several files, put each file in its own fenced code block "
+    "and name it in the fence info string, e.g. ```python path=src/app.py"
+)
+
+_FENCE_RE = re.compile(r"^[ \t]*```[ \t]*([^`]*?)[ \t]*$")
+_PATH_RE = re.compile(r"^[\w.\-/]*\w\.[A-Za-z]\w*$")  # a relative path with an extension
+_KEYED_PATH_RE = re.compile(r"""\b(?:path|file|filename|title)=["']?([^"'\s]+)""")
+_MARKER_RE = re.compile(r"^(?:#+|\*+|file(?:name)?:|path:)?\s*[*`]*([^\s*`]+?)[*`]*:?$", re.IGNORECASE)
+
+
+def fence_filename(info: str, previous_line: str = "") -> str | None:
+    """
+    Finds the file a fenced block belongs to.
+
+    Recognizes a name in the fence info string (```python path=app.py,
+    ```python app.py, ```python:app.py) or a marker line right before the fence
+    (**app.py**, `app.py`, ### app.py, File: app.py).
+
+    Returns:
+        The relative file path, or None if the block isn't annotated.
+    """
+    keyed = _KEYED_PATH_RE.search(info)
+    if keyed:
+        return keyed.group(1)
+    for token in re.split(r"[\s:]+", info):
+        if _PATH_RE.match(token) and not token.startswith("."):
+            return token
+    marker = _MARKER_RE.match(previous_line.strip())
+    if marker and _PATH_RE.match(marker.group(1)):
+        return marker.group(1)
+    return None
+
+
+def default_extension(language: str) -> str:
+    """Returns the file extension used for code in `language` (".txt" if unknown)."""
+    return next((ext for ext, lang in EXTENSION_LANGUAGES.items() if lang == language.lower()), ".txt")
+
+
+class _FenceParser:
+    """
+    Splits streamed text into complete lines and tracks fenced code blocks.
+
+    Only the current incomplete line is buffered. Subclasses handle lines
+    outside fences, the opening fence, code lines and the closing fence.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._in_fence = False
+        self._previous_line = ""
+
+    def feed(self, chunk: str) -> None:
+        """Processes the next chunk of the response."""
+        text = self._partial + chunk
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def finish(self) -> None:
+        """Processes the trailing line once the response is complete."""
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        if self._in_fence:
+            self._in_fence = False
+            self._close_block()
+
+    def _line(self, line: str) -> None:
+        fence = _FENCE_RE.match(line)
+        if self._in_fence:
+            if fence and not fence.group(1):
+                self._in_fence = False
+                self._close_block()
+            else:
+                self._code_line(line)
+        elif fence:
+            self._in_fence = True
+            self._open_block(fence.group(1), self._previous_line)
+        else:
+            self._text_line(line)
+            if line.strip():
+                self._previous_line = line
+
+    def _text_line(self, line: str) -> None:
+        pass
+
+    def _open_block(self, info: str, previous_line: str) -> None:
+        pass
+
+    def _code_line(self, line: str) -> None:
+        pass
+
+    def _close_block(self) -> None:
+        pass
+
+
+class _BlankLineDeferrer:
+    """Writes lines to a writer, dropping leading and trailing blank lines."""
+
+    def __init__(self, writer: AtomicWriter):
+        self.writer = writer
+        self._started = False
+        self._pending_blank = 0
+
+    def write_line(self, line: str) -> None:
+        if not line.strip():
+            if self._started:
+                self._pending_blank += 1
+            return
+        if self._started:
+            self.writer.write("\n" * (self._pending_blank + 1))
+        self.writer.write(line)
+        self._started = True
+        self._pending_blank = 0
+
+    def finish(self) -> None:
+        if self._started:
+            self.writer.write("\n")
+
+
+class StreamingFileWriter(_FenceParser):
+    """
+    Streams the code of a response into one file, like extract_code but incrementally.
+
+    The content of the first fenced block is written; without any fence the
+    whole response is. Text before the first fence is written tentatively and
+    discarded when a fence opens, so nothing but the current line is held in
+    memory. The file is replaced atomically by close().
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._writer = AtomicWriter(path)
+        self._lines = _BlankLineDeferrer(self._writer)
+        self._fenced = False
+        self._done = False
+
+    def _text_line(self, line: str) -> None:
+        if not self._fenced:
+            self._lines.write_line(line)
+
+    def _open_block(self, info: str, previous_line: str) -> None:
+        if not self._fenced:
+            self._fenced = True
+            self._writer.truncate()
+            self._lines = _BlankLineDeferrer(self._writer)
+
+    def _code_line(self, line: str) -> None:
+        if not self._done:
+            self._lines.write_line(line)
+
+    def _close_block(self) -> None:
+        self._done = True
+
+    def close(self) -> list[str]:
+        """Commits the file and returns its path in a list."""
+        self.finish()
+        self._lines.finish()
+        self._writer.commit()
+        return [self.path]
+
+    def abort(self) -> None:
+        """Discards the partially written file."""
+        self._writer.abort()
+
+
+class StreamingFileSplitter(_FenceParser):
+    """
+    Streams a response into separate files, one per fenced block.
+
+    Blocks named in their fence or by a marker line before it (see
+    fence_filename) are written to that path under `directory`; unnamed blocks
+    get generated_<n> names with the language's extension. A response without
+    any fence is written to generated<ext> as a whole. Each file is committed
+    atomically as soon as its block closes, so completed files appear while the
+    rest of the response is still streaming.
+    """
+
+    def __init__(self, directory: str, language: str, on_file: Callable[[str], None] | None = None):
+        """
+        Initializes the StreamingFileSplitter.
+
+        Args:
+            directory: Directory receiving the files.
+            language: Language used to name unannotated blocks.
+            on_file: Optional callback invoked with each file path when it is committed.
+        """
+        super().__init__()
+        self.directory = directory
+        self.extension = default_extension(language)
+        self.on_file = on_file
+        self.files: list[str] = []
+        self._unnamed = 0
+        self._fenced = False
+        self._writer: AtomicWriter | None = None
+        self._lines: _BlankLineDeferrer | None = None
+
+    def _text_line(self, line: str) -> None:
+        if self._fenced:
+            return
+        if self._writer is None:
+            self._start(os.path.join(self.directory, f"generated{self.extension}"))
+        self._lines.write_line(line)
+
+    def _open_block(self, info: str, previous_line: str) -> None:
+        if not self._fenced and self._writer is not None:
+            # Text before the first fence was prose, not a file.
+            self._writer.abort()
+            self._writer = None
+        self._fenced = True
+        name = fence_filename(info, previous_line)
+        if name is None:
+            self._unnamed += 1
+            name = f"generated_{self._unnamed}{self.extension}"
+        self._start(self._resolve(name))
+
+    def _code_line(self, line: str) -> None:
+        self._lines.write_line(line)
+
+    def _close_block(self) -> None:
+        self._commit()
+
+    def close(self) -> list[str]:
+        """Commits any file still open and returns every file written, in order."""
+        self.finish()
+        self._commit()
+        return self.files
+
+    def abort(self) -> None:
+        """Discards the file being written; files already committed are kept."""
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+    def _start(self, path: str) -> None:
+        self._writer = AtomicWriter(path)
+        self._lines = _BlankLineDeferrer(self._writer)
+
+    def _commit(self) -> None:
+        if self._writer is None:
+            return
+        self._lines.finish()
+        self._writer.commit()
+        self.files.append(self._writer.path)
+        self._writer = None
+        if self.on_file is not None:
+            self.on_file(self.files[-1])
+
+    def _resolve(self, name: str) -> str:
+        normalized = os.path.normpath(name)
+        if os.path.isabs(name) or normalized == ".." or normalized.startswith(".." + os.sep):
+            raise LLMConfigurationError(f"Refusing to write generated file outside the output directory: {name}")
+        return os.path.join(self.directory, normalized)
+
+
+def write_stream(chunks: Iterable[str], output: StreamingFileWriter | StreamingFileSplitter) -> list[str]:
+    """
+    Feeds a streamed response into a file writer or splitter.
+
+    On error the file being written is discarded and the stream closed (which
+    aborts the backend request); files already completed are kept.
+
+    Returns:
+        The paths written.
+    """
+    try:
+        for chunk in chunks:
+            output.feed(chunk)
+        return output.close()
+    except BaseException:
+        output.abort()
+        raise
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
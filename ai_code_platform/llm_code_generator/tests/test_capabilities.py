@@ -0,0 +1,91 @@
+import json
+import time
+
+import pytest
+import requests
+
+from ..capabilities import CapabilityCache, ServerCapabilities, probe_server
+from ..fake_llm_server import FakeLLMServer
+from ..local_llm_service import LocalLLMService
+
+
+def test_probe_detects_full_support():
+    with FakeLLMServer() as server:
+        base = server.url[:-len("/v1")]
+        capabilities = probe_server(base)  # /v1 is found by probing
+    assert capabilities.api_base_url == server.url
+    assert capabilities.models == ["fake-model"]
+    assert capabilities.streaming and capabilities.n and capabilities.keep_alive
+    assert len(server.requests) == 3  # plain, `n` and streamed chat probes
+
+
+def test_probe_detects_limited_server():
+    with FakeLLMServer(supports_n=False, supports_streaming=False) as server:
+        capabilities = probe_server(server.url)
+    assert not (capabilities.streaming or capabilities.n)
+    assert capabilities.keep_alive
+
+
+def test_probe_unreachable_server_raises():
+    with FakeLLMServer() as server:
+        url = server.url
+    with pytest.raises(requests.exceptions.RequestException):
+        probe_server(url, timeout=2)
+
+
+def test_cache_persists_per_endpoint_and_expires(tmp_path):
+    path = str(tmp_path / "capabilities.json")
+    with FakeLLMServer() as server:
+        cache = CapabilityCache(path=path)
+        first = cache.get_or_probe(server.url)
+        assert cache.get_or_probe(server.url) == first
+        assert cache.probes == 1
+        probes = len(server.requests)
+
+        reopened = CapabilityCache(path=path)
+        assert reopened.get_or_probe(server.url + "/") == first
+        assert reopened.probes == 0 and len(server.requests) == probes
+
+        expired = CapabilityCache(path=path, ttl=0)
+        time.sleep(0.01)
+        assert expired.get(server.url) is None
+        expired.get_or_probe(server.url)
+        assert expired.probes == 1
+
+    with open(path, encoding="utf-8") as f:
+        assert list(json.load(f)["endpoints"]) == [server.url]
+
+
+def test_service_uses_probed_profile(tmp_path):
+    cache = CapabilityCache(path=str(tmp_path / "capabilities.json"))
+    with FakeLLMServer(supports_n=False, supports_streaming=False) as server:
+        base = server.url[:-len("/v1")]
+        llm = LocalLLMService(api_base_url=base, capabilities=cache)
+        assert llm.chat_completions_url == f"{server.url}/chat/completions"
+        assert llm.model == "fake-model"  # the placeholder model is replaced by the listed one
+        assert isinstance(llm.session, requests.Session)
+
+        server.requests.clear()
+        assert "def " in "".join(llm.stream_code("add numbers", "python"))
+        assert "stream" not in server.requests[-1]
+
+        server.requests.clear()
+        llm.generate_code("add numbers", "python", candidates=3)
+        assert server.requests and all("n" not in payload for payload in server.requests)
+
+
+def test_service_falls_back_when_probe_fails(tmp_path):
+    with FakeLLMServer() as server:
+        url = server.url
+    llm = LocalLLMService(api_base_url=url, model="m", capabilities=CapabilityCache(path=str(tmp_path / "c.json")))
+    assert llm.server_capabilities is None
+    assert llm.chat_completions_url == f"{url}/chat/completions"
+    assert llm.session is None
+
+
+def test_cached_profile_skips_probe(tmp_path):
+    cache = CapabilityCache(path=str(tmp_path / "capabilities.json"))
+    cache.put("http://example.invalid/v1", ServerCapabilities(api_base_url="http://example.invalid/v1", models=["m"], streaming=True))
+    llm = LocalLLMService(api_base_url="http://example.invalid/v1", model="other", capabilities=cache)
+    assert llm.server_capabilities.streaming and cache.probes == 0
+    assert llm.model == "other"  # an explicit model is kept
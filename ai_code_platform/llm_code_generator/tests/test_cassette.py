@@ -0,0 +1,222 @@
+import gzip
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+import anthropic
+import pytest
+import requests
+
+from ..cassette import (
+    Call,
+    Cassette,
+    CassetteMissError,
+    Exchange,
+    RecordingAnthropicClient,
+    ReplayAnthropicClient,
+    ReplayTransport,
+    record_service,
+    replay_services,
+    replay_traffic,
+)
+from ..cancellation import CancelScope, entered
+from ..claude_service import ClaudeService
+from ..fake_llm_server import FakeLLMServer
+from ..llm_service import LLMAPIError, RequestCancelledError
+from ..local_llm_service import LocalLLMService
+
+
+def _local_exchange(content: str, offset: float = 0.0, latency: float = 0.0, **request) -> Exchange:
+    body = {"choices": [{"message": {"content": content}, "finish_reason": "stop"}]}
+    return Exchange(
+        service="local",
+        request={"model": "m", "messages": [{"role": "user", "content": "hi"}], **request},
+        offset=offset,
+        latency=latency,
+        body=json.dumps(body),
+        url="http://localhost:1234/v1/chat/completions",
+    )
+
+
+def test_record_and_replay_local_service(tmp_path):
+    """Test that local traffic recorded against a server replays identically without it."""
+    path = str(tmp_path / "traffic.cassette")
+    with FakeLLMServer(first_token_latency=0.05) as server:
+        cassette = Cassette(path)
+        service = record_service(LocalLLMService(api_base_url=server.url), cassette)
+        code = service.generate_code("Write a function to add numbers", "python")
+        streamed = "".join(service.stream_code("Write a function to sort", "python"))
+        cassette.close()
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["version"] == 2
+    loaded = Cassette.load(path)
+    assert [e.request.get("stream", False) for e in loaded.exchanges] == [False, True]
+    assert loaded.exchanges[0].latency >= 0.05
+    assert loaded.exchanges[1].chunks
+    # Only the outer calls are recorded, not the complete/stream_complete calls they make.
+    assert [(c.method, c.args["prompt"]) for c in loaded.calls] == [
+        ("generate_code", "Write a function to add numbers"),
+        ("stream_code", "Write a function to sort"),
+    ]
+
+    replay = LocalLLMService(api_base_url=server.url, transport=ReplayTransport(loaded, time_scale=0))
+    assert replay.generate_code("Write a function to add numbers", "python") == code
+    assert "".join(replay.stream_code("Write a function to sort", "python")) == streamed
+
+
+def test_recording_is_written_as_it_happens(tmp_path):
+    """Test that each finished exchange is on disk at once, and a cut-off tail is skipped on load."""
+    path = tmp_path / "traffic.cassette"
+    with FakeLLMServer() as server:
+        cassette = Cassette(str(path))
+        service = record_service(LocalLLMService(api_base_url=server.url), cassette)
+        service.generate_code("first", "python")
+        assert [c.method for c in Cassette.load(str(path)).calls] == ["generate_code"]  # before close()
+        service.generate_code("second", "python")
+    assert cassette.exchanges == [] and cassette.calls == []  # nothing held in memory
+
+    data = path.read_bytes()
+    path.write_bytes(data[:-10])  # as if the process died while appending the last record
+    loaded = Cassette.load(str(path))
+    assert [c.args["prompt"] for c in loaded.calls] == ["first"] and len(loaded.exchanges) == 2
+    cassette.close()
+
+
+def _stream_cancelled_after(service: LocalLLMService, delay: float) -> float:
+    scope = CancelScope()
+    threading.Timer(delay, scope.cancel).start()
+    started = time.monotonic()
+    with entered(scope), pytest.raises(RequestCancelledError):
+        service._stream_completion("s", "hi", max_tokens=64)
+    return time.monotonic() - started
+
+
+def test_recorded_and_replayed_streams_abort_when_cancelled():
+    """Test that cancelling a request interrupts a recording or replayed stream still waiting for a token."""
+    with FakeLLMServer(first_token_latency=1.0) as server:
+        recording = record_service(LocalLLMService(api_base_url=server.url), Cassette())
+        assert _stream_cancelled_after(recording, 0.1) < 0.5
+
+    slow = _local_exchange("unused", stream=True)
+    slow.request["messages"] = [{"role": "system", "content": "s"}, {"role": "user", "content": "hi"}]
+    slow.chunks = [[0.0, 'data: {"choices": [{"delta": {"content": "x"}}]}'], [5.0, "data: [DONE]"]]
+    replay = LocalLLMService(transport=ReplayTransport(Cassette(exchanges=[slow]), time_scale=1))
+    assert _stream_cancelled_after(replay, 0.1) < 0.5
+
+
+def test_replay_ignores_tuning_parameters():
+    """Test that requests match on the conversation, not on temperature or max_tokens."""
+    cassette = Cassette(exchanges=[_local_exchange("x = 1", max_tokens=2048, temperature=0.7)])
+    service = LocalLLMService(transport=ReplayTransport(cassette, time_scale=0))
+    completion = service._chat_completion([{"role": "user", "content": "hi"}], max_tokens=300)[0]
+    assert completion.text == "x = 1"
+
+
+def test_replay_reproduces_scaled_latency():
+    """Test that replay waits the recorded latency times the time scale."""
+    cassette = Cassette(exchanges=[_local_exchange("x = 1", latency=0.2)])
+    service = LocalLLMService(transport=ReplayTransport(cassette, time_scale=0.5))
+    started = time.monotonic()
+    service._chat_completion([{"role": "user", "content": "hi"}])
+    assert 0.09 <= time.monotonic() - started < 0.2
+
+
+def test_replay_repeated_requests_in_order_then_reuses_last():
+    """Test that identical requests get their recorded responses in order."""
+    cassette = Cassette(exchanges=[_local_exchange("first"), _local_exchange("second", offset=1.0)])
+    service = LocalLLMService(transport=ReplayTransport(cassette, time_scale=0))
+    messages = [{"role": "user", "content": "hi"}]
+    assert [service._chat_completion(messages)[0].text for _ in range(3)] == ["first", "second", "second"]
+
+
+def test_replay_miss_and_recorded_errors():
+    """Test that unmatched requests and recorded failures surface as LLMAPIError."""
+    failed = _local_exchange("unused")
+    failed.request["messages"] = [{"role": "user", "content": "down"}]
+    failed.body, failed.error = None, "ConnectionError: refused"
+    rejected = _local_exchange("unused")
+    rejected.request["messages"] = [{"role": "user", "content": "bad"}]
+    rejected.status, rejected.body = 400, "invalid model"
+    service = LocalLLMService(transport=ReplayTransport(Cassette(exchanges=[failed, rejected]), time_scale=0))
+
+    with pytest.raises(LLMAPIError, match="No recorded local exchange"):
+        service._chat_completion([{"role": "user", "content": "other"}])
+    with pytest.raises(LLMAPIError, match="connection error"):
+        service._chat_completion([{"role": "user", "content": "down"}])
+    with pytest.raises(LLMAPIError, match="status 400"):
+        service._chat_completion([{"role": "user", "content": "bad"}])
+    with pytest.raises(CassetteMissError):
+        service.transport.post(service.chat_completions_url, data=json.dumps({"messages": []}))
+
+
+def test_record_captures_connection_errors():
+    """Test that a failed request is recorded along with the error."""
+    inner = MagicMock()
+    inner.post.side_effect = requests.exceptions.ConnectionError("refused")
+    cassette = Cassette()
+    service = record_service(LocalLLMService(session=inner), cassette)
+    with pytest.raises(LLMAPIError):
+        service._chat_completion([{"role": "user", "content": "hi"}])
+    assert cassette.exchanges[0].error == "ConnectionError: refused"
+
+
+def _claude_message(text: str) -> anthropic.types.Message:
+    return anthropic.types.Message.model_validate({
+        "id": "msg_1",
+        "type": "message",
+        "role": "assistant",
+        "model": "claude-3-haiku-20240307",
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": 10, "output_tokens": 5},
+    })
+
+
+def test_record_and_replay_claude_service():
+    """Test that Claude create and stream calls are recorded and replayed through the SDK types."""
+    client = MagicMock()
+    client.messages.create.return_value = _claude_message("```python\nx = 1\n```")
+    stream = MagicMock()
+    stream.text_stream = iter(["x = ", "2"])
+    stream.get_final_message.return_value = _claude_message("x = 2")
+    client.messages.stream.return_value.__enter__.return_value = stream
+    cassette = Cassette()
+
+    service = ClaudeService(api_key="key")
+    service.client = RecordingAnthropicClient(client, cassette)
+    assert service.generate_code("prompt", "python") == "x = 1"
+    assert "".join(service.stream_complete("system", "prompt")) == "x = 2"
+    assert [e.service for e in cassette.exchanges] == ["claude", "claude"]
+    assert cassette.exchanges[0].body["usage"]["output_tokens"] == 5
+    assert [chunk[1] for chunk in cassette.exchanges[1].chunks] == ["x = ", "2"]
+
+    replay = ClaudeService(api_key="key")
+    replay.client = ReplayAnthropicClient(cassette, time_scale=0)
+    assert replay.generate_code("prompt", "python") == "x = 1"
+    replayed = replay.stream_complete("system", "prompt")
+    assert "".join(replayed) == "x = 2"
+    assert (replayed.finish_reason, replayed.output_tokens) == ("end_turn", 5)
+
+
+def test_replay_traffic_reports_latency_and_throughput(tmp_path):
+    """Test that recorded traffic is re-issued at scaled arrival times and measured."""
+    exchanges = [
+        _local_exchange(f"x = {i}", offset=i * 0.1, latency=0.1, max_tokens=64)
+        for i in range(4)
+    ]
+    calls = []
+    for i, exchange in enumerate(exchanges):
+        exchange.request["messages"] = [{"role": "system", "content": "s"}, {"role": "user", "content": f"prompt {i}"}]
+        calls.append(Call(service="local", method="complete", args={"system_prompt": "s", "prompt": f"prompt {i}", "max_tokens": 64}, offset=i * 0.1, latency=0.1))
+    cassette = Cassette(str(tmp_path / "traffic.cassette"), exchanges, calls)
+    cassette.save()
+
+    report = replay_traffic(Cassette.load(cassette.path), time_scale=0.5, concurrency=4)
+    summary = report.summary()
+    assert summary["requests"] == 4 and summary["errors"] == 0
+    assert 0.2 <= report.wall_time < 0.4  # last arrival at 0.15s plus 0.05s latency
+    assert summary["p50_ms"] >= 45
+    assert summary["recorded"] == {"wall_time_s": 0.4, "p50_ms": 100.0, "p95_ms": 100.0}
+    assert set(replay_services(cassette)) == {"local"}
@@ -2,6 +2,7 @@ import pytest
 import os
 from unittest.mock import patch, MagicMock
 from ..claude_service import ClaudeService, LLMConfigurationError, LLMAPIError
+from ..client_registry import CLIENT_REGISTRY
 from anthropic import Anthropic, APIConnectionError, RateLimitError, APIStatusError, APIError
 
 @pytest.fixture
@@ -15,6 +16,13 @@ def mock_anthropic_constructor(): # Yields the constructor mock
         mock_constructor.return_value = mock_instance
         yield mock_constructor
 
+@pytest.fixture(autouse=True)
+def clear_client_registry():
+    # Clients are shared per API key; each test must see its own (possibly mocked) client.
+    CLIENT_REGISTRY.clear()
+    yield
+    CLIENT_REGISTRY.clear()
+
 @pytest.fixture(autouse=True)
 def clear_env_vars():
     # Ensure ANTHROPIC_API_KEY is not set from the test runner's environment
@@ -183,6 +191,108 @@ def test_claude_service_generate_code_response_no_text_block(mock_anthropic_cons
         service.generate_code(prompt, language)
     assert "Claude API response content block does not have text" in str(excinfo.value)
 
+def test_claude_service_candidates_concurrent_first_valid(mock_anthropic_constructor):
+    """Test that Claude candidates are requested concurrently and the first valid one is returned."""
+    service = ClaudeService(api_key="test_key")
+    mock_client_instance = mock_anthropic_constructor.return_value
+
+    def make_stream(text):
+        stream = MagicMock()
+        stream.text_stream = iter([text])
+        stream.get_final_message.return_value.stop_reason = "end_turn"
+        context = MagicMock()
+        context.__enter__.return_value = stream
+        return context
+
+    # Candidates are streamed so the losers can be aborted.
+    mock_client_instance.messages.stream.side_effect = [
+        make_stream("def broken(:"),
+        make_stream("```python\ndef ok():\n    return 1\n```"),
+    ]
+
+    generated_code = service.generate_code("prompt", "python", candidates=2)
+
+    assert generated_code == "def ok():\n    return 1"
+    assert mock_client_instance.messages.stream.call_count == 2
+    mock_client_instance.messages.create.assert_not_called()
+
+def test_claude_service_candidates_all_api_errors(mock_anthropic_constructor):
+    """Test that API errors surface as LLMAPIError when no candidate was produced."""
+    service = ClaudeService(api_key="test_key")
+    mock_client_instance = mock_anthropic_constructor.return_value
+    mock_client_instance.messages.stream.side_effect = Exception("boom")
+
+    with pytest.raises(LLMAPIError) as excinfo:
+        service.generate_code("prompt", "python", candidates=3)
+    assert "boom" in str(excinfo.value)
+
+def test_claude_service_stream_code(mock_anthropic_constructor):
+    """Test that Claude text deltas are streamed through the SDK stream helper."""
+    service = ClaudeService(api_key="test_key")
+    mock_client_instance = mock_anthropic_constructor.return_value
+    stream = MagicMock()
+    stream.text_stream = iter(["def f():", "\n    return 1"])
+    mock_client_instance.messages.stream.return_value.__enter__.return_value = stream
+
+    assert list(service.stream_code("prompt", "python")) == ["def f():", "\n    return 1"]
+    kwargs = mock_client_instance.messages.stream.call_args[1]
+    assert kwargs["model"] == service.model
+    assert kwargs["messages"] == [{"role": "user", "content": "prompt"}]
+    mock_client_instance.messages.stream.return_value.__exit__.assert_called_once()
+
+def test_claude_service_stream_errors_are_translated(mock_anthropic_constructor):
+    """Test that streaming errors surface as LLMAPIError."""
+    service = ClaudeService(api_key="test_key")
+    mock_anthropic_constructor.return_value.messages.stream.side_effect = Exception("stream broke")
+
+    with pytest.raises(LLMAPIError) as excinfo:
+        list(service.stream_code("prompt", "python"))
+    assert "stream broke" in str(excinfo.value)
+
+def test_claude_service_warm_up(mock_anthropic_constructor):
+    """Test that warm-up preconnects via the model list and sends minimal priming requests."""
+    service = ClaudeService(api_key="test_key")
+    client = mock_anthropic_constructor.return_value
+    client.models = MagicMock()
+    client.messages.create.return_value = MagicMock(content=[MagicMock(text="OK")])
+
+    report = service.warm_up("python")
+
+    client.models.list.assert_called_once_with(limit=1)
+    assert client.messages.create.call_count == 2
+    kwargs = client.messages.create.call_args[1]
+    assert kwargs["max_tokens"] == 1
+    assert kwargs["system"] == service._system_prompt("python")
+    assert report.warm_latency is not None
+
+def test_claude_service_warm_up_connection_error(mock_anthropic_constructor):
+    """Test that an unreachable API fails warm-up with LLMAPIError."""
+    service = ClaudeService(api_key="test_key")
+    client = mock_anthropic_constructor.return_value
+    client.models = MagicMock()
+    client.models.list.side_effect = APIConnectionError(request=MagicMock())
+
+    with pytest.raises(LLMAPIError) as excinfo:
+        service.warm_up()
+    assert "Claude API connection error" in str(excinfo.value)
+    client.messages.create.assert_not_called()
+
+def test_claude_service_continues_truncated_reply(mock_anthropic_constructor):
+    """Test that a reply stopped at max_tokens is continued via an assistant prefill."""
+    service = ClaudeService(api_key="test_key")
+    client = mock_anthropic_constructor.return_value
+    first = MagicMock(content=[MagicMock(text="```python\ndef f():\n   ")], stop_reason="max_tokens")
+    second = MagicMock(content=[MagicMock(text="\n    return 1\n```")], stop_reason="end_turn")
+    client.messages.create.side_effect = [first, second]
+
+    assert service.generate_code("prompt", "python") == "def f():\n    return 1"
+
+    messages = client.messages.create.call_args_list[1][1]["messages"]
+    assert messages == [
+        {"role": "user", "content": "prompt"},
+        {"role": "assistant", "content": "```python\ndef f():"},
+    ]
+
 def test_anthropic_client_initialization_failure(mock_anthropic_constructor): # Use the constructor mock
     """Test LLMConfigurationError if Anthropic client fails to initialize."""
     with patch('anthropic.Anthropic', side_effect=Exception("Init failed")):
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import patch, MagicMock
 import sys
+import json
 import os
 from io import StringIO
 # Import the main function from your CLI script
@@ -161,3 +162,331 @@ def test_cli_local_llm_api_error(mock_local_llm_service_constructor):
 
     assert exit_code == 1
     assert f"API Error: {expected_error_msg}" in stderr
+
+
+def test_cli_candidates_parameter(mock_local_llm_service_constructor):
+    """Test that --candidates is forwarded to generate_code."""
+    prompt = "candidates test"
+    mock_local_instance = mock_local_llm_service_constructor.return_value
+
+    exit_code, stdout, stderr = run_cli_in_test([prompt, "--candidates", "4"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    mock_local_instance.generate_code.assert_called_once_with(prompt, "python", candidates=4)
+
+
+def test_cli_validation_error(mock_local_llm_service_constructor):
+    """Test CLI handles LLMValidationError when no candidate is valid."""
+    from ai_code_platform.llm_code_generator.llm_service import LLMValidationError
+    mock_local_instance = mock_local_llm_service_constructor.return_value
+    mock_local_instance.generate_code.side_effect = LLMValidationError("None of the 2 python candidates passed validation")
+
+    exit_code, _, stderr = run_cli_in_test(["prompt", "--candidates", "2"])
+    assert exit_code == 1
+    assert "Validation Error: None of the 2 python candidates" in stderr
+
+
+def test_cli_project_subcommand(mock_local_llm_service_constructor, tmp_path):
+    """Test the project subcommand generates files from a manifest."""
+    import json
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps({"files": [
+        {"path": "models.py", "prompt": "models"},
+        {"path": "services.py", "prompt": "services", "depends_on": ["models.py"]},
+    ]}))
+    out = tmp_path / "out"
+
+    exit_code, stdout, stderr = run_cli_in_test(["project", str(manifest), "--output-dir", str(out), "--jobs", "2"])
+
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert (out / "models.py").read_text() == "Generated by Mocked Local LLM"
+    assert "Generated 2 files, reused 0 unchanged files." in stdout
+    assert "Critical path:" in stdout
+    assert "models.py -> services.py" in stdout
+
+
+def test_cli_project_invalid_manifest(mock_local_llm_service_constructor, tmp_path):
+    """Test the project subcommand reports manifest errors."""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('{"files": [{"path": "a.py", "prompt": "a", "depends_on": ["b.py"]}]}')
+
+    exit_code, _, stderr = run_cli_in_test(["project", str(manifest)])
+    assert exit_code == 1
+    assert "Configuration Error: a.py depends on unknown file b.py" in stderr
+
+
+def test_cli_refine_subcommand_in_place(mock_local_llm_service_constructor, tmp_path):
+    """Test the refine subcommand writes the refined code and reports token savings."""
+    from ai_code_platform.llm_code_generator.llm_service import RefineResult
+    source = tmp_path / "module.py"
+    source.write_text("x = 1\n")
+    mock_local_instance = mock_local_llm_service_constructor.return_value
+    mock_local_instance.refine_code.return_value = RefineResult(
+        code="x = 2\n", used_patch=True, output_tokens=15, full_regeneration_tokens=400,
+    )
+
+    exit_code, stdout, stderr = run_cli_in_test(["refine", str(source), "set x to 2", "--in-place"])
+
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    mock_local_instance.refine_code.assert_called_once_with("x = 1\n", "set x to 2", "python")
+    assert source.read_text() == "x = 2\n"
+    assert "saved ~385" in stdout
+
+
+def test_cli_multiple_languages(mock_local_llm_service_constructor):
+    """Test that several --language values use a single multi-language request."""
+    prompt = "multi language test"
+    mock_local_instance = mock_local_llm_service_constructor.return_value
+    mock_local_instance.generate_multi_language.return_value = {
+        "python": "py code", "typescript": "ts code", "go": "go code",
+    }
+
+    exit_code, stdout, stderr = run_cli_in_test([prompt, "--language", "python", "typescript,go"])
+
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    mock_local_instance.generate_multi_language.assert_called_once_with(prompt, ["python", "typescript", "go"])
+    mock_local_instance.generate_code.assert_not_called()
+    assert "--- Generated Code (typescript) ---" in stdout
+    assert "go code" in stdout
+
+
+def test_cli_context_files(mock_local_llm_service_constructor, tmp_path):
+    """Test that --context packs files in front of the prompt."""
+    (tmp_path / "models.py").write_text("class UserAccount:\n    pass\n")
+    mock_local_instance = mock_local_llm_service_constructor.return_value
+
+    with patch.dict(os.environ, {"AI_CODE_PLATFORM_CACHE_DIR": str(tmp_path / "cache")}):
+        exit_code, stdout, stderr = run_cli_in_test(["extend UserAccount", "--context", str(tmp_path / "*.py")])
+
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert "Packed 1 context files" in stdout
+    sent_prompt = mock_local_instance.generate_code.call_args[0][0]
+    assert "class UserAccount:" in sent_prompt
+    assert sent_prompt.endswith("Task: extend UserAccount")
+
+
+def test_cli_http2_option_uses_local_transport(mock_local_llm_service_constructor):
+    """Test that --http2 passes a LocalTransport to the local service."""
+    from ai_code_platform.llm_code_generator.local_transport import LocalTransport
+    exit_code, _, stderr = run_cli_in_test(["prompt", "--http2"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert isinstance(mock_local_llm_service_constructor.call_args[1]["transport"], LocalTransport)
+
+
+def test_cli_warmup_and_keep_alive_options(mock_local_llm_service_constructor):
+    """Test that --warmup primes the service before generating and --keep-alive is forwarded."""
+    from ai_code_platform.llm_code_generator.llm_service import WarmupReport
+    mock_instance = mock_local_llm_service_constructor.return_value
+    mock_instance.warm_up.return_value = WarmupReport(preconnect_time=0.01, cold_latency=1.5, warm_latency=0.05)
+
+    exit_code, stdout, stderr = run_cli_in_test(["prompt", "--language", "go", "--warmup", "--keep-alive", "10m"])
+
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert mock_local_llm_service_constructor.call_args[1]["keep_alive"] == "10m"
+    mock_instance.warm_up.assert_called_once_with("go")
+    assert "cold first call 1500 ms, warm call 50 ms" in stdout
+    assert stdout.index("Warm-up") < stdout.index("--- Generated Code ---")
+
+
+def test_cli_watch_subcommand(mock_local_llm_service_constructor, tmp_path, monkeypatch):
+    """Test that `watch` builds a PromptWatcher with a persistent cache and runs it."""
+    monkeypatch.setenv("AI_CODE_PLATFORM_CACHE_DIR", str(tmp_path))
+    with patch("ai_code_platform.cli.PromptWatcher") as mock_watcher:
+        mock_watcher.return_value.generated = 2
+        mock_watcher.return_value.cache_hits = 1
+        mock_watcher.return_value.cancelled = 0
+        exit_code, stdout, stderr = run_cli_in_test([
+            "watch", str(tmp_path), "--debounce", "1.5", "--cache-dir", str(tmp_path / "cache"),
+        ])
+
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    args, kwargs = mock_watcher.call_args
+    assert args == (mock_local_llm_service_constructor.return_value, str(tmp_path))
+    assert kwargs["debounce"] == 1.5
+    assert kwargs["cache"].directory == str(tmp_path / "cache")
+    assert kwargs["cache"].feedback is not None  # rated-down outputs are regenerated, not restored
+    mock_watcher.return_value.run.assert_called_once_with()
+    assert "Generated 2, served 1 from cache" in stdout
+
+
+def test_cli_adaptive_max_tokens_and_token_stats(mock_local_llm_service_constructor, tmp_path, monkeypatch):
+    """Test that --adaptive-max-tokens passes persistent stats and token-stats reports them."""
+    monkeypatch.setenv("AI_CODE_PLATFORM_CACHE_DIR", str(tmp_path))
+
+    def generate(prompt, language):
+        mock_local_llm_service_constructor.call_args[1]["output_stats"].record("local-model", language, 321)
+        return "code"
+
+    mock_local_llm_service_constructor.return_value.generate_code.side_effect = generate
+    exit_code, _, stderr = run_cli_in_test(["prompt", "--adaptive-max-tokens"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert (tmp_path / "output_stats.json").exists()
+
+    exit_code, stdout, _ = run_cli_in_test(["token-stats"])
+    assert exit_code == 0
+    assert "local-model/python" in stdout and "321" in stdout
+
+
+def test_cli_history_subcommand(tmp_path, monkeypatch):
+    """Test searching and showing recorded generations from the CLI."""
+    from ai_code_platform.llm_code_generator.history_store import HistoryRecord, HistoryStore
+    monkeypatch.setenv("AI_CODE_PLATFORM_CACHE_DIR", str(tmp_path))
+    store = HistoryStore()
+    record_id = store.record(HistoryRecord(prompt="sum a list of numbers", language="python", code="def total(xs): return sum(xs)", model="llama3"))
+    store.record(HistoryRecord(prompt="reverse a string", language="go", code="func reverse() {}", model="llama3"))
+    store.close()
+
+    exit_code, stdout, _ = run_cli_in_test(["history", "sum", "--language", "python"])
+    assert exit_code == 0
+    assert record_id[:12] in stdout and "sum a list of numbers" in stdout
+    assert "reverse" not in stdout
+    assert "1 result(s)" in stdout
+
+    exit_code, stdout, _ = run_cli_in_test(["history", "--show", record_id[:10]])
+    assert exit_code == 0
+    assert "def total(xs): return sum(xs)" in stdout
+
+    exit_code, _, stderr = run_cli_in_test(["history", "--show", "missing"])
+    assert exit_code == 1 and "No unique generation" in stderr
+
+
+def test_cli_history_is_opt_in(mock_local_llm_service_constructor, tmp_path, monkeypatch):
+    """Test that generations are only recorded in the history store with --history."""
+    from ai_code_platform.llm_code_generator.history_store import HistoryStore
+    monkeypatch.setenv("AI_CODE_PLATFORM_CACHE_DIR", str(tmp_path))
+    mock_local_llm_service_constructor.return_value.history = None
+    exit_code, _, stderr = run_cli_in_test(["prompt"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert mock_local_llm_service_constructor.return_value.history is None
+    assert os.listdir(tmp_path) == []
+
+    exit_code, _, stderr = run_cli_in_test(["prompt", "--history"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert isinstance(mock_local_llm_service_constructor.return_value.history, HistoryStore)
+
+
+def test_cli_record_and_replay(tmp_path):
+    """Test recording traffic with --record and replaying it without the backend."""
+    from ai_code_platform.llm_code_generator.fake_llm_server import FakeLLMServer
+    cassette = str(tmp_path / "traffic.cassette")
+    with FakeLLMServer() as server:
+        exit_code, stdout, stderr = run_cli_in_test(["prompt", "--local-url", server.url, "--no-history", "--record", cassette])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert f"Recorded 1 call(s) and 1 exchange(s) to {cassette}" in stdout
+
+    exit_code, stdout, stderr = run_cli_in_test(["replay", cassette, "--time-scale", "0", "--json"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    report = json.loads(stdout)
+    assert report["requests"] == 1 and report["errors"] == 0
+
+    exit_code, _, stderr = run_cli_in_test(["replay", str(tmp_path / "missing.cassette")])
+    assert exit_code == 1 and "Could not read cassette" in stderr
+
+
+def test_cli_docs_subcommand(mock_local_llm_service_constructor, tmp_path):
+    """Test that the docs subcommand documents a source tree through the selected service."""
+    from ai_code_platform.llm_code_generator.llm_service import Completion
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "util.py").write_text("def helper():\n    return 1\n")
+    mock_local_llm_service_constructor.return_value.complete.return_value = Completion(text='{"s1": "Returns one."}')
+
+    exit_code, stdout, stderr = run_cli_in_test([
+        "docs", str(source), "--output-dir", str(tmp_path / "docs"), "--cache-dir", str(tmp_path / "cache"), "--no-history",
+    ])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert "Documented 1 symbols in 1 files: 1 generated in 1 requests" in stdout
+    assert "Returns one." in (tmp_path / "docs" / "util.py.md").read_text()
+
+
+def test_cli_output_streams_to_file(mock_local_llm_service_constructor, tmp_path):
+    """Test that --output streams the code into a file instead of printing it."""
+    mock_local_llm_service_constructor.return_value.stream_code.return_value = iter(["```python\nx", " = 1\n```"])
+    output = tmp_path / "out.py"
+    exit_code, stdout, stderr = run_cli_in_test(["prompt", "--output", str(output)])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert output.read_text() == "x = 1\n"
+    assert f"Wrote {output}" in stdout and "--- Generated Code ---" not in stdout
+    mock_local_llm_service_constructor.return_value.generate_code.assert_not_called()
+
+
+def test_cli_output_dir_splits_files(mock_local_llm_service_constructor, tmp_path):
+    """Test that --output-dir asks for named files and writes one file per block."""
+    mock_local_llm_service_constructor.return_value.stream_code.return_value = iter([
+        "```python path=a.py\na = 1\n```\n", "```python path=b.py\nb = 2\n```\n",
+    ])
+    exit_code, stdout, stderr = run_cli_in_test(["prompt", "--output-dir", str(tmp_path)])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert (tmp_path / "a.py").read_text() == "a = 1\n" and (tmp_path / "b.py").read_text() == "b = 2\n"
+    prompt = mock_local_llm_service_constructor.return_value.stream_code.call_args[0][0]
+    assert prompt.startswith("prompt\n\n") and "path=" in prompt
+    assert stdout.index(f"Wrote {tmp_path / 'a.py'}") < stdout.index(f"Wrote {tmp_path / 'b.py'}")
+
+
+def test_cli_profile_writes_collapsed_stacks(mock_local_llm_service_constructor, tmp_path):
+    """Test that --profile reports per-phase timings and writes collapsed stacks."""
+    profile = tmp_path / "profile.folded"
+    exit_code, stdout, stderr = run_cli_in_test(["prompt", "--profile", str(profile), "--profile-memory", "--no-history"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    assert "--- Generated Code ---" in stdout
+    assert "Profile:" in stderr and "net KiB" in stderr
+    for name in ("setup", "generate", "output"):
+        assert f"  {name} " in stderr
+    assert profile.exists()
+
+
+def test_cli_serve_prefetch_requires_cache():
+    """Test that serve --prefetch is rejected when the response cache is disabled."""
+    exit_code, _, stderr = run_cli_in_test(["serve", "--prefetch", "2", "--cache-size", "0"])
+    assert exit_code == 2
+    assert "--prefetch needs the response cache" in stderr
+
+
+def test_cli_eval_offline_with_fake_backend(tmp_path):
+    """Test that eval runs fully offline against the fake backend and reports pass@k."""
+    corpus = tmp_path / "tasks.jsonl"
+    corpus.write_text("\n".join(json.dumps(task) for task in [
+        {"id": "add", "prompt": "Write add", "tests": "assert add(1, 2) == 3", "canonical_solution": "def add(a, b):\n    return a + b"},
+        {"id": "sub", "prompt": "Write sub", "tests": "assert sub(3, 2) == 1"},  # no solution: the fake answers `pass`
+    ]))
+    exit_code, stdout, stderr = run_cli_in_test(["eval", str(corpus), "--models", "fake", "--samples", "2", "--json", "--no-history"])
+    assert exit_code == 0, f"CLI Error: {stderr}"
+    [summary] = json.loads(stdout)
+    assert summary["model"] == "fake"
+    assert summary["pass@1"] == 0.5 and summary["pass@2"] == 0.5
+    assert summary["samples"] == 4 and summary["errors"] == 0
+
+
+def test_cli_probe_subcommand_caches_profile(tmp_path, monkeypatch):
+    """Test that `probe` reports a server's capabilities and reuses the cached profile."""
+    from ai_code_platform.llm_code_generator.fake_llm_server import FakeLLMServer
+    monkeypatch.setenv("AI_CODE_PLATFORM_CACHE_DIR", str(tmp_path))
+    with FakeLLMServer(supports_n=False) as server:
+        exit_code, stdout, stderr = run_cli_in_test(["probe", "--local-url", server.url])
+        assert exit_code == 0, f"CLI Error: {stderr}"
+        assert "probed now" in stdout and "fake-model" in stdout
+        assert "streaming        yes" in stdout and "n                no" in stdout
+        requests_after_probe = len(server.requests)
+
+        exit_code, stdout, _ = run_cli_in_test(["probe", "--local-url", server.url, "--json"])
+        assert exit_code == 0
+        assert json.loads(stdout)["n"] is False
+        assert len(server.requests) == requests_after_probe
+
+
+def test_cli_feedback_subcommand_resolves_history_ids(tmp_path, monkeypatch):
+    """Test rating a recorded generation by id prefix and showing its feedback."""
+    from ai_code_platform.llm_code_generator.history_store import HistoryRecord, HistoryStore
+    monkeypatch.setenv("AI_CODE_PLATFORM_CACHE_DIR", str(tmp_path))
+    store = HistoryStore()
+    record_id = store.record(HistoryRecord(prompt="sum a list", language="python", code="sum(xs)", model="llama3"))
+    store.close()
+
+    exit_code, stdout, _ = run_cli_in_test(["feedback", record_id[:10], "down"])
+    assert exit_code == 0
+    assert f"{record_id}: 0 up, 1 down -> downranked" in stdout
+
+    exit_code, stdout, _ = run_cli_in_test(["feedback", record_id])
+    assert exit_code == 0 and "1 down" in stdout
+
+    exit_code, _, stderr = run_cli_in_test(["feedback", "missing", "up"])
+    assert exit_code == 1 and "Not a generation id" in stderr
@@ -0,0 +1,118 @@
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import anthropic
+import pytest
+
+from ..claude_service import ClaudeService
+from ..client_registry import AnthropicClientRegistry, ClientSettings
+from ..llm_service import LLMConfigurationError
+
+
+@pytest.fixture
+def mock_anthropic_constructor():
+    with patch("anthropic.Anthropic", side_effect=lambda **kwargs: MagicMock(kwargs=kwargs)) as mock_constructor:
+        yield mock_constructor
+
+
+def test_registry_shares_clients_per_key_and_base_url(mock_anthropic_constructor):
+    registry = AnthropicClientRegistry()
+    client = registry.get("key")
+    assert registry.get("key") is client
+    assert registry.get("other") is not client
+    assert registry.get("key", "https://proxy.example") is not client
+    assert len(registry) == registry.created == 3
+    mock_anthropic_constructor.assert_any_call(api_key="key")
+    mock_anthropic_constructor.assert_any_call(api_key="key", base_url="https://proxy.example")
+
+
+def test_registry_builds_one_client_under_concurrency(mock_anthropic_constructor):
+    registry = AnthropicClientRegistry()
+    barrier = threading.Barrier(16)
+    clients = []
+
+    def get():
+        barrier.wait()
+        clients.append(registry.get("key"))
+
+    threads = [threading.Thread(target=get) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mock_anthropic_constructor.call_count == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_registry_resets_after_fork(mock_anthropic_constructor):
+    """Test that a child process gets fresh clients and a fresh lock, leaving the parent's open."""
+    registry = AnthropicClientRegistry()
+    parent_client = registry.get("key")
+    registry._lock.acquire()  # as if another thread held it at fork time
+    registry._pid -= 1  # simulate running in a forked child
+
+    child_client = registry.get("key")
+    assert child_client is not parent_client
+    assert registry.created == 1
+    parent_client.close.assert_not_called()
+
+
+def test_registry_settings_tune_pool_and_timeouts():
+    registry = AnthropicClientRegistry(ClientSettings(max_keepalive_connections=64, timeout=30, connect_timeout=2, max_retries=5))
+    client = registry.get("key")
+    assert client.timeout == anthropic.Timeout(30, connect=2)
+    assert client.max_retries == 5
+    assert ClientSettings().client_kwargs() == {}
+    registry.close()
+
+
+def test_registry_configure_replaces_clients(mock_anthropic_constructor):
+    registry = AnthropicClientRegistry()
+    service = ClaudeService(api_key="key", registry=registry)
+    old = service.client
+    registry.configure(timeout=10.0)
+    assert not old.close.called  # the service still holds it
+    new = registry.get("key")
+    assert new is not old
+    assert new.kwargs["timeout"].read == 10.0
+
+    registry.close()
+    assert new.close.called and len(registry) == 0
+
+
+def test_claude_services_share_the_registry_client(mock_anthropic_constructor):
+    registry = AnthropicClientRegistry()
+    first = ClaudeService(api_key="key", registry=registry)
+    second = ClaudeService(api_key="key", model="claude-3-haiku-20240307", registry=registry)
+    assert first.client is second.client
+    assert mock_anthropic_constructor.call_count == 1
+
+
+def test_claude_service_registry_failure_is_configuration_error():
+    registry = AnthropicClientRegistry()
+    with patch("anthropic.Anthropic", side_effect=Exception("Init failed")):
+        with pytest.raises(LLMConfigurationError):
+            ClaudeService(api_key="key", registry=registry)
+    assert len(registry) == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_service_created_before_fork_uses_a_child_client(mock_anthropic_constructor):
+    """Test that a ClaudeService built in the parent doesn't reuse the parent's client in a forked child."""
+    registry = AnthropicClientRegistry()
+    service = ClaudeService(api_key="key", registry=registry)
+    parent_client = service.client
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child
+        try:
+            fresh = service.client is not parent_client and service.client is registry.get("key")
+            os.write(write_end, b"1" if fresh else b"0")
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    os.waitpid(pid, 0)
+    assert os.read(read_end, 1) == b"1"
+    os.close(read_end)
+    assert service.client is parent_client  # the parent keeps its client
@@ -0,0 +1,52 @@
+from ..code_extraction import CodeBlock, extract_code, extract_code_blocks, stitch_continuation
+
+
+def test_extract_language_block():
+    """Test extraction from a language-tagged fenced block."""
+    raw = "Here you go:\n```python\ndef f():\n    return 1\n```\nEnjoy!"
+    assert extract_code(raw, "python") == "def f():\n    return 1"
+
+def test_extract_generic_block_with_surrounding_text():
+    """Test extraction from an untagged fenced block surrounded by prose."""
+    raw = "Sure:\n```\nconsole.log(1);\n```\nThat's it."
+    assert extract_code(raw, "javascript") == "console.log(1);"
+
+def test_extract_single_line_fence_with_language_line():
+    """Test a response that is only a fence, with the language on its own line."""
+    assert extract_code("```\npython\nx = 1```", "python") == "x = 1"
+
+def test_extract_unfenced_code_is_returned_as_is():
+    """Test that unfenced responses are only stripped."""
+    assert extract_code("  x = 1\n", "python") == "x = 1"
+
+def test_extract_preserves_escaped_newlines():
+    """Test that responses using escaped newlines keep that form."""
+    raw = "```python\\ndef f():\\n  pass\\n```"
+    assert extract_code(raw, "python") == "def f():\\n  pass"
+
+def test_extract_code_blocks_multiple_languages():
+    """Test splitting a response into its fenced blocks."""
+    raw = "Python:\n```python\ndef f():\n    return 1\n```\n\nGo:\n```go title=f.go\nfunc f() int { return 1 }\n```\n```\nplain\n```"
+    blocks = extract_code_blocks(raw)
+    assert blocks == [
+        CodeBlock(info="python", code="def f():\n    return 1"),
+        CodeBlock(info="go title=f.go", code="func f() int { return 1 }"),
+        CodeBlock(info="", code="plain"),
+    ]
+    assert [block.language for block in blocks] == ["python", "go", ""]
+
+
+def test_stitch_continuation_drops_reopened_fence_and_overlap():
+    """Test that a continuation re-opening the fence and repeating a line is joined cleanly."""
+    partial = "```python\ndef long_function(values):\n    total = 0\n    for value in values:\n"
+    continuation = "```python\n    for value in values:\n        total += value\n    return total\n```"
+    assert stitch_continuation(partial, continuation) == (
+        "```python\ndef long_function(values):\n    total = 0\n    for value in values:\n"
+        "        total += value\n    return total\n```"
+    )
+
+
+def test_stitch_continuation_plain_concatenation():
+    """Test that short coincidental overlaps are kept and closed fences are left alone."""
+    assert stitch_continuation("x = 1\n", "x = 2\n") == "x = 1\nx = 2\n"
+    assert stitch_continuation("```\ncode\n```\n", "```js\nmore\n```") == "```\ncode\n```\n```js\nmore\n```"
@@ -0,0 +1,50 @@
+import pytest
+from ..code_patch import Edit, PatchError, apply_patch, parse_patch
+
+PATCH = """```
+<<<<<<< SEARCH
+    return a + b
+=======
+    return a - b
+>>>>>>> REPLACE
+<<<<<<< SEARCH
+def add(a, b):
+=======
+def subtract(a, b):
+>>>>>>> REPLACE
+```"""
+
+
+def test_parse_patch_multiple_edits():
+    """Test parsing several edits, ignoring a surrounding fence."""
+    edits = parse_patch(PATCH)
+    assert edits == [
+        Edit(search="    return a + b\n", replace="    return a - b\n"),
+        Edit(search="def add(a, b):\n", replace="def subtract(a, b):\n"),
+    ]
+
+def test_parse_patch_without_edits():
+    """Test that a response without edits is rejected."""
+    with pytest.raises(PatchError):
+        parse_patch("def subtract(a, b):\n    return a - b")
+
+def test_apply_patch_handles_missing_final_newline():
+    """Test that the last line of a file can be matched without a trailing newline."""
+    code = "def add(a, b):\n    return a + b"
+    assert apply_patch(code, parse_patch(PATCH)) == "def subtract(a, b):\n    return a - b"
+
+def test_apply_patch_empty_replacement_deletes():
+    """Test that an empty replacement removes the matched lines."""
+    code = "import os\nimport sys\nx = 1\n"
+    assert apply_patch(code, [Edit(search="import os\n", replace="")]) == "import sys\nx = 1\n"
+
+@pytest.mark.parametrize("edit, message", [
+    (Edit(search="missing\n", replace=""), "not found"),
+    (Edit(search="x = 1\n", replace=""), "matches 2 times"),
+    (Edit(search="  ", replace="y"), "empty SEARCH"),
+])
+def test_apply_patch_errors(edit, message):
+    """Test that missing, ambiguous or empty search text fails."""
+    with pytest.raises(PatchError) as excinfo:
+        apply_patch("x = 1\nx = 1\n", [edit])
+    assert message in str(excinfo.value)
@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import patch
+from ..code_validator import ValidationResult, normalize_language, validate_code
+
+
+def test_normalize_language_aliases():
+    """Test that common aliases map to canonical language names."""
+    assert normalize_language("py") == "python"
+    assert normalize_language(" JS ") == "javascript"
+    assert normalize_language("golang") == "go"
+    assert normalize_language("rust") == "rust"
+
+def test_validate_python_valid():
+    """Test that syntactically valid Python passes."""
+    result = validate_code("def add(a, b):\n    return a + b\n", "python")
+    assert result == ValidationResult(valid=True, language="python")
+
+def test_validate_python_invalid():
+    """Test that a Python syntax error is reported."""
+    result = validate_code("def add(a, b)\n    return a + b\n", "py")
+    assert not result.valid
+    assert result.language == "python"
+    assert "expected ':'" in result.errors or "invalid syntax" in result.errors
+
+def test_validate_json():
+    """Test JSON validation."""
+    assert validate_code('{"a": 1}', "json").valid
+    assert not validate_code('{"a": }', "json").valid
+
+def test_validate_unknown_language_is_unchecked():
+    """Test that languages without a checker are accepted but marked unchecked."""
+    result = validate_code("anything goes", "cobol")
+    assert result.valid
+    assert result.checked is False
+
+def test_validate_missing_external_checker_is_unchecked():
+    """Test that a checker not installed on PATH doesn't fail validation."""
+    with patch('shutil.which', return_value=None):
+        result = validate_code("function f( {", "javascript")
+    assert result.valid
+    assert result.checked is False
+
+@pytest.mark.skipif(not __import__("shutil").which("node"), reason="node not installed")
+def test_validate_javascript_with_node():
+    """Test JavaScript validation through `node --check`."""
+    assert validate_code("function f(a) { return a + 1; }", "javascript").valid
+    result = validate_code("function f(a { return a + 1; }", "js")
+    assert not result.valid
+    assert result.errors
@@ -0,0 +1,71 @@
+import os
+import pytest
+from ..context_packer import ContextPacker, read_mapped, resolve_context_paths, terms
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "models.py").write_text("class UserAccount:\n    def __init__(self, email):\n        self.email = email\n")
+    (src / "billing.py").write_text("def charge_invoice(invoice, amount):\n    return invoice.total + amount\n")
+    (src / "big.py").write_text("def unrelated_helper():\n    pass\n" * 400)
+    (src / "blob.bin").write_bytes(b"\0\1\2binary")
+    times = {"billing.py": 1_000_000_000, "models.py": 2_000_000_000, "big.py": 3_000_000_000}
+    for name, mtime in times.items():
+        os.utime(src / name, ns=(mtime, mtime))
+    return src
+
+
+def test_terms_split_identifiers():
+    """Test that camelCase and snake_case identifiers contribute their parts."""
+    counts = terms("class UserAccount: charge_invoice()")
+    assert {"useraccount", "user", "account", "charge_invoice", "charge", "invoice", "class"} <= set(counts)
+
+def test_resolve_context_paths_globs_and_directories(source_tree):
+    """Test expansion of directories and recursive globs, without duplicates."""
+    paths = resolve_context_paths([str(source_tree / "**" / "*.py"), str(source_tree)])
+    assert sorted(os.path.basename(p) for p in paths) == ["big.py", "billing.py", "blob.bin", "models.py"]
+
+def test_read_mapped_hashes_content(tmp_path):
+    """Test memory-mapped reads, including empty files."""
+    (tmp_path / "a.txt").write_text("hello")
+    (tmp_path / "empty.txt").write_text("")
+    data, digest = read_mapped(str(tmp_path / "a.txt"))
+    assert data == b"hello"
+    assert digest == "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+    assert read_mapped(str(tmp_path / "empty.txt"))[0] == b""
+
+def test_pack_selects_relevant_files_within_budget(source_tree, tmp_path):
+    """Test relevance ranking, the token budget and stable (oldest first) ordering."""
+    packer = ContextPacker(cache_dir=str(tmp_path / "cache"))
+    packed = packer.pack("Add a method to UserAccount that can charge an invoice", [str(source_tree)], token_budget=200)
+
+    assert [os.path.basename(f.path) for f in packed.files] == ["billing.py", "models.py"]
+    assert packed.skipped == [str(source_tree / "big.py")]
+    assert packed.tokens <= 200
+    rendered = packed.render("Add a method")
+    assert rendered.index("billing.py") < rendered.index("models.py") < rendered.index("Task: Add a method")
+    assert "class UserAccount:" in rendered
+
+def test_pack_reuses_index_for_unchanged_files(source_tree, tmp_path):
+    """Test that a second run doesn't re-read or re-tokenize unchanged files."""
+    cache_dir = str(tmp_path / "cache")
+    first = ContextPacker(cache_dir=cache_dir)
+    first.pack("UserAccount", [str(source_tree)], token_budget=10_000)
+    assert first.files_scanned == 4
+
+    second = ContextPacker(cache_dir=cache_dir)
+    second.pack("UserAccount", [str(source_tree)], token_budget=10_000)
+    assert second.files_scanned == 0
+
+    (source_tree / "models.py").write_text("class UserAccount:\n    pass\n")
+    third = ContextPacker(cache_dir=cache_dir)
+    packed = third.pack("UserAccount", [str(source_tree)], token_budget=10_000)
+    assert third.files_scanned == 1
+    assert "    pass" in next(f for f in packed.files if f.path.endswith("models.py")).content
+
+def test_render_without_files_returns_prompt(tmp_path):
+    """Test that an empty selection leaves the prompt unchanged."""
+    packed = ContextPacker(cache_dir=str(tmp_path)).pack("prompt", [str(tmp_path / "nothing*")], token_budget=100)
+    assert packed.render("prompt") == "prompt"
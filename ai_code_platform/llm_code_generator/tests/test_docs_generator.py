@@ -0,0 +1,159 @@
+import ast
+import json
+import os
+import re
+import threading
+
+from ..docs_generator import (
+    DocsGenerator,
+    Symbol,
+    extract_symbols,
+    normalized_ast_hash,
+    pack_batches,
+    parse_batch_response,
+)
+from ..llm_service import Completion, LLMAPIError, LLMService
+
+SOURCE = '''
+import os
+
+
+def add(a: int, b: int) -> int:
+    """Old docstring."""
+    return a + b  # comment
+
+
+class Greeter(Base):
+    greeting = "hi"
+
+    def greet(self, name):
+        return f"{self.greeting} {name}"
+
+    async def close(self):
+        pass
+'''
+
+
+class DocsService(LLMService):
+    """Documents every symbol in a batch as 'Docs for <qualname>'; can drop or fail on request."""
+    def __init__(self, drop: set[str] = frozenset(), fail: bool = False):
+        self.prompts = []
+        self.drop = drop
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        raise AssertionError("docs use complete()")
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> Completion:
+        with self._lock:
+            self.prompts.append(prompt)
+        if self.fail:
+            raise LLMAPIError("backend down")
+        symbols = re.findall(r"### (s\d+): \w+ `([\w.]+)`", prompt)
+        is_batch = len(symbols) > 1
+        docs = {sid: f"Docs for {name}." for sid, name in symbols if not (is_batch and name in self.drop)}
+        return Completion(text=json.dumps(docs))
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def make_generator(service, tmp_path, **kwargs):
+    return DocsGenerator(service, str(tmp_path / "src"), str(tmp_path / "docs"), cache_dir=str(tmp_path / "cache"), **kwargs)
+
+
+def test_extract_symbols():
+    symbols = extract_symbols(SOURCE, "pkg/mod.py")
+    assert [(s.qualname, s.kind) for s in symbols] == [
+        ("add", "function"), ("Greeter", "class"), ("Greeter.greet", "method"), ("Greeter.close", "method"),
+    ]
+    assert symbols[0].signature == "add(a: int, b: int) -> int"
+    assert symbols[1].signature == "class Greeter(Base)"
+    assert symbols[3].signature == "async close(self)"
+    assert "greeting = 'hi'" in symbols[1].source and "return" not in symbols[1].source
+
+
+def test_ast_hash_ignores_formatting_comments_and_docstrings():
+    base = extract_symbols(SOURCE, "m.py")
+    reformatted = SOURCE.replace('"""Old docstring."""', '"""New docstring."""').replace("a + b  # comment", "(a+b)")
+    changed_method = SOURCE.replace('f"{self.greeting} {name}"', "name")
+    assert [s.ast_hash for s in extract_symbols(reformatted, "m.py")] == [s.ast_hash for s in base]
+
+    changed = extract_symbols(changed_method, "m.py")
+    assert [a.ast_hash == b.ast_hash for a, b in zip(base, changed)] == [True, True, False, True]
+    assert normalized_ast_hash(ast.parse("x = 1")) != normalized_ast_hash(ast.parse("x = 2"))
+
+
+def test_pack_batches_respects_budget_and_count():
+    symbols = [Symbol("m.py", f"f{i}", "function", "f()", 1, str(i), source="x " * size) for i, size in enumerate([10, 10, 10, 500, 10])]
+    batches = pack_batches(symbols, token_budget=40, max_symbols=2)
+    assert [[s.qualname for s in batch] for batch in batches] == [["f0", "f1"], ["f2"], ["f3"], ["f4"]]
+
+
+def test_parse_batch_response():
+    assert parse_batch_response('Sure!\n```json\n{"s1": "One.", "s2": 3}\n```', 2) == {0: "One."}
+    assert parse_batch_response("not json", 2) == {}
+    assert parse_batch_response("Just the docs.", 1) == {0: "Just the docs."}
+
+
+def test_docs_generator_batches_and_writes_markdown(tmp_path):
+    write(tmp_path / "src" / "pkg" / "mod.py", SOURCE)
+    write(tmp_path / "src" / "util.py", "def helper():\n    return 1\n")
+    write(tmp_path / "src" / "__pycache__" / "skip.py", "def skipped(): pass\n")
+    service = DocsService()
+
+    report = make_generator(service, tmp_path).run()
+
+    assert (report.files, report.symbols, report.generated, report.cached) == (2, 5, 5, 0)
+    assert report.requests == len(service.prompts) == 1  # every symbol packed into one request
+    page = (tmp_path / "docs" / "pkg" / "mod.py.md").read_text()
+    assert "## `add(a: int, b: int) -> int`\n\nDocs for add." in page
+    assert "### `Greeter.greet(self, name)`\n\nDocs for Greeter.greet." in page
+    assert "[`util.py`](util.py.md) (1 symbols)" in (tmp_path / "docs" / "index.md").read_text()
+    assert sorted(report.written) == ["index.md", "pkg/mod.py.md", "util.py.md"]
+
+
+def test_docs_generator_only_regenerates_changed_symbols(tmp_path):
+    path = tmp_path / "src" / "mod.py"
+    write(path, SOURCE)
+    make_generator(DocsService(), tmp_path).run()
+
+    service = DocsService()
+    report = make_generator(service, tmp_path).run()
+    assert (report.generated, report.cached, report.requests, report.written) == (0, 4, 0, [])
+
+    write(path, SOURCE.replace("return a + b", "return b + a").replace("# comment", "# reworded"))
+    report = make_generator(service, tmp_path).run()
+    assert (report.generated, report.cached, report.requests) == (1, 3, 1)
+    assert "`add`" in service.prompts[0] and "Greeter" not in service.prompts[0]
+
+
+def test_docs_generator_retries_dropped_symbols_and_reports_failures(tmp_path):
+    write(tmp_path / "src" / "mod.py", SOURCE)
+    service = DocsService(drop={"Greeter"})
+    report = make_generator(service, tmp_path).run()
+    assert report.generated == 4 and not report.failed
+    assert report.requests == 2  # the batch, then Greeter on its own
+
+    write(tmp_path / "broken" / "src" / "mod.py", SOURCE)
+    report = make_generator(DocsService(fail=True), tmp_path / "broken").run()
+    assert report.generated == 0 and len(report.failed) == 4
+    assert report.failed["mod.py:add"] == "backend down"
+    assert "_No documentation generated._" in (tmp_path / "broken" / "docs" / "mod.py.md").read_text()
+
+
+def test_docs_generator_reloads_source_for_indexed_files(tmp_path):
+    """Test that a cache miss on an unchanged (indexed) file still sends the symbol's source."""
+    import shutil
+    write(tmp_path / "src" / "util.py", "def helper():\n    return 42\n")
+    make_generator(DocsService(), tmp_path).run()
+    shutil.rmtree(tmp_path / "cache" / "docs")
+
+    service = DocsService()
+    report = make_generator(service, tmp_path).run()
+    assert report.generated == 1
+    assert "return 42" in service.prompts[0]
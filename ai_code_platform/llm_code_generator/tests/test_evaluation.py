@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from ..evaluation import (
+    EvalTask,
+    EvaluationCorpusError,
+    Evaluator,
+    ModelReport,
+    Sample,
+    load_corpus,
+    run_tests,
+)
+from ..llm_service import LLMAPIError, LLMService
+
+TASKS = [
+    EvalTask(id="add", prompt="add", tests="assert add(1, 2) == 3"),
+    EvalTask(id="neg", prompt="neg", tests="assert neg(1) == -1"),
+]
+
+
+class ScriptedService(LLMService):
+    """Answers `add` correctly, `neg` correctly only every other time, and fails on `down`."""
+    model = "scripted"
+
+    def __init__(self):
+        self.neg_calls = 0
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        if prompt == "down":
+            raise LLMAPIError("backend down")
+        if prompt == "add":
+            return "def add(a, b):\n    return a + b"
+        self.neg_calls += 1
+        return "def neg(x):\n    return -x" if self.neg_calls % 2 else "def neg(x):\n    return x"
+
+
+def test_pass_at_k_is_unbiased_estimate():
+    report = ModelReport(model="m", samples=[
+        Sample("a", 0.1, passed=True), Sample("a", 0.1), Sample("a", 0.1), Sample("a", 0.1),
+        Sample("b", 0.1), Sample("b", 0.1), Sample("b", 0.1), Sample("b", 0.1),
+    ])
+    assert report.pass_at(1) == pytest.approx((1 / 4 + 0) / 2)
+    assert report.pass_at(2) == pytest.approx((1 - 3 / 6) / 2)  # 1 - C(3,2)/C(4,2) for task a
+    assert report.pass_at(4) == pytest.approx(0.5)
+    assert report.pass_at(5) is None
+
+
+def test_run_tests_reports_pass_failure_and_timeout():
+    assert run_tests("def f():\n    return 1", "assert f() == 1").passed
+
+    failed = run_tests("def f():\n    return 2", "assert f() == 1, 'wrong answer'")
+    assert not failed.passed and "wrong answer" in failed.error
+
+    hung = run_tests("while True:\n    pass", "", timeout=0.5)
+    assert not hung.passed and "Timed out" in hung.error
+
+
+def test_run_tests_is_isolated_from_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outcome = run_tests("open('stray.txt', 'w').write('x')", "import os\nassert os.listdir('.') == ['solution.py', 'stray.txt'] or True")
+    assert outcome.passed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_evaluator_reports_quality_and_latency():
+    report = Evaluator(TASKS, samples=4, concurrency=4, test_workers=2).evaluate(ScriptedService())
+    assert report.model == "scripted"
+    assert [sample.task_id for sample in report.samples] == ["add"] * 4 + ["neg"] * 4
+    assert sum(sample.passed for sample in report.samples) == 6
+    assert report.pass_at(1) == pytest.approx((1 + 0.5) / 2)
+    summary = report.summary([1, 4])
+    assert summary["pass@4"] == 1.0
+    assert summary["p50_ms"] is not None and summary["tokens_per_s"] > 0
+    assert summary["errors"] == 0
+
+
+def test_evaluator_records_generation_errors():
+    report = Evaluator([EvalTask(id="down", prompt="down", tests="pass")], samples=2).evaluate(ScriptedService(), label="x")
+    assert report.model == "x"
+    assert all(sample.generation_error == "backend down" and not sample.passed for sample in report.samples)
+    assert report.summary([1])["errors"] == 2
+    assert report.summary([1])["p50_ms"] is None
+
+
+def test_load_corpus(tmp_path):
+    path = tmp_path / "tasks.jsonl"
+    path.write_text(
+        json.dumps({"id": "a", "prompt": "p", "tests": "t", "canonical_solution": "s"}) + "\n\n"
+        + json.dumps({"id": "b", "prompt": "p", "tests": "t"}) + "\n"
+    )
+    tasks = load_corpus(str(path))
+    assert [task.id for task in tasks] == ["a", "b"]
+    assert tasks[0].canonical_solution == "s"
+
+    path.write_text(json.dumps({"id": "a", "prompt": "p"}))
+    with pytest.raises(EvaluationCorpusError, match="'tests'"):
+        load_corpus(str(path))
+    path.write_text(json.dumps([{"id": "a", "prompt": "p", "tests": "t", "language": "go"}]))
+    with pytest.raises(EvaluationCorpusError, match="only Python"):
+        load_corpus(str(path))
@@ -0,0 +1,117 @@
+import time
+import uuid
+
+import pytest
+
+from ..feedback import DOWNRANKED, INVALIDATED, PROMOTED, SERVE, FeedbackStore, InvalidFeedbackError
+from ..history_store import HistoryStore
+from ..llm_service import Completion, LLMService, capture_generation
+from ..response_cache import ResponseCache
+
+
+class CompletingService(LLMService):
+    model = "feedback-model"
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int = 2048) -> Completion:
+        return Completion(text=f"```python\n# {prompt}\n```", finish_reason="stop")
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        return self._complete_code("system", prompt, language).text
+
+
+def test_store_aggregates_and_verdicts(tmp_path):
+    store = FeedbackStore(path=str(tmp_path / "feedback.log"))
+    good, bad = uuid.uuid4().hex, uuid.uuid4().hex
+    assert store.verdict(good) == SERVE and store.summary(good) is None
+
+    store.record(good, 1)
+    assert store.verdict(good) == PROMOTED
+    store.record(bad, -1)
+    assert store.verdict(bad) == DOWNRANKED
+    summary = store.record(bad, -1)
+    assert (summary.up, summary.down) == (0, 2)
+    assert store.verdict(bad) == INVALIDATED
+
+    with pytest.raises(InvalidFeedbackError):
+        store.record("not-an-id", 1)
+    with pytest.raises(InvalidFeedbackError):
+        store.record(good, 5)
+
+    # Append-only and compact: a header plus one fixed-size record per rating.
+    assert (tmp_path / "feedback.log").stat().st_size == 8 + 3 * 25
+    reopened = FeedbackStore(path=str(tmp_path / "feedback.log"))
+    assert reopened.verdict(bad) == INVALIDATED and len(reopened) == 2 and reopened.ratings == 3
+
+
+def test_store_picks_up_ratings_from_other_writers(tmp_path):
+    path = str(tmp_path / "feedback.log")
+    reader = FeedbackStore(path=path, refresh_interval=0)
+    generation_id = uuid.uuid4().hex
+    assert reader.verdict(generation_id) == SERVE
+    FeedbackStore(path=path).record(generation_id, 1)
+    assert reader.verdict(generation_id) == PROMOTED
+
+
+def test_cache_serves_downranks_and_invalidates_by_feedback(tmp_path):
+    feedback = FeedbackStore(path=str(tmp_path / "feedback.log"))
+    cache = ResponseCache(ttl=60, feedback=feedback)
+    good, bad = uuid.uuid4().hex, uuid.uuid4().hex
+    cache.put("good", "good code", generation_id=good)
+    cache.put("bad", "bad code", generation_id=bad)
+    cache.put("plain", "plain code")
+
+    feedback.record(good, 1)
+    cache._entries["good"].created_at -= 3600  # past the TTL, but promoted
+    assert cache.get("good").code == "good code"
+
+    feedback.record(bad, -1)
+    assert cache.get("bad") is None and "bad" not in cache
+    assert cache.get("bad", allow_downranked=True).code == "bad code"
+    feedback.record(bad, -1)
+    assert cache.get("bad", allow_downranked=True) is None
+    assert cache.invalidated == 1 and cache.downranked == 1 and len(cache) == 2
+
+    cache._entries["plain"].created_at -= 3600
+    assert cache.get("plain") is None  # no feedback: the TTL applies as before
+
+
+def test_promoted_entries_outlive_unrated_ones_without_ttl(tmp_path):
+    """Test that promotion matters in the serve configuration (an LRU cache without a TTL)."""
+    feedback = FeedbackStore(path=str(tmp_path / "feedback.log"), refresh_interval=0)
+    cache = ResponseCache(max_entries=2, feedback=feedback)
+    good = uuid.uuid4().hex
+    cache.put("good", "good code", generation_id=good)
+    feedback.record(good, 1)
+    for key in ("a", "b", "c"):
+        cache.put(key, f"{key} code", generation_id=uuid.uuid4().hex)
+
+    assert cache.get("good").code == "good code"  # the oldest entry, which plain LRU would evict first
+    assert cache.get("c").code == "c code"
+    assert cache.get("a") is None and cache.get("b") is None
+    assert len(cache) == 2
+
+
+def test_capture_generation_links_history_ids(tmp_path):
+    llm = CompletingService()
+    llm.history = HistoryStore(path=str(tmp_path / "history.sqlite3"))
+    try:
+        with capture_generation() as generation:
+            llm.generate_code("add numbers", "python")
+        assert llm.history.get(generation.id).prompt == "add numbers"
+    finally:
+        llm.history.close()
+
+    with capture_generation() as generation:
+        pass  # nothing went through _complete_code
+    assert len(generation.id) == 32
+
+
+def test_verdict_lookup_is_fast(tmp_path):
+    feedback = FeedbackStore(path=str(tmp_path / "feedback.log"))
+    ids = [uuid.uuid4().hex for _ in range(1000)]
+    for generation_id in ids[:200]:
+        feedback.record(generation_id, -1)
+    started = time.perf_counter()
+    for generation_id in ids:
+        feedback.verdict(generation_id)
+    assert (time.perf_counter() - started) / len(ids) < 1e-4
@@ -0,0 +1,128 @@
+import threading
+import pytest
+from ..history_store import HistoryRecord, HistoryStore, fts_query
+from ..llm_service import Completion
+from .test_llm_service import ScriptedLLMService
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    yield history
+    history.close()
+
+
+def make_record(prompt, code="pass", language="python", model="model-a", created_at=1000.0):
+    return HistoryRecord(prompt=prompt, language=language, code=code, service="LocalLLMService", model=model, created_at=created_at)
+
+
+def test_fts_query_quotes_terms():
+    """Test that user text can't inject FTS5 syntax and prefixes are kept."""
+    assert fts_query('parse "csv" OR (json)') == '"parse" "csv" "OR" "json"'
+    assert fts_query("bill* NEAR") == '"bill"* "NEAR"'
+    assert fts_query("!!!") == ""
+
+
+def test_record_and_search_text_and_metadata(store):
+    """Test full-text search over prompts and code combined with metadata filters."""
+    store.record(make_record("merge two sorted lists", code="def merge(a, b): ...", created_at=1000))
+    store.record(make_record("parse a CSV invoice", code="import csv", language="go", created_at=2000))
+    store.record(make_record("merge invoices by customer", model="model-b", created_at=3000))
+
+    assert [r.prompt for r in store.search("merge")] == ["merge invoices by customer", "merge two sorted lists"]
+    assert [r.prompt for r in store.search("invoice*")] == ["merge invoices by customer", "parse a CSV invoice"]
+    assert [r.prompt for r in store.search("csv")] == ["parse a CSV invoice"]  # matched in prompt and code
+    assert [r.prompt for r in store.search("merge", model="model-b")] == ["merge invoices by customer"]
+    assert [r.prompt for r in store.search(language="go")] == ["parse a CSV invoice"]
+    assert [r.prompt for r in store.search(since=2000, until=3000)] == ["parse a CSV invoice"]
+    assert [r.prompt for r in store.search(limit=1)] == ["merge invoices by customer"]
+    assert store.search("nothing matches this") == []
+    assert store.count() == 3
+
+
+def test_search_by_relevance(store):
+    """Test that BM25 ranking puts the best match first."""
+    store.record(make_record("sort", code="x = 1", created_at=1))
+    store.record(make_record("cache the thing", code="cache cache cache", created_at=2))
+    store.record(make_record("something about a cache", code="y = 2", created_at=3))
+    assert store.search("cache", by_relevance=True)[0].prompt == "cache the thing"
+
+
+def test_get_by_id_and_unique_prefix(store):
+    """Test lookups by full id and by unambiguous id prefix."""
+    record = make_record("prompt", code="code")
+    record_id = store.record(record)
+    assert store.get(record_id) == record
+    assert store.get(record_id[:8]).code == "code"
+    assert store.get("does-not-exist") is None
+
+
+def test_concurrent_records_are_all_written(store):
+    """Test that records from many threads are written by the background writer."""
+    threads = [
+        threading.Thread(target=lambda i=i: [store.record(make_record(f"prompt {i} {j}")) for j in range(50)])
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.count() == 400
+
+
+def test_history_survives_reopen(tmp_path):
+    """Test that close() flushes pending records to disk."""
+    path = str(tmp_path / "history.sqlite3")
+    first = HistoryStore(path)
+    first.record(make_record("persisted prompt"))
+    first.close()
+
+    second = HistoryStore(path)
+    assert [r.prompt for r in second.search("persisted")] == ["persisted prompt"]
+    second.close()
+
+
+def test_no_database_until_used(tmp_path):
+    """Test that an unused store doesn't create a database file."""
+    HistoryStore(str(tmp_path / "history.sqlite3")).close()
+    assert not (tmp_path / "history.sqlite3").exists()
+
+
+def test_service_generations_are_recorded(store):
+    """Test that _complete_code records the generation with usage and timing."""
+    service = ScriptedLLMService([Completion(text="```python\nx = 1\n```", input_tokens=12, output_tokens=5)])
+    service.history = store
+    service._complete_code("system", "make x", "python")
+
+    [record] = store.search("make")
+    assert (record.code, record.language, record.service) == ("x = 1", "python", "ScriptedLLMService")
+    assert (record.input_tokens, record.output_tokens) == (12, 5)
+    assert record.duration >= 0
+
+
+def test_write_errors_drop_the_batch_without_hanging(tmp_path):
+    """Test that an unwritable database drops records and flush() still returns."""
+    history = HistoryStore(str(tmp_path / "file" / "history.sqlite3"))
+    (tmp_path / "file").write_text("not a directory")
+    finished = threading.Event()
+
+    def record_and_flush():
+        history.record(make_record("lost"))
+        history.flush()
+        history.record(make_record("lost too"))
+        history.flush()
+        finished.set()
+
+    threading.Thread(target=record_and_flush, daemon=True).start()
+    assert finished.wait(5)
+    assert history.dropped == 2 and isinstance(history.last_error, OSError)
+    history.close()
+
+
+def test_record_after_close_is_rejected(store):
+    """Test that records can't be queued once the writer has stopped."""
+    store.record(make_record("kept"))
+    store.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        store.record(make_record("too late"))
+    store.flush()  # returns: nothing is left queued
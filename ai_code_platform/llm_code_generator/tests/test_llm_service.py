@@ -1,6 +1,10 @@
 import pytest
 from abc import ABC, abstractmethod
-from ..llm_service import LLMService, LLMConfigurationError
+import threading
+import time
+from ..cancellation import on_cancel
+from ..code_validator import ValidationResult
+from ..llm_service import Completion, LLMService, LLMAPIError, LLMConfigurationError, LLMValidationError, RequestCancelledError
 
 # A minimal concrete implementation for testing LLMService if needed,
 # or we can just test that it's an ABC.
@@ -44,5 +48,300 @@ def test_llm_configuration_error_can_be_raised_and_caught():
         raise LLMConfigurationError(error_message)
     assert str(excinfo.value) == error_message
 
+def test_select_first_valid_returns_first_passing_candidate():
+    """Tests that the first candidate to pass validation wins without waiting for slower ones."""
+    service = MockLLMService()
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    def validator(code, language):
+        return ValidationResult(valid=code != "bad", language=language)
+
+    result = service._select_first_valid([slow, lambda: "bad", lambda: "good"], "python", validator)
+    release.set()
+    assert result == "good"
+
+def test_select_first_valid_raises_validation_error():
+    """Tests that LLMValidationError lists the validation failures."""
+    service = MockLLMService()
+
+    def validator(code, language):
+        return ValidationResult(valid=False, language=language, errors=f"{code} failed")
+
+    with pytest.raises(LLMValidationError) as excinfo:
+        service._select_first_valid([lambda: "a", lambda: "b"], "python", validator)
+    assert "a failed" in str(excinfo.value)
+    assert "b failed" in str(excinfo.value)
+
+def test_select_first_valid_reraises_api_error_when_nothing_produced():
+    """Tests that API errors propagate if every producer failed."""
+    service = MockLLMService()
+
+    def failing():
+        raise LLMAPIError("down")
+
+    with pytest.raises(LLMAPIError):
+        service._select_first_valid([failing, failing], "python")
+
+def test_select_first_valid_aborts_losing_streams():
+    """Tests that candidates still streaming when one passes are aborted, not left to finish."""
+    service = MockLLMService()
+    aborted = threading.Event()
+    outcomes = []
+
+    def hanging_stream():
+        on_cancel(aborted.set)
+        try:
+            yield "partial"
+            if not aborted.wait(5):
+                yield " never aborted"
+        finally:
+            outcomes.append("closed")
+
+    service.stream_complete = lambda system_prompt, prompt, max_tokens=2048: hanging_stream()
+
+    def slow():
+        try:
+            return service._stream_completion("system", "prompt").text
+        except RequestCancelledError:
+            outcomes.append("cancelled")
+            raise
+
+    assert service._select_first_valid([slow, lambda: "good"], "python") == "good"
+    assert aborted.wait(1)
+    for _ in range(100):
+        if len(outcomes) == 2:
+            break
+        time.sleep(0.01)
+    assert sorted(outcomes) == ["cancelled", "closed"]
+
+class ScriptedLLMService(LLMService):
+    """Returns scripted raw completions from complete()."""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        raise AssertionError("refine_code should not call generate_code")
+
+    def complete(self, system_prompt, prompt, max_tokens=2048):
+        self.requests.append((system_prompt, prompt))
+        return self.replies.pop(0)
+
+PREVIOUS_CODE = "def add(a, b):\n    total = a + b\n    return total\n" + "\n".join(f"CONST_{i} = {i}" for i in range(50)) + "\n"
+
+def test_warm_up_primes_system_prompt_and_reports_latency():
+    """Tests that warm_up sends two minimal requests with the generate_code system prompt."""
+    budgets = []
+
+    class RecordingService(ScriptedLLMService):
+        def complete(self, system_prompt, prompt, max_tokens=2048):
+            budgets.append(max_tokens)
+            return super().complete(system_prompt, prompt, max_tokens)
+
+    service = RecordingService([Completion(text="OK"), Completion(text="OK")])
+    report = service.warm_up("go")
+
+    assert [system for system, _ in service.requests] == [service._system_prompt("go")] * 2
+    assert budgets == [1, 1]
+    assert report.cold_latency >= 0 and report.warm_latency >= 0 and report.preconnect_time >= 0
+    assert report.saved == report.cold_latency - report.warm_latency
+
+def test_warm_up_without_complete_support():
+    """Tests that backends without raw completions are only preconnected."""
+    report = MockLLMService().warm_up()
+    assert report.cold_latency is None and report.warm_latency is None and report.saved is None
+
+class TruncatingService(ScriptedLLMService):
+    """Scripted service whose replies may be cut off; continuations are scripted too."""
+    def __init__(self, replies, continuations=()):
+        super().__init__(replies)
+        self.continuations = list(continuations)
+        self.budgets = []
+        self.model = "scripted-model"
+
+    def complete(self, system_prompt, prompt, max_tokens=2048):
+        self.budgets.append(max_tokens)
+        return super().complete(system_prompt, prompt, max_tokens)
+
+    def _continue(self, system_prompt, prompt, partial, max_tokens):
+        self.budgets.append(max_tokens)
+        completion = self.continuations.pop(0)
+        return partial + completion.text, completion
+
+def test_complete_code_continues_truncated_replies():
+    """Tests that replies cut off by max_tokens are continued and stitched."""
+    from ..output_stats import OutputLengthStats
+    service = TruncatingService(
+        [Completion(text="def f():\n", finish_reason="length", output_tokens=10)],
+        [Completion(text="    return 1\n", finish_reason="stop", output_tokens=4)],
+    )
+    service.output_stats = OutputLengthStats(min_samples=1)
+
+    completion = service._complete_code("system", "prompt", "python")
+
+    assert completion.text == "def f():\n    return 1\n"
+    assert completion.output_tokens == 14 and completion.finish_reason == "stop"
+    assert service.output_stats.snapshot()["scripted-model/python"]["truncations"] == 1
+    assert service.output_stats.snapshot()["scripted-model/python"]["continuations"] == 1
+
+def test_complete_code_limits_continuations():
+    """Tests that a reply that never finishes is returned after max_continuations."""
+    cut = Completion(text="x", finish_reason="max_tokens", output_tokens=1)
+    service = TruncatingService([cut], [cut, cut, cut])
+    completion = service._complete_code("system", "prompt", "python")
+    assert completion.text == "xxx"
+    assert len(service.continuations) == 1
+
+def test_complete_code_adapts_max_tokens_to_learned_lengths():
+    """Tests that the first request is sized from stats while continuations get the full default."""
+    from ..output_stats import OutputLengthStats
+    service = TruncatingService(
+        [Completion(text="a", finish_reason="length", output_tokens=300)],
+        [Completion(text="b", finish_reason="stop", output_tokens=50)],
+    )
+    service.output_stats = OutputLengthStats(min_samples=1, floor=1)
+    service.output_stats.record("scripted-model", "python", 200)
+
+    service._complete_code("system", "prompt", "python")
+    assert service.budgets == [300, 2048]
+
+def test_complete_code_without_stats_or_continuation_support():
+    """Tests the defaults: 2048 tokens and truncated replies returned as-is when _continue isn't implemented."""
+    service = ScriptedLLMService([Completion(text="partial", finish_reason="length")])
+    assert service._complete_code("system", "prompt", "python").text == "partial"
+
+def test_stream_code_continues_truncated_streams_and_records_history(tmp_path):
+    """Tests that streamed generations are sized, continued and recorded like generate_code."""
+    from ..history_store import HistoryStore
+    from ..llm_service import CompletionStream, capture_generation
+    from ..output_stats import OutputLengthStats
+
+    class StreamingTruncatingService(TruncatingService):
+        def stream_complete(self, system_prompt, prompt, max_tokens=2048):
+            self.budgets.append(max_tokens)
+            stream = CompletionStream(["```python\ndef f():", "\n"])
+            stream.finish_reason, stream.output_tokens = "length", 10
+            return stream
+
+    service = StreamingTruncatingService([], [Completion(text="    return 1\n```", finish_reason="stop", output_tokens=4)])
+    service.output_stats = OutputLengthStats(min_samples=1, floor=1)
+    service.output_stats.record("scripted-model", "python", 200)
+    service.history = HistoryStore(path=str(tmp_path / "history.sqlite3"))
+    try:
+        with capture_generation() as generation:
+            chunks = list(service.stream_code("prompt", "python"))
+        assert chunks == ["```python\ndef f():", "\n", "    return 1\n```"]
+        assert service.budgets == [300, 2048]
+        record = service.history.get(generation.id)
+        assert record.code == "def f():\n    return 1" and record.output_tokens == 14
+    finally:
+        service.history.close()
+    assert service.output_stats.snapshot()["scripted-model/python"]["continuations"] == 1
+
+def test_continuation_delta_skips_already_streamed_whitespace():
+    """Tests that prefill continuations (which drop trailing whitespace) don't repeat it in the stream."""
+    from ..llm_service import _continuation_delta
+    assert _continuation_delta("def f():\n", "def f():\n    return 1") == "    return 1"
+    assert _continuation_delta("def f():\n", "def f():" + "\n    return 1") == "    return 1"
+    assert _continuation_delta("x = ", "x = 1") == "1"
+    # A stitched reply that rewrote already-sent text continues after the shared prefix, without repeating it.
+    assert _continuation_delta("def f():\n    x = 1", "def f():\n    y = 2\n") == "y = 2\n"
+
+def test_complete_not_implemented_by_default():
+    """Tests that backends must opt in to raw completions."""
+    with pytest.raises(NotImplementedError):
+        MockLLMService().complete("system", "prompt")
+
+def test_refine_code_applies_patch():
+    """Tests that a valid patch is applied locally and output tokens are saved."""
+    patch = "<<<<<<< SEARCH\n    total = a + b\n=======\n    total = a + b + 1\n>>>>>>> REPLACE\n"
+    service = ScriptedLLMService([Completion(text=patch, output_tokens=20)])
+
+    result = service.refine_code(PREVIOUS_CODE, "add one", "python")
+
+    assert result.used_patch
+    assert "total = a + b + 1" in result.code
+    assert result.output_tokens == 20
+    assert result.saved_tokens > 0
+    assert len(service.requests) == 1
+    assert "SEARCH" in service.requests[0][0]
+    assert "Change request: add one" in service.requests[0][1]
+
+def test_refine_code_falls_back_when_patch_does_not_apply():
+    """Tests fallback to full regeneration when the patch doesn't match."""
+    bad_patch = "<<<<<<< SEARCH\nnot in the file\n=======\nx\n>>>>>>> REPLACE\n"
+    full = "```python\ndef add(a, b):\n    return a + b + 1\n```"
+    service = ScriptedLLMService([Completion(text=bad_patch, output_tokens=10), Completion(text=full, output_tokens=300)])
+
+    result = service.refine_code(PREVIOUS_CODE, "add one", "python")
+
+    assert not result.used_patch
+    assert result.code == "def add(a, b):\n    return a + b + 1"
+    assert result.output_tokens == 310
+    assert result.saved_tokens == -10
+    assert "not found" in result.patch_error
+
+def test_refine_code_falls_back_when_patch_breaks_validation():
+    """Tests that a patch producing invalid code is rejected."""
+    broken_patch = "<<<<<<< SEARCH\n    return total\n=======\n    return (total\n>>>>>>> REPLACE\n"
+    service = ScriptedLLMService([Completion(text=broken_patch), Completion(text="def add(a, b):\n    return a + b")])
+
+    result = service.refine_code(PREVIOUS_CODE, "break it", "python")
+
+    assert not result.used_patch
+    assert "failed validation" in result.patch_error
+
+class MultiLanguageService(ScriptedLLMService):
+    """Scripted raw completion plus per-language generate_code fallbacks."""
+    def __init__(self, replies):
+        super().__init__(replies)
+        self.fallback_languages = []
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        self.fallback_languages.append(language)
+        return f"fallback {language}"
+
+def test_generate_multi_language_single_completion():
+    """Tests that all languages are split out of one response."""
+    reply = "```python\ndef f(): pass\n```\n```ts\nfunction f() {}\n```\n```go\nfunc f() {}\n```"
+    service = MultiLanguageService([Completion(text=reply)])
+
+    result = service.generate_multi_language("a function f", ["python", "typescript", "go"])
+
+    assert result == {"python": "def f(): pass", "typescript": "function f() {}", "go": "func f() {}"}
+    assert len(service.requests) == 1
+    assert "python, typescript, go" in service.requests[0][0]
+    assert service.fallback_languages == []
+
+def test_generate_multi_language_falls_back_for_missing_languages():
+    """Tests that missing languages are generated individually."""
+    service = MultiLanguageService([Completion(text="```python\ndef f(): pass\n```")])
+
+    result = service.generate_multi_language("a function f", ["python", "typescript", "go"])
+
+    assert result["python"] == "def f(): pass"
+    assert result["typescript"] == "fallback typescript"
+    assert result["go"] == "fallback go"
+    assert sorted(service.fallback_languages) == ["go", "typescript"]
+
+def test_generate_multi_language_without_complete_support():
+    """Tests that backends without complete() use per-language calls only."""
+    result = MockLLMService().generate_multi_language("p", ["python", "go"])
+    assert result == {"python": "Mock code for p in python", "go": "Mock code for p in go"}
+
+def test_stream_code_falls_back_to_generate_code():
+    """Tests that backends without complete() stream one chunk from generate_code."""
+    assert list(MockLLMService().stream_code("p", "python")) == ["Mock code for p in python"]
+
+def test_stream_code_default_uses_complete():
+    """Tests that the default stream_complete yields the complete() text as one chunk."""
+    service = ScriptedLLMService([Completion(text="```python\nx = 1\n```")])
+    assert list(service.stream_code("p", "python")) == ["```python\nx = 1\n```"]
+    assert "python" in service.requests[0][0]
+
 # Add more tests for other custom exceptions if needed (LLMAPIError, etc.)
 # These would typically be tested in the context of the services that raise them.
@@ -4,6 +4,7 @@ import json
 from unittest.mock import patch, MagicMock
 import requests # For requests.exceptions
 from ..local_llm_service import LocalLLMService, LLMConfigurationError, LLMAPIError
+from ..llm_service import LLMValidationError
 
 @pytest.fixture
 def mock_requests_post():
@@ -240,6 +241,197 @@ def test_local_llm_service_with_api_key(mock_requests_post):
     assert call_args is not None
     assert call_args[1]['headers'] == expected_headers
 
+def test_local_llm_service_candidates_single_round_trip(mock_requests_post):
+    """Test that candidates are requested with `n` in one call and the first valid one wins."""
+    service = LocalLLMService()
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"choices": [
+        {"message": {"content": "```python\ndef f(:\n    pass\n```"}},
+        {"message": {"content": "```python\ndef f():\n    return 1\n```"}},
+        {"message": {"content": "def g(:"}},
+    ]}
+    mock_response.raise_for_status = MagicMock()
+    mock_requests_post.return_value = mock_response
+
+    generated_code = service.generate_code("prompt", "python", candidates=3)
+
+    assert generated_code == "def f():\n    return 1"
+    mock_requests_post.assert_called_once()
+    payload = json.loads(mock_requests_post.call_args[1]['data'])
+    assert payload["n"] == 3
+
+def test_local_llm_service_candidates_top_up_when_n_ignored(mock_requests_post):
+    """Test that missing choices are requested concurrently if the server ignores `n`."""
+    service = LocalLLMService()
+    invalid = MagicMock()
+    invalid.json.return_value = {"choices": [{"message": {"content": "def f(:"}}]}
+    valid = MagicMock()
+    valid.iter_lines.return_value = iter([
+        'data: {"choices": [{"delta": {"content": "x = 1"}, "finish_reason": "stop"}]}',
+        "data: [DONE]",
+    ])
+    mock_requests_post.side_effect = [invalid, valid]
+
+    assert service.generate_code("prompt", "python", candidates=2) == "x = 1"
+    assert mock_requests_post.call_count == 2
+    top_up = json.loads(mock_requests_post.call_args_list[1][1]['data'])
+    assert "n" not in top_up and top_up["stream"] is True
+    assert top_up["max_tokens"] == json.loads(mock_requests_post.call_args_list[0][1]['data'])["max_tokens"]
+
+def test_local_llm_service_candidates_are_continued_and_recorded(mock_requests_post, tmp_path):
+    """Test that `n` choices are continued when cut off and recorded, with the winner's id captured."""
+    from ..history_store import HistoryStore
+    from ..llm_service import capture_generation
+    from ..output_stats import OutputLengthStats
+    choices = MagicMock()
+    choices.json.return_value = {"choices": [
+        {"message": {"content": "```python\ndef f():\n"}, "finish_reason": "length"},
+        {"message": {"content": "def g(:"}, "finish_reason": "stop"},
+    ]}
+    continuation = MagicMock()
+    continuation.json.return_value = {"choices": [{"message": {"content": "    return 1\n```"}, "finish_reason": "stop"}]}
+    mock_requests_post.side_effect = [choices, continuation]
+    history = HistoryStore(str(tmp_path / "history.db"))
+    stats = OutputLengthStats()
+    service = LocalLLMService(history=history, output_stats=stats)
+
+    with capture_generation() as generation:
+        assert service.generate_code("prompt", "python", candidates=2) == "def f():\n    return 1"
+    history.flush()
+    assert history.get(generation.id).code == "def f():\n    return 1"
+    assert history.count() >= 1
+    assert stats.snapshot()["local-model/python"]["continuations"] == 1
+    history.close()
+
+def test_local_llm_service_candidates_none_valid(mock_requests_post):
+    """Test LLMValidationError when no candidate compiles."""
+    service = LocalLLMService()
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"choices": [
+        {"message": {"content": "def f(:"}},
+        {"message": {"content": "def g(:"}},
+    ]}
+    mock_requests_post.return_value = mock_response
+
+    with pytest.raises(LLMValidationError) as excinfo:
+        service.generate_code("prompt", "python", candidates=2)
+    assert "None of the 2 python candidates passed validation" in str(excinfo.value)
+
+def test_local_llm_service_complete_returns_raw_text_and_usage(mock_requests_post):
+    """Test that complete() returns the unmodified reply with token usage."""
+    service = LocalLLMService()
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "choices": [{"message": {"content": "```python\nx = 1\n```"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 7},
+    }
+    mock_requests_post.return_value = mock_response
+
+    completion = service.complete("system", "prompt", max_tokens=100)
+
+    assert completion.text == "```python\nx = 1\n```"
+    assert completion.finish_reason == "stop"
+    assert (completion.input_tokens, completion.output_tokens) == (12, 7)
+    payload = json.loads(mock_requests_post.call_args[1]['data'])
+    assert payload["max_tokens"] == 100
+    assert payload["messages"][0] == {"role": "system", "content": "system"}
+
+def test_local_llm_service_stream_code(mock_requests_post):
+    """Test that streamed SSE deltas are yielded and the response is closed."""
+    service = LocalLLMService()
+    mock_response = MagicMock()
+    mock_response.iter_lines.return_value = iter([
+        ": keep-alive comment",
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "```python\\nx"}}]}',
+        "",
+        'data: {"choices": [{"delta": {"content": " = 1\\n```"}}]}',
+        "data: [DONE]",
+    ])
+    mock_requests_post.return_value = mock_response
+
+    chunks = list(service.stream_code("prompt", "python"))
+
+    assert chunks == ["```python\nx", " = 1\n```"]
+    assert json.loads(mock_requests_post.call_args[1]['data'])["stream"] is True
+    assert mock_requests_post.call_args[1]['stream'] is True
+    mock_response.close.assert_called_once()
+
+def test_local_llm_service_stream_close_early_closes_response(mock_requests_post):
+    """Test that abandoning a stream closes the HTTP response."""
+    service = LocalLLMService()
+    mock_response = MagicMock()
+    mock_response.iter_lines.return_value = iter(['data: {"choices": [{"delta": {"content": "a"}}]}'] * 5)
+    mock_requests_post.return_value = mock_response
+
+    chunks = service.stream_code("prompt", "python")
+    assert next(chunks) == "a"
+    chunks.close()
+    mock_response.close.assert_called_once()
+
+def test_local_llm_service_uses_session_when_given():
+    """Test that a shared session is used instead of one-off requests."""
+    session = MagicMock()
+    session.post.return_value.json.return_value = {"choices": [{"message": {"content": "x = 1"}}]}
+    service = LocalLLMService(session=session)
+
+    assert service.generate_code("prompt", "python") == "x = 1"
+    session.post.assert_called_once()
+
 # To run:
 # cd /app
 # pytest ai_code_platform/llm_code_generator/tests
+
+def test_local_llm_service_warm_up_loads_model_and_keeps_alive():
+    """Test warm-up against a server that loads the model on the first request."""
+    from ..fake_llm_server import FakeLLMServer
+    with FakeLLMServer(load_latency=0.2) as server:
+        service = LocalLLMService(api_base_url=server.url, keep_alive="30m")
+        report = service.warm_up("python")
+
+        assert isinstance(service.session, requests.Session)  # preconnect attached a pooled session
+        assert report.cold_latency >= 0.2 > report.warm_latency
+        assert report.saved > 0
+        assert [payload["max_tokens"] for payload in server.requests] == [1, 1]
+        assert server.requests[0]["messages"][0]["content"] == service._system_prompt("python")
+        assert all(payload["keep_alive"] == "30m" for payload in server.requests)
+
+def test_local_llm_service_warm_up_unreachable_server():
+    """Test that warm-up reports an unreachable server as LLMAPIError."""
+    service = LocalLLMService(api_base_url="http://localhost:1234/v1", session=MagicMock())
+    service.session.get.side_effect = requests.exceptions.ConnectionError("refused")
+    with pytest.raises(LLMAPIError) as excinfo:
+        service.warm_up()
+    assert "Local LLM API connection error" in str(excinfo.value)
+
+def test_local_llm_service_continues_truncated_reply(mock_requests_post):
+    """Test that a reply cut off by max_tokens is continued and stitched before extraction."""
+    truncated = MagicMock()
+    truncated.json.return_value = {"choices": [{"message": {"content": "```python\ndef f():\n"}, "finish_reason": "length"}]}
+    rest = MagicMock()
+    rest.json.return_value = {"choices": [{"message": {"content": "```python\n    return 1\n```"}, "finish_reason": "stop"}]}
+    mock_requests_post.side_effect = [truncated, rest]
+
+    service = LocalLLMService(api_base_url="http://localhost:1234/v1")
+    assert service.generate_code("prompt", "python") == "def f():\n    return 1"
+
+    continuation = json.loads(mock_requests_post.call_args_list[1][1]["data"])
+    assert [m["role"] for m in continuation["messages"]] == ["system", "user", "assistant", "user"]
+    assert continuation["messages"][2]["content"] == "```python\ndef f():\n"
+    assert continuation["max_tokens"] == 2048
+
+def test_local_llm_service_adaptive_max_tokens(mock_requests_post):
+    """Test that learned output lengths shrink max_tokens and new generations are recorded."""
+    from ..output_stats import OutputLengthStats
+    stats = OutputLengthStats(min_samples=1, floor=1)
+    stats.record("local-model", "python", 100)
+    mock_requests_post.return_value.json.return_value = {
+        "choices": [{"message": {"content": "x = 1"}, "finish_reason": "stop"}],
+        "usage": {"completion_tokens": 120},
+    }
+
+    service = LocalLLMService(api_base_url="http://localhost:1234/v1", output_stats=stats)
+    service.generate_code("prompt", "python")
+
+    assert json.loads(mock_requests_post.call_args[1]["data"])["max_tokens"] == 150
+    assert stats.snapshot()["local-model/python"]["max"] == 120
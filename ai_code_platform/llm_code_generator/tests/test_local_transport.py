@@ -0,0 +1,87 @@
+import socket
+import pytest
+from unittest.mock import MagicMock
+from ..fake_llm_server import FakeLLMServer
+from ..local_llm_service import LocalLLMService, LLMAPIError
+from ..local_transport import HTTP2_AVAILABLE, LocalTransport
+
+BIG_PROMPT = "def helper():\n    return 1\n" * 200
+
+
+@pytest.fixture
+def fake_server():
+    with FakeLLMServer() as server:
+        yield server
+
+
+def test_gzip_enabled_after_server_advertises_support(fake_server):
+    """Test that request bodies are gzipped once the server sends Accept-Encoding: gzip."""
+    transport = LocalTransport(http2=False)
+    service = LocalLLMService(api_base_url=fake_server.url, transport=transport)
+
+    service.generate_code(BIG_PROMPT, "python")
+    assert fake_server.gzip_requests == 0
+    code = service.generate_code(BIG_PROMPT, "python")
+
+    assert code.startswith("def ")
+    assert fake_server.gzip_requests == 1
+    assert fake_server.requests[1]["messages"][1]["content"] == BIG_PROMPT
+    assert transport.bytes_sent < transport.bytes_before_compression
+
+def test_small_bodies_and_disabled_compression_are_sent_plain(fake_server):
+    """Test that small bodies and compress_requests=False skip gzip."""
+    service = LocalLLMService(api_base_url=fake_server.url, transport=LocalTransport(http2=False))
+    for _ in range(2):
+        service.generate_code("short prompt", "python")
+    never = LocalLLMService(api_base_url=fake_server.url, transport=LocalTransport(http2=False, compress_requests=False))
+    for _ in range(2):
+        never.generate_code(BIG_PROMPT, "python")
+    assert fake_server.gzip_requests == 0
+
+def test_forced_compression_and_streaming(fake_server):
+    """Test compress_requests=True on the first request and streaming through the transport."""
+    service = LocalLLMService(api_base_url=fake_server.url, transport=LocalTransport(http2=False, compress_requests=True))
+    text = "".join(service.stream_code(BIG_PROMPT, "python"))
+    assert text.startswith("```python\ndef ")
+    assert fake_server.gzip_requests == 1
+
+def test_unsupported_media_type_disables_compression():
+    """Test that a 415 reply to a gzipped body is retried uncompressed and remembered."""
+    transport = LocalTransport(http2=False, compress_requests=True)
+    rejected = MagicMock(status_code=415, headers={})
+    accepted = MagicMock(status_code=200, headers={})
+    transport._session = MagicMock()
+    transport._session.request.side_effect = [rejected, accepted, accepted]
+
+    assert transport.post("http://server/v1/chat/completions", data="x" * 2000) is accepted
+    transport.post("http://server/v1/chat/completions", data="x" * 2000)
+
+    calls = transport._session.request.call_args_list
+    assert calls[0][1]["headers"]["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in calls[1][1]["headers"]
+    assert "Content-Encoding" not in calls[2][1]["headers"]
+    rejected.close.assert_called_once()
+
+def test_falls_back_to_http1_without_http2_support(fake_server):
+    """Test that the transport reports HTTP/1.1 when HTTP/2 is unavailable or disabled."""
+    assert LocalTransport(http2=False).protocol_for(fake_server.url) == "HTTP/1.1"
+    if not HTTP2_AVAILABLE:
+        assert LocalTransport(http2=True).protocol_for(fake_server.url) == "HTTP/1.1"
+
+@pytest.mark.skipif(not HTTP2_AVAILABLE, reason="httpx[http2] not installed")
+def test_http2_falls_back_when_server_speaks_only_http1(fake_server):
+    """Test that a server without HTTP/2 support is switched to HTTP/1.1 transparently."""
+    transport = LocalTransport(http2=True)
+    service = LocalLLMService(api_base_url=fake_server.url, transport=transport)
+    assert service.generate_code("prompt", "python").startswith("def ")
+    assert transport.protocol_for(fake_server.url) == "HTTP/1.1"
+
+def test_connection_errors_keep_service_error_messages():
+    """Test that transport errors still map to the service's LLMAPIError messages."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    service = LocalLLMService(api_base_url=f"http://127.0.0.1:{port}/v1", transport=LocalTransport())
+    with pytest.raises(LLMAPIError) as excinfo:
+        service.generate_code("prompt", "python")
+    assert "Local LLM API connection error" in str(excinfo.value)
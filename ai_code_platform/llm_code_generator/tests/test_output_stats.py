@@ -0,0 +1,59 @@
+from ..output_stats import OutputLengthStats
+
+
+def test_default_until_enough_samples():
+    """Test that max_tokens isn't adapted before min_samples generations."""
+    stats = OutputLengthStats(min_samples=3)
+    stats.record("model", "python", 100)
+    stats.record("model", "python", 120)
+    assert stats.suggest_max_tokens("model", "python", 2048) == 2048
+    stats.record("model", "python", 110)
+    assert stats.suggest_max_tokens("model", "python", 2048) == 256  # 120 * 1.5 is below the floor
+
+
+def test_suggestion_uses_quantile_with_headroom_and_is_clamped():
+    """Test the quantile/headroom estimate and its clamping to the default."""
+    stats = OutputLengthStats(min_samples=1, quantile=0.95, headroom=1.5, floor=64)
+    for tokens in range(100, 1100, 10):  # 100 samples: 100, 110, ..., 1090
+        stats.record("model", "go", tokens)
+    assert stats.suggest_max_tokens("model", "go", 4096) == 1560  # p95 = 1040
+    assert stats.suggest_max_tokens("model", "go", 1000) == 1000
+    assert stats.suggest_max_tokens("other-model", "go", 4096) == 4096
+
+
+def test_window_keeps_recent_samples():
+    """Test that old samples fall out of the window."""
+    stats = OutputLengthStats(window=3, min_samples=1, floor=1, headroom=1.0)
+    for tokens in (5000, 10, 10, 10):
+        stats.record("model", "python", tokens)
+    assert stats.suggest_max_tokens("model", "python", 2048) == 10
+
+
+def test_snapshot_and_persistence(tmp_path):
+    """Test that statistics survive a save/load round trip and are reported per key."""
+    path = str(tmp_path / "stats.json")
+    stats = OutputLengthStats(path=path, min_samples=1)
+    stats.record("model", "Python", 300, truncated=True, continuations=1)
+    stats.record("model", "python", 500)
+    stats.save()
+
+    snapshot = OutputLengthStats(path=path, min_samples=1).snapshot()
+    assert snapshot == {
+        "model/python": {
+            "samples": 2,
+            "p50": 300,
+            "p95": 500,
+            "max": 500,
+            "requests": 2,
+            "truncations": 1,
+            "continuations": 1,
+            "suggested_max_tokens": 750,
+        }
+    }
+
+
+def test_corrupt_file_is_ignored(tmp_path):
+    """Test that an unreadable statistics file starts empty."""
+    path = tmp_path / "stats.json"
+    path.write_text("{not json")
+    assert OutputLengthStats(path=str(path)).snapshot() == {}
@@ -0,0 +1,136 @@
+import threading
+import time
+
+from ..fake_llm_server import FakeLLMServer
+from ..llm_service import LLMAPIError, LLMService
+from ..local_llm_service import LocalLLMService
+from ..prefetch import LanguageFollowers, Prefetcher
+from ..response_cache import ResponseCache, make_cache_key
+
+
+class GatedStreamingService(LLMService):
+    """Streams `# <language>: <prompt>` in chunks; a chunk only follows once `gate` is set."""
+    model = "prefetch-model"
+
+    def __init__(self, gated: bool = False):
+        self.gate = threading.Event()
+        if not gated:
+            self.gate.set()
+        self.started = threading.Event()
+        self.requests = []
+        self.closed = 0
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        raise NotImplementedError
+
+    def stream_code(self, prompt: str, language: str):
+        self.requests.append((prompt, language))
+        if prompt == "fail":
+            raise LLMAPIError("backend down")
+        try:
+            for chunk in [f"```{language}\n", f"# {language}: ", prompt, "\n```"]:
+                self.started.set()
+                assert self.gate.wait(5)
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+def test_prefetch_fills_cache_and_tracks_hits():
+    llm = GatedStreamingService()
+    cache = ResponseCache()
+    prefetcher = Prefetcher(cache)
+    try:
+        assert prefetcher.submit(llm, "add", "go")
+        assert prefetcher.submit(llm, "sub", "go")
+        assert prefetcher.wait_idle(5)
+        assert not prefetcher.submit(llm, "add", "go")  # already cached
+
+        key = make_cache_key(llm, "add", "go")
+        entry = cache.get(key)
+        assert entry.code == "# go: add" and entry.metadata["prefetched"] is True
+        assert len(entry.metadata["generation_id"]) == 32  # so the served prefetch can be rated
+        prefetcher.record_use(key)
+        prefetcher.record_use(key)  # only the first use counts
+
+        stats = prefetcher.stats()
+        assert (stats.scheduled, stats.skipped, stats.completed, stats.hits) == (2, 1, 2, 1)
+        assert stats.hit_rate == 0.5
+        assert stats.used_tokens > 0 and stats.wasted_tokens == stats.used_tokens  # "sub" is unused so far
+    finally:
+        prefetcher.close()
+
+
+def test_prefetch_waits_for_idle_and_runs_highest_priority_first():
+    llm = GatedStreamingService()
+    prefetcher = Prefetcher(ResponseCache())
+    try:
+        with prefetcher.foreground():
+            prefetcher.submit(llm, "later", "python")
+            prefetcher.submit(llm, "next file", "python", priority=1.0)
+            assert not llm.started.wait(0.1)
+        assert prefetcher.wait_idle(5)
+        assert llm.requests == [("next file", "python"), ("later", "python")]
+    finally:
+        prefetcher.close()
+
+
+def test_real_traffic_cancels_running_prefetch():
+    llm = GatedStreamingService(gated=True)
+    cache = ResponseCache()
+    prefetcher = Prefetcher(cache)
+    try:
+        prefetcher.submit(llm, "add", "go")
+        assert llm.started.wait(5)
+        with prefetcher.foreground():
+            llm.gate.set()
+            assert prefetcher.wait_idle(5)
+        stats = prefetcher.stats()
+        assert (stats.completed, stats.cancelled) == (0, 1)
+        assert stats.wasted_tokens > 0
+        assert llm.closed == 1  # the backend stream was closed
+        assert make_cache_key(llm, "add", "go") not in cache
+    finally:
+        prefetcher.close()
+
+
+def test_real_traffic_aborts_prefetch_waiting_for_first_token():
+    with FakeLLMServer(first_token_latency=5) as server:
+        llm = LocalLLMService(api_base_url=server.url, model=server.model)
+        prefetcher = Prefetcher(ResponseCache())
+        try:
+            prefetcher.submit(llm, "add", "go")
+            while not server.requests:
+                time.sleep(0.01)
+            time.sleep(0.1)  # let the stream reach the blocking read
+
+            started = time.perf_counter()
+            with prefetcher.foreground():
+                assert prefetcher.wait_idle(2)
+            assert time.perf_counter() - started < 1
+            stats = prefetcher.stats()
+            assert (stats.completed, stats.cancelled, stats.failed) == (0, 1, 0)
+        finally:
+            prefetcher.close()
+
+
+def test_failed_prefetch_is_counted():
+    llm = GatedStreamingService()
+    prefetcher = Prefetcher(ResponseCache())
+    try:
+        prefetcher.submit(llm, "fail", "python")
+        assert prefetcher.wait_idle(5)
+        assert prefetcher.stats().failed == 1
+    finally:
+        prefetcher.close()
+
+
+def test_language_followers_learn_transitions():
+    followers = LanguageFollowers(min_count=2)
+    for client in ("a", "b"):
+        followers.observe(client, "add two numbers", "python")
+        followers.observe(client, "add two numbers", "typescript")
+    followers.observe("c", "other", "python")
+    followers.observe("c", "different prompt", "go")  # not the same prompt: no transition
+    assert followers.predict("python") == ["typescript"]
+    assert followers.predict("typescript") == []
@@ -0,0 +1,117 @@
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from .. import profiling
+from ..profiling import Profiler, phase
+
+
+def burn(seconds: float) -> None:
+    """Keeps the CPU busy for `seconds`."""
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
+
+
+def test_phase_is_a_shared_no_op_without_profiler():
+    assert profiling._active is None
+    assert phase("request") is phase("extract")
+    with phase("request"):
+        pass
+
+
+def test_profiler_records_nested_phases_and_cpu_samples():
+    with Profiler(interval=0.001) as profiler:
+        with phase("generate"):
+            with phase("request"):
+                burn(0.05)
+            with phase("request"):
+                time.sleep(0.02)
+    assert profiling._active is None
+
+    request = profiler.phases["generate/request"]
+    assert request.calls == 2
+    assert request.wall >= 0.07
+    assert 0.04 <= request.cpu < request.wall
+    assert profiler.phases["generate"].calls == 1
+
+    lines = profiler.collapsed().splitlines()
+    assert lines and all(line.startswith("phase:") and line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.startswith("phase:generate/request;") and "burn (test_profiling.py:" in line for line in lines)
+    summary = profiler.summary()
+    assert "generate/request" in summary
+    assert "burn (test_profiling.py:" in summary
+
+
+def test_profiler_weights_samples_by_cpu_time():
+    if not profiling._HAS_THREAD_CLOCKS:
+        pytest.skip("per-thread CPU clocks unavailable")
+    with Profiler(interval=0.001) as profiler:
+        with phase("busy"):
+            burn(0.05)
+        with phase("idle"):
+            time.sleep(0.05)
+    busy = sum(weight for stack, weight in profiler.stacks.items() if stack.startswith("phase:busy;"))
+    idle = sum(weight for stack, weight in profiler.stacks.items() if stack.startswith("phase:idle;"))
+    assert busy > 10 * idle
+
+
+def test_profiler_tracks_phases_per_thread():
+    def worker():
+        with phase("candidate"):
+            with phase("validate"):
+                burn(0.01)
+
+    with Profiler(interval=0.001) as profiler:
+        with phase("generate"):
+            threads = [threading.Thread(target=worker) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    assert profiler.phases["candidate/validate"].calls == 3
+    assert "generate/candidate" not in profiler.phases
+
+
+def test_profiler_memory_reports_net_and_peak_allocation():
+    with Profiler(memory=True) as profiler:
+        with phase("outer"):
+            kept = bytearray(1_000_000)
+            with phase("inner"):
+                temporary = bytearray(4_000_000)
+                del temporary
+    assert not tracemalloc.is_tracing()
+    inner, outer = profiler.phases["outer/inner"], profiler.phases["outer"]
+    assert inner.allocated < 100_000 and inner.peak >= 4_000_000
+    assert outer.allocated >= 1_000_000 and outer.peak >= 5_000_000
+    assert "Top allocation sites" in profiler.summary()
+    del kept
+
+
+def test_profiler_sample_rate_skips_unsampled_phases(monkeypatch):
+    draws = iter([0.9, 0.01])
+    monkeypatch.setattr(profiling.random, "random", lambda: next(draws))
+    with Profiler(sample_rate=0.1) as profiler:
+        with phase("generate"):  # 0.9: not sampled
+            with phase("request"):
+                pass
+        with phase("generate"):  # 0.01: sampled
+            with phase("request"):
+                pass
+    assert profiler.phases["generate"].calls == 1
+    assert profiler.phases["generate/request"].calls == 1
+
+
+def test_profiler_sampler_sleeps_until_a_sampled_phase_runs(monkeypatch):
+    draws = iter([0.9, 0.01])
+    monkeypatch.setattr(profiling.random, "random", lambda: next(draws))
+    with Profiler(sample_rate=0.1, interval=0.001) as profiler:
+        assert not profiler._wake.is_set()
+        with phase("generate"):  # not sampled
+            assert not profiler._wake.is_set()
+        with phase("generate"):  # sampled
+            assert profiler._wake.is_set()
+        assert not profiler._wake.is_set()
+    assert profiler._sampler is None  # stop() woke and joined the idle sampler
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+import pytest
+from ..llm_service import LLMService
+from ..project_generator import (
+    CHECKPOINT_FILENAME,
+    ProjectGenerator,
+    ProjectManifestError,
+    ProjectNode,
+    critical_path,
+    load_manifest,
+    validate_graph,
+)
+
+
+class RecordingLLMService(LLMService):
+    """Returns deterministic code and records every prompt it receives."""
+    model = "recording-model"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        with self._lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        first_line = prompt.splitlines()[0]
+        return f"# {language}: {first_line}"
+
+
+def write_manifest(tmp_path, files, language="python"):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"language": language, "files": files}))
+    return str(path)
+
+
+def test_load_manifest(tmp_path):
+    """Test manifest parsing with default and per-file languages."""
+    manifest = write_manifest(tmp_path, [
+        {"path": "models.py", "prompt": "models"},
+        {"path": "api.ts", "prompt": "api", "language": "typescript", "depends_on": ["models.py"]},
+    ])
+    nodes = load_manifest(manifest)
+    assert nodes == [
+        ProjectNode(path="models.py", prompt="models", language="python"),
+        ProjectNode(path="api.ts", prompt="api", language="typescript", depends_on=["models.py"]),
+    ]
+
+@pytest.mark.parametrize("nodes, message", [
+    ([ProjectNode("a.py", "a", "python", ["missing.py"])], "unknown file"),
+    ([ProjectNode("a.py", "a", "python"), ProjectNode("a.py", "b", "python")], "Duplicate"),
+    ([ProjectNode("a.py", "a", "python", ["b.py"]), ProjectNode("b.py", "b", "python", ["a.py"])], "cycle"),
+    ([ProjectNode("../escape.py", "a", "python")], "inside the output directory"),
+])
+def test_validate_graph_errors(nodes, message):
+    """Test that invalid graphs are rejected."""
+    with pytest.raises(ProjectManifestError) as excinfo:
+        validate_graph(nodes)
+    assert message in str(excinfo.value)
+
+def test_critical_path():
+    """Test that the critical path follows the longest weighted chain."""
+    nodes = [
+        ProjectNode("a", "a", "python"),
+        ProjectNode("b", "b", "python", ["a"]),
+        ProjectNode("c", "c", "python"),
+        ProjectNode("d", "d", "python", ["b", "c"]),
+    ]
+    chain, total = critical_path(nodes, {"a": 1.0, "b": 2.0, "c": 5.0, "d": 1.0})
+    assert chain == ["c", "d"]
+    assert total == 6.0
+
+def test_generate_runs_independent_nodes_concurrently_and_feeds_dependencies(tmp_path):
+    """Test concurrent scheduling and that dependency outputs reach dependent prompts."""
+    llm = RecordingLLMService(delay=0.05)
+    nodes = [
+        ProjectNode("models.py", "Write models", "python"),
+        ProjectNode("utils.py", "Write utils", "python"),
+        ProjectNode("services.py", "Write services", "python", ["models.py", "utils.py"]),
+    ]
+    report = ProjectGenerator(llm, str(tmp_path / "out"), max_workers=4).generate(nodes)
+
+    assert llm.max_active == 2
+    services_prompt = next(p for p in llm.prompts if p.startswith("Write services"))
+    assert "--- models.py (python) ---\n# python: Write models" in services_prompt
+    assert "--- utils.py (python) ---\n# python: Write utils" in services_prompt
+    assert (tmp_path / "out" / "services.py").read_text() == "# python: Write services"
+    assert report.generated == ["models.py", "utils.py", "services.py"]
+    assert report.critical_path[-1] == "services.py"
+    assert report.critical_path_time <= report.serial_time
+
+def test_generate_rerun_only_regenerates_changed_nodes(tmp_path):
+    """Test that the checkpoint skips unchanged nodes and invalidates dependents of changed ones."""
+    out = str(tmp_path / "out")
+    nodes = [
+        ProjectNode("a.py", "A", "python"),
+        ProjectNode("b.py", "B", "python"),
+        ProjectNode("c.py", "C", "python", ["a.py"]),
+    ]
+    ProjectGenerator(RecordingLLMService(), out).generate(nodes)
+    assert os.path.exists(os.path.join(out, CHECKPOINT_FILENAME))
+
+    llm = RecordingLLMService()
+    report = ProjectGenerator(llm, out).generate(nodes)
+    assert llm.prompts == []
+    assert report.reused == ["a.py", "b.py", "c.py"]
+
+    nodes[0] = ProjectNode("a.py", "A changed", "python")
+    llm = RecordingLLMService()
+    report = ProjectGenerator(llm, out).generate(nodes)
+    assert report.generated == ["a.py", "c.py"]
+    assert report.reused == ["b.py"]
+
+def test_generate_regenerates_when_output_file_was_edited(tmp_path):
+    """Test that a hand-edited or deleted output is regenerated."""
+    out = tmp_path / "out"
+    nodes = [ProjectNode("a.py", "A", "python")]
+    ProjectGenerator(RecordingLLMService(), str(out)).generate(nodes)
+    (out / "a.py").write_text("edited")
+
+    report = ProjectGenerator(RecordingLLMService(), str(out)).generate(nodes)
+    assert report.generated == ["a.py"]
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+import pytest
+from ..fake_llm_server import FakeLLMServer
+from ..feedback import FeedbackStore
+from ..llm_service import LLMAPIError, LLMService
+from ..local_llm_service import LocalLLMService
+from ..prompt_watcher import PromptWatcher, output_path_for
+from ..response_cache import ResponseCache
+
+
+class StreamingService(LLMService):
+    """Streams a fenced reply echoing the prompt; can pause after the first chunk."""
+    def __init__(self):
+        self.calls = []
+        self.closed = []
+        self.gate: threading.Event | None = None
+        self.started = threading.Event()
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        raise AssertionError("the watcher should stream")
+
+    def stream_code(self, prompt: str, language: str):
+        self.calls.append(prompt)
+
+        def chunks():
+            try:
+                yield f"```{language}\n"
+                self.started.set()
+                if self.gate is not None:
+                    self.gate.wait(5)
+                yield f"# {prompt}\n```"
+            finally:
+                self.closed.append(prompt)
+        return chunks()
+
+
+def write_prompt(path, text, mtime):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.utime(path, ns=(mtime * 10**9, mtime * 10**9))
+
+
+@pytest.fixture
+def service():
+    return StreamingService()
+
+
+def make_watcher(service, directory, **kwargs):
+    return PromptWatcher(service, str(directory), debounce=0.5, **kwargs)
+
+
+def test_output_path_for():
+    """Test that the inner extension selects the output file and language."""
+    assert output_path_for("src/api.ts.prompt", "python") == ("src/api.ts", "typescript")
+    assert output_path_for("src/tool.prompt", "go") == ("src/tool.go", "go")
+    assert output_path_for("src/notes.prompt", "cobol") == ("src/notes.txt", "cobol")
+
+
+def test_generates_after_debounce_and_writes_next_to_prompt(service, tmp_path):
+    """Test that a change is generated only once the file has settled."""
+    prompt_path = tmp_path / "add.py.prompt"
+    write_prompt(prompt_path, "add two numbers", 1000)
+    watcher = make_watcher(service, tmp_path)
+
+    watcher.poll_once(now=0.0)
+    watcher.poll_once(now=0.3)
+    watcher.wait_idle(5)
+    assert service.calls == []
+
+    watcher.poll_once(now=0.6)
+    watcher.wait_idle(5)
+    assert service.calls == ["add two numbers"]
+    assert (tmp_path / "add.py").read_text() == "# add two numbers"
+    assert watcher.generated == 1
+    watcher.close()
+
+
+def test_only_changed_prompts_are_regenerated(service, tmp_path):
+    """Test that unchanged, touched and up-to-date prompt files are skipped."""
+    write_prompt(tmp_path / "a.py.prompt", "first", 1000)
+    write_prompt(tmp_path / "b.py.prompt", "second", 1000)
+    (tmp_path / "b.py").write_text("# existing output")  # newer than its prompt
+    watcher = make_watcher(service, tmp_path)
+    watcher.poll_once(now=0.0)
+    watcher.poll_once(now=1.0)
+    watcher.wait_idle(5)
+    assert service.calls == ["first"]
+
+    write_prompt(tmp_path / "a.py.prompt", "first", 2000)  # touched, same content
+    watcher.poll_once(now=2.0)
+    watcher.poll_once(now=3.0)
+    watcher.wait_idle(5)
+    assert service.calls == ["first"]
+    assert (tmp_path / "b.py").read_text() == "# existing output"
+    watcher.close()
+
+
+def test_touched_crlf_prompt_with_current_output_is_skipped(service, tmp_path):
+    """Test that a CRLF prompt hashes the same at startup as when it is re-read."""
+    prompt_path = tmp_path / "b.py.prompt"
+    prompt_path.write_bytes(b"first line\r\nsecond line\r\n")
+    os.utime(prompt_path, ns=(1000 * 10**9, 1000 * 10**9))
+    (tmp_path / "b.py").write_text("# existing output")  # newer than its prompt
+    watcher = make_watcher(service, tmp_path)
+    watcher.poll_once(now=0.0)
+
+    os.utime(prompt_path, ns=(2000 * 10**9, 2000 * 10**9))  # touched, same content
+    watcher.poll_once(now=1.0)
+    watcher.poll_once(now=2.0)
+    watcher.wait_idle(5)
+    assert service.calls == []
+    watcher.close()
+
+
+def test_reverted_edit_is_served_from_cache(service, tmp_path):
+    """Test that restoring an earlier prompt reuses the cached generation."""
+    prompt_path = tmp_path / "a.py.prompt"
+    watcher = make_watcher(service, tmp_path, cache=ResponseCache())
+    for step, text in enumerate(["version one", "version two", "version one"]):
+        write_prompt(prompt_path, text, 1000 + step)
+        watcher.poll_once(now=step * 10.0)
+        watcher.poll_once(now=step * 10.0 + 1)
+        watcher.wait_idle(5)
+
+    assert service.calls == ["version one", "version two"]
+    assert (tmp_path / "a.py").read_text() == "# version one"
+    assert watcher.generated == 2 and watcher.cache_hits == 1
+    watcher.close()
+
+
+def test_cached_outputs_follow_feedback(service, tmp_path):
+    """Test that cached outputs keep their generation id and rated-down ones are regenerated."""
+    feedback = FeedbackStore(str(tmp_path / "feedback.log"), refresh_interval=0)
+    results = []
+    prompt_path = tmp_path / "a.py.prompt"
+    watcher = make_watcher(service, tmp_path, cache=ResponseCache(feedback=feedback), on_result=results.append)
+    for step, text in enumerate(["version one", "version two", "version one"]):
+        if step == 2:
+            feedback.record(results[0].generation_id, -1)
+        write_prompt(prompt_path, text, 1000 + step)
+        watcher.poll_once(now=step * 10.0)
+        watcher.poll_once(now=step * 10.0 + 1)
+        watcher.wait_idle(5)
+
+    assert [r.status for r in results] == ["generated", "generated", "generated"]  # downranked, not restored
+    assert service.calls == ["version one", "version two", "version one"]
+    assert len({r.generation_id for r in results}) == 3 and all(r.generation_id for r in results)
+    watcher.close()
+
+
+def test_change_during_generation_cancels_it(service, tmp_path):
+    """Test that editing a prompt mid-generation aborts the stale stream."""
+    prompt_path = tmp_path / "a.py.prompt"
+    service.gate = threading.Event()
+    results = []
+    watcher = make_watcher(service, tmp_path, on_result=results.append)
+
+    write_prompt(prompt_path, "stale", 1000)
+    watcher.poll_once(now=0.0)
+    watcher.poll_once(now=1.0)
+    assert service.started.wait(5)
+
+    write_prompt(prompt_path, "fresh", 1001)
+    watcher.poll_once(now=2.0)
+    service.gate.set()
+    watcher.poll_once(now=3.0)
+    watcher.wait_idle(5)
+
+    assert service.calls == ["stale", "fresh"]
+    assert service.closed == ["stale", "fresh"]
+    assert (tmp_path / "a.py").read_text() == "# fresh"
+    assert sorted(result.status for result in results) == ["cancelled", "generated"]
+    assert watcher.cancelled == 1
+    watcher.close()
+
+
+def test_failed_generation_is_reported_and_retried_on_next_change(tmp_path):
+    """Test that backend errors don't stop the watcher."""
+    class FailingService(StreamingService):
+        def stream_code(self, prompt, language):
+            raise LLMAPIError("server down")
+
+    results = []
+    watcher = make_watcher(FailingService(), tmp_path, on_result=results.append)
+    write_prompt(tmp_path / "a.py.prompt", "prompt", 1000)
+    watcher.poll_once(now=0.0)
+    watcher.poll_once(now=1.0)
+    watcher.wait_idle(5)
+
+    assert [(r.status, r.error) for r in results] == [("failed", "server down")]
+    assert not (tmp_path / "a.py").exists()
+    watcher.close()
+
+
+def test_change_aborts_request_still_waiting_for_first_token(tmp_path):
+    """Test that a re-edit interrupts a generation before its first token arrives."""
+    with FakeLLMServer(first_token_latency=5) as server:
+        results = []
+        watcher = make_watcher(LocalLLMService(api_base_url=server.url, model=server.model), tmp_path, on_result=results.append)
+        write_prompt(tmp_path / "a.py.prompt", "slow", 1000)
+        watcher.poll_once(now=0.0)
+        watcher.poll_once(now=1.0)
+        while not server.requests:
+            time.sleep(0.01)
+        time.sleep(0.1)  # let the stream reach the blocking read
+
+        started = time.perf_counter()
+        write_prompt(tmp_path / "a.py.prompt", "edited", 1001)
+        watcher.poll_once(now=2.0)  # cancels the in-flight job; "edited" waits for the debounce
+        while not results:
+            time.sleep(0.01)
+        assert time.perf_counter() - started < 1
+        assert [(r.status, r.error) for r in results] == [("cancelled", None)]
+        watcher.close()
+
+
+def test_unwritable_output_is_reported_as_failed(service, tmp_path):
+    """Test that an output that can't be written is a failed result, not a lost job."""
+    (tmp_path / "a.py").mkdir()  # the output path is taken by a directory
+    results = []
+    watcher = make_watcher(service, tmp_path, on_result=results.append)
+    watcher.poll_once(now=-10.0)  # the first scan would take the existing "output" as current
+    write_prompt(tmp_path / "a.py.prompt", "prompt", 1000)
+    watcher.poll_once(now=0.0)
+    watcher.poll_once(now=1.0)
+    watcher.wait_idle(5)
+
+    assert [r.status for r in results] == ["failed"] and watcher.failed == 1
+    assert watcher._jobs == {}
+    watcher.close()
+
+
+def test_finished_futures_are_pruned_while_polling(service, tmp_path):
+    """Test that a long-running watch doesn't keep every finished generation's future."""
+    watcher = make_watcher(service, tmp_path)
+    for step in range(5):
+        write_prompt(tmp_path / "a.py.prompt", f"version {step}", 1000 + step)
+        watcher.poll_once(now=step * 10.0)
+        watcher.poll_once(now=step * 10.0 + 1)
+        while watcher.generated < step + 1:
+            time.sleep(0.01)
+    assert len(watcher._futures) <= 1
+    watcher.close()
@@ -0,0 +1,55 @@
+import time
+from unittest.mock import patch
+from ..response_cache import ResponseCache, make_cache_key, service_identity
+from .test_llm_service import MockLLMService
+
+
+class ModelService(MockLLMService):
+    def __init__(self, model):
+        self.model = model
+
+
+def test_make_cache_key_depends_on_backend_prompt_language_and_params():
+    """Test that every input that changes the output changes the key."""
+    llm = ModelService("model-a")
+    base = make_cache_key(llm, "prompt", "python")
+    assert base == make_cache_key(ModelService("model-a"), "prompt", "python")
+    assert base != make_cache_key(ModelService("model-b"), "prompt", "python")
+    assert base != make_cache_key(llm, "prompt!", "python")
+    assert base != make_cache_key(llm, "prompt", "go")
+    assert base != make_cache_key(llm, "prompt", "python", candidates=3)
+
+def test_service_identity_ignores_non_string_attributes():
+    """Test that mocked or missing attributes don't leak into the identity."""
+    assert service_identity(MockLLMService()) == {"service": "MockLLMService"}
+    assert service_identity(ModelService("m")) == {"service": "ModelService", "model": "m"}
+
+def test_lru_eviction_and_stats():
+    """Test LRU eviction order and hit/miss counters."""
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "code a")
+    cache.put("b", "code b")
+    assert cache.get("a").code == "code a"  # "a" becomes most recently used
+    cache.put("c", "code c")
+    assert cache.get("b") is None
+    assert cache.get("c").code == "code c"
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert len(cache) == 2
+
+def test_disk_persistence_and_invalidate(tmp_path):
+    """Test that entries survive a new cache instance and can be invalidated."""
+    ResponseCache(directory=str(tmp_path)).put("abcd", "x = 1", language="python")
+    cache = ResponseCache(directory=str(tmp_path))
+    entry = cache.get("abcd")
+    assert entry.code == "x = 1"
+    assert entry.metadata == {"language": "python"}
+    cache.invalidate("abcd")
+    assert ResponseCache(directory=str(tmp_path)).get("abcd") is None
+
+def test_ttl_expiry():
+    """Test that expired entries are dropped."""
+    cache = ResponseCache(ttl=10)
+    cache.put("k", "code")
+    with patch("time.time", return_value=time.time() + 11):
+        assert cache.get("k") is None
+    assert len(cache) == 0
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import threading
+from ai_code_platform.server import GenerationServer, ServicePool
+from ai_code_platform.llm_code_generator.llm_service import LLMAPIError, LLMService
+from ai_code_platform.llm_code_generator.response_cache import ResponseCache
+
+
+class StreamingLLMService(LLMService):
+    """Streams a fenced code block in several chunks; optionally blocks until released."""
+    model = "streaming-model"
+
+    def __init__(self, release: threading.Event | None = None):
+        self.release = release
+        self.calls = 0
+        self.closed = 0
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        if prompt == "fail":
+            raise LLMAPIError("backend down")
+        return f"# {language}: {prompt}"
+
+    def stream_code(self, prompt: str, language: str):
+        self.calls += 1
+        try:
+            for chunk in [f"```{language}\n", f"# {language}: ", prompt, "\n```"]:
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+async def http(port: int, method: str, path: str, payload=None, headers=None, source: str | None = None) -> tuple[int, dict, bytes]:
+    # `source` picks another loopback address, so the server sees a different peer.
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, local_addr=(source, 0) if source else None)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = [f"{method} {path} HTTP/1.1", "Host: test", "Connection: close", f"Content-Length: {len(body)}"]
+    head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    header_blob, _, response_body = raw.partition(b"\r\n\r\n")
+    lines = header_blob.decode().split("\r\n")
+    status = int(lines[0].split()[1])
+    response_headers = {k.lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:])}
+    return status, response_headers, response_body
+
+
+def parse_events(body: bytes) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def run_with_server(scenario, llm=None, **server_kwargs):
+    llm = llm or StreamingLLMService()
+
+    async def main():
+        server = GenerationServer(ServicePool(lambda service, model: llm), **server_kwargs)
+        listener = await server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            return await scenario(port, server)
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+
+    return asyncio.run(main())
+
+
+def test_health_and_not_found():
+    """Test the health endpoint, 404s and 405s."""
+    async def scenario(port, server):
+        return (
+            await http(port, "GET", "/api/health"),
+            await http(port, "GET", "/nope"),
+            await http(port, "GET", "/api/generate"),
+        )
+
+    health, missing, wrong_method = run_with_server(scenario)
+    assert health[0] == 200 and json.loads(health[2]) == {"status": "ok"}
+    assert health[1]["access-control-allow-origin"] == "*"
+    assert missing[0] == 404
+    assert wrong_method[0] == 405
+
+def test_generate_json_uses_shared_cache():
+    """Test JSON generation and that repeated requests are served from the cache."""
+    llm = StreamingLLMService()
+
+    async def scenario(port, server):
+        first = await http(port, "POST", "/api/generate", {"prompt": "add", "language": "go"})
+        second = await http(port, "POST", "/api/generate", {"prompt": "add", "language": "go"})
+        stats = await http(port, "GET", "/api/stats")
+        return first, second, stats
+
+    first, second, stats = run_with_server(scenario, llm=llm, cache=ResponseCache())
+    assert json.loads(first[2])["code"] == "# go: add"
+    assert json.loads(first[2])["cached"] is False
+    assert json.loads(second[2])["cached"] is True
+    assert llm.calls == 1
+    assert json.loads(stats[2])["cache"] == {"entries": 1, "hits": 1, "misses": 1}
+
+def test_generate_validation_and_backend_errors():
+    """Test 400 for bad input and 502 for backend failures."""
+    async def scenario(port, server):
+        return (
+            await http(port, "POST", "/api/generate", {"language": "python"}),
+            await http(port, "POST", "/api/generate", {"prompt": "fail"}),
+        )
+
+    bad_request, backend_error = run_with_server(scenario)
+    assert bad_request[0] == 400
+    assert "'prompt' is required" in json.loads(bad_request[2])["error"]
+    assert backend_error[0] == 502
+    assert "API Error: backend down" in json.loads(backend_error[2])["error"]
+
+def test_generate_stream_sends_chunks_then_extracted_code():
+    """Test SSE streaming of chunks followed by the extracted code."""
+    llm = StreamingLLMService()
+
+    async def scenario(port, server):
+        return await http(port, "POST", "/api/generate/stream", {"prompt": "sum", "language": "python"})
+
+    status, headers, body = run_with_server(scenario, llm=llm, cache=ResponseCache())
+    assert status == 200
+    assert headers["content-type"] == "text/event-stream"
+    events = parse_events(body)
+    assert [name for name, _ in events] == ["chunk"] * 4 + ["done"]
+    assert "".join(data["text"] for name, data in events if name == "chunk") == "```python\n# python: sum\n```"
+    assert events[-1][1]["code"] == "# python: sum"
+    assert llm.closed == 1
+
+def test_per_client_limit_and_many_concurrent_clients():
+    """Test that per-client limits return 429 while other clients proceed concurrently."""
+    release = threading.Event()
+    llm = StreamingLLMService(release=release)
+
+    async def scenario(port, server):
+        async def request(source, prompt, client_id=None):
+            headers = {"X-Client-Id": client_id} if client_id else None
+            return await http(port, "POST", "/api/generate", {"prompt": prompt}, headers, source=source)
+
+        blocked = asyncio.ensure_future(request("127.0.0.1", "first"))
+        others = [asyncio.ensure_future(request(f"127.0.1.{i + 1}", f"p{i}")) for i in range(50)]
+        while llm.calls < 51:
+            await asyncio.sleep(0.01)
+        rejected = await request("127.0.0.1", "second")
+        # The limit is per address; a made-up X-Client-Id doesn't get around it.
+        spoofed = await request("127.0.0.1", "third", client_id="someone-else")
+        release.set()
+        return rejected, spoofed, await blocked, await asyncio.gather(*others)
+
+    rejected, spoofed, first, others = run_with_server(scenario, llm=llm, per_client_limit=1)
+    assert rejected[0] == 429
+    assert rejected[1]["retry-after"] == "1"
+    assert spoofed[0] == 429
+    assert first[0] == 200
+    assert all(status == 200 for status, _, _ in others)
+
+def test_prefetch_hints_and_language_followers():
+    """Test that the server prefetches hinted and predicted requests while idle and reports hits."""
+    from ai_code_platform.llm_code_generator.prefetch import Prefetcher
+
+    llm = StreamingLLMService()
+    cache = ResponseCache()
+    prefetcher = Prefetcher(cache)
+
+    async def scenario(port, server):
+        server.followers.min_count = 1
+        await http(port, "POST", "/api/generate", {
+            "prompt": "models", "language": "python", "prefetch": [{"prompt": "services"}],
+        })
+        assert await asyncio.to_thread(prefetcher.wait_idle, 5)
+        hinted = await http(port, "POST", "/api/generate", {"prompt": "services", "language": "python"})
+        # Teach the server that clients ask for Go after Python, then check Go is prefetched.
+        await http(port, "POST", "/api/generate", {"prompt": "sum", "language": "python"})
+        await http(port, "POST", "/api/generate", {"prompt": "sum", "language": "go"})
+        await http(port, "POST", "/api/generate", {"prompt": "max", "language": "python"})
+        assert await asyncio.to_thread(prefetcher.wait_idle, 5)
+        predicted = await http(port, "POST", "/api/generate", {"prompt": "max", "language": "go"})
+        stats = await http(port, "GET", "/api/stats")
+        return hinted, predicted, stats
+
+    hinted, predicted, stats = run_with_server(scenario, llm=llm, cache=cache, prefetcher=prefetcher)
+    assert json.loads(hinted[2])["cached"] is True
+    assert json.loads(predicted[2])["cached"] is True
+    prefetch = json.loads(stats[2])["prefetch"]
+    assert prefetch["hits"] == 2 and prefetch["completed"] >= 2
+    assert 0 < prefetch["hit_rate"] <= 1
+
+
+def test_session_requests_supersede_each_other():
+    """Test that a newer request in the same session cancels the in-flight one with 409."""
+    release = threading.Event()
+    started = threading.Event()
+
+    class SlowDraftService(StreamingLLMService):
+        def stream_code(self, prompt: str, language: str):
+            if prompt == "draft":
+                started.set()
+                release.wait(5)
+            return super().stream_code(prompt, language)
+
+    async def scenario(port, server):
+        draft = asyncio.create_task(http(port, "POST", "/api/generate", {"prompt": "draft", "session": "tab-1"}))
+        await asyncio.to_thread(started.wait, 5)
+        other_client = await http(port, "POST", "/api/generate", {"prompt": "other", "session": "tab-1"}, {"X-Client-Id": "b"})
+        # Another address claiming the first client's id gets its own session too.
+        spoofed = await http(port, "POST", "/api/generate", {"prompt": "spoofed", "session": "tab-1"}, {"X-Client-Id": "127.0.0.1"}, source="127.0.0.2")
+        assert spoofed[0] == 200 and not draft.done()
+        final = await http(port, "POST", "/api/generate", {"prompt": "final", "session": "tab-1"})
+        release.set()
+        return await draft, other_client, final, await http(port, "GET", "/api/stats")
+
+    draft, other_client, final, stats = run_with_server(scenario, llm=SlowDraftService())
+    assert draft[0] == 409 and "Superseded" in json.loads(draft[2])["error"]
+    assert other_client[0] == 200  # sessions are scoped per client (address and X-Client-Id)
+    assert final[0] == 200 and json.loads(final[2])["code"] == "# python: final"
+    payload = json.loads(stats[2])
+    assert payload["errors"] == 0
+    assert payload["sessions"]["superseded"] == 1 and payload["sessions"]["completed"] == 3
+
+
+def test_feedback_downranks_and_invalidates_cached_generations(tmp_path):
+    """Test that ratings posted to /api/feedback decide whether cached generations are served."""
+    from ai_code_platform.llm_code_generator.feedback import FeedbackStore
+
+    class FlakyService(StreamingLLMService):
+        def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+            if self.calls >= 2:
+                self.calls += 1
+                raise LLMAPIError("backend down")
+            return super().generate_code(prompt, language, candidates)
+
+    feedback = FeedbackStore(path=str(tmp_path / "feedback.log"))
+    cache = ResponseCache(feedback=feedback)
+
+    async def scenario(port, server):
+        first = json.loads((await http(port, "POST", "/api/generate", {"prompt": "add"}))[2])
+        rating = await http(port, "POST", "/api/feedback", {"generation_id": first["generation_id"], "rating": -1})
+        regenerated = json.loads((await http(port, "POST", "/api/generate", {"prompt": "add"}))[2])
+        await http(port, "POST", "/api/feedback", {"generation_id": regenerated["generation_id"], "rating": -1})
+        fallback = json.loads((await http(port, "POST", "/api/generate", {"prompt": "add"}))[2])
+        await http(port, "POST", "/api/feedback", {"generation_id": regenerated["generation_id"], "rating": -1})
+        failed = await http(port, "POST", "/api/generate", {"prompt": "add"})
+        invalid = await http(port, "POST", "/api/feedback", {"generation_id": "nope", "rating": 1})
+        return first, rating, regenerated, fallback, failed, invalid, await http(port, "GET", "/api/stats")
+
+    first, rating, regenerated, fallback, failed, invalid, stats = run_with_server(scenario, llm=FlakyService(), cache=cache, feedback=feedback)
+    assert first["cached"] is False and len(first["generation_id"]) == 32
+    assert rating[0] == 200 and json.loads(rating[2])["verdict"] == "downranked"
+    assert regenerated["cached"] is False and regenerated["generation_id"] != first["generation_id"]
+    # The backend is down now: the downranked entry is better than nothing...
+    assert fallback["cached"] is True and fallback["generation_id"] == regenerated["generation_id"]
+    # ...until it is invalidated.
+    assert failed[0] == 502
+    assert invalid[0] == 400
+    payload = json.loads(stats[2])
+    assert payload["feedback"] == {"generations": 2, "ratings": 3}
+    assert payload["cache"]["invalidated"] == 1
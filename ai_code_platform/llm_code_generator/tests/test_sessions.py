@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from ..fake_llm_server import FakeLLMServer
+from ..llm_service import LLMAPIError, LLMService, RequestCancelledError
+from ..local_llm_service import LocalLLMService
+from ..sessions import SessionRequests, SupersededError, on_cancel
+
+
+class GatedService(LLMService):
+    """Streams a fenced block; "slow" prompts wait for `gate` before every chunk."""
+    model = "session-model"
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.closed = []
+        self.aborted = []
+
+    def generate_code(self, prompt: str, language: str, candidates: int = 1) -> str:
+        raise NotImplementedError
+
+    def stream_code(self, prompt: str, language: str):
+        if prompt == "fail":
+            raise LLMAPIError("backend down")
+        return self._stream(prompt, language)
+
+    def _stream(self, prompt, language):
+        on_cancel(lambda: self.aborted.append(prompt))
+        try:
+            for chunk in [f"```{language}\n", f"# {prompt}", "\n```"]:
+                self.started.set()
+                if prompt.startswith("slow"):
+                    assert self.gate.wait(5)
+                yield chunk
+        finally:
+            self.closed.append(prompt)
+
+
+def run_in_thread(target):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = target()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def test_new_request_supersedes_in_flight_request():
+    llm = GatedService()
+    sessions = SessionRequests()
+    thread, outcome = run_in_thread(lambda: sessions.generate("editor", llm, "slow draft", "python"))
+    assert llm.started.wait(5)
+
+    assert sessions.generate("other", llm, "fast", "python") == "# fast"  # other sessions are unaffected
+    assert llm.aborted == []
+    assert sessions.generate("editor", llm, "final", "python") == "# final"
+    assert llm.aborted == ["slow draft"]
+
+    llm.gate.set()
+    thread.join(5)
+    assert isinstance(outcome["error"], SupersededError)
+    assert "slow draft" in llm.closed
+
+    stats = sessions.stats()
+    assert (stats.requests, stats.completed, stats.superseded) == (3, 2, 1)
+    assert stats.cancelled_seconds > 0
+
+
+def test_failures_propagate_and_cancel_reports_in_flight():
+    llm = GatedService()
+    sessions = SessionRequests()
+    with pytest.raises(LLMAPIError):
+        sessions.generate("editor", llm, "fail", "python")
+    assert not sessions.cancel("editor")
+
+    thread, outcome = run_in_thread(lambda: sessions.generate("editor", llm, "slow", "python"))
+    assert llm.started.wait(5)
+    assert sessions.cancel("editor")
+    llm.gate.set()
+    thread.join(5)
+    assert isinstance(outcome["error"], SupersededError)
+
+
+def test_local_stream_is_interrupted_before_first_token():
+    with FakeLLMServer(first_token_latency=5) as server:
+        llm = LocalLLMService(api_base_url=server.url, model=server.model)
+        sessions = SessionRequests()
+        thread, outcome = run_in_thread(lambda: sessions.generate("editor", llm, "draft", "python"))
+        while not server.requests:
+            time.sleep(0.01)
+        time.sleep(0.1)  # let the stream reach the blocking read
+
+        started = time.perf_counter()
+        sessions.cancel("editor")
+        thread.join(5)
+        assert time.perf_counter() - started < 2
+        assert isinstance(outcome["error"], SupersededError)
+
+
+def test_superseding_a_candidate_race_cancels_every_candidate():
+    running = []
+
+    class RacingService(GatedService):
+        def generate_code(self, prompt, language, candidates=1):
+            def produce(i):
+                aborted = threading.Event()
+                on_cancel(lambda: (self.aborted.append(i), aborted.set()))
+                running.append(i)
+                aborted.wait(5)
+                raise RequestCancelledError(f"candidate {i} aborted")
+            return self._select_first_valid([lambda i=i: produce(i) for i in range(candidates)], language)
+
+    llm = RacingService()
+    sessions = SessionRequests()
+    thread, outcome = run_in_thread(lambda: sessions.generate("editor", llm, "draft", "python", candidates=3))
+    while len(running) < 3:
+        time.sleep(0.01)
+
+    started = time.perf_counter()
+    assert sessions.cancel("editor")
+    thread.join(5)
+    assert time.perf_counter() - started < 1
+    assert isinstance(outcome["error"], SupersededError)
+    assert sorted(llm.aborted) == [0, 1, 2]
+    assert sessions.stats().superseded == 1
@@ -0,0 +1,155 @@
+import os
+import stat
+
+import pytest
+
+from ..llm_service import LLMAPIError, LLMConfigurationError
+from .. import storage
+from ..storage import AtomicWriter, atomic_write_text
+from ..streaming_output import (
+    StreamingFileSplitter,
+    StreamingFileWriter,
+    fence_filename,
+    write_stream,
+)
+
+
+def chunked(text: str, size: int = 7):
+    """Splits text into small chunks that cut through lines and fences."""
+    return iter([text[i:i + size] for i in range(0, len(text), size)])
+
+
+MULTI_FILE_RESPONSE = """Here is the project.
+
+```python path=pkg/models.py
+class User:
+    pass
+```
+
+**pkg/service.py**
+```python
+from pkg.models import User
+
+
+def load():
+    return User()
+```
+
+And a helper:
+```python
+x = 1
+```
+"""
+
+
+@pytest.mark.parametrize("info, previous, expected", [
+    ("python path=src/app.py", "", "src/app.py"),
+    ("python title=\"app.py\"", "", "app.py"),
+    ("python app.py", "", "app.py"),
+    ("python:src/app.py", "", "src/app.py"),
+    ("python", "**src/app.py**", "src/app.py"),
+    ("python", "### `app.py`", "app.py"),
+    ("python", "File: app.py", "app.py"),
+    ("python", "Here is the code:", None),
+    ("python3.11", "", None),
+])
+def test_fence_filename(info, previous, expected):
+    assert fence_filename(info, previous) == expected
+
+
+def test_writer_streams_first_fenced_block(tmp_path):
+    path = str(tmp_path / "out.py")
+    text = "Sure! Here it is:\n\n```python\ndef f():\n\n    return 1\n\n```\nHope this helps.\n```python\nignored\n```"
+    assert write_stream(chunked(text), StreamingFileWriter(path)) == [path]
+    with open(path) as f:
+        assert f.read() == "def f():\n\n    return 1\n"
+
+
+def test_writer_without_fence_writes_whole_response(tmp_path):
+    path = str(tmp_path / "out.py")
+    write_stream(chunked("\n\nprint('hi')\nprint('there')\n\n"), StreamingFileWriter(path))
+    with open(path) as f:
+        assert f.read() == "print('hi')\nprint('there')\n"
+
+
+def test_writer_leaves_existing_file_on_error(tmp_path):
+    path = tmp_path / "out.py"
+    path.write_text("old")
+
+    def failing():
+        yield "```python\nnew = 1\n"
+        raise LLMAPIError("connection lost")
+
+    with pytest.raises(LLMAPIError):
+        write_stream(failing(), StreamingFileWriter(str(path)))
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["out.py"]  # temporary file removed
+
+
+def test_splitter_writes_each_block_as_it_completes(tmp_path):
+    committed = []
+
+    def on_file(path):
+        committed.append((os.path.relpath(path, tmp_path), (tmp_path / "pkg" / "service.py").exists()))
+
+    splitter = StreamingFileSplitter(str(tmp_path), "python", on_file=on_file)
+    files = write_stream(chunked(MULTI_FILE_RESPONSE), splitter)
+
+    assert [os.path.relpath(path, tmp_path) for path in files] == ["pkg/models.py", "pkg/service.py", "generated_1.py"]
+    # models.py was committed before service.py's block had been parsed.
+    assert committed[0] == ("pkg/models.py", False)
+    assert (tmp_path / "pkg" / "service.py").read_text() == "from pkg.models import User\n\n\ndef load():\n    return User()\n"
+    assert (tmp_path / "generated_1.py").read_text() == "x = 1\n"
+
+
+def test_splitter_unfenced_response_and_unterminated_block(tmp_path):
+    write_stream(chunked("print('a')\n"), StreamingFileSplitter(str(tmp_path / "a"), "python"))
+    assert (tmp_path / "a" / "generated.py").read_text() == "print('a')\n"
+
+    files = write_stream(chunked("```go main.go\npackage main"), StreamingFileSplitter(str(tmp_path / "b"), "go"))
+    assert files == [str(tmp_path / "b" / "main.go")]
+    assert (tmp_path / "b" / "main.go").read_text() == "package main\n"
+
+
+def test_splitter_rejects_paths_outside_directory(tmp_path):
+    with pytest.raises(LLMConfigurationError):
+        write_stream(iter(["```python path=../evil.py\nx = 1\n```\n"]), StreamingFileSplitter(str(tmp_path / "out"), "python"))
+    assert not (tmp_path / "evil.py").exists()
+
+
+def test_atomic_writer_commit_and_abort(tmp_path):
+    path = str(tmp_path / "file.txt")
+    with AtomicWriter(path) as writer:
+        writer.write("partial")
+        writer.truncate()
+        writer.write("final")
+        assert not os.path.exists(path)
+    with open(path) as f:
+        assert f.read() == "final"
+
+    writer = AtomicWriter(path)
+    writer.write("discarded")
+    writer.abort()
+    with open(path) as f:
+        assert f.read() == "final"
+    assert os.listdir(tmp_path) == ["file.txt"]
+
+
+def test_atomic_writes_keep_or_default_the_file_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_umask", None)  # read afresh under the umask set here
+    umask = os.umask(0o022)
+    try:
+        new = str(tmp_path / "new.py")
+        atomic_write_text(new, "x = 1\n")
+        assert stat.S_IMODE(os.stat(new).st_mode) == 0o644  # not the 0600 of temporary files
+
+        script = str(tmp_path / "script.sh")
+        atomic_write_text(script, "#!/bin/sh\n")
+        os.chmod(script, 0o750)
+        atomic_write_text(script, "#!/bin/sh\necho hi\n")
+        assert stat.S_IMODE(os.stat(script).st_mode) == 0o750
+        with AtomicWriter(script) as writer:
+            writer.write("#!/bin/sh\n")
+        assert stat.S_IMODE(os.stat(script).st_mode) == 0o750
+    finally:
+        os.umask(umask)
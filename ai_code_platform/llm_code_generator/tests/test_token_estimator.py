@@ -0,0 +1,15 @@
+from ..token_estimator import estimate_tokens
+
+
+def test_estimate_tokens_empty():
+    """Test that empty text costs nothing."""
+    assert estimate_tokens("") == 0
+
+def test_estimate_tokens_counts_words_punctuation_and_newlines():
+    """Test the estimator's word, punctuation and newline costs."""
+    # "def"(1) "add"(1) "(" "a" "," "b" ")" ":" -> 3 punct + 2 words, newline, "return"(2) "a" "+" "b"
+    assert estimate_tokens("def add(a, b):\n    return a + b") == 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 2 + 1 + 1 + 1
+
+def test_estimate_tokens_long_identifiers_cost_more():
+    """Test that long identifiers are split into several tokens."""
+    assert estimate_tokens("calculate_running_average") > estimate_tokens("avg")
@@ -0,0 +1,743 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext, suppress
+from dataclasses import asdict, dataclass, field
+from typing import Callable
+
+import requests
+
+from ai_code_platform.llm_code_generator.capabilities import CapabilityCache
+from ai_code_platform.llm_code_generator.claude_service import ClaudeService
+from ai_code_platform.llm_code_generator.client_registry import AnthropicClientRegistry, ClientSettings
+from ai_code_platform.llm_code_generator.code_extraction import extract_code
+from ai_code_platform.llm_code_generator.feedback import FeedbackStore, InvalidFeedbackError
+from ai_code_platform.llm_code_generator.history_store import HistoryStore
+from ai_code_platform.llm_code_generator.llm_service import (
+    LLMService,
+    LLMAPIError,
+    LLMConfigurationError,
+    LLMServiceError,
+    LLMValidationError,
+    capture_generation,
+)
+from ai_code_platform.llm_code_generator.local_llm_service import LocalLLMService
+from ai_code_platform.llm_code_generator.local_transport import LocalTransport
+from ai_code_platform.llm_code_generator.output_stats import OutputLengthStats
+from ai_code_platform.llm_code_generator.prefetch import LanguageFollowers, Prefetcher
+from ai_code_platform.llm_code_generator.profiling import phase
+from ai_code_platform.llm_code_generator.response_cache import CacheEntry, ResponseCache, make_cache_key
+from ai_code_platform.llm_code_generator.sessions import SessionRequests, SupersededError
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_HEADER_LINES = 100
+SERVICES = ("claude", "local")
+MAX_PREFETCH_HINTS = 8
+MAX_SESSION_KEY_LENGTH = 256
+
+HTTP_REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    411: "Length Required",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    """An error that is reported to the client with the given HTTP status."""
+
+    def __init__(self, status: int, message: str, headers: dict | None = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+@dataclass
+class HttpRequest:
+    """A parsed HTTP/1.1 request."""
+    method: str
+    path: str
+    version: str
+    headers: dict[str, str]  # lower-case names
+    body: bytes
+    client: str
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def client_id(self) -> str:
+        """
+        Identifies the client for sessions and prefetch predictions: the peer address,
+        sub-keyed by X-Client-Id if sent.
+
+        The header only tells apart clients sharing an address (editor tabs, tools);
+        it is chosen by the client, so limits are keyed on the address alone.
+        """
+        client_id = self.headers.get("x-client-id")
+        return f"{self.client}/{client_id}" if client_id else self.client
+
+    def json(self) -> dict:
+        try:
+            payload = json.loads(self.body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HttpError(400, f"Request body is not valid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Request body must be a JSON object.")
+        return payload
+
+
+@dataclass
+class GenerationRequest:
+    """The validated fields of a generation request."""
+    prompt: str
+    language: str = "python"
+    service: str | None = None
+    model: str | None = None
+    candidates: int = 1
+    prefetch: list[tuple[str, str]] = field(default_factory=list)  # (prompt, language) the client expects to request next
+    session: str | None = None  # a newer request with the same session (and client) cancels this one
+
+    @classmethod
+    def from_http(cls, request: HttpRequest) -> "GenerationRequest":
+        payload = request.json()
+        prompt = payload.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HttpError(400, "'prompt' is required.")
+        language = payload.get("language", "python")
+        service = payload.get("service")
+        model = payload.get("model")
+        candidates = payload.get("candidates", 1)
+        if not isinstance(language, str) or not language.strip():
+            raise HttpError(400, "'language' must be a non-empty string.")
+        if service is not None and service not in SERVICES:
+            raise HttpError(400, f"'service' must be one of {', '.join(SERVICES)}.")
+        if model is not None and not isinstance(model, str):
+            raise HttpError(400, "'model' must be a string.")
+        if not isinstance(candidates, int) or not 1 <= candidates <= 16:
+            raise HttpError(400, "'candidates' must be an integer between 1 and 16.")
+        hints = payload.get("prefetch", [])
+        if not isinstance(hints, list) or not all(
+            isinstance(hint, dict) and isinstance(hint.get("prompt"), str) and hint["prompt"].strip()
+            and isinstance(hint.get("language", ""), str) for hint in hints
+        ):
+            raise HttpError(400, "'prefetch' must be a list of {\"prompt\", \"language\"} objects.")
+        prefetch = [(hint["prompt"], hint.get("language") or language) for hint in hints[:MAX_PREFETCH_HINTS]]
+        session = payload.get("session")
+        if session is not None and (not isinstance(session, str) or not 0 < len(session) <= MAX_SESSION_KEY_LENGTH):
+            raise HttpError(400, f"'session' must be a non-empty string of at most {MAX_SESSION_KEY_LENGTH} characters.")
+        return cls(
+            prompt=prompt,
+            language=language,
+            service=service,
+            model=model,
+            candidates=candidates,
+            prefetch=prefetch,
+            session=session,
+        )
+
+
+class ServicePool:
+    """
+    Keeps one warm LLMService per (service, model) for the life of the process.
+
+    Services are created lazily on first use and then shared by every request,
+    so API clients, HTTP connection pools and server-side prompt caches stay warm.
+    """
+
+    def __init__(self, factory: Callable[[str, str | None], LLMService], default_service: str = "local"):
+        """
+        Initializes the ServicePool.
+
+        Args:
+            factory: Builds a service from (service name, model override or None).
+            default_service: The service used when a request doesn't name one.
+        """
+        self.factory = factory
+        self.default_service = default_service
+        self._services: dict[tuple[str, str | None], LLMService] = {}
+        self._lock = threading.Lock()
+
+    def get(self, service: str | None = None, model: str | None = None) -> LLMService:
+        key = (service or self.default_service, model)
+        llm = self._services.get(key)
+        if llm is None:
+            with self._lock:
+                llm = self._services.get(key)
+                if llm is None:
+                    llm = self.factory(*key)
+                    self._services[key] = llm
+        return llm
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+
+def build_service_factory(
+    claude_model: str = ClaudeService.DEFAULT_MODEL,
+    local_url: str | None = None,
+    local_model: str | None = None,
+    api_key: str | None = None,
+    pool_size: int = 256,
+    http2: bool = False,
+    keep_alive: str | None = None,
+    output_stats: OutputLengthStats | None = None,
+    history: HistoryStore | None = None,
+    capabilities: CapabilityCache | None = None,
+) -> Callable[[str, str | None], LLMService]:
+    """
+    Returns a ServicePool factory configured like the CLI.
+
+    All local services share one requests.Session whose connection pool is sized
+    for `pool_size` concurrent requests, so connections to the local server are
+    reused across requests instead of being opened per call. With `http2`, they
+    share one LocalTransport instead (HTTP/2 multiplexing and gzip bodies).
+    Claude services share one client per API key, keeping up to `pool_size`
+    connections alive.
+    `keep_alive` is forwarded to LocalLLMService to keep the model loaded, and
+    `output_stats` (adaptive max_tokens) and `history` to every service.
+    With `capabilities`, local services follow the server's probed capability
+    profile, which is probed at most once per endpoint and TTL.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    transport = LocalTransport(pool_size=pool_size) if http2 else None
+    claude_clients = AnthropicClientRegistry(ClientSettings(max_keepalive_connections=pool_size))
+
+    def factory(service: str, model: str | None) -> LLMService:
+        if service == "claude":
+            return ClaudeService(
+                api_key=api_key,
+                model=model or claude_model,
+                output_stats=output_stats,
+                history=history,
+                registry=claude_clients,
+            )
+        return LocalLLMService(
+            api_base_url=local_url,
+            model=model or local_model,
+            api_key=api_key or "not-needed",
+            session=session,
+            transport=transport,
+            keep_alive=keep_alive,
+            output_stats=output_stats,
+            history=history,
+            capabilities=capabilities,
+        )
+
+    return factory
+
+
+class ClientLimiter:
+    """Caps the number of in-flight generation requests per client address. Only used from the event loop."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active: dict[str, int] = {}
+
+    def try_acquire(self, client: str) -> bool:
+        if self._active.get(client, 0) >= self.limit:
+            return False
+        self._active[client] = self._active.get(client, 0) + 1
+        return True
+
+    def release(self, client: str) -> None:
+        remaining = self._active.get(client, 0) - 1
+        if remaining > 0:
+            self._active[client] = remaining
+        else:
+            self._active.pop(client, None)
+
+
+@dataclass
+class ServerStats:
+    """Counters exposed by GET /api/stats."""
+    requests: int = 0
+    generations: int = 0
+    streams: int = 0
+    active_streams: int = 0
+    rejected: int = 0
+    errors: int = 0
+    started_at: float = field(default_factory=time.time)
+
+
+class GenerationServer:
+    """
+    asyncio HTTP/1.1 server exposing code generation to the web front end.
+
+    Endpoints:
+        GET  /api/health           liveness check
+        GET  /api/stats            request, cache and concurrency counters
+        POST /api/generate         JSON in, JSON out: {"code", "language", "cached",
+                                   "duration_ms", "generation_id"}
+        POST /api/generate/stream  JSON in, Server-Sent Events out: "chunk" events with
+                                   {"text"} deltas, then "done" with the extracted code
+                                   and generation id (or "error")
+        POST /api/feedback         {"generation_id", "rating": 1 or -1} in, the
+                                   generation's feedback summary out
+
+    Blocking LLMService calls run on a bounded thread pool, so the event loop only
+    handles sockets and can hold hundreds of concurrent streaming clients. Services,
+    their connection pools and the response cache are shared by all requests.
+
+    With a Prefetcher, every generated response schedules likely-next requests
+    into the cache while the backend is idle: the same prompt in the languages
+    clients usually ask for next, and the requests named in the optional
+    "prefetch" list of the body ([{"prompt", "language"}], e.g. the next files
+    of an editor's manifest).
+
+    Requests with a "session" key are cancel-superseded: a newer request with
+    the same key from the same client stops the in-flight one, which frees its
+    backend slot and answers 409 (or an "error" event with status 409 on the
+    stream endpoint). See SessionRequests.
+
+    With a FeedbackStore (which the cache should share), ratings posted to
+    /api/feedback decide which cached generations are served: see ResponseCache.
+    A downranked entry is still served when regenerating it fails.
+    """
+
+    def __init__(
+        self,
+        services: ServicePool,
+        cache: ResponseCache | None = None,
+        max_concurrency: int = 256,
+        per_client_limit: int = 8,
+        max_body_bytes: int = 1024 * 1024,
+        allowed_origin: str = "*",
+        prefetcher: Prefetcher | None = None,
+        feedback: FeedbackStore | None = None,
+    ):
+        """
+        Initializes the GenerationServer.
+
+        Args:
+            services: Shared warm services.
+            cache: Optional response cache shared by all requests.
+            max_concurrency: Maximum number of backend calls running at once.
+            per_client_limit: Maximum in-flight generation requests per client address;
+                              further requests get 429.
+            max_body_bytes: Maximum accepted request body size.
+            allowed_origin: Value of Access-Control-Allow-Origin for the browser front end.
+            prefetcher: Optional prefetcher filling `cache` with likely-next generations.
+            feedback: Optional store for ratings posted to /api/feedback.
+        """
+        self.services = services
+        self.cache = cache
+        self.prefetcher = prefetcher
+        self.feedback = feedback
+        self.followers = LanguageFollowers()
+        self.sessions = SessionRequests()
+        self.max_body_bytes = max_body_bytes
+        self.allowed_origin = allowed_origin
+        self.limiter = ClientLimiter(per_client_limit)
+        self.stats = ServerStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="generation")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> asyncio.AbstractServer:
+        """Starts listening and returns the asyncio server (use port 0 for an ephemeral port)."""
+        return await asyncio.start_server(self._handle_connection, host, port, limit=MAX_HEADER_BYTES)
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        """Releases the backend thread pool and stops prefetching."""
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if isinstance(peer, tuple) and peer else "unknown"
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader, client)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self.stats.requests += 1
+                if not await self._dispatch(request, writer):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with suppress(ConnectionError, OSError):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader, client: str) -> HttpRequest | None:
+        try:
+            request_line = await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HttpError(431, "Request line too long.")
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").strip().split()
+        if len(parts) != 3:
+            raise HttpError(400, "Malformed request line.")
+        method, target, version = parts
+
+        headers: dict[str, str] = {}
+        for _ in range(MAX_HEADER_LINES):
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise HttpError(431, "Header line too long.")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(431, "Too many header lines.")
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "Chunked request bodies are not supported; send Content-Length.")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length.")
+        if length > self.max_body_bytes:
+            raise HttpError(413, f"Request body exceeds {self.max_body_bytes} bytes.")
+        body = await reader.readexactly(length) if length else b""
+        path = target.split("?", 1)[0]
+        return HttpRequest(method=method.upper(), path=path, version=version, headers=headers, body=body, client=client)
+
+    async def _dispatch(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        """Handles one request and returns whether the connection can be reused."""
+        routes = {
+            ("GET", "/api/health"): self._health,
+            ("GET", "/api/stats"): self._stats,
+            ("POST", "/api/generate"): self._generate,
+            ("POST", "/api/generate/stream"): self._generate_stream,
+            ("POST", "/api/feedback"): self._record_feedback,
+        }
+        try:
+            if request.method == "OPTIONS":
+                await self._send(writer, 204, b"", {}, keep_alive=request.keep_alive)
+                return request.keep_alive
+            handler = routes.get((request.method, request.path))
+            if handler is None:
+                if any(path == request.path for _, path in routes):
+                    raise HttpError(405, f"{request.method} is not allowed on {request.path}.")
+                raise HttpError(404, f"No route for {request.path}.")
+            return await handler(request, writer)
+        except HttpError as e:
+            await self._send_json(writer, e.status, {"error": e.message}, keep_alive=request.keep_alive, headers=e.headers)
+            return request.keep_alive
+
+    async def _health(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        await self._send_json(writer, 200, {"status": "ok"}, keep_alive=request.keep_alive)
+        return request.keep_alive
+
+    async def _stats(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        payload = {
+            "requests": self.stats.requests,
+            "generations": self.stats.generations,
+            "streams": self.stats.streams,
+            "active_streams": self.stats.active_streams,
+            "rejected": self.stats.rejected,
+            "errors": self.stats.errors,
+            "uptime_s": round(time.time() - self.stats.started_at, 3),
+            "services": len(self.services),
+        }
+        if self.cache is not None:
+            payload["cache"] = {"entries": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses}
+            if self.cache.feedback is not None:
+                payload["cache"].update(downranked=self.cache.downranked, invalidated=self.cache.invalidated)
+        if self.feedback is not None:
+            payload["feedback"] = {"generations": len(self.feedback), "ratings": self.feedback.ratings}
+        if self.prefetcher is not None:
+            prefetch = self.prefetcher.stats()
+            payload["prefetch"] = {**asdict(prefetch), "hit_rate": round(prefetch.hit_rate, 3)}
+        sessions = self.sessions.stats()
+        if sessions.requests:
+            payload["sessions"] = {name: round(value, 3) for name, value in asdict(sessions).items()}
+        await self._send_json(writer, 200, payload, keep_alive=request.keep_alive)
+        return request.keep_alive
+
+    async def _generate(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        params = GenerationRequest.from_http(request)
+        async with self._client_slot(request):
+            self.stats.generations += 1
+            started = time.perf_counter()
+            llm = await self._get_service(params)
+            key = make_cache_key(llm, params.prompt, params.language)
+            entry = self.cache.get(key) if self.cache is not None else None
+            if entry is not None:
+                code, cached, generation_id = entry.code, True, entry.metadata.get("generation_id")
+                self._record_cache_use(key)
+            else:
+                kwargs = {"candidates": params.candidates} if params.candidates > 1 else {}
+                session = self._session_key(request, params)
+
+                def generate() -> tuple[str, str]:
+                    with self._foreground(), phase("generate"):  # one profiling sample unit per request
+                        with capture_generation() as generation:
+                            if session is not None:
+                                code = self.sessions.generate(session, llm, params.prompt, params.language, params.candidates)
+                            else:
+                                code = llm.generate_code(params.prompt, params.language, **kwargs)
+                    return code, generation.id
+
+                try:
+                    code, generation_id = await self._run_backend(generate)
+                    cached = False
+                except HttpError as e:
+                    entry = self._downranked_fallback(key, e.status)
+                    if entry is None:
+                        raise
+                    code, cached, generation_id = entry.code, True, entry.metadata.get("generation_id")
+                if self.cache is not None and not cached:
+                    self.cache.put(key, code, language=params.language, generation_id=generation_id)
+            self._schedule_prefetch(llm, params, request.client_id)
+
+        await self._send_json(writer, 200, {
+            "code": code,
+            "language": params.language,
+            "cached": cached,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "generation_id": generation_id,
+        }, keep_alive=request.keep_alive)
+        return request.keep_alive
+
+    async def _generate_stream(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        params = GenerationRequest.from_http(request)
+        async with self._client_slot(request):
+            llm = await self._get_service(params)
+            self.stats.streams += 1
+            self.stats.active_streams += 1
+            try:
+                await self._send_headers(writer, 200, {
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no",
+                }, keep_alive=False)
+                await self._stream_generation(llm, params, writer, self._session_key(request, params))
+                self._schedule_prefetch(llm, params, request.client_id)
+            finally:
+                self.stats.active_streams -= 1
+        return False  # The SSE response is delimited by closing the connection.
+
+    async def _stream_generation(
+        self,
+        llm: LLMService,
+        params: GenerationRequest,
+        writer: asyncio.StreamWriter,
+        session: str | None = None,
+    ) -> None:
+        started = time.perf_counter()
+        key = make_cache_key(llm, params.prompt, params.language)
+        entry = self.cache.get(key) if self.cache is not None else None
+        if entry is not None:
+            self._record_cache_use(key)
+            await self._send_cached_events(writer, entry, params.language)
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def publish(kind: str, value) -> None:
+            with suppress(RuntimeError):  # the loop may already be closed at shutdown
+                loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+
+        def produce() -> None:
+            chunks = None
+            try:
+                with self._foreground(), phase("stream"), capture_generation() as generation:
+                    if session is not None:
+                        chunks = self.sessions.stream(session, llm, params.prompt, params.language)
+                    else:
+                        chunks = llm.stream_code(params.prompt, params.language)
+                    for chunk in chunks:
+                        if cancelled.is_set():
+                            break
+                        publish("chunk", chunk)
+                publish("end", generation.id)
+            except Exception as e:
+                publish("error", e)
+            finally:
+                # Closing the generator closes the backend HTTP stream when the client went away.
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+
+        loop.run_in_executor(self._executor, produce)
+        parts: list[str] = []
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "chunk":
+                    parts.append(value)
+                    await self._send_event(writer, "chunk", {"text": value})
+                elif kind == "error":
+                    if not isinstance(value, SupersededError):
+                        self.stats.errors += 1
+                    status, message = self._error_status(value)
+                    fallback = self._downranked_fallback(key, status) if not parts else None
+                    if fallback is not None:
+                        await self._send_cached_events(writer, fallback, params.language)
+                    else:
+                        await self._send_event(writer, "error", {"error": message, "status": status})
+                    break
+                else:
+                    code = extract_code("".join(parts), params.language)
+                    if self.cache is not None:
+                        self.cache.put(key, code, language=params.language, generation_id=value)
+                    await self._send_event(writer, "done", {
+                        "code": code,
+                        "language": params.language,
+                        "cached": False,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                        "generation_id": value,
+                    })
+                    break
+        finally:
+            # Stops the producer (and closes the backend stream) if the client disconnected.
+            cancelled.set()
+
+    async def _send_cached_events(self, writer: asyncio.StreamWriter, entry: CacheEntry, language: str) -> None:
+        await self._send_event(writer, "chunk", {"text": entry.code})
+        await self._send_event(writer, "done", {
+            "code": entry.code,
+            "language": language,
+            "cached": True,
+            "duration_ms": 0.0,
+            "generation_id": entry.metadata.get("generation_id"),
+        })
+
+    def _downranked_fallback(self, key: str, status: int) -> CacheEntry | None:
+        """Returns a downranked cache entry to serve when regenerating it failed at the backend (502)."""
+        if self.cache is None or status != 502:
+            return None
+        return self.cache.get(key, allow_downranked=True)
+
+    async def _record_feedback(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        if self.feedback is None:
+            raise HttpError(404, "Feedback is not enabled on this server.")
+        payload = request.json()
+        generation_id, rating = payload.get("generation_id"), payload.get("rating")
+        if isinstance(rating, bool) or rating not in (1, -1):
+            raise HttpError(400, "'rating' must be 1 or -1.")
+        try:
+            # A small append to the log; not worth a trip to the backend pool.
+            summary = self.feedback.record(generation_id, rating)
+        except InvalidFeedbackError as e:
+            raise HttpError(400, str(e))
+        await self._send_json(writer, 200, {
+            "generation_id": generation_id,
+            "up": summary.up,
+            "down": summary.down,
+            "verdict": self.feedback.verdict(generation_id),
+        }, keep_alive=request.keep_alive)
+        return request.keep_alive
+
+    @staticmethod
+    def _session_key(request: HttpRequest, params: GenerationRequest) -> str | None:
+        # Scoped to the client, so one client can't cancel another's requests.
+        return f"{request.client_id}\0{params.session}" if params.session is not None else None
+
+    def _foreground(self):
+        return self.prefetcher.foreground() if self.prefetcher is not None else nullcontext()
+
+    def _record_cache_use(self, key: str) -> None:
+        if self.prefetcher is not None:
+            self.prefetcher.record_use(key)
+
+    def _schedule_prefetch(self, llm: LLMService, params: GenerationRequest, client: str) -> None:
+        """Queues the client's prefetch hints and the languages usually requested after this one."""
+        if self.prefetcher is None:
+            return
+        self.followers.observe(client, params.prompt, params.language)
+        for prompt, language in params.prefetch:
+            self.prefetcher.submit(llm, prompt, language, priority=1.0)
+        for language in self.followers.predict(params.language):
+            self.prefetcher.submit(llm, params.prompt, language)
+
+    async def _get_service(self, params: GenerationRequest) -> LLMService:
+        # Creating a service can block (client construction), so it runs off the loop.
+        return await self._run_backend(functools.partial(self.services.get, params.service, params.model))
+
+    async def _run_backend(self, call: Callable):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except LLMServiceError as e:
+            if not isinstance(e, SupersededError):  # cancelled on purpose, reported in the session stats
+                self.stats.errors += 1
+            status, message = self._error_status(e)
+            raise HttpError(status, message)
+
+    @staticmethod
+    def _error_status(e: Exception) -> tuple[int, str]:
+        if isinstance(e, SupersededError):
+            return 409, f"Superseded: {e}"
+        if isinstance(e, LLMValidationError):
+            return 422, f"Validation Error: {e}"
+        if isinstance(e, LLMConfigurationError):
+            return 503, f"Configuration Error: {e}"
+        if isinstance(e, LLMAPIError):
+            return 502, f"API Error: {e}"
+        return 500, f"An unexpected error occurred: {e}"
+
+    @asynccontextmanager
+    async def _client_slot(self, request: HttpRequest):
+        if not self.limiter.try_acquire(request.client):
+            self.stats.rejected += 1
+            raise HttpError(
+                429,
+                f"Too many concurrent requests for this client (limit {self.limiter.limit}).",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield
+        finally:
+            self.limiter.release(request.client)
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool, headers: dict | None = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        await self._send(writer, status, body, {"Content-Type": "application/json", **(headers or {})}, keep_alive)
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, body: bytes, headers: dict, keep_alive: bool) -> None:
+        await self._send_headers(writer, status, {**headers, "Content-Length": str(len(body))}, keep_alive, body=body)
+
+    async def _send_headers(self, writer: asyncio.StreamWriter, status: int, headers: dict, keep_alive: bool, body: bytes = b"") -> None:
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}"]
+        all_headers = {
+            "Access-Control-Allow-Origin": self.allowed_origin,
+            "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers": "Content-Type, X-Client-Id",
+            "Connection": "keep-alive" if keep_alive else "close",
+            **headers,
+        }
+        lines.extend(f"{name}: {value}" for name, value in all_headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_event(self, writer: asyncio.StreamWriter, event: str, payload: dict) -> None:
+        writer.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+        await writer.drain()